@@ -1,11 +1,14 @@
 """
 Utility per registrare operazioni di audit log
 """
+import logging
 from sqlalchemy.orm import Session
 from . import models
 from datetime import datetime
 from typing import Optional, Dict, Any
 
+logger = logging.getLogger(__name__)
+
 
 def log_action(
     db: Session,
@@ -48,7 +51,7 @@ def log_action(
     except Exception as e:
         # Non bloccare l'operazione principale se il logging fallisce
         db.rollback()
-        print(f"Errore durante il logging audit: {str(e)}")
+        logger.error("Errore durante il logging audit: %s", e)
 
 
 def get_changes_dict(old_obj: Any, new_obj: Any, fields_to_track: list) -> Dict[str, Dict[str, Any]]:
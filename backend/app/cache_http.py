@@ -0,0 +1,66 @@
+"""
+GET condizionali (ETag / If-None-Match) per le risposte grandi lette spesso dal frontend.
+
+L'ETag (debole) non deriva dal corpo della risposta ma da una "firma" dei dati letta con una
+sola query aggregata: numero di righe, id massimo e aggiornato_il massimo delle query che
+compongono la risposta. Se il client invia lo stesso ETag la risposta è un 304 senza corpo,
+prima di caricare le righe e serializzarle.
+- righe aggiunte: cambia l'id massimo; eliminate: cambia il conteggio;
+- righe modificate: cambia aggiornato_il (onupdate, anche con gli update() in blocco;
+  update_intervento lo aggiorna anche quando cambiano solo dettagli e ricambi);
+- tabelle senza aggiornato_il (audit_logs, solo inserimenti): conteggio e id massimo.
+Cache-Control "private, no-cache": il browser conserva la risposta ma la rivalida sempre,
+quindi il polling del frontend riceve 304 finché i dati non cambiano.
+ETAG_VERSIONE va incrementata quando cambia il formato delle risposte con ETag.
+"""
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+from sqlalchemy import func, select, true
+from sqlalchemy.orm import Query, Session
+
+ETAG_VERSIONE = "1"
+CACHE_CONTROL_RIVALIDA = "private, no-cache"
+
+
+def firma(db: Session, *queries: Query) -> tuple:
+    """Conteggio, id massimo e aggiornato_il massimo di ogni query (una sola query SQL)"""
+    parti = []
+    for indice, query in enumerate(queries):
+        model = query.column_descriptions[0]["entity"]
+        colonne = [func.count(model.id).label(f"n{indice}"), func.max(model.id).label(f"id{indice}")]
+        if "aggiornato_il" in model.__table__.c:
+            colonne.append(func.max(model.aggiornato_il).label(f"agg{indice}"))
+        parti.append(query.order_by(None).limit(None).offset(None).with_entities(*colonne).subquery())
+    origine = parti[0]
+    for parte in parti[1:]:
+        origine = origine.join(parte, true())
+    return tuple(db.execute(select(*parti).select_from(origine)).one())
+
+
+def etag(*valori) -> str:
+    """ETag debole dai valori (firma dei dati e parametri che cambiano la risposta)"""
+    impronta = hashlib.sha1(repr((ETAG_VERSIONE, valori)).encode()).hexdigest()[:20]
+    return f'W/"{impronta}"'
+
+
+def _corrisponde(if_none_match: Optional[str], valore: str) -> bool:
+    """Confronto debole (RFC 9110): W/"x" e "x" coincidono"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    atteso = valore.removeprefix("W/")
+    return any(voce.strip().removeprefix("W/") == atteso for voce in if_none_match.split(","))
+
+
+def non_modificata(request: Request, response: Response, valore: str) -> Optional[Response]:
+    """
+    Imposta ETag e Cache-Control sulla risposta; se il client ha già questa versione
+    restituisce il 304 da restituire al posto dei dati, altrimenti None.
+    """
+    headers = {"ETag": valore, "Cache-Control": CACHE_CONTROL_RIVALIDA}
+    if _corrisponde(request.headers.get("if-none-match"), valore):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,130 @@
+"""
+Compressione delle risposte (brotli o gzip) per JSON, CSV e testo.
+
+Le liste (/interventi/, /api/audit-logs/) e il dettaglio cliente con sedi e assets superano
+spesso le centinaia di KB: compressi occupano un decimo della banda.
+- Brotli se il client lo accetta (Accept-Encoding: br) e il modulo brotli è installato,
+  altrimenti gzip;
+- solo i tipi testuali (COMPRESSIONE_TIPI) e sopra COMPRESSIONE_MIN_BYTES: PDF, immagini e
+  XLSX sono già compressi, le risposte piccole non ne traggono vantaggio;
+- le risposte in streaming (export CSV) vengono compresse blocco per blocco, con un flush a
+  ogni blocco così il client riceve i dati senza attendere la fine;
+- NDJSON (avanzamento import) e text/event-stream restano non compressi: ogni riga deve
+  arrivare subito.
+Middleware ASGI puro come MetricheMiddleware (nessun costo aggiuntivo sulle risposte in streaming).
+"""
+import os
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from .services import lazy_imports
+
+COMPRESSIONE_ATTIVA = os.getenv("COMPRESSIONE_ATTIVA", "true").lower() in ("1", "true", "yes")
+COMPRESSIONE_MIN_BYTES = int(os.getenv("COMPRESSIONE_MIN_BYTES", "1024"))
+COMPRESSIONE_GZIP_LIVELLO = int(os.getenv("COMPRESSIONE_GZIP_LIVELLO", "6"))
+# Qualità 4-5: rapporto vicino al massimo con un costo CPU simile a gzip 6 (11 è troppo lento per risposte dinamiche)
+COMPRESSIONE_BROTLI_QUALITA = int(os.getenv("COMPRESSIONE_BROTLI_QUALITA", "4"))
+
+COMPRESSIONE_TIPI = ("application/json", "text/csv", "text/plain", "text/html", "text/css", "application/javascript", "image/svg+xml")
+TIPI_ESCLUSI = ("application/x-ndjson", "text/event-stream")
+
+
+def scegli_codifica(accept_encoding: str) -> Optional[str]:
+    """"br", "gzip" o None in base all'header Accept-Encoding (q=0 esclude la codifica)"""
+    accettate = set()
+    for voce in accept_encoding.lower().split(","):
+        nome, _, parametri = voce.strip().partition(";")
+        qualita = parametri.strip()
+        if qualita.startswith("q="):
+            try:
+                if float(qualita[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accettate.add(nome.strip())
+    if "br" in accettate and lazy_imports.get_brotli() is not None:
+        return "br"
+    if "gzip" in accettate:
+        return "gzip"
+    return None
+
+
+class _Compressore:
+    """Interfaccia comune a gzip e brotli: comprimi(blocco, finale) -> byte da inviare"""
+
+    def __init__(self, codifica: str):
+        self.codifica = codifica
+        if codifica == "br":
+            self._brotli = lazy_imports.get_brotli().Compressor(quality=COMPRESSIONE_BROTLI_QUALITA)
+        else:
+            self._zlib = zlib.compressobj(COMPRESSIONE_GZIP_LIVELLO, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def comprimi(self, blocco: bytes, finale: bool) -> bytes:
+        if self.codifica == "br":
+            dati = self._brotli.process(blocco)
+            return dati + (self._brotli.finish() if finale else self._brotli.flush())
+        dati = self._zlib.compress(blocco)
+        return dati + self._zlib.flush(zlib.Z_FINISH if finale else zlib.Z_SYNC_FLUSH)
+
+
+def _comprimibile(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    tipo = headers.get("content-type", "").split(";")[0].strip().lower()
+    return tipo.startswith(COMPRESSIONE_TIPI) and tipo not in TIPI_ESCLUSI
+
+
+class CompressioneMiddleware:
+    """Middleware ASGI: comprime con la codifica scelta da scegli_codifica"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSIONE_ATTIVA or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        codifica = scegli_codifica(Headers(scope=scope).get("accept-encoding", ""))
+        if codifica is None:
+            await self.app(scope, receive, send)
+            return
+
+        stato = {"inizio": None, "compressore": None, "diretto": False}
+
+        async def send_compresso(messaggio):
+            if messaggio["type"] == "http.response.start":
+                # Header inviati col primo blocco: solo allora si sa se comprimere
+                stato["inizio"] = messaggio
+                stato["diretto"] = not _comprimibile(Headers(raw=messaggio["headers"]))
+                return
+            if messaggio["type"] != "http.response.body" or stato["diretto"]:
+                if stato["inizio"] is not None:
+                    await send(stato["inizio"])
+                    stato["inizio"] = None
+                await send(messaggio)
+                return
+
+            corpo = messaggio.get("body", b"")
+            altro = messaggio.get("more_body", False)
+            if stato["compressore"] is None:
+                inizio, stato["inizio"] = stato["inizio"], None
+                headers = MutableHeaders(raw=inizio["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if not altro and len(corpo) < COMPRESSIONE_MIN_BYTES:
+                    stato["diretto"] = True
+                    await send(inizio)
+                    await send(messaggio)
+                    return
+                stato["compressore"] = _Compressore(codifica)
+                headers["Content-Encoding"] = codifica
+                if altro:
+                    del headers["Content-Length"]
+                corpo = stato["compressore"].comprimi(corpo, finale=not altro)
+                if not altro:
+                    headers["Content-Length"] = str(len(corpo))
+                await send(inizio)
+            else:
+                corpo = stato["compressore"].comprimi(corpo, finale=not altro)
+            await send({"type": "http.response.body", "body": corpo, "more_body": altro})
+
+        await self.app(scope, receive, send_compresso)
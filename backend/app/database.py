@@ -1,24 +1,119 @@
-from sqlalchemy import create_engine
+import logging
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from contextlib import contextmanager
 import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 # Legge la stringa di connessione dalle variabili d'ambiente di Docker
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://admin:sistema54secure@db:5432/sistema54_db")
 
+# Replica di sola lettura (opzionale): se non configurata tutte le letture vanno sul primario
+SQLALCHEMY_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+
+# Ritardo massimo (secondi) accettato sulla replica prima di tornare al primario
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "10"))
+# Ogni quanto (secondi) ricontrollare il ritardo della replica
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DATABASE_REPLICA_LAG_CHECK_INTERVAL", "5"))
+
 # Creazione Engine
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 # Session Local: ogni richiesta avrà la sua sessione DB isolata
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine e sessioni per la replica (None se la replica non è configurata)
+replica_engine = create_engine(SQLALCHEMY_REPLICA_URL, pool_pre_ping=True) if SQLALCHEMY_REPLICA_URL else None
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
+
 # Base per i modelli ORM
 Base = declarative_base()
 
+# Query per misurare il ritardo della replica in secondi.
+# Se la replica ha applicato tutto il WAL ricevuto il ritardo è 0 (evita falsi positivi quando il primario è inattivo);
+# se il server non è in recovery (es. due istanze Postgres indipendenti in locale) il ritardo è 0.
+_REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+_replica_state_lock = threading.Lock()
+_replica_state = {"checked_at": 0.0, "healthy": False, "lag": None}
+
+
+def get_replica_lag() -> float:
+    """Restituisce il ritardo della replica in secondi (solleva eccezione se la replica non risponde)"""
+    with replica_engine.connect() as conn:
+        return float(conn.execute(_REPLICA_LAG_SQL).scalar() or 0)
+
+
+def is_replica_available() -> bool:
+    """
+    Verifica (con cache di REPLICA_LAG_CHECK_INTERVAL secondi) se la replica è utilizzabile:
+    raggiungibile e con ritardo entro REPLICA_MAX_LAG_SECONDS.
+    """
+    if replica_engine is None:
+        return False
+
+    now = time.monotonic()
+    with _replica_state_lock:
+        if now - _replica_state["checked_at"] < REPLICA_LAG_CHECK_INTERVAL:
+            return _replica_state["healthy"]
+        # Segna subito il controllo per evitare che più richieste lo eseguano in parallelo
+        _replica_state["checked_at"] = now
+
+    try:
+        lag = get_replica_lag()
+        healthy = lag <= REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning("Ritardo replica %.1fs oltre la soglia di %.1fs - letture sul primario", lag, REPLICA_MAX_LAG_SECONDS)
+    except Exception as e:
+        lag = None
+        healthy = False
+        logger.warning("Replica non raggiungibile, letture sul primario: %s", e)
+
+    with _replica_state_lock:
+        _replica_state["healthy"] = healthy
+        _replica_state["lag"] = lag
+    return healthy
+
+
+def get_read_sessionmaker():
+    """Sessionmaker per le letture: replica se disponibile e aggiornata, altrimenti primario"""
+    if is_replica_available():
+        return ReplicaSessionLocal
+    return SessionLocal
+
+
 # Dependency Injection per FastAPI
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency per gli endpoint di sola lettura (liste, ricerche, statistiche).
+# NON usarla per scritture o per letture che devono vedere una scrittura appena fatta.
+def get_read_db():
+    db = get_read_sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Sessione di sola lettura per job e script fuori dal ciclo richiesta (es. scheduler)
+@contextmanager
+def read_session():
+    db = get_read_sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
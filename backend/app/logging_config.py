@@ -0,0 +1,119 @@
+"""
+Configurazione del logging dell'applicazione (logger "app" e figli: app.main, app.services.pdf_service, ...).
+
+- I thread delle richieste non scrivono mai su stdout: i record vanno in una coda in memoria
+  (QueueHandler) e un thread dedicato (QueueListener) li formatta e li scrive.
+- Livelli per modulo da variabili d'ambiente:
+      LOG_LEVEL=INFO                                            livello predefinito
+      LOG_LEVELS=app.services.pdf_service=DEBUG,app.scheduler=WARNING   eccezioni per modulo
+- LOG_FORMAT=text (default, leggibile nei log Docker) oppure json (una riga JSON per evento).
+- Campionamento dei messaggi DEBUG ad alto volume: con LOG_DEBUG_SAMPLE_RATE=0.1 viene scritto
+  un messaggio su 10 per ciascun punto di log (stesso logger e stesso testo con i segnaposto).
+  WARNING ed errori non vengono mai campionati.
+
+Usare i segnaposto di logging (logger.debug("Lettura %s", lettura_id)) e non le f-string:
+se il livello è disabilitato il messaggio non viene nemmeno costruito.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime
+
+LOGGER_APP = "app"
+
+_listener = None
+_lock = threading.Lock()
+
+
+class CampionamentoDebug(logging.Filter):
+    """Lascia passare un messaggio DEBUG su N per ogni punto di log (logger + testo del messaggio)"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.ogni = max(1, round(1 / rate)) if rate > 0 else 0
+        self._contatori = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.ogni == 1:
+            return True
+        if self.ogni == 0:
+            return False
+        chiave = (record.name, record.msg)
+        with self._lock:
+            contatore = self._contatori.get(chiave, 0)
+            self._contatori[chiave] = contatore + 1
+        return contatore % self.ogni == 0
+
+
+class FormatterJson(logging.Formatter):
+    """Una riga JSON per evento (campi extra=... inclusi; il traceback è già nel messaggio, vedi QueueHandler.prepare)"""
+
+    _ATTRIBUTI_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        evento = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for chiave, valore in vars(record).items():
+            if chiave not in self._ATTRIBUTI_STANDARD and not chiave.startswith("_"):
+                evento[chiave] = valore
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+def _livelli_per_modulo(valore: str) -> dict:
+    """"app.x=DEBUG,app.y=WARNING" -> {"app.x": "DEBUG", "app.y": "WARNING"}"""
+    livelli = {}
+    for voce in valore.split(","):
+        if "=" in voce:
+            nome, livello = voce.split("=", 1)
+            livelli[nome.strip()] = livello.strip().upper()
+    return livelli
+
+
+def configura_logging():
+    """Configura il logger "app" (idempotente: una sola volta per processo)"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+
+        if os.getenv("LOG_FORMAT", "text").lower() == "json":
+            formatter = FormatterJson()
+        else:
+            formatter = logging.Formatter("%(asctime)s %(levelname)-7s [%(name)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+        uscita = logging.StreamHandler(sys.stdout)
+        uscita.setFormatter(formatter)
+
+        # Coda non limitata: put_nowait non blocca mai il thread della richiesta
+        coda = queue.SimpleQueue()
+        handler_coda = logging.handlers.QueueHandler(coda)
+        handler_coda.addFilter(CampionamentoDebug(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))))
+
+        logger_app = logging.getLogger(LOGGER_APP)
+        logger_app.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        logger_app.addHandler(handler_coda)
+        logger_app.propagate = False  # Non duplicare sui handler di uvicorn
+        for nome, livello in _livelli_per_modulo(os.getenv("LOG_LEVELS", "")).items():
+            logging.getLogger(nome).setLevel(livello)
+
+        _listener = logging.handlers.QueueListener(coda, uscita, respect_handler_level=True)
+        _listener.start()
+        atexit.register(arresta_logging)
+
+
+def arresta_logging():
+    """Svuota la coda e ferma il thread di scrittura (all'arresto del processo)"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
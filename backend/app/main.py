@@ -1,22 +1,35 @@
+import time
+_IMPORT_STARTED_AT = time.perf_counter()  # Per misurare il tempo import -> pronto
+
 from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, status, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, or_, and_
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import desc, or_, and_, func, insert
 from typing import List, Optional
-from datetime import datetime, timedelta, time as dt_time
-from fastapi.responses import Response, FileResponse
+from datetime import date, datetime, timedelta, time as dt_time
+from fastapi.responses import Response, FileResponse, StreamingResponse
 from . import models, schemas, database, auth
-from .services import pdf_service, email_service, two_factor_service
+from .services import pdf_service, email_service, two_factor_service, lazy_imports, cliente_sync, ricerca, magazzino_service, import_service, export_service, fatturazione_copie, geocoding, coordinate, percorsi, logo_service
 from .utils import get_default_permessi
 from .audit_logger import log_action, get_changes_dict
 import os
+import json
+import logging
 import shutil
+import tempfile
 from pathlib import Path
 import asyncio
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+from .scheduler import start_scheduler, shutdown_scheduler
+from .logging_config import configura_logging
+from . import metrics, profiling, compressione, cache_http, serializzazione
+
+# Logging su coda con thread di scrittura dedicato (vedi logging_config)
+configura_logging()
+logger = logging.getLogger(__name__)
 
 # Helper per ottenere IP dalla richiesta
 def get_client_ip(request: Request) -> str:
@@ -40,14 +53,37 @@ def convert_intervento_time_fields(intervento: models.Intervento) -> dict:
             data[key] = value
     return data
 
-# Creazione Tabelle (In produzione useremo Alembic, per ora va bene così)
-models.Base.metadata.create_all(bind=database.engine)
+# Creazione tabelle all'avvio solo se richiesta esplicitamente (AUTO_CREATE_SCHEMA=true),
+# altrimenti usare lo script init_db.py. In produzione useremo Alembic.
+AUTO_CREATE_SCHEMA = os.getenv("AUTO_CREATE_SCHEMA", "false").lower() in ("1", "true", "yes")
 
-# Set globale per tracciare gli interventi per cui l'email è già stata programmata
-# Questo evita di inviare email multiple quando vengono create più letture copie rapidamente
-_interventi_email_programmate = set()
-
-app = FastAPI(title="SISTEMA54 Digital API - CMMS")
+def _startup_database():
+    """Operazioni DB di avvio (bloccanti: eseguite nel threadpool, non all'import)"""
+    if AUTO_CREATE_SCHEMA:
+        models.Base.metadata.create_all(bind=database.engine)
+    try:
+        with database.SessionLocal() as db:
+            init_superadmin(db)
+    except Exception as e:
+        logger.error("Errore inizializzazione superadmin all'avvio: %s", e)
+        logger.info("L'utente verrà creato al primo login se necessario.")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Avvio e arresto dell'applicazione (una volta per worker, non all'import del modulo)"""
+    await run_in_threadpool(_startup_database)
+    await run_in_threadpool(start_scheduler)
+    # Precarica in background WeasyPrint & co. se richiesto (PRELOAD_OPTIONAL_DEPS)
+    lazy_imports.start_background_warm_up()
+    logger.info("Backend pronto in %.2fs dall'import (pid %s)", time.perf_counter() - _IMPORT_STARTED_AT, os.getpid())
+    yield
+    await run_in_threadpool(shutdown_scheduler)
+    await geocoding.chiudi()
+
+# Risposte serializzate con orjson se installato (vedi app/serializzazione.py)
+app = FastAPI(title="SISTEMA54 Digital API - CMMS", lifespan=lifespan, default_response_class=serializzazione.RispostaJSON)
+# Profiler attivabile per singola richiesta nel thread dell'endpoint (vedi app/profiling.py)
+app.router.route_class = profiling.RouteProfilabile
 
 # Configurazione CORS (Fondamentale per far parlare Frontend e Backend)
 app.add_middleware(
@@ -58,103 +94,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Metriche per route e query per richiesta (GET /metrics, vedi app/metrics.py)
+app.add_middleware(metrics.MetricheMiddleware)
+# Profiling opt-in (header X-Profile per gli admin o campionamento) e log query lente
+app.add_middleware(profiling.ProfilingMiddleware)
+# Compressione brotli/gzip delle risposte testuali sopra COMPRESSIONE_MIN_BYTES (vedi app/compressione.py)
+app.add_middleware(compressione.CompressioneMiddleware)
+
 # Directory per upload file
-UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR = logo_service.UPLOAD_DIR
 UPLOAD_DIR.mkdir(exist_ok=True)
-LOGO_DIR = UPLOAD_DIR / "logos"
+LOGO_DIR = logo_service.LOGO_DIR
 LOGO_DIR.mkdir(exist_ok=True)
 
-# Monta directory static per servire file uploadati
+# Monta directory static per servire file uploadati. I loghi hanno nomi derivati dal contenuto
+# (vedi app/services/logo_service.py): cache immutable; montati prima di /uploads che li includerebbe
+app.mount("/uploads/logos", logo_service.StaticFilesImmutabili(directory=str(LOGO_DIR)), name="uploads_logos")
 app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 
 # --- FUNZIONE PER CONTROLLARE SCADENZE CONTRATTI (NOLEGGIO E ASSISTENZA) ---
 def check_scadenze_contratti():
-    """Controlla le scadenze dei contratti (noleggio e assistenza) e invia notifiche settimanali da 30 giorni prima"""
-    db = next(database.get_db())
+    """
+    Controlla le scadenze dei contratti (noleggio e assistenza) e invia notifiche settimanali da 30 giorni prima.
+    Restituisce il numero di notifiche per tipo (salvato nello storico job).
+    
+    I dati arrivano da due query (asset ⨝ cliente ⨝ sede e clienti con contratto ⨝ sedi),
+    le email sono generate in memoria e inviate con una sola connessione SMTP.
+    """
+    # Job di sola lettura: usa la replica se disponibile
+    db = database.get_read_sessionmaker()()
     try:
         oggi = datetime.now().date()
+        limite = oggi + timedelta(days=30)
         
         # Ottieni impostazioni azienda
         settings = db.query(models.ImpostazioniAzienda).first()
-        if not settings:
-            settings = models.ImpostazioniAzienda(
-                nome_azienda="SISTEMA54",
-                indirizzo_completo="Configurazione Richiesta",
-                tariffe_categorie={}
-            )
-            db.add(settings)
-            db.commit()
-            db.refresh(settings)
         
-        if not settings.email_notifiche_scadenze:
-            print("Email notifiche scadenze non configurata nelle impostazioni")
-            return
+        if not settings or not settings.email_notifiche_scadenze:
+            logger.info("Email notifiche scadenze non configurata nelle impostazioni")
+            return {"noleggi": 0, "contratti_assistenza": 0}
+        
+        azienda_nome = settings.nome_azienda or "Sistema 54"
+        azienda_telefono = settings.telefono or ""
+        azienda_email = settings.email or ""
         
         # --- CONTROLLO SCADENZE NOLEGGI ---
-        # Trova assets in scadenza tra 1 e 30 giorni
-        assets_scadenza = db.query(models.AssetCliente).filter(
+        # Asset in scadenza tra 1 e 30 giorni con cliente e sede in un'unica query
+        righe_noleggio = db.query(models.AssetCliente, models.Cliente, models.SedeCliente).join(
+            models.Cliente, models.AssetCliente.cliente_id == models.Cliente.id
+        ).outerjoin(
+            models.SedeCliente, models.AssetCliente.sede_id == models.SedeCliente.id
+        ).filter(
             models.AssetCliente.data_scadenza_noleggio.isnot(None),
             models.AssetCliente.data_scadenza_noleggio >= oggi,
-            models.AssetCliente.data_scadenza_noleggio <= oggi + timedelta(days=30)
-        ).all()
+            models.AssetCliente.data_scadenza_noleggio <= limite
+        ).order_by(models.Cliente.id, models.AssetCliente.data_scadenza_noleggio).all()
         
         # Raggruppa per cliente e calcola giorni alla scadenza
-        assets_da_notificare = []
-        for asset in assets_scadenza:
-            if asset.data_scadenza_noleggio:
-                giorni_alla_scadenza = (asset.data_scadenza_noleggio.date() - oggi).days
-                # Invia email settimanalmente: ogni lunedì se siamo tra 1-30 giorni dalla scadenza
-                # Invia sempre se siamo tra 1-30 giorni (lo scheduler gira ogni lunedì)
-                if 1 <= giorni_alla_scadenza <= 30:
-                    assets_da_notificare.append({
-                        'asset': asset,
-                        'giorni_alla_scadenza': giorni_alla_scadenza,
-                        'tipo': 'noleggio'
-                    })
+        # Invia sempre se siamo tra 1-30 giorni (lo scheduler gira ogni lunedì)
+        assets_per_cliente = {}
+        for asset, cliente, sede in righe_noleggio:
+            giorni_alla_scadenza = (asset.data_scadenza_noleggio.date() - oggi).days
+            if 1 <= giorni_alla_scadenza <= 30:
+                assets_per_cliente.setdefault(cliente.id, (cliente, []))[1].append({
+                    'asset': asset,
+                    'sede': sede,
+                    'giorni_alla_scadenza': giorni_alla_scadenza
+                })
         
         # --- CONTROLLO SCADENZE CONTRATTI ASSISTENZA ---
-        clienti_con_contratto = db.query(models.Cliente).filter(
+        # Clienti con contratto in scadenza e relative sedi in un'unica query
+        righe_assistenza = db.query(models.Cliente, models.SedeCliente).outerjoin(
+            models.SedeCliente, models.SedeCliente.cliente_id == models.Cliente.id
+        ).filter(
             models.Cliente.has_contratto_assistenza == True,
             models.Cliente.data_fine_contratto_assistenza.isnot(None),
             models.Cliente.data_fine_contratto_assistenza >= oggi,
-            models.Cliente.data_fine_contratto_assistenza <= oggi + timedelta(days=30)
-        ).all()
+            models.Cliente.data_fine_contratto_assistenza <= limite
+        ).order_by(models.Cliente.id, models.SedeCliente.id).all()
         
-        contratti_da_notificare = []
-        for cliente in clienti_con_contratto:
-            if cliente.data_fine_contratto_assistenza:
-                giorni_alla_scadenza = (cliente.data_fine_contratto_assistenza.date() - oggi).days
-                # Invia email settimanalmente: ogni lunedì se siamo tra 1-30 giorni dalla scadenza
-                # Invia sempre se siamo tra 1-30 giorni (lo scheduler gira ogni lunedì)
-                if 1 <= giorni_alla_scadenza <= 30:
-                    contratti_da_notificare.append({
-                        'cliente': cliente,
-                        'giorni_alla_scadenza': giorni_alla_scadenza,
-                        'tipo': 'assistenza'
-                    })
-        
-        # --- INVIO EMAIL PER NOLEGGI ---
-        assets_per_cliente = {}
-        for item in assets_da_notificare:
-            asset = item['asset']
-            cliente_id = asset.cliente_id
-            if cliente_id not in assets_per_cliente:
-                assets_per_cliente[cliente_id] = []
-            assets_per_cliente[cliente_id].append(item)
-        
-        for cliente_id, items in assets_per_cliente.items():
-            cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
-            if not cliente:
+        contratti_per_cliente = {}
+        for cliente, sede in righe_assistenza:
+            giorni_alla_scadenza = (cliente.data_fine_contratto_assistenza.date() - oggi).days
+            if not 1 <= giorni_alla_scadenza <= 30:
                 continue
-            
-            # Carica sedi del cliente
-            sedi_cliente = db.query(models.SedeCliente).filter(
-                models.SedeCliente.cliente_id == cliente_id
-            ).all()
-            
+            item = contratti_per_cliente.setdefault(cliente.id, {
+                'cliente': cliente,
+                'sedi': [],
+                'giorni_alla_scadenza': giorni_alla_scadenza
+            })
+            if sede is not None:
+                item['sedi'].append(sede)
+        
+        # --- GENERAZIONE EMAIL (in memoria) ---
+        messaggi = []  # (destinatario, oggetto, corpo HTML)
+        
+        for cliente, items in assets_per_cliente.values():
             # Email all'azienda
-            assets_list = [item['asset'] for item in items]
-            subject_azienda = f"Avviso Scadenza Contratti Noleggio - Cliente {cliente.ragione_sociale}"
+            righe_asset = ''.join([
+                f'<li>{i["asset"].tipo_asset}: {i["asset"].marca or ""} {i["asset"].modello or i["asset"].descrizione or ""} - Scade: {i["asset"].data_scadenza_noleggio.strftime("%d/%m/%Y")} (Giorni rimanenti: {i["giorni_alla_scadenza"]})</li>'
+                for i in items
+            ])
             body_azienda_html = f"""
             <html>
             <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
@@ -163,112 +203,74 @@ def check_scadenze_contratti():
                         <h1>Avviso Scadenza Contratti Noleggio</h1>
                     </div>
                     <div style="background-color: #f9fafb; padding: 30px; border: 1px solid #e5e7eb;">
-                        <p>Il cliente <strong>{cliente.ragione_sociale}</strong> ha {len(assets_list)} contratto/i di noleggio in scadenza:</p>
+                        <p>Il cliente <strong>{cliente.ragione_sociale}</strong> ha {len(items)} contratto/i di noleggio in scadenza:</p>
                         <ul>
-                            {''.join([f'<li>{a.tipo_asset}: {a.marca or ""} {a.modello or a.descrizione or ""} - Scade: {a.data_scadenza_noleggio.strftime("%d/%m/%Y") if a.data_scadenza_noleggio else "N/A"} (Giorni rimanenti: {items[i]["giorni_alla_scadenza"]})</li>' for i, a in enumerate(assets_list)])}
+                            {righe_asset}
                         </ul>
                     </div>
                 </div>
             </body>
             </html>
             """
-            email_service.send_email(
+            messaggi.append((
                 settings.email_notifiche_scadenze,
-                subject_azienda,
-                body_azienda_html,
-                db=db
-            )
+                f"Avviso Scadenza Contratti Noleggio - Cliente {cliente.ragione_sociale}",
+                body_azienda_html
+            ))
             
-            # Email al cliente (email principale)
-            if cliente.email_amministrazione:
-                for item in items:
-                    asset = item['asset']
-                    # Carica info sede se disponibile
-                    sede_info = None
-                    if asset.sede_id:
-                        sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == asset.sede_id).first()
-                        if sede:
-                            sede_info = {
-                                'nome_sede': sede.nome_sede,
-                                'indirizzo_completo': sede.indirizzo_completo,
-                                'email': sede.email
-                            }
-                    
-                    asset_dict = {
-                        'tipo_asset': asset.tipo_asset,
-                        'marca': asset.marca,
-                        'modello': asset.modello,
-                        'descrizione': asset.descrizione,
-                        'data_scadenza_noleggio': asset.data_scadenza_noleggio
-                    }
+            for item in items:
+                asset = item['asset']
+                sede = item['sede']
+                sede_info = {
+                    'nome_sede': sede.nome_sede,
+                    'indirizzo_completo': sede.indirizzo_completo,
+                    'email': sede.email
+                } if sede else None
+                asset_dict = {
+                    'tipo_asset': asset.tipo_asset,
+                    'marca': asset.marca,
+                    'modello': asset.modello,
+                    'descrizione': asset.descrizione,
+                    'data_scadenza_noleggio': asset.data_scadenza_noleggio
+                }
+                
+                # Email al cliente (email principale)
+                if cliente.email_amministrazione:
                     subject, body_html = email_service.generate_scadenza_contratto_email(
                         cliente_nome=cliente.ragione_sociale,
                         tipo_contratto="noleggio",
                         giorni_alla_scadenza=item['giorni_alla_scadenza'],
-                        azienda_nome=settings.nome_azienda or "Sistema 54",
-                        azienda_telefono=settings.telefono or "",
-                        azienda_email=settings.email or "",
+                        azienda_nome=azienda_nome,
+                        azienda_telefono=azienda_telefono,
+                        azienda_email=azienda_email,
                         asset_info=asset_dict,
                         sede_info=sede_info
                     )
-                    email_service.send_email(
-                        cliente.email_amministrazione,
-                        subject,
-                        body_html,
-                        db=db
+                    messaggi.append((cliente.email_amministrazione, subject, body_html))
+                
+                # Email alla sede dove si trova l'asset (se ha email)
+                if sede and sede.email:
+                    subject, body_html = email_service.generate_scadenza_contratto_email(
+                        cliente_nome=f"{cliente.ragione_sociale} - {sede.nome_sede}",
+                        tipo_contratto="noleggio",
+                        giorni_alla_scadenza=item['giorni_alla_scadenza'],
+                        azienda_nome=azienda_nome,
+                        azienda_telefono=azienda_telefono,
+                        azienda_email=azienda_email,
+                        asset_info=asset_dict,
+                        sede_info=sede_info
                     )
-            
-            # Email alle sedi interessate (se hanno email e l'asset è associato a quella sede)
-            for item in items:
-                asset = item['asset']
-                if asset.sede_id:
-                    sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == asset.sede_id).first()
-                    if sede and sede.email:
-                        sede_info = {
-                            'nome_sede': sede.nome_sede,
-                            'indirizzo_completo': sede.indirizzo_completo,
-                            'email': sede.email
-                        }
-                        asset_dict = {
-                            'tipo_asset': asset.tipo_asset,
-                            'marca': asset.marca,
-                            'modello': asset.modello,
-                            'descrizione': asset.descrizione,
-                            'data_scadenza_noleggio': asset.data_scadenza_noleggio
-                        }
-                        subject, body_html = email_service.generate_scadenza_contratto_email(
-                            cliente_nome=f"{cliente.ragione_sociale} - {sede.nome_sede}",
-                            tipo_contratto="noleggio",
-                            giorni_alla_scadenza=item['giorni_alla_scadenza'],
-                            azienda_nome=settings.nome_azienda or "Sistema 54",
-                            azienda_telefono=settings.telefono or "",
-                            azienda_email=settings.email or "",
-                            asset_info=asset_dict,
-                            sede_info=sede_info
-                        )
-                        email_service.send_email(
-                            sede.email,
-                            subject,
-                            body_html,
-                            db=db
-                        )
+                    messaggi.append((sede.email, subject, body_html))
         
-        # --- INVIO EMAIL PER CONTRATTI ASSISTENZA ---
-        for item in contratti_da_notificare:
+        for item in contratti_per_cliente.values():
             cliente = item['cliente']
-            
-            # Carica sedi del cliente
-            sedi_cliente = db.query(models.SedeCliente).filter(
-                models.SedeCliente.cliente_id == cliente.id
-            ).all()
-            
-            # Email all'azienda
+            giorni_rimanenti = item['giorni_alla_scadenza']
             contratto_dict = {
                 'data_fine_contratto_assistenza': cliente.data_fine_contratto_assistenza
             }
-            subject_azienda = f"Avviso Scadenza Contratto Assistenza - Cliente {cliente.ragione_sociale}"
-            giorni_rimanenti = item['giorni_alla_scadenza']
-            data_scadenza = cliente.data_fine_contratto_assistenza.strftime('%d/%m/%Y') if cliente.data_fine_contratto_assistenza else 'N/A'
+            data_scadenza = cliente.data_fine_contratto_assistenza.strftime('%d/%m/%Y')
+            
+            # Email all'azienda
             body_azienda_html = f"""
             <html>
             <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
@@ -287,12 +289,11 @@ def check_scadenze_contratti():
             </body>
             </html>
             """
-            email_service.send_email(
+            messaggi.append((
                 settings.email_notifiche_scadenze,
-                subject_azienda,
-                body_azienda_html,
-                db=db
-            )
+                f"Avviso Scadenza Contratto Assistenza - Cliente {cliente.ragione_sociale}",
+                body_azienda_html
+            ))
             
             # Email al cliente (email principale)
             if cliente.email_amministrazione:
@@ -300,28 +301,23 @@ def check_scadenze_contratti():
                     cliente_nome=cliente.ragione_sociale,
                     tipo_contratto="assistenza",
                     giorni_alla_scadenza=giorni_rimanenti,
-                    azienda_nome=settings.nome_azienda or "Sistema 54",
-                    azienda_telefono=settings.telefono or "",
-                    azienda_email=settings.email or "",
+                    azienda_nome=azienda_nome,
+                    azienda_telefono=azienda_telefono,
+                    azienda_email=azienda_email,
                     contratto_info=contratto_dict
                 )
-                email_service.send_email(
-                    cliente.email_amministrazione,
-                    subject,
-                    body_html,
-                    db=db
-                )
+                messaggi.append((cliente.email_amministrazione, subject, body_html))
             
             # Email a tutte le sedi del cliente (se hanno email)
-            for sede in sedi_cliente:
+            for sede in item['sedi']:
                 if sede.email:
                     subject, body_html = email_service.generate_scadenza_contratto_email(
                         cliente_nome=f"{cliente.ragione_sociale} - {sede.nome_sede}",
                         tipo_contratto="assistenza",
                         giorni_alla_scadenza=giorni_rimanenti,
-                        azienda_nome=settings.nome_azienda or "Sistema 54",
-                        azienda_telefono=settings.telefono or "",
-                        azienda_email=settings.email or "",
+                        azienda_nome=azienda_nome,
+                        azienda_telefono=azienda_telefono,
+                        azienda_email=azienda_email,
                         contratto_info=contratto_dict,
                         sede_info={
                             'nome_sede': sede.nome_sede,
@@ -329,23 +325,23 @@ def check_scadenze_contratti():
                             'email': sede.email
                         }
                     )
-                    email_service.send_email(
-                        sede.email,
-                        subject,
-                        body_html,
-                        db=db
-                    )
+                    messaggi.append((sede.email, subject, body_html))
         
-        totale_notifiche = len(assets_da_notificare) + len(contratti_da_notificare)
-        if totale_notifiche > 0:
-            print(f"Notifiche scadenze inviate: {len(assets_da_notificare)} noleggi, {len(contratti_da_notificare)} contratti assistenza")
+        # --- INVIO EMAIL (una sola connessione SMTP) ---
+        email_service.send_emails_batch(messaggi, db=db)
+        
+        totale_noleggi = sum(len(items) for _, items in assets_per_cliente.values())
+        totale_contratti = len(contratti_per_cliente)
+        if totale_noleggi + totale_contratti > 0:
+            logger.info("Notifiche scadenze inviate: %s noleggi, %s contratti assistenza (%s email)", totale_noleggi, totale_contratti, len(messaggi))
         else:
-            print("Nessuna scadenza contratto da notificare questa settimana")
+            logger.info("Nessuna scadenza contratto da notificare questa settimana")
         
+        # Conteggi registrati nello storico job dello scheduler
+        return {"noleggi": totale_noleggi, "contratti_assistenza": totale_contratti}
     except Exception as e:
-        print(f"Errore controllo scadenze contratti: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Errore controllo scadenze contratti: %s", e)
+        raise
     finally:
         db.close()
 
@@ -361,19 +357,17 @@ def get_giorni_da_cadenza(cadenza: str) -> int:
     return cadenze.get(cadenza or "trimestrale", 90)  # Default trimestrale
 
 def get_mesi_da_cadenza(cadenza: str) -> int:
-    """Converte la cadenza letture copie in numero di mesi"""
-    cadenze = {
-        "mensile": 1,
-        "bimestrale": 2,
-        "trimestrale": 3,
-        "semestrale": 6
-    }
-    return cadenze.get(cadenza or "trimestrale", 3)  # Default trimestrale
+    """Converte la cadenza letture copie in numero di mesi (stessa tabella del motore di fatturazione)"""
+    return fatturazione_copie.MESI_CADENZA.get(cadenza or "trimestrale", 3)  # Default trimestrale
 
 # --- FUNZIONE PER CONTROLLARE SCADENZE LETTURE COPIE ---
 def check_scadenze_letture_copie():
-    """Controlla le scadenze delle letture copie e invia alert 7 giorni prima della scadenza basata sulla cadenza configurata"""
-    db = next(database.get_db())
+    """
+    Controlla le scadenze delle letture copie e invia alert 7 giorni prima della scadenza basata sulla cadenza configurata.
+    Restituisce il numero di asset in scadenza notificati (salvato nello storico job).
+    """
+    # Job di sola lettura: usa la replica se disponibile
+    db = database.get_read_sessionmaker()()
     try:
         # Trova tutti gli asset Printing a noleggio
         assets_printing = db.query(models.AssetCliente).filter(
@@ -381,14 +375,14 @@ def check_scadenze_letture_copie():
         ).all()
         
         if not assets_printing:
-            print("Nessun asset Printing trovato")
-            return
+            logger.info("Nessun asset Printing trovato")
+            return {"letture_in_scadenza": 0}
         
         # Ottieni impostazioni azienda
         settings = db.query(models.ImpostazioniAzienda).first()
         if not settings or not settings.email_avvisi_promemoria:
-            print("Email avvisi promemoria non configurata")
-            return
+            logger.info("Email avvisi promemoria non configurata")
+            return {"letture_in_scadenza": 0}
         
         # Raggruppa per cliente
         clienti_da_notificare: dict = {}
@@ -454,37 +448,17 @@ def check_scadenze_letture_copie():
                 body_html=body_html,
                 db=db
             )
-            print(f"Alert letture copie inviato per cliente {cliente.ragione_sociale} (ID: {cliente_id})")
+            logger.info("Alert letture copie inviato per cliente %s (ID: %s)", cliente.ragione_sociale, cliente_id)
         
+        return {"letture_in_scadenza": sum(len(dati['assets']) for dati in clienti_da_notificare.values())}
     except Exception as e:
-        print(f"Errore controllo scadenze letture copie: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Errore controllo scadenze letture copie: %s", e)
+        raise
     finally:
         db.close()
 
-# --- SCHEDULER PER NOTIFICHE SCADENZE ---
-scheduler = BackgroundScheduler()
-scheduler.add_job(
-    check_scadenze_contratti,
-    trigger=CronTrigger(day_of_week='mon', hour=9, minute=0),  # Ogni lunedì alle 9:00
-    id='check_scadenze_contratti',
-    name='Controllo scadenze contratti (noleggio e assistenza) - Settimanale',
-    replace_existing=True
-)
-scheduler.add_job(
-    check_scadenze_letture_copie,
-    trigger=CronTrigger(hour=9, minute=0),  # Ogni giorno alle 9:00
-    id='check_scadenze_letture_copie',
-    name='Controllo scadenze letture copie',
-    replace_existing=True
-)
-scheduler.start()
-print("Scheduler notifiche scadenze avviato:")
-print("  - Contratti (noleggio e assistenza): ogni lunedì alle 9:00")
-print("  - Letture copie: ogni giorno alle 9:00")
-
 # --- FUNZIONE MOCK EMAIL ---
+@profiling.profila
 def send_email_background(
     email_to: str, 
     pdf_content: bytes, 
@@ -502,10 +476,8 @@ def send_email_background(
     """
     if not db:
         # Mock mode (per compatibilità)
-        print(f"--- [EMAIL MOCK] ---")
-        print(f"TO: {email_to}")
-        print(f"OGGETTO: Rapporto Intervento Tecnico {azienda_nome} del {data_intervento.strftime('%d/%m/%Y')}")
-        print("--------------------")
+        logger.info("[EMAIL MOCK] TO: %s OGGETTO: Rapporto Intervento Tecnico %s del %s", email_to, azienda_nome, data_intervento.strftime('%d/%m/%Y'))
+        metrics.EMAIL_INVIATE.inc("mock")
         return
     
     try:
@@ -519,10 +491,8 @@ def send_email_background(
         smtp_config = email_service.get_smtp_config(db)
         if not smtp_config.get('username') or not smtp_config.get('password'):
             # Se SMTP non configurato, usa mock
-            print(f"--- [EMAIL MOCK - SMTP non configurato] ---")
-            print(f"TO: {email_to}")
-            print(f"OGGETTO: Rapporto Intervento Tecnico {azienda_nome} del {data_intervento.strftime('%d/%m/%Y')}")
-            print("--------------------")
+            logger.info("[EMAIL MOCK - SMTP non configurato] TO: %s OGGETTO: Rapporto Intervento Tecnico %s del %s", email_to, azienda_nome, data_intervento.strftime('%d/%m/%Y'))
+            metrics.EMAIL_INVIATE.inc("mock")
             return
         
         # Formatta data intervento
@@ -641,12 +611,12 @@ Nota: Questa è una comunicazione automatica. Si prega di non rispondere diretta
             server.login(smtp_config.get('username'), smtp_config.get('password'))
             server.send_message(msg)
         
-        print(f"✅ Email inviata con successo a {email_to} per RIT {numero_rit}")
+        metrics.EMAIL_INVIATE.inc("ok")
+        logger.info("Email inviata con successo a %s per RIT %s", email_to, numero_rit)
         
     except Exception as e:
-        print(f"⚠️ Errore invio email a {email_to}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        metrics.EMAIL_INVIATE.inc("errore")
+        logger.exception("Errore invio email a %s: %s", email_to, e)
 
 def genera_numero_rit(db: Session) -> str:
     anno_corrente = datetime.now().year
@@ -703,37 +673,27 @@ def init_superadmin(db: Session):
             db.add(default_superadmin)
             db.commit()
             db.refresh(default_superadmin)
-            print("✅ SuperAdmin creato: admin@sistema54.it / admin123")
+            logger.info("SuperAdmin creato: admin@sistema54.it / admin123")
             return True
         else:
-            print(f"ℹ️ SuperAdmin già esistente: {superadmin.email}")
+            logger.info("SuperAdmin già esistente: %s", superadmin.email)
             # Verifica che abbia una password hash
             if not superadmin.password_hash:
                 password_hash = auth.get_password_hash("admin123")
                 superadmin.password_hash = password_hash
                 db.commit()
-                print("✅ Password hash aggiornata per SuperAdmin")
+                logger.info("Password hash aggiornata per SuperAdmin")
             # Aggiorna permessi se non sono impostati
             if not superadmin.permessi or superadmin.permessi == {}:
                 superadmin.permessi = get_default_permessi("superadmin")
                 db.commit()
-                print("✅ Permessi di default applicati al SuperAdmin")
+                logger.info("Permessi di default applicati al SuperAdmin")
             return False
     except Exception as e:
-        print(f"⚠️ Errore creazione superadmin: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Errore creazione superadmin: %s", e)
         db.rollback()
         return False
 
-# Esegui all'avvio - con gestione errori
-try:
-    with database.SessionLocal() as db:
-        init_superadmin(db)
-except Exception as e:
-    print(f"⚠️ Errore inizializzazione superadmin all'avvio: {e}")
-    print("L'utente verrà creato al primo login se necessario.")
-
 # --- API AUTENTICAZIONE ---
 
 @app.post("/api/auth/login", response_model=schemas.Token, tags=["Autenticazione"])
@@ -1060,39 +1020,60 @@ def update_user(user_id: int, user_update: schemas.UserUpdate, request: Request,
 # --- API GEOCODING (Proxy per Nominatim) ---
 
 @app.get("/api/geocoding/search", tags=["Geocoding"])
-def search_addresses(
+async def search_addresses(
+    response: Response,
     q: str = Query(..., description="Query di ricerca indirizzo"),
-    db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
-    """Proxy per Nominatim API per cercare indirizzi italiani (evita problemi CORS)"""
-    import requests
-    
+    """Proxy per Nominatim API per cercare indirizzi italiani (evita problemi CORS), con cache e richieste unite"""
     try:
-        # Chiama Nominatim API
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": f"{q}, Italia",
-            "format": "json",
-            "addressdetails": "1",
-            "limit": "5",
-            "countrycodes": "it",
-            "accept-language": "it"
-        }
-        
-        # Aggiungi User-Agent come richiesto da Nominatim
-        headers = {
-            "User-Agent": "Sistema54-App/1.0"
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        response.raise_for_status()
-        
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=503, detail=f"Errore nella ricerca indirizzi: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
+        risultato = await geocoding.cerca(q)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    # Gli stessi indirizzi vengono cercati più volte durante la digitazione: cache anche nel browser
+    response.headers["Cache-Control"] = "private, max-age=3600"
+    response.headers["X-Geocoding-Cache"] = risultato.origine
+    return risultato.risultati
+
+@app.post("/api/geocoding/coordinate-mancanti", tags=["Geocoding"])
+def geocodifica_coordinate_mancanti(
+    background_tasks: BackgroundTasks,
+    limite: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(database.get_db),
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """Avvia in background la geocodifica di clienti e sedi senza coordinate (es. dopo un import)"""
+    da_geocodificare = sum(
+        db.query(func.count(model.id)).filter(model.geocodifica_il.is_(None)).scalar()
+        for model in coordinate.CAMPI_INDIRIZZO
+    )
+    if da_geocodificare:
+        background_tasks.add_task(coordinate.geocodifica, limite=limite)
+    return {"da_geocodificare": da_geocodificare, "in_elaborazione": min(da_geocodificare, limite)}
+
+# --- API PERCORSI TECNICI ---
+
+@app.get("/api/percorsi/tecnico/{tecnico_id}", response_model=schemas.PercorsoTecnicoResponse, tags=["Percorsi"])
+def percorso_tecnico(
+    tecnico_id: int,
+    data: Optional[date] = Query(None, description="Giorno delle chiamate (default oggi)"),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Latitudine di partenza (es. sede aziendale)"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Longitudine di partenza"),
+    ritorno: bool = Query(False, description="Includi il rientro al punto di partenza"),
+    solo_aperte: bool = Query(True, description="Solo le chiamate non ancora firmate dal cliente"),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """
+    Ordine di visita delle chiamate del tecnico nel giorno (vicino più vicino + 2-opt)
+    con le distanze in linea d'aria. Usa solo le coordinate salvate, nessun servizio esterno.
+    """
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="Indicare sia lat sia lon per il punto di partenza")
+    if not db.query(models.Utente.id).filter(models.Utente.id == tecnico_id).first():
+        raise HTTPException(status_code=404, detail="Tecnico non trovato")
+    partenza = (lat, lon) if lat is not None else None
+    return percorsi.percorso_tecnico(db, tecnico_id, data or date.today(), partenza, ritorno, solo_aperte)
 
 # --- API UPLOAD LOGO ---
 
@@ -1102,43 +1083,30 @@ def upload_logo(
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.require_admin)
 ):
-    """Upload logo azienda"""
-    # Verifica estensione
-    allowed_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp'}
-    file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in allowed_extensions:
-        raise HTTPException(status_code=400, detail="Formato file non supportato. Usa PNG, JPG, GIF, SVG o WEBP")
-    
-    # Salva file
-    filename = f"logo_{datetime.now().strftime('%Y%m%d_%H%M%S')}{file_ext}"
-    file_path = LOGO_DIR / filename
-    
+    """Upload logo azienda: salva le varianti per interfaccia e PDF (vedi logo_service)"""
+    contenuto = file.file.read(logo_service.DIMENSIONE_MASSIMA_FILE + 1)
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Aggiorna impostazioni
-        settings = get_settings_or_default(db)
-        # Rimuovi vecchio logo se esiste
-        if settings.logo_url and settings.logo_url.startswith("/uploads/logos/"):
-            old_path = UPLOAD_DIR / settings.logo_url.replace("/uploads/", "")
-            if old_path.exists():
-                old_path.unlink()
-        
-        logo_url = f"/uploads/logos/{filename}"
-        settings.logo_url = logo_url
-        db.commit()
-        
-        return {"logo_url": logo_url, "message": "Logo caricato con successo"}
-    except Exception as e:
-        if file_path.exists():
-            file_path.unlink()
+        logo_url = logo_service.salva_logo(contenuto, Path(file.filename or "").suffix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        logger.exception("Errore salvataggio logo: %s", e)
         raise HTTPException(status_code=500, detail=f"Errore durante l'upload: {str(e)}")
 
+    # Aggiorna impostazioni e rimuove i file del logo precedente
+    settings = get_settings_or_default(db)
+    logo_precedente = settings.logo_url
+    settings.logo_url = logo_url
+    db.commit()
+    if logo_precedente != logo_url:
+        logo_service.elimina_logo(logo_precedente, tranne=logo_url)
+
+    return {"logo_url": logo_url, "message": "Logo caricato con successo"}
+
 # --- API CLIENTI (CORRETTA) ---
 
 @app.post("/clienti/", response_model=schemas.ClienteResponse, tags=["Clienti"])
-def create_cliente(cliente: schemas.ClienteCreate, request: Request, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
+def create_cliente(cliente: schemas.ClienteCreate, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
     # 1. Controllo Duplicati (Solo se PIVA o CF sono forniti E non vuoti)
     p_iva_valida = cliente.p_iva and cliente.p_iva.strip()
     cf_valido = cliente.codice_fiscale and cliente.codice_fiscale.strip()
@@ -1232,39 +1200,90 @@ def create_cliente(cliente: schemas.ClienteCreate, request: Request, db: Session
             entity_name=db_cliente.ragione_sociale,
             ip_address=get_client_ip(request)
         )
+        # Coordinate di cliente e sedi per i percorsi dei tecnici (dopo la risposta)
+        background_tasks.add_task(coordinate.geocodifica_cliente, db_cliente.id)
         
-        return db_cliente
+        return get_cliente_completo(db, db_cliente.id)
 
     except Exception as e:
         db.rollback() # Annulla tutto se c'è un errore
-        print(f"Errore DB: {str(e)}")
+        logger.exception("Errore DB: %s", e)
         raise HTTPException(status_code=500, detail=f"Errore interno durante il salvataggio: {str(e)}")
 
-@app.get("/clienti/", response_model=List[schemas.ClienteResponse], tags=["Clienti"])
-def search_clienti(q: str = "", db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
-    query = db.query(models.Cliente)
-    if q:
-        search = f"%{q}%"
-        query = query.filter(
-            or_(
-                models.Cliente.ragione_sociale.ilike(search),
-                models.Cliente.p_iva.ilike(search),
-                models.Cliente.codice_fiscale.ilike(search)
-            )
-        )
-    result = query.order_by(models.Cliente.ragione_sociale.asc()).limit(50).all()
-    print(f"[DEBUG] Endpoint /clienti/ chiamato - query: '{q}', risultati: {len(result)}")
-    return result
+@app.get("/clienti/", response_model=List[schemas.ClienteListItem], tags=["Clienti"])
+def search_clienti(
+    q: str = "",
+    limit: int = Query(ricerca.RICERCA_LIMIT_DEFAULT, ge=1),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """
+    Ricerca clienti per ragione sociale, P.IVA o codice fiscale, ordinata per pertinenza.
+    Restituisce solo i dati anagrafici: sedi e assets si leggono da /clienti/{id}.
+    """
+    return ricerca.cerca_clienti(db, q, limit)
+
+# Dichiarato prima di /clienti/{cliente_id} per non essere interpretato come id
+@app.get("/clienti/lookup", response_model=List[schemas.ClienteLookup], tags=["Clienti"])
+def lookup_clienti(
+    q: str = "",
+    limit: int = Query(20, ge=1),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """
+    Autocomplete clienti: solo id, ragione sociale, P.IVA e città.
+    Legge soltanto queste colonne (indice di copertura ix_clienti_lookup).
+    """
+    return ricerca.cerca_clienti(db, q, limit, colonne=[
+        models.Cliente.id,
+        models.Cliente.ragione_sociale,
+        models.Cliente.p_iva,
+        models.Cliente.citta
+    ])
+
+@app.get("/clienti/vicini", response_model=List[schemas.PuntoVicino], tags=["Clienti"])
+def clienti_vicini(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    limit: int = Query(20, ge=1, le=100),
+    raggio_km: Optional[float] = Query(None, gt=0),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """Clienti e sedi più vicini a una posizione (coordinate geocodificate, distanza in linea d'aria)"""
+    return percorsi.punti_vicini(db, (lat, lon), limit, raggio_km)
+
+def get_cliente_completo(db: Session, cliente_id: int) -> Optional[models.Cliente]:
+    """Cliente con sedi e assets caricati in blocco (selectinload: 3 query in totale)"""
+    return db.query(models.Cliente).options(
+        selectinload(models.Cliente.sedi),
+        selectinload(models.Cliente.assets_noleggio)
+    ).filter(models.Cliente.id == cliente_id).populate_existing().first()
 
 @app.get("/clienti/{cliente_id}", response_model=schemas.ClienteResponse, tags=["Clienti"])
-def get_cliente(cliente_id: int, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
-    """Ottiene un cliente con le sue sedi e assets"""
-    db_cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+def get_cliente(
+    cliente_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(database.get_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """Ottiene un cliente con le sue sedi e assets (304 se invariato, vedi cache_http)"""
+    firma = cache_http.firma(
+        db,
+        db.query(models.Cliente).filter(models.Cliente.id == cliente_id),
+        db.query(models.SedeCliente).filter(models.SedeCliente.cliente_id == cliente_id),
+        db.query(models.AssetCliente).filter(models.AssetCliente.cliente_id == cliente_id),
+    )
+    if not firma[0]:
+        raise HTTPException(status_code=404, detail="Cliente non trovato")
+    invariata = cache_http.non_modificata(request, response, cache_http.etag(firma))
+    if invariata:
+        return invariata
+    db_cliente = get_cliente_completo(db, cliente_id)
     if not db_cliente:
         raise HTTPException(status_code=404, detail="Cliente non trovato")
-    # Forza il caricamento delle relazioni
-    _ = db_cliente.sedi  # Carica sedi
-    _ = db_cliente.assets_noleggio  # Carica assets noleggio
     return db_cliente
 
 @app.get("/clienti/{cliente_id}/sedi", response_model=List[schemas.SedeClienteResponse], tags=["Clienti"])
@@ -1298,7 +1317,8 @@ def preview_cliente_changes(
         "assets_protetti": [],  # Asset con letture copie che NON verranno eliminati
         "sedi_da_aggiornare": [],
         "sedi_da_creare": [],
-        "sedi_da_eliminare": []
+        "sedi_da_eliminare": [],
+        "sedi_in_uso": []  # Sedi non più presenti ma usate da interventi/asset, NON verranno eliminate
     }
     
     # Calcola modifiche cliente
@@ -1313,108 +1333,69 @@ def preview_cliente_changes(
                     "valore_nuovo": value
                 })
     
-    # Calcola modifiche assets
-    if hasattr(cliente, 'assets_noleggio') and cliente.assets_noleggio is not None and len(cliente.assets_noleggio) > 0:
-        assets_esistenti = {a.id: a for a in db.query(models.AssetCliente).filter(models.AssetCliente.cliente_id == cliente_id).all()}
-        assets_con_letture_copie = set()
-        
-        for asset_id in assets_esistenti.keys():
-            letture_count = db.query(models.LetturaCopie).filter(models.LetturaCopie.asset_id == asset_id).count()
-            if letture_count > 0:
-                assets_con_letture_copie.add(asset_id)
-        
-        assets_processati_ids = set()
-        
-        for asset in cliente.assets_noleggio:
-            asset_dict = asset.model_dump() if hasattr(asset, 'model_dump') else asset
-            asset_id = asset_dict.get('id')
-            
-            # Cerca asset esistente
-            db_asset = None
-            if asset_id and asset_id in assets_esistenti:
-                db_asset = assets_esistenti[asset_id]
-                assets_processati_ids.add(asset_id)
-            else:
-                # Cerca per marca/modello/matricola
-                marca = (asset_dict.get('marca') or '').strip()
-                modello = (asset_dict.get('modello') or '').strip()
-                matricola = (asset_dict.get('matricola') or '').strip()
-                seriale = (asset_dict.get('seriale') or '').strip()
-                tipo_asset = asset_dict.get('tipo_asset')
-                
-                for existing_id, existing_asset in assets_esistenti.items():
-                    if existing_id in assets_processati_ids:
-                        continue
-                    if existing_asset.tipo_asset != tipo_asset:
-                        continue
-                    if (existing_asset.marca or '').strip().lower() != marca.lower() or (existing_asset.modello or '').strip().lower() != modello.lower():
-                        continue
-                    
-                    if tipo_asset == "Printing":
-                        existing_matricola = (existing_asset.matricola or '').strip()
-                        if (matricola and existing_matricola and matricola.lower() == existing_matricola.lower()) or (not matricola and not existing_matricola):
-                            db_asset = existing_asset
-                            assets_processati_ids.add(existing_id)
-                            break
-                    elif tipo_asset == "IT":
-                        existing_seriale = (existing_asset.seriale or '').strip()
-                        if (seriale and existing_seriale and seriale.lower() == existing_seriale.lower()) or (not seriale and not existing_seriale):
-                            db_asset = existing_asset
-                            assets_processati_ids.add(existing_id)
-                            break
-            
-            if db_asset:
-                # Asset da aggiornare
-                asset_modifiche = []
-                for key, value in asset_dict.items():
-                    if key != 'id' and hasattr(db_asset, key):
-                        old_value = getattr(db_asset, key)
-                        # Ignora contatori iniziali se non specificati esplicitamente
-                        if key in ['contatore_iniziale_bn', 'contatore_iniziale_colore'] and (value is None or value == 0):
-                            continue
-                        if old_value != value:
-                            asset_modifiche.append({
-                                "campo": key,
-                                "valore_precedente": old_value,
-                                "valore_nuovo": value
-                            })
-                
-                if asset_modifiche:
-                    modifiche["assets_da_aggiornare"].append({
-                        "id": db_asset.id,
-                        "nome": f"{db_asset.marca or ''} {db_asset.modello or ''} {db_asset.matricola or db_asset.seriale or ''}".strip(),
-                        "modifiche": asset_modifiche,
-                        "ha_letture_copie": db_asset.id in assets_con_letture_copie
-                    })
-            else:
-                # Nuovo asset da creare
-                modifiche["assets_da_creare"].append({
-                    "nome": f"{asset_dict.get('marca') or ''} {asset_dict.get('modello') or ''} {asset_dict.get('matricola') or asset_dict.get('seriale') or ''}".strip()
-                })
-        
-        # Asset da eliminare
-        for asset_id, asset in assets_esistenti.items():
-            if asset_id not in assets_processati_ids:
-                if asset_id in assets_con_letture_copie:
-                    # Asset protetto (ha letture copie)
-                    letture_count = db.query(models.LetturaCopie).filter(models.LetturaCopie.asset_id == asset_id).count()
-                    modifiche["assets_protetti"].append({
-                        "id": asset.id,
-                        "nome": f"{asset.marca or ''} {asset.modello or ''} {asset.matricola or asset.seriale or ''}".strip(),
-                        "letture_copie_count": letture_count,
-                        "motivo": f"Ha {letture_count} letture copie associate - NON verrà eliminato per preservare i dati storici"
-                    })
-                else:
-                    # Asset da eliminare
-                    modifiche["assets_da_eliminare"].append({
-                        "id": asset.id,
-                        "nome": f"{asset.marca or ''} {asset.modello or ''} {asset.matricola or asset.seriale or ''}".strip()
-                    })
+    # Calcola modifiche assets e sedi con lo stesso diff usato da update_cliente.
+    # I conteggi (letture per asset, utilizzo sedi) arrivano da una query raggruppata per tipo;
+    # il piano resta in cache per il salvataggio che segue con lo stesso payload.
+    dati_cliente = {
+        campo: cliente_dict.get(campo, getattr(db_cliente, campo))
+        for campo in ('indirizzo', 'citta', 'cap', 'email_amministrazione')
+    }
+    diff_assets, diff_sedi, piano = cliente_sync.calcola_piano(db, cliente_id, cliente, dati_cliente, con_conteggi=True)
+    cliente_sync.salva_piano(cliente_sync.chiave_piano(cliente_id, cliente), piano)
+    letture_count = piano["conteggi"]["letture_assets"]
+    utilizzo_sedi = piano["conteggi"]["utilizzo_sedi"]
+    
+    for db_asset, cambiati in diff_assets.da_aggiornare:
+        modifiche["assets_da_aggiornare"].append({
+            "id": db_asset.id,
+            "nome": cliente_sync.nome_asset(db_asset),
+            "modifiche": [
+                {"campo": key, "valore_precedente": getattr(db_asset, key), "valore_nuovo": value}
+                for key, value in cambiati.items()
+            ],
+            "ha_letture_copie": db_asset.id in diff_assets.con_letture_ids
+        })
+    for asset_dict in diff_assets.da_creare:
+        modifiche["assets_da_creare"].append({"nome": cliente_sync.nome_asset(asset_dict)})
+    for asset in diff_assets.da_eliminare:
+        modifiche["assets_da_eliminare"].append({"id": asset.id, "nome": cliente_sync.nome_asset(asset)})
+    
+    for asset in diff_assets.protetti:
+        count = letture_count.get(asset.id, 0)
+        modifiche["assets_protetti"].append({
+            "id": asset.id,
+            "nome": cliente_sync.nome_asset(asset),
+            "letture_copie_count": count,
+            "motivo": f"Ha {count} letture copie associate - NON verrà eliminato per preservare i dati storici"
+        })
+    
+    for db_sede, cambiati in diff_sedi.da_aggiornare:
+        modifiche["sedi_da_aggiornare"].append({
+            "id": db_sede.id,
+            "nome": db_sede.nome_sede,
+            "modifiche": [
+                {"campo": key, "valore_precedente": getattr(db_sede, key), "valore_nuovo": value}
+                for key, value in cambiati.items()
+            ]
+        })
+    for sede_dict in diff_sedi.da_creare:
+        modifiche["sedi_da_creare"].append({"nome": sede_dict.get("nome_sede")})
+    for sede in diff_sedi.da_eliminare:
+        modifiche["sedi_da_eliminare"].append({"id": sede.id, "nome": sede.nome_sede})
+    for sede in diff_sedi.in_uso:
+        utilizzo = utilizzo_sedi.get(sede.id, {"interventi": 0, "assets": 0})
+        modifiche["sedi_in_uso"].append({
+            "id": sede.id,
+            "nome": sede.nome_sede,
+            "interventi_count": utilizzo["interventi"],
+            "assets_count": utilizzo["assets"],
+            "motivo": f"Usata da {utilizzo['interventi']} interventi e {utilizzo['assets']} asset - NON verrà eliminata"
+        })
     
     return modifiche
 
 @app.put("/clienti/{cliente_id}", response_model=schemas.ClienteResponse, tags=["Clienti"])
-def update_cliente(cliente_id: int, cliente: schemas.ClienteCreate, request: Request, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
+def update_cliente(cliente_id: int, cliente: schemas.ClienteCreate, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
     """Aggiorna un cliente e le sue sedi"""
     db_cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
     if not db_cliente:
@@ -1447,284 +1428,33 @@ def update_cliente(cliente_id: int, cliente: schemas.ClienteCreate, request: Req
             update_data['codice_sdi'] = cliente_dict_full['codice_sdi'] or ''
         for key, value in update_data.items():
             setattr(db_cliente, key, value)
-        
-        # PRIMA: Gestione assets (devono essere gestiti prima delle sedi per evitare violazioni FK)
-        # IMPORTANTE: Non eliminare gli asset esistenti per preservare contatori iniziali e letture copie
-        # Ottieni gli ID delle sedi che saranno referenziate dai nuovi assets
-        sedi_referenziate_da_nuovi_assets = set()
-        
-        if hasattr(cliente, 'assets_noleggio') and cliente.assets_noleggio is not None and len(cliente.assets_noleggio) > 0:
-            # Carica gli asset esistenti per questo cliente
-            assets_esistenti = {a.id: a for a in db.query(models.AssetCliente).filter(models.AssetCliente.cliente_id == cliente_id).all()}
-            
-            # Ottieni gli ID degli asset che hanno letture copie associate (non possono essere eliminati)
-            assets_con_letture_copie = set()
-            for asset_id in assets_esistenti.keys():
-                letture_count = db.query(models.LetturaCopie).filter(models.LetturaCopie.asset_id == asset_id).count()
-                if letture_count > 0:
-                    assets_con_letture_copie.add(asset_id)
-            
-            # Processa gli asset nuovi/aggiornati
-            # IMPORTANTE: Usa anche marca/modello/matricola per identificare asset esistenti per evitare duplicazioni
-            assets_processati_ids = set()
-            for asset in cliente.assets_noleggio:
-                asset_dict = asset.model_dump() if hasattr(asset, 'model_dump') else asset
-                # Rimuovi eventuali campi non presenti nel modello
-                asset_dict.pop('tipo_configurazione_bn', None)
-                asset_dict.pop('tipo_configurazione_colore', None)
-                # Assicurati che sede_id sia null se 0 o non valido
-                if asset_dict.get('sede_id') == 0 or asset_dict.get('sede_id') == '0':
-                    asset_dict['sede_id'] = None
-                
-                asset_id = asset_dict.get('id')
-                sede_id = asset_dict.get('sede_id')
-                if sede_id and sede_id != 0 and sede_id != '0':
-                    sedi_referenziate_da_nuovi_assets.add(int(sede_id))
-                
-                db_asset = None
-                asset_trovato_per_id = False
-                
-                # Prima prova a trovare per ID
-                if asset_id and asset_id in assets_esistenti:
-                    db_asset = assets_esistenti[asset_id]
-                    assets_processati_ids.add(asset_id)
-                    asset_trovato_per_id = True
-                else:
-                    # Se non trovato per ID, cerca per marca/modello/matricola (per evitare duplicazioni)
-                    marca = (asset_dict.get('marca') or '').strip()
-                    modello = (asset_dict.get('modello') or '').strip()
-                    matricola = (asset_dict.get('matricola') or '').strip()
-                    seriale = (asset_dict.get('seriale') or '').strip()
-                    tipo_asset = asset_dict.get('tipo_asset')
-                    
-                    # Cerca asset esistente con stesso tipo, marca, modello e matricola/seriale
-                    for existing_id, existing_asset in assets_esistenti.items():
-                        if existing_id in assets_processati_ids:
-                            continue  # Già processato
-                        
-                        # Confronta tipo asset
-                        if existing_asset.tipo_asset != tipo_asset:
-                            continue
-                        
-                        # Confronta marca e modello
-                        existing_marca = (existing_asset.marca or '').strip()
-                        existing_modello = (existing_asset.modello or '').strip()
-                        
-                        if marca.lower() != existing_marca.lower() or modello.lower() != existing_modello.lower():
-                            continue
-                        
-                        # Per Printing: confronta matricola
-                        if tipo_asset == "Printing":
-                            existing_matricola = (existing_asset.matricola or '').strip()
-                            if matricola and existing_matricola:
-                                if matricola.lower() == existing_matricola.lower():
-                                    db_asset = existing_asset
-                                    assets_processati_ids.add(existing_id)
-                                    asset_trovato_per_id = True
-                                    print(f"[UPDATE CLIENTE] Asset trovato per marca/modello/matricola: {marca} {modello} {matricola} (ID: {existing_id})")
-                                    break
-                            elif not matricola and not existing_matricola:
-                                # Entrambi senza matricola, considera match se marca/modello corrispondono
-                                db_asset = existing_asset
-                                assets_processati_ids.add(existing_id)
-                                asset_trovato_per_id = True
-                                print(f"[UPDATE CLIENTE] Asset trovato per marca/modello (senza matricola): {marca} {modello} (ID: {existing_id})")
-                                break
-                        # Per IT: confronta seriale
-                        elif tipo_asset == "IT":
-                            existing_seriale = (existing_asset.seriale or '').strip()
-                            if seriale and existing_seriale:
-                                if seriale.lower() == existing_seriale.lower():
-                                    db_asset = existing_asset
-                                    assets_processati_ids.add(existing_id)
-                                    asset_trovato_per_id = True
-                                    print(f"[UPDATE CLIENTE] Asset trovato per marca/modello/seriale: {marca} {modello} {seriale} (ID: {existing_id})")
-                                    break
-                            elif not seriale and not existing_seriale:
-                                # Entrambi senza seriale, considera match se marca/modello corrispondono
-                                db_asset = existing_asset
-                                assets_processati_ids.add(existing_id)
-                                asset_trovato_per_id = True
-                                print(f"[UPDATE CLIENTE] Asset trovato per marca/modello (senza seriale): {marca} {modello} (ID: {existing_id})")
-                                break
-                
-                if db_asset:
-                    # Aggiorna asset esistente - PRESERVA i contatori iniziali e le letture copie
-                    # Salva i contatori iniziali esistenti prima dell'aggiornamento
-                    contatore_bn_originale = db_asset.contatore_iniziale_bn
-                    contatore_colore_originale = db_asset.contatore_iniziale_colore
-                    
-                    # Aggiorna tutti i campi tranne i contatori iniziali (se non specificati esplicitamente)
-                    for key, value in asset_dict.items():
-                        if key != 'id' and hasattr(db_asset, key):
-                            # Se il campo è un contatore iniziale e il valore è 0 o None, preserva il valore esistente
-                            if key == 'contatore_iniziale_bn' and (value is None or value == 0):
-                                # Preserva il valore esistente se non viene specificato esplicitamente
-                                continue
-                            elif key == 'contatore_iniziale_colore' and (value is None or value == 0):
-                                # Preserva il valore esistente se non viene specificato esplicitamente
-                                continue
-                            else:
-                                setattr(db_asset, key, value)
-                    
-                    # Se i contatori iniziali non sono stati specificati nel payload, preservali
-                    if 'contatore_iniziale_bn' not in asset_dict or asset_dict.get('contatore_iniziale_bn') is None or asset_dict.get('contatore_iniziale_bn') == 0:
-                        db_asset.contatore_iniziale_bn = contatore_bn_originale
-                    if 'contatore_iniziale_colore' not in asset_dict or asset_dict.get('contatore_iniziale_colore') is None or asset_dict.get('contatore_iniziale_colore') == 0:
-                        db_asset.contatore_iniziale_colore = contatore_colore_originale
-                else:
-                    # Crea nuovo asset solo se non trovato né per ID né per marca/modello/matricola
-                    asset_dict.pop('id', None)  # Rimuovi ID se presente ma non valido
-                    db_asset = models.AssetCliente(**asset_dict, cliente_id=db_cliente.id)
-                    db.add(db_asset)
-                    print(f"[UPDATE CLIENTE] Nuovo asset creato: {asset_dict.get('marca')} {asset_dict.get('modello')} {asset_dict.get('matricola') or asset_dict.get('seriale')}")
-            
-            # Elimina solo gli asset che non sono più nella lista E non hanno letture copie associate
-            for asset_id, asset in assets_esistenti.items():
-                if asset_id not in assets_processati_ids and asset_id not in assets_con_letture_copie:
-                    # L'asset non è più nella lista e non ha letture copie, può essere eliminato
-                    db.delete(asset)
-        elif not hasattr(cliente, 'assets_noleggio') or not cliente.has_noleggio or (hasattr(cliente, 'assets_noleggio') and (cliente.assets_noleggio is None or len(cliente.assets_noleggio) == 0)):
-            # Se noleggio è disabilitato o non ci sono assets, elimina solo quelli senza letture copie
-            assets_esistenti = db.query(models.AssetCliente).filter(models.AssetCliente.cliente_id == cliente_id).all()
-            for asset in assets_esistenti:
-                letture_count = db.query(models.LetturaCopie).filter(models.LetturaCopie.asset_id == asset.id).count()
-                if letture_count == 0:
-                    # Nessuna lettura copie associata, può essere eliminato
-                    db.delete(asset)
-                else:
-                    # Ha letture copie associate, NON eliminare (preserva i dati storici)
-                    print(f"[UPDATE CLIENTE] Asset {asset.id} ({asset.marca} {asset.modello}) ha {letture_count} letture copie associate - NON eliminato")
-        
-        # POI: Gestione sedi (ora che gli assets sono stati gestiti)
-        # Gestione sede legale operativa
-        if cliente.sede_legale_operativa:
-            # Verifica se esiste già una sede legale per questo cliente
-            sede_legale_esistente = db.query(models.SedeCliente).filter(
-                models.SedeCliente.cliente_id == cliente_id,
-                models.SedeCliente.nome_sede == "Sede Legale/Centrale"
-            ).first()
-            
-            if not sede_legale_esistente:
-                # Crea la sede legale come sede operativa
-                indirizzo_completo = f"{db_cliente.indirizzo}, {db_cliente.citta or ''} {db_cliente.cap or ''}".strip()
-                db_sede_legale = models.SedeCliente(
-                    cliente_id=db_cliente.id,
-                    nome_sede="Sede Legale/Centrale",
-                    indirizzo_completo=indirizzo_completo,
-                    citta=db_cliente.citta,
-                    cap=db_cliente.cap,
-                    telefono=None,
-                    email=db_cliente.email_amministrazione
-                )
-                db.add(db_sede_legale)
-            else:
-                # Aggiorna la sede legale esistente con i dati del cliente
-                sede_legale_esistente.indirizzo_completo = f"{db_cliente.indirizzo}, {db_cliente.citta or ''} {db_cliente.cap or ''}".strip()
-                sede_legale_esistente.citta = db_cliente.citta
-                sede_legale_esistente.cap = db_cliente.cap
-                sede_legale_esistente.email = db_cliente.email_amministrazione
-        else:
-            # Se sede_legale_operativa è disabilitata, elimina la sede legale se non è in uso
-            sede_legale_esistente = db.query(models.SedeCliente).filter(
-                models.SedeCliente.cliente_id == cliente_id,
-                models.SedeCliente.nome_sede == "Sede Legale/Centrale"
-            ).first()
-            
-            if sede_legale_esistente:
-                # Verifica se la sede legale è in uso (da interventi o assets)
-                sede_in_uso_interventi = db.query(models.Intervento.sede_id).filter(
-                    models.Intervento.sede_id == sede_legale_esistente.id
-                ).first()
-                sede_in_uso_assets = db.query(models.AssetCliente.sede_id).filter(
-                    models.AssetCliente.sede_id == sede_legale_esistente.id
-                ).first()
-                
-                if not sede_in_uso_interventi and not sede_in_uso_assets:
-                    # La sede legale non è in uso, può essere eliminata
-                    db.delete(sede_legale_esistente)
-        
-        if cliente.has_multisede and cliente.sedi is not None:
-            # Ottieni le sedi esistenti
-            sedi_esistenti = {s.id: s for s in db.query(models.SedeCliente).filter(models.SedeCliente.cliente_id == cliente_id).all()}
-            # Ottieni gli ID delle sedi referenziate da interventi (non possono essere eliminate)
-            sedi_in_uso_result = db.query(models.Intervento.sede_id).filter(
-                models.Intervento.sede_id.isnot(None)
-            ).distinct().all()
-            sedi_in_uso_interventi = {s[0] for s in sedi_in_uso_result if s[0] in sedi_esistenti}
-            # Unisci le sedi in uso (da interventi e dai nuovi assets)
-            sedi_in_uso = sedi_in_uso_interventi | sedi_referenziate_da_nuovi_assets
-            
-            # Processa le sedi nuove/aggiornate (escludendo la sede legale se è gestita automaticamente)
-            sedi_processate_ids = set()
-            for sede_data in cliente.sedi:
-                sede_dict = sede_data.model_dump() if hasattr(sede_data, 'model_dump') else sede_data
-                # Salta la sede legale se è gestita automaticamente
-                if cliente.sede_legale_operativa and sede_dict.get('nome_sede') == "Sede Legale/Centrale":
-                    continue
-                    
-                sede_id = sede_dict.get('id')
-                
-                if sede_id and sede_id in sedi_esistenti:
-                    # Aggiorna sede esistente tramite ID
-                    db_sede = sedi_esistenti[sede_id]
-                    sedi_processate_ids.add(sede_id)
-                    for key, value in sede_dict.items():
-                        if key != 'id' and hasattr(db_sede, key):
-                            setattr(db_sede, key, value)
-                else:
-                    # Nessun ID o ID non esistente: verifica se esiste già una sede con stesso nome e indirizzo
-                    nome_sede = sede_dict.get('nome_sede')
-                    indirizzo_completo = sede_dict.get('indirizzo_completo')
-                    
-                    # Cerca una sede esistente con stesso nome e indirizzo per questo cliente
-                    sede_esistente_per_nome = None
-                    if nome_sede and indirizzo_completo:
-                        sede_esistente_per_nome = db.query(models.SedeCliente).filter(
-                            models.SedeCliente.cliente_id == cliente_id,
-                            models.SedeCliente.nome_sede == nome_sede,
-                            models.SedeCliente.indirizzo_completo == indirizzo_completo
-                        ).first()
-                    
-                    if sede_esistente_per_nome:
-                        # Aggiorna la sede esistente invece di crearne una nuova
-                        sedi_processate_ids.add(sede_esistente_per_nome.id)
-                        for key, value in sede_dict.items():
-                            if key != 'id' and hasattr(sede_esistente_per_nome, key):
-                                setattr(sede_esistente_per_nome, key, value)
-                    else:
-                        # Crea nuova sede solo se non esiste già una con stesso nome e indirizzo
-                        sede_dict.pop('id', None)  # Rimuovi ID se presente ma non valido
-                        db_sede = models.SedeCliente(**sede_dict, cliente_id=db_cliente.id)
-                        db.add(db_sede)
-            
-            # Elimina solo le sedi che non sono in uso e non sono più nella lista
-            for sede_id, sede in sedi_esistenti.items():
-                if sede_id not in sedi_in_uso and sede_id not in sedi_processate_ids:
-                    db.delete(sede)
-        elif not cliente.has_multisede:
-            # Se multisede è disabilitato, elimina solo le sedi non referenziate
-            sedi_in_uso_interventi_result = db.query(models.Intervento.sede_id).filter(
-                models.Intervento.sede_id.isnot(None)
-            ).distinct().all()
-            sedi_in_uso_interventi = {s[0] for s in sedi_in_uso_interventi_result}
-            # Unisci le sedi in uso (da interventi e dai nuovi assets)
-            sedi_in_uso = sedi_in_uso_interventi | sedi_referenziate_da_nuovi_assets
-            
-            # Elimina solo le sedi non in uso
-            if sedi_in_uso:
-                db.query(models.SedeCliente).filter(
-                    models.SedeCliente.cliente_id == cliente_id,
-                    ~models.SedeCliente.id.in_(sedi_in_uso)
-                ).delete(synchronize_session=False)
-            else:
-                # Nessuna sede in uso, elimina tutte
-                db.query(models.SedeCliente).filter(
-                    models.SedeCliente.cliente_id == cliente_id
-                ).delete()
+        # Un indirizzo modificato azzera le coordinate (nuova geocodifica in background)
+        if any(getattr(cliente_originale, campo) != getattr(db_cliente, campo) for campo in coordinate.CAMPI_INDIRIZZO[models.Cliente]):
+            for key, value in coordinate.COORDINATE_AZZERATE.items():
+                setattr(db_cliente, key, value)
+        
+        # Gestione assets e sedi: riusa il piano calcolato dalla preview con lo stesso payload (se ancora in cache),
+        # altrimenti lo calcola ora. Gli asset esistenti vengono aggiornati (non ricreati) per preservare contatori
+        # iniziali e letture copie; asset con letture e sedi in uso non vengono mai eliminati.
+        # Il piano in cache è scartato se sedi o asset sono cambiati dopo la preview (es. salvati da un altro worker).
+        piano = cliente_sync.leggi_piano(cliente_sync.chiave_piano(cliente_id, cliente), consuma=True)
+        if piano is not None and not cliente_sync.piano_attuale(db, cliente_id, piano):
+            logger.info("Piano della preview superato per il cliente %s: ricalcolato", cliente_id)
+            piano = None
+        if piano is None:
+            dati_cliente = {
+                'indirizzo': db_cliente.indirizzo,
+                'citta': db_cliente.citta,
+                'cap': db_cliente.cap,
+                'email_amministrazione': db_cliente.email_amministrazione
+            }
+            _, _, piano = cliente_sync.calcola_piano(db, cliente_id, cliente, dati_cliente)
+        cliente_sync.applica_piano(db, cliente_id, piano)
         
         db.commit()
         db.refresh(db_cliente)
+        # I piani in cache per questo cliente non sono più validi
+        cliente_sync.invalida_piani(cliente_id)
         
         # Log audit con modifiche
         fields_to_track = ['ragione_sociale', 'indirizzo', 'citta', 'cap', 'p_iva', 'codice_fiscale', 
@@ -1741,11 +1471,13 @@ def update_cliente(cliente_id: int, cliente: schemas.ClienteCreate, request: Req
             changes=changes if changes else None,
             ip_address=get_client_ip(request)
         )
+        # Nuova geocodifica degli indirizzi modificati o nuovi (dopo la risposta)
+        background_tasks.add_task(coordinate.geocodifica_cliente, db_cliente.id)
         
-        return db_cliente
+        return get_cliente_completo(db, db_cliente.id)
     except Exception as e:
         db.rollback()
-        print(f"Errore aggiornamento cliente: {str(e)}")
+        logger.exception("Errore aggiornamento cliente: %s", e)
         raise HTTPException(status_code=500, detail=f"Errore interno durante l'aggiornamento: {str(e)}")
 
 # --- API MAGAZZINO ---
@@ -1758,6 +1490,8 @@ def create_prodotto(prodotto: schemas.ProdottoCreate, request: Request, db: Sess
 
     db_prodotto = models.ProdottoMagazzino(**prodotto.model_dump())
     db.add(db_prodotto)
+    db.flush()
+    magazzino_service.registra_carico_iniziale(db, db_prodotto, utente_id=current_user.id)
     db.commit()
     db.refresh(db_prodotto)
     
@@ -1775,17 +1509,41 @@ def create_prodotto(prodotto: schemas.ProdottoCreate, request: Request, db: Sess
     return db_prodotto
 
 @app.get("/magazzino/", response_model=List[schemas.ProdottoResponse], tags=["Magazzino"])
-def read_magazzino(q: str = "", skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
-    query = db.query(models.ProdottoMagazzino)
-    if q:
-        search = f"%{q}%"
-        query = query.filter(
-            or_(
-                models.ProdottoMagazzino.codice_articolo.ilike(search),
-                models.ProdottoMagazzino.descrizione.ilike(search)
-            )
-        )
-    return query.order_by(models.ProdottoMagazzino.descrizione.asc()).offset(skip).limit(limit).all()
+def read_magazzino(
+    q: str = "",
+    categoria: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(100, ge=1),
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """Ricerca articoli per codice o descrizione, ordinati per pertinenza e disponibilità"""
+    return ricerca.cerca_prodotti(db, q, categoria=categoria, skip=skip, limit=limit)
+
+@app.get("/magazzino/verifica-giacenze", tags=["Magazzino"])
+def verifica_giacenze_magazzino(
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """
+    Articoli la cui giacenza non coincide con la somma dei movimenti registrati.
+    Solo Admin e SuperAdmin possono accedere.
+    """
+    differenze = magazzino_service.verifica_giacenze(db)
+    return {"coerente": not differenze, "differenze": differenze}
+
+@app.get("/magazzino/{prodotto_id}/movimenti", response_model=List[schemas.MovimentoMagazzinoResponse], tags=["Magazzino"])
+def read_movimenti_prodotto(
+    prodotto_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """Movimenti di magazzino di un articolo (più recenti per primi)"""
+    return db.query(models.MovimentoMagazzino).filter(
+        models.MovimentoMagazzino.prodotto_id == prodotto_id
+    ).order_by(desc(models.MovimentoMagazzino.created_at), desc(models.MovimentoMagazzino.id)).offset(skip).limit(limit).all()
 
 @app.put("/magazzino/{prodotto_id}", response_model=schemas.ProdottoResponse, tags=["Magazzino"])
 def update_prodotto(prodotto_id: int, prodotto: schemas.ProdottoUpdate, request: Request, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
@@ -1814,8 +1572,13 @@ def update_prodotto(prodotto_id: int, prodotto: schemas.ProdottoUpdate, request:
         if existing:
             raise HTTPException(status_code=400, detail="Codice articolo già esistente per un altro prodotto")
     
+    # La giacenza non si sovrascrive direttamente: la rettifica viene registrata nei movimenti
+    nuova_giacenza = update_data.pop('giacenza', None)
     for key, value in update_data.items():
         setattr(db_prodotto, key, value)
+    if nuova_giacenza is not None:
+        db.flush()
+        magazzino_service.rettifica_giacenza(db, prodotto_id, nuova_giacenza, utente_id=current_user.id)
     
     db.commit()
     db.refresh(db_prodotto)
@@ -1925,25 +1688,25 @@ def create_intervento(
                 # Assicurati che la modifica sia tracciata dalla sessione
                 db.add(db_cliente)
                 
-                print(f"[CONTRATTO ASSISTENZA] Cliente {db_cliente.id} - Chiamate utilizzate: {chiamate_utilizzate_precedenti} -> {chiamate_utilizzate_attuali} (limite: {db_cliente.limite_chiamate_contratto}, rimanenti: {chiamate_rimanenti})")
+                logger.debug("[CONTRATTO ASSISTENZA] Cliente %s - Chiamate utilizzate: %s -> %s (limite: %s, rimanenti: %s)", db_cliente.id, chiamate_utilizzate_precedenti, chiamate_utilizzate_attuali, db_cliente.limite_chiamate_contratto, chiamate_rimanenti)
                 
                 # Se supera il limite, applica il costo fuori limite
                 if chiamate_utilizzate_attuali > db_cliente.limite_chiamate_contratto:
                     costo_chiamata = db_cliente.costo_chiamata_fuori_limite or 0.0
-                    print(f"[CONTRATTO ASSISTENZA] Limite superato! Applicato costo fuori limite: €{costo_chiamata}")
+                    logger.debug("[CONTRATTO ASSISTENZA] Limite superato! Applicato costo fuori limite: €%s", costo_chiamata)
                 else:
                     costo_chiamata = 0.0
-                    print(f"[CONTRATTO ASSISTENZA] Chiamata inclusa nel contratto (gratuita)")
+                    logger.debug("[CONTRATTO ASSISTENZA] Chiamata inclusa nel contratto (gratuita)")
             else:
                 # Nessun limite: chiamata gratuita
                 costo_chiamata = 0.0
-                print(f"[CONTRATTO ASSISTENZA] Cliente {db_cliente.id} - Nessun limite chiamate, chiamata gratuita")
+                logger.debug("[CONTRATTO ASSISTENZA] Cliente %s - Nessun limite chiamate, chiamata gratuita", db_cliente.id)
             tariffa_oraria = 0.0
         elif is_printing_with_noleggio:
             # Intervento Printing con prodotti a noleggio: non scalare chiamate contratto assistenza
             costo_chiamata = 0.0
             tariffa_oraria = 0.0
-            print(f"[NOLEGGIO PRINTING] Intervento Printing con prodotti a noleggio - Chiamate contratto assistenza NON scalate")
+            logger.debug("[NOLEGGIO PRINTING] Intervento Printing con prodotti a noleggio - Chiamate contratto assistenza NON scalate")
         else:
             # Cliente senza contratto: applica tariffe standard
             if intervento.flag_diritto_chiamata:
@@ -1997,7 +1760,7 @@ def create_intervento(
         if has_noleggio_assets:
             tariffa_oraria = 0.0
             costo_chiamata = 0.0
-            print(f"[NOLEGGIO] Rilevati prodotti a noleggio - Tariffa oraria e costo chiamata azzerati")
+            logger.debug("[NOLEGGIO] Rilevati prodotti a noleggio - Tariffa oraria e costo chiamata azzerati")
         
         # 4. Creazione Testata
         intervento_data = intervento.model_dump(exclude={"dettagli", "ricambi"})
@@ -2039,11 +1802,14 @@ def create_intervento(
                 prodotto_id=ricambio.prodotto_id 
             )
             db.add(db_ricambio)
-            
-            if ricambio.prodotto_id:
-                prod_magazzino = db.query(models.ProdottoMagazzino).filter(models.ProdottoMagazzino.id == ricambio.prodotto_id).first()
-                if prod_magazzino:
-                    prod_magazzino.giacenza -= ricambio.quantita
+        
+        # Scarico atomico di tutti i ricambi con una sola UPDATE (registrato nei movimenti di magazzino)
+        magazzino_service.scarica_ricambi(
+            db,
+            [(ricambio.prodotto_id, ricambio.quantita) for ricambio in intervento.ricambi],
+            intervento_id=db_intervento.id,
+            utente_id=current_user.id
+        )
         
         db.commit()
         db.refresh(db_intervento)
@@ -2075,21 +1841,21 @@ def create_intervento(
                     models.LetturaCopie.intervento_id == db_intervento.id
                 ).count()
                 
-                print(f"[CREATE EMAIL PDF] Prelievo copie rilevato - Letture copie trovate: {letture_copie_count}")
+                logger.debug("[CREATE EMAIL PDF] Prelievo copie rilevato - Letture copie trovate: %s", letture_copie_count)
                 
                 if letture_copie_count == 0:
-                    print(f"[CREATE EMAIL PDF] Prelievo copie senza letture copie - Email NON inviata durante creazione")
-                    print(f"[CREATE EMAIL PDF] L'email verrà inviata durante l'update quando le letture copie saranno disponibili")
+                    logger.debug("[CREATE EMAIL PDF] Prelievo copie senza letture copie - Email NON inviata durante creazione")
+                    logger.debug("[CREATE EMAIL PDF] L'email verrà inviata durante l'update quando le letture copie saranno disponibili")
                     # Non inviare email durante la creazione per prelievi copie senza letture
                     pass
                 else:
                     # Se ci sono già letture copie, procedi con l'invio
-                    print(f"[CREATE EMAIL PDF] Prelievo copie con {letture_copie_count} letture copie - Generazione PDF per email")
+                    logger.debug("[CREATE EMAIL PDF] Prelievo copie con %s letture copie - Generazione PDF per email", letture_copie_count)
                     
                     # Ricarica completamente l'intervento dalla sessione per assicurarsi che tutte le modifiche siano salvate
                     db_intervento_fresh = db.query(models.Intervento).filter(models.Intervento.id == db_intervento.id).first()
                     if not db_intervento_fresh:
-                        print(f"[CREATE EMAIL PDF] ERRORE: Intervento {db_intervento.id} non trovato dopo il commit!")
+                        logger.error("[CREATE EMAIL PDF] Intervento %s non trovato dopo il commit!", db_intervento.id)
                         raise Exception(f"Intervento {db_intervento.id} non trovato")
                     
                     # Forza il caricamento delle relazioni
@@ -2101,7 +1867,7 @@ def create_intervento(
                         models.LetturaCopie.intervento_id == db_intervento_fresh.id
                     ).all()
                     
-                    print(f"[CREATE EMAIL PDF] Letture copie caricate dal DB: {len(db_intervento_fresh.letture_copie)}")
+                    logger.debug("[CREATE EMAIL PDF] Letture copie caricate dal DB: %s", len(db_intervento_fresh.letture_copie))
                     
                     # Carica informazioni asset per ogni lettura copie
                     for lettura in db_intervento_fresh.letture_copie:
@@ -2112,7 +1878,7 @@ def create_intervento(
                                 lettura.asset_marca = asset.marca or ''
                                 lettura.asset_modello = asset.modello or ''
                                 lettura.asset_marca_modello = f"{asset.marca or ''} {asset.modello or ''}".strip() or 'N/A'
-                                print(f"[CREATE EMAIL PDF] Asset caricato per lettura {lettura.id}: {lettura.asset_marca_modello}")
+                                logger.debug("[CREATE EMAIL PDF] Asset caricato per lettura %s: %s", lettura.id, lettura.asset_marca_modello)
                     
                     # Ricarica anche le impostazioni azienda
                     settings_refreshed = get_settings_or_default(db)
@@ -2128,7 +1894,7 @@ def create_intervento(
                     
                     if cliente and cliente.email_amministrazione:
                         background_tasks.add_task(
-                            send_email_background,
+                            metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                             cliente.email_amministrazione,
                             pdf_bytes,
                             db_intervento_fresh.numero_relazione,
@@ -2144,7 +1910,7 @@ def create_intervento(
                         sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento_fresh.sede_id).first()
                         if sede and sede.email:
                             background_tasks.add_task(
-                                send_email_background,
+                                metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                                 sede.email,
                                 pdf_bytes,
                                 db_intervento_fresh.numero_relazione,
@@ -2159,7 +1925,7 @@ def create_intervento(
                     email_azienda = settings_refreshed.email_notifiche_scadenze or settings_refreshed.email
                     if email_azienda:
                         background_tasks.add_task(
-                            send_email_background,
+                            metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                             email_azienda,
                             pdf_bytes,
                             db_intervento_fresh.numero_relazione,
@@ -2171,7 +1937,7 @@ def create_intervento(
                             db
                         )
                     
-                    print(f"[CREATE EMAIL PDF] PDF generato e email programmate per RIT {db_intervento_fresh.numero_relazione}")
+                    logger.info("[CREATE EMAIL PDF] PDF generato e email programmate per RIT %s", db_intervento_fresh.numero_relazione)
             else:
                 # Per interventi normali (non prelievo copie), invia email normalmente
                 # Ricarica l'intervento con tutte le relazioni per generare il PDF corretto
@@ -2197,7 +1963,7 @@ def create_intervento(
                 # Email al cliente (se ha email amministrazione)
                 if cliente and cliente.email_amministrazione:
                     background_tasks.add_task(
-                        send_email_background,
+                        metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                         cliente.email_amministrazione,
                         pdf_bytes,
                         db_intervento.numero_relazione,
@@ -2214,7 +1980,7 @@ def create_intervento(
                     sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento.sede_id).first()
                     if sede and sede.email:
                         background_tasks.add_task(
-                            send_email_background,
+                            metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                             sede.email,
                             pdf_bytes,
                             db_intervento.numero_relazione,
@@ -2231,7 +1997,7 @@ def create_intervento(
                 email_azienda = settings_refreshed.email_notifiche_scadenze or settings_refreshed.email
                 if email_azienda:
                     background_tasks.add_task(
-                        send_email_background,
+                        metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                         email_azienda,
                         pdf_bytes,
                         db_intervento.numero_relazione,
@@ -2243,9 +2009,7 @@ def create_intervento(
                         db
                     )
         except Exception as e:
-            print(f"Warning: Errore generazione email: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Errore generazione email: %s", e)
 
         # Converti campi time in stringhe prima di restituire
         # Usa model_validate per gestire automaticamente le relazioni
@@ -2257,71 +2021,30 @@ def create_intervento(
 
     except Exception as e:
         db.rollback()
-        print(f"Errore creazione intervento: {e}")
+        logger.exception("Errore creazione intervento: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/interventi/", response_model=List[schemas.InterventoResponse], tags=["R.I.T."])
 def read_interventi(
+    request: Request,
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
     q: str = "", 
-    db: Session = Depends(database.get_db), 
+    db: Session = Depends(database.get_read_db), 
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
     """Ottiene la lista degli interventi con ricerca opzionale per cliente, seriale, part number o prodotto"""
     query = db.query(models.Intervento)
     
-    # Se c'è un termine di ricerca, filtra gli interventi
+    # Ricerca per numero relazione, cliente, seriale / part number / prodotto nei dettagli e ricambi
     if q and q.strip():
-        search_term = f"%{q.strip()}%"
-        # Cerca per:
-        # 1. Numero relazione
-        # 2. Cliente (ragione sociale)
-        # 3. Serial number nei dettagli
-        # 4. Part number nei dettagli
-        # 5. Descrizione prodotto nei ricambi
-        from sqlalchemy import or_
-        
-        # Cerca nei campi principali dell'intervento
-        query = query.filter(
-            or_(
-                models.Intervento.numero_relazione.ilike(search_term),
-                models.Intervento.cliente_ragione_sociale.ilike(search_term)
-            )
-        )
-        
-        # Cerca anche nei dettagli (seriale, part number) e nei ricambi (descrizione)
-        # Carica gli interventi che corrispondono e poi filtra quelli con dettagli/ricambi corrispondenti
-        interventi_matching = query.all()
-        matching_ids = set()
-        
-        for intervento in interventi_matching:
-            # Verifica dettagli (seriale, part number)
-            for dettaglio in intervento.dettagli:
-                if (dettaglio.serial_number and search_term.lower().replace('%', '') in (dettaglio.serial_number or '').lower()) or \
-                   (dettaglio.part_number and search_term.lower().replace('%', '') in (dettaglio.part_number or '').lower()) or \
-                   (dettaglio.marca_modello and search_term.lower().replace('%', '') in (dettaglio.marca_modello or '').lower()):
-                    matching_ids.add(intervento.id)
-                    break
-            
-            # Verifica ricambi (descrizione prodotto)
-            for ricambio in intervento.ricambi_utilizzati:
-                if ricambio.descrizione and search_term.lower().replace('%', '') in ricambio.descrizione.lower():
-                    matching_ids.add(intervento.id)
-                    break
-        
-        # Se ci sono match nei dettagli/ricambi, aggiungi anche quelli
-        if matching_ids:
-            query = db.query(models.Intervento).filter(
-                or_(
-                    models.Intervento.numero_relazione.ilike(search_term),
-                    models.Intervento.cliente_ragione_sociale.ilike(search_term),
-                    models.Intervento.id.in_(matching_ids)
-                )
-            )
-        else:
-            # Se non ci sono match nei dettagli/ricambi, usa solo la query principale
-            pass
+        query = query.filter(ricerca.condizione_ricerca_interventi(q))
+    
+    # 304 senza caricare né serializzare i RIT se nulla è cambiato (polling della dashboard)
+    invariata = cache_http.non_modificata(request, response, cache_http.etag(cache_http.firma(db, query), request.url.query))
+    if invariata:
+        return invariata
     
     interventi = query.order_by(desc(models.Intervento.id)).offset(skip).limit(limit).all()
     result = []
@@ -2330,7 +2053,33 @@ def read_interventi(
         intervento_dict['dettagli'] = [schemas.DettaglioAssetResponse.model_validate(d) for d in i.dettagli]
         intervento_dict['ricambi_utilizzati'] = [schemas.RicambioResponse.model_validate(r) for r in i.ricambi_utilizzati]
         result.append(schemas.InterventoResponse.model_validate(intervento_dict))
-    return result
+    # RIT già validati: serializzati una volta sola, senza la seconda validazione del response_model
+    return serializzazione.risposta_validata(List[schemas.InterventoResponse], result, response)
+
+def _risposta_export(formato: str, prefisso: str, titolo: str, costruisci) -> StreamingResponse:
+    """File CSV/XLSX generato in streaming da export_service"""
+    if formato == "xlsx" and lazy_imports.get_openpyxl() is None:
+        raise HTTPException(status_code=400, detail="Export XLSX non disponibile (openpyxl non installato). Usa formato=csv")
+    return StreamingResponse(
+        export_service.genera_export(formato, costruisci, titolo),
+        media_type=export_service.FORMATI[formato],
+        headers={"Content-Disposition": f'attachment; filename="{export_service.nome_file(prefisso, formato)}"'}
+    )
+
+@app.get("/interventi/export", tags=["R.I.T."])
+def export_interventi(
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    q: str = "",
+    data_da: Optional[datetime] = None,
+    data_a: Optional[datetime] = None,
+    cliente_id: Optional[int] = None,
+    macro_categoria: Optional[models.MacroCategoria] = None,
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """Export CSV/XLSX dei RIT (stessa ricerca della lista, più periodo, cliente e categoria)"""
+    return _risposta_export(formato, "rit", "RIT", lambda db: export_service.righe_interventi(
+        db, q=q, data_da=data_da, data_a=data_a, cliente_id=cliente_id, macro_categoria=macro_categoria
+    ))
 
 @app.get("/interventi/{intervento_id}", response_model=schemas.InterventoResponse, tags=["R.I.T."])
 def read_intervento(intervento_id: int, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
@@ -2339,7 +2088,7 @@ def read_intervento(intervento_id: int, db: Session = Depends(database.get_db),
     intervento_dict = convert_intervento_time_fields(intervento)
     intervento_dict['dettagli'] = [schemas.DettaglioAssetResponse.model_validate(d) for d in intervento.dettagli]
     intervento_dict['ricambi_utilizzati'] = [schemas.RicambioResponse.model_validate(r) for r in intervento.ricambi_utilizzati]
-    return schemas.InterventoResponse.model_validate(intervento_dict)
+    return serializzazione.risposta_validata(schemas.InterventoResponse, schemas.InterventoResponse.model_validate(intervento_dict))
 
 @app.put("/interventi/{intervento_id}", response_model=schemas.InterventoResponse, tags=["R.I.T."])
 def update_intervento(
@@ -2438,7 +2187,7 @@ def update_intervento(
             # L'intervento aveva già scalato le chiamate, non scalare di nuovo
             chiamate_utilizzate_attuali = db_intervento.chiamate_utilizzate_contratto
             chiamate_rimanenti = db_intervento.chiamate_rimanenti_contratto
-            print(f"[UPDATE INTERVENTO] Chiamate già scalate in precedenza - Mantenute: {chiamate_utilizzate_attuali}")
+            logger.debug("[UPDATE INTERVENTO] Chiamate già scalate in precedenza - Mantenute: %s", chiamate_utilizzate_attuali)
         elif db_cliente.limite_chiamate_contratto is not None:
             # Prima volta che si scala per questo intervento
             chiamate_utilizzate_precedenti = db_cliente.chiamate_utilizzate_contratto or 0
@@ -2449,14 +2198,14 @@ def update_intervento(
             db_cliente.chiamate_utilizzate_contratto = chiamate_utilizzate_attuali
             db.add(db_cliente)
             
-            print(f"[CONTRATTO ASSISTENZA UPDATE] Cliente {db_cliente.id} - Chiamate utilizzate: {chiamate_utilizzate_precedenti} -> {chiamate_utilizzate_attuali}")
+            logger.debug("[CONTRATTO ASSISTENZA UPDATE] Cliente %s - Chiamate utilizzate: %s -> %s", db_cliente.id, chiamate_utilizzate_precedenti, chiamate_utilizzate_attuali)
     
     # Se ci sono prodotti a noleggio, azzera tariffa oraria e costo chiamata
     tariffa_oraria_update = update_data.get("tariffa_oraria_applicata", db_intervento.tariffa_oraria_applicata) if not has_noleggio_assets else 0.0
     if has_noleggio_assets:
         tariffa_oraria_update = 0.0
         update_data["costo_chiamata_applicato"] = 0.0
-        print(f"[NOLEGGIO UPDATE] Rilevati prodotti a noleggio - Tariffa oraria e costo chiamata azzerati")
+        logger.debug("[NOLEGGIO UPDATE] Rilevati prodotti a noleggio - Tariffa oraria e costo chiamata azzerati")
     
     update_data.update({
         "sede_indirizzo": sede_indirizzo,
@@ -2473,6 +2222,8 @@ def update_intervento(
     for key, value in update_data.items():
         if hasattr(db_intervento, key):
             setattr(db_intervento, key, value)
+    # Dettagli e ricambi vengono ricreati: la riga dell'intervento potrebbe non cambiare (ETag di /interventi/)
+    db_intervento.aggiornato_il = datetime.now()
     
     # Gestione dettagli: elimina vecchi e aggiungi nuovi
     for dettaglio in db_intervento.dettagli:
@@ -2534,18 +2285,18 @@ def update_intervento(
             models.LetturaCopie.intervento_id == db_intervento.id
         ).count()
         
-        print(f"[UPDATE EMAIL PDF] Verifica prelievo copie: is_prelievo_copie={db_intervento.is_prelievo_copie}, letture_copie_count={letture_copie_count}")
+        logger.debug("[UPDATE EMAIL PDF] Verifica prelievo copie: is_prelievo_copie=%s, letture_copie_count=%s", db_intervento.is_prelievo_copie, letture_copie_count)
         
         # Se è un prelievo copie e ci sono letture copie associate, genera e invia il PDF
         if db_intervento.is_prelievo_copie and letture_copie_count > 0:
-            print(f"[UPDATE EMAIL PDF] Rilevato prelievo copie con {letture_copie_count} letture copie - Generazione PDF per email")
+            logger.debug("[UPDATE EMAIL PDF] Rilevato prelievo copie con %s letture copie - Generazione PDF per email", letture_copie_count)
             
             # IMPORTANTE: Ricarica l'intervento DOPO il commit per assicurarsi che tutte le modifiche siano salvate
             # Non usare db.refresh perché potrebbe non funzionare correttamente dopo il commit
             # Ricarica completamente l'intervento dalla sessione
             db_intervento_fresh = db.query(models.Intervento).filter(models.Intervento.id == db_intervento.id).first()
             if not db_intervento_fresh:
-                print(f"[UPDATE EMAIL PDF] ERRORE: Intervento {db_intervento.id} non trovato dopo il commit!")
+                logger.error("[UPDATE EMAIL PDF] Intervento %s non trovato dopo il commit!", db_intervento.id)
                 raise Exception(f"Intervento {db_intervento.id} non trovato")
             
             # Forza il caricamento delle relazioni
@@ -2557,7 +2308,7 @@ def update_intervento(
                 models.LetturaCopie.intervento_id == db_intervento_fresh.id
             ).all()
             
-            print(f"[UPDATE EMAIL PDF] Letture copie caricate dal DB: {len(db_intervento_fresh.letture_copie)}")
+            logger.debug("[UPDATE EMAIL PDF] Letture copie caricate dal DB: %s", len(db_intervento_fresh.letture_copie))
             
             # Carica informazioni asset per ogni lettura copie
             for lettura in db_intervento_fresh.letture_copie:
@@ -2568,11 +2319,11 @@ def update_intervento(
                         lettura.asset_marca = asset.marca or ''
                         lettura.asset_modello = asset.modello or ''
                         lettura.asset_marca_modello = f"{asset.marca or ''} {asset.modello or ''}".strip() or 'N/A'
-                        print(f"[UPDATE EMAIL PDF] Asset caricato per lettura {lettura.id}: {lettura.asset_marca_modello}")
+                        logger.debug("[UPDATE EMAIL PDF] Asset caricato per lettura %s: %s", lettura.id, lettura.asset_marca_modello)
                     else:
-                        print(f"[UPDATE EMAIL PDF] ATTENZIONE: Asset {lettura.asset_id} non trovato per lettura {lettura.id}")
+                        logger.warning("[UPDATE EMAIL PDF] Asset %s non trovato per lettura %s", lettura.asset_id, lettura.id)
                 else:
-                    print(f"[UPDATE EMAIL PDF] ATTENZIONE: Lettura {lettura.id} senza asset_id")
+                    logger.warning("[UPDATE EMAIL PDF] Lettura %s senza asset_id", lettura.id)
             
             # Ricarica le impostazioni azienda
             settings_refreshed = get_settings_or_default(db)
@@ -2594,7 +2345,7 @@ def update_intervento(
             # Email al cliente (se ha email amministrazione)
             if cliente and cliente.email_amministrazione:
                 background_tasks.add_task(
-                    send_email_background,
+                    metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                     cliente.email_amministrazione,
                     pdf_bytes,
                     db_intervento_fresh.numero_relazione,
@@ -2611,7 +2362,7 @@ def update_intervento(
                 sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento_fresh.sede_id).first()
                 if sede and sede.email:
                     background_tasks.add_task(
-                        send_email_background,
+                        metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                         sede.email,
                         pdf_bytes,
                         db_intervento_fresh.numero_relazione,
@@ -2627,7 +2378,7 @@ def update_intervento(
             email_azienda = settings_refreshed.email_notifiche_scadenze or settings_refreshed.email
             if email_azienda:
                 background_tasks.add_task(
-                    send_email_background,
+                    metrics.in_coda(metrics.EMAIL_IN_CODA, send_email_background),
                     email_azienda,
                     pdf_bytes,
                     db_intervento_fresh.numero_relazione,
@@ -2639,11 +2390,9 @@ def update_intervento(
                     db
                 )
             
-            print(f"[UPDATE EMAIL PDF] PDF generato e email programmate per RIT {db_intervento_fresh.numero_relazione}")
+            logger.info("[UPDATE EMAIL PDF] PDF generato e email programmate per RIT %s", db_intervento_fresh.numero_relazione)
     except Exception as e:
-        print(f"[UPDATE EMAIL PDF] Warning: Errore generazione email durante update: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[UPDATE EMAIL PDF] Errore generazione email durante update: %s", e)
     
     # Converti per la risposta
     intervento_dict = convert_intervento_time_fields(db_intervento)
@@ -2689,7 +2438,7 @@ def download_pdf_rit(intervento_id: int, db: Session = Depends(database.get_db),
             } 
         )
     except Exception as e:
-        print(f"Errore PDF: {e}") # Logga l'errore nella console Docker
+        logger.exception("Errore PDF: %s", e)
         raise HTTPException(status_code=500, detail=f"Errore generazione PDF: {e}")
     
 @app.get("/impostazioni/public", tags=["Configurazione"])
@@ -2703,8 +2452,7 @@ def read_impostazioni_public(db: Session = Depends(database.get_db)):
             "colore_primario": settings.colore_primario if settings.colore_primario else "#4F46E5"
         }
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Errore caricamento impostazioni pubbliche: %s", e)
         raise HTTPException(status_code=500, detail=f"Errore caricamento impostazioni: {str(e)}")
 
 @app.get("/impostazioni/", response_model=schemas.ImpostazioniAziendaResponse, tags=["Configurazione"])
@@ -2725,10 +2473,84 @@ def update_impostazioni(settings: schemas.ImpostazioniAziendaCreate, db: Session
     return db_settings
 
 # --- API LETTURE COPIE ---
+@app.get("/letture-copie/export", tags=["Letture Copie"])
+def export_letture_copie(
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    asset_id: Optional[int] = None,
+    cliente_id: Optional[int] = None,
+    data_da: Optional[datetime] = None,
+    data_a: Optional[datetime] = None,
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """Export CSV/XLSX delle letture copie di un periodo (per asset o cliente)"""
+    return _risposta_export(formato, "letture_copie", "Letture copie", lambda db: export_service.righe_letture_copie(
+        db, asset_id=asset_id, cliente_id=cliente_id, data_da=data_da, data_a=data_a
+    ))
+
+@app.get("/api/fatturazione-copie/", response_model=List[schemas.RigaFatturazioneCopieResponse], tags=["Letture Copie"])
+def get_righe_fatturazione_copie(
+    cliente_id: Optional[int] = None,
+    asset_id: Optional[int] = None,
+    intervento_id: Optional[int] = None,
+    data_da: Optional[datetime] = None,
+    data_a: Optional[datetime] = None,
+    skip: int = 0,
+    limit: int = 500,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """Righe di fatturazione copie (copie del periodo, incluse, addebitate e importi) - Solo admin"""
+    riga = models.RigaFatturazioneCopie
+    query = db.query(riga)
+    if cliente_id:
+        query = query.filter(riga.cliente_id == cliente_id)
+    if asset_id:
+        query = query.filter(riga.asset_id == asset_id)
+    if intervento_id:
+        query = query.filter(riga.intervento_id == intervento_id)
+    if data_da:
+        query = query.filter(riga.data_lettura >= data_da)
+    if data_a:
+        query = query.filter(riga.data_lettura <= data_a)
+    return query.order_by(riga.data_lettura, riga.id).offset(skip).limit(limit).all()
+
+@app.get("/api/fatturazione-copie/volumi-mensili", response_model=List[schemas.VolumiCopieMensiliResponse], tags=["Letture Copie"])
+def get_volumi_copie_mensili(
+    anno: Optional[int] = None,
+    cliente_id: Optional[int] = None,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """Copie stampate, addebitate e importi per cliente e mese - Solo admin"""
+    return fatturazione_copie.volumi_mensili(db, anno=anno, cliente_id=cliente_id)
+
+@app.post("/api/fatturazione-copie/ricalcola", tags=["Letture Copie"])
+def ricalcola_fatturazione_copie(
+    cliente_id: Optional[int] = None,
+    asset_id: Optional[int] = None,
+    data_da: Optional[datetime] = None,
+    data_a: Optional[datetime] = None,
+    db: Session = Depends(database.get_db),
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """
+    Ricalcola le righe di fatturazione copie (es. dopo la modifica delle tariffe di un asset).
+    Senza filtri ricalcola tutte le letture - Solo admin
+    """
+    righe = fatturazione_copie.aggiorna_righe(
+        db,
+        asset_ids=[asset_id] if asset_id else None,
+        cliente_id=cliente_id,
+        data_da=data_da,
+        data_a=data_a
+    )
+    db.commit()
+    return {"righe_ricalcolate": righe}
+
 @app.get("/letture-copie/asset/{asset_id}/all", response_model=List[schemas.LetturaCopieResponse], tags=["Letture Copie"])
 def get_all_letture_asset(
     asset_id: int,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
     """Ottiene tutte le letture copie per un asset, ordinate per data (più recenti prima)"""
@@ -2770,14 +2592,132 @@ def get_ultima_lettura(
     
     return ultima_lettura
 
+def _errore_lettura_copie(asset, contatore_bn: int, contatore_colore: Optional[int], ultima_lettura, data_lettura: datetime) -> Optional[str]:
+    """
+    Valida una nuova lettura rispetto all'ultima lettura dell'asset (o ai contatori iniziali).
+    ultima_lettura: oggetto con data_lettura, contatore_bn e contatore_colore, oppure None.
+    Restituisce il messaggio di errore, None se la lettura è valida.
+    """
+    if ultima_lettura:
+        # Validazione: nuove copie devono essere >= precedenti
+        if contatore_bn < ultima_lettura.contatore_bn:
+            return f"Il contatore B/N ({contatore_bn}) non può essere inferiore all'ultima lettura ({ultima_lettura.contatore_bn})"
+        if contatore_colore and ultima_lettura.contatore_colore:
+            if contatore_colore < ultima_lettura.contatore_colore:
+                return f"Il contatore Colore ({contatore_colore}) non può essere inferiore all'ultima lettura ({ultima_lettura.contatore_colore})"
+        
+        # Validazione: devono essere passati i giorni minimi in base alla cadenza configurata
+        cadenza = asset.cadenza_letture_copie or "trimestrale"
+        giorni_minimi = get_giorni_da_cadenza(cadenza)
+        giorni_da_ultima = (data_lettura - ultima_lettura.data_lettura).days
+        if giorni_da_ultima < giorni_minimi:
+            # Calcola la data minima per la prossima lettura
+            data_minima_lettura = ultima_lettura.data_lettura + timedelta(days=giorni_minimi)
+            return f"Non possono essere effettuate letture prima della cadenza configurata ({cadenza}, {giorni_minimi} giorni). Ultima lettura: {ultima_lettura.data_lettura.strftime('%d/%m/%Y')} ({giorni_da_ultima} giorni fa). Prossima lettura possibile: {data_minima_lettura.strftime('%d/%m/%Y')}"
+    else:
+        # Prima lettura: usa contatori iniziali come riferimento
+        if contatore_bn < (asset.contatore_iniziale_bn or 0):
+            return f"Il contatore B/N ({contatore_bn}) non può essere inferiore al contatore iniziale ({asset.contatore_iniziale_bn or 0})"
+        if contatore_colore and asset.contatore_iniziale_colore:
+            if contatore_colore < asset.contatore_iniziale_colore:
+                return f"Il contatore Colore ({contatore_colore}) non può essere inferiore al contatore iniziale ({asset.contatore_iniziale_colore})"
+    return None
+
+@profiling.profila
+def _invia_email_prelievo_copie(intervento_id: int):
+    """
+    Genera il PDF del prelievo copie e lo invia a cliente, sede e azienda (background task).
+    Programmato una sola volta da POST /interventi/{id}/letture-copie:batch dopo il commit
+    di tutte le letture del RIT.
+    """
+    logger.debug("[LETTURE COPIE EMAIL] Avvio invio email per intervento %s", intervento_id)
+    # Nuova sessione DB: quella della richiesta è già chiusa
+    from .database import SessionLocal
+    db_email = SessionLocal()
+    try:
+        db_intervento_email = db_email.query(models.Intervento).filter(models.Intervento.id == intervento_id).first()
+        if not db_intervento_email or not db_intervento_email.is_prelievo_copie:
+            logger.debug("[LETTURE COPIE EMAIL] Intervento %s non trovato o non è un prelievo copie", intervento_id)
+            return
+        
+        # Forza il caricamento delle relazioni
+        _ = db_intervento_email.dettagli  # Carica dettagli
+        _ = db_intervento_email.ricambi_utilizzati  # Carica ricambi
+        
+        # Carica tutte le letture copie con informazioni asset
+        righe_letture = db_email.query(models.LetturaCopie, models.AssetCliente.marca, models.AssetCliente.modello).outerjoin(
+            models.AssetCliente, models.AssetCliente.id == models.LetturaCopie.asset_id
+        ).filter(
+            models.LetturaCopie.intervento_id == intervento_id
+        ).order_by(models.LetturaCopie.id).all()
+        if not righe_letture:
+            logger.debug("[LETTURE COPIE EMAIL] Nessuna lettura copie trovata per intervento %s", intervento_id)
+            return
+        for lettura_item, marca, modello in righe_letture:
+            lettura_item.asset_marca = marca or ''
+            lettura_item.asset_modello = modello or ''
+            lettura_item.asset_marca_modello = f"{marca or ''} {modello or ''}".strip() or 'N/A'
+        db_intervento_email.letture_copie = [lettura_item for lettura_item, _, _ in righe_letture]
+        logger.debug("[LETTURE COPIE EMAIL] Letture copie caricate: %s", len(righe_letture))
+        
+        # Ricarica le impostazioni azienda
+        settings_refreshed = get_settings_or_default(db_email)
+        
+        # Genera il PDF usando l'intervento ricaricato
+        pdf_bytes = pdf_service.genera_pdf_intervento(db_intervento_email, settings_refreshed)
+        
+        # Data intervento
+        data_intervento_email = db_intervento_email.data_creazione
+        
+        # Dati azienda per footer email
+        azienda_indirizzo = settings_refreshed.indirizzo_completo or ""
+        azienda_telefono = settings_refreshed.telefono or ""
+        azienda_email_contatto = settings_refreshed.email or ""
+        
+        # Destinatari: cliente (email amministrazione), sede di intervento, azienda
+        destinatari = []
+        cliente = db_email.query(models.Cliente).filter(models.Cliente.id == db_intervento_email.cliente_id).first()
+        if cliente and cliente.email_amministrazione:
+            destinatari.append(cliente.email_amministrazione)
+        if db_intervento_email.sede_id:
+            sede = db_email.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento_email.sede_id).first()
+            if sede and sede.email:
+                destinatari.append(sede.email)
+        email_azienda = settings_refreshed.email_notifiche_scadenze or settings_refreshed.email
+        if email_azienda:
+            destinatari.append(email_azienda)
+        
+        for destinatario in destinatari:
+            send_email_background(
+                destinatario,
+                pdf_bytes,
+                db_intervento_email.numero_relazione,
+                settings_refreshed.nome_azienda,
+                data_intervento_email,
+                azienda_indirizzo,
+                azienda_telefono,
+                azienda_email_contatto,
+                db_email
+            )
+            logger.debug("[LETTURE COPIE EMAIL] Email inviata a: %s", destinatario)
+        
+        logger.info("[LETTURE COPIE EMAIL] PDF generato e email inviate per RIT %s", db_intervento_email.numero_relazione)
+    except Exception as e:
+        logger.exception("[LETTURE COPIE EMAIL] Errore generazione email prelievo copie: %s", e)
+    finally:
+        db_email.close()
+
 @app.post("/letture-copie/", response_model=schemas.LetturaCopieResponse, tags=["Letture Copie"])
 def create_lettura_copie(
     lettura: schemas.LetturaCopieCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
-    """Crea una nuova lettura copie"""
+    """
+    Crea una singola lettura copie.
+    Per le letture di un RIT di prelievo copie usare POST /interventi/{id}/letture-copie:batch
+    (tutte le letture in una transazione e un solo invio del PDF).
+    """
     # Verifica che l'asset esista
     asset = db.query(models.AssetCliente).filter(models.AssetCliente.id == lettura.asset_id).first()
     if not asset:
@@ -2795,323 +2735,129 @@ def create_lettura_copie(
         models.LetturaCopie.asset_id == lettura.asset_id
     ).order_by(desc(models.LetturaCopie.data_lettura)).first()
     
-    # Validazione: nuove copie devono essere >= precedenti
-    if ultima_lettura:
-        if lettura.contatore_bn < ultima_lettura.contatore_bn:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Il contatore B/N ({lettura.contatore_bn}) non può essere inferiore all'ultima lettura ({ultima_lettura.contatore_bn})"
-            )
-        if lettura.contatore_colore and ultima_lettura.contatore_colore:
-            if lettura.contatore_colore < ultima_lettura.contatore_colore:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Il contatore Colore ({lettura.contatore_colore}) non può essere inferiore all'ultima lettura ({ultima_lettura.contatore_colore})"
-                )
-        
-        # Validazione: devono essere passati i giorni minimi in base alla cadenza configurata
-        cadenza = asset.cadenza_letture_copie or "trimestrale"
-        giorni_minimi = get_giorni_da_cadenza(cadenza)
-        # Usa la data corrente per calcolare i giorni dall'ultima lettura
-        giorni_da_ultima = (data_lettura_corrente - ultima_lettura.data_lettura).days
-        
-        if giorni_da_ultima < giorni_minimi:
-            # Calcola la data minima per la prossima lettura
-            data_minima_lettura = ultima_lettura.data_lettura + timedelta(days=giorni_minimi)
-            raise HTTPException(
-                status_code=400,
-                detail=f"Non possono essere effettuate letture prima della cadenza configurata ({cadenza}, {giorni_minimi} giorni). Ultima lettura: {ultima_lettura.data_lettura.strftime('%d/%m/%Y')} ({giorni_da_ultima} giorni fa). Prossima lettura possibile: {data_minima_lettura.strftime('%d/%m/%Y')}"
-            )
-    else:
-        # Prima lettura: usa contatori iniziali come riferimento
-        if lettura.contatore_bn < (asset.contatore_iniziale_bn or 0):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Il contatore B/N ({lettura.contatore_bn}) non può essere inferiore al contatore iniziale ({asset.contatore_iniziale_bn or 0})"
-            )
-        if lettura.contatore_colore and asset.contatore_iniziale_colore:
-            if lettura.contatore_colore < asset.contatore_iniziale_colore:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Il contatore Colore ({lettura.contatore_colore}) non può essere inferiore al contatore iniziale ({asset.contatore_iniziale_colore})"
-                )
-    
-    # Ottieni cadenza per calcolo copie incluse
-    cadenza = asset.cadenza_letture_copie or "trimestrale"
-    
-    # Calcola copie incluse in base alla cadenza per il calcolo economico
-    # Le copie incluse mensili vengono moltiplicate per il numero di mesi della cadenza
-    copie_incluse_bn_periodo = 0
-    copie_incluse_colore_periodo = 0
-    
-    if asset.copie_incluse_bn is not None:
-        mesi_cadenza = get_mesi_da_cadenza(cadenza)
-        copie_incluse_bn_periodo = asset.copie_incluse_bn * mesi_cadenza
-    
-    if asset.copie_incluse_colore is not None:
-        mesi_cadenza = get_mesi_da_cadenza(cadenza)
-        copie_incluse_colore_periodo = asset.copie_incluse_colore * mesi_cadenza
-    
-    # Calcola copie effettive stampate nel periodo (differenza tra nuovo prelievo e ultimo prelievo)
-    copie_stampate_bn = 0
-    copie_stampate_colore = 0
-    
-    if ultima_lettura:
-        # Calcolo corretto: nuovo prelievo - ultimo prelievo
-        copie_stampate_bn = lettura.contatore_bn - ultima_lettura.contatore_bn
-        if lettura.contatore_colore is not None and ultima_lettura.contatore_colore is not None:
-            copie_stampate_colore = lettura.contatore_colore - ultima_lettura.contatore_colore
-    else:
-        # Prima lettura: usa contatori iniziali come riferimento
-        copie_stampate_bn = lettura.contatore_bn - (asset.contatore_iniziale_bn or 0)
-        if lettura.contatore_colore is not None and asset.contatore_iniziale_colore is not None:
-            copie_stampate_colore = lettura.contatore_colore - asset.contatore_iniziale_colore
-    
-    # Calcola copie fuori limite (da addebitare)
-    copie_fuori_limite_bn = max(0, copie_stampate_bn - copie_incluse_bn_periodo)
-    copie_fuori_limite_colore = max(0, copie_stampate_colore - copie_incluse_colore_periodo)
-    
-    # Calcola costo totale (se necessario, può essere aggiunto al costo dell'intervento)
-    costo_copie_bn = 0
-    costo_copie_colore = 0
-    
-    if copie_fuori_limite_bn > 0 and asset.costo_copia_bn_fuori_limite:
-        costo_copie_bn = copie_fuori_limite_bn * asset.costo_copia_bn_fuori_limite
-    
-    if copie_fuori_limite_colore > 0 and asset.costo_copia_colore_fuori_limite:
-        costo_copie_colore = copie_fuori_limite_colore * asset.costo_copia_colore_fuori_limite
-    
-    # Salva informazioni di calcolo nelle note
-    note_calcolo = f"Calcolo copie per cadenza '{cadenza}':\n"
-    note_calcolo += f"  Data lettura: {data_lettura_corrente.strftime('%d/%m/%Y %H:%M')}\n"
-    if ultima_lettura:
-        note_calcolo += f"  Ultima lettura: {ultima_lettura.data_lettura.strftime('%d/%m/%Y')} (B/N: {ultima_lettura.contatore_bn}, Colore: {ultima_lettura.contatore_colore or 0})\n"
-    else:
-        note_calcolo += f"  Contatori iniziali: B/N: {asset.contatore_iniziale_bn or 0}, Colore: {asset.contatore_iniziale_colore or 0}\n"
-    note_calcolo += f"  Nuova lettura: B/N: {lettura.contatore_bn}, Colore: {lettura.contatore_colore or 0}\n"
-    note_calcolo += f"  Copie incluse nel periodo ({cadenza}): B/N={copie_incluse_bn_periodo}, Colore={copie_incluse_colore_periodo}\n"
-    note_calcolo += f"  Copie stampate nel periodo: B/N={copie_stampate_bn}, Colore={copie_stampate_colore}\n"
-    note_calcolo += f"  Copie fuori limite: B/N={copie_fuori_limite_bn}, Colore={copie_fuori_limite_colore}\n"
-    if costo_copie_bn > 0 or costo_copie_colore > 0:
-        note_calcolo += f"  Costo totale: B/N=€{costo_copie_bn:.2f}, Colore=€{costo_copie_colore:.2f}"
+    errore = _errore_lettura_copie(asset, lettura.contatore_bn, lettura.contatore_colore, ultima_lettura, data_lettura_corrente)
+    if errore:
+        raise HTTPException(status_code=400, detail=errore)
     
     # Crea lettura con data corrente
     lettura_dict = lettura.model_dump()
     lettura_dict['data_lettura'] = data_lettura_corrente  # Usa sempre la data corrente
     # Rimuovi tecnico_id se presente (lo impostiamo sempre a current_user.id)
     lettura_dict.pop('tecnico_id', None)
-    if lettura_dict.get('note'):
-        lettura_dict['note'] = f"{lettura_dict['note']}\n\n{note_calcolo}"
-    else:
-        lettura_dict['note'] = note_calcolo
     
-    # Log per debug
-    print(f"[CREATE LETTURA COPIE] Creazione lettura copie per asset {lettura.asset_id}")
-    print(f"[CREATE LETTURA COPIE] intervento_id passato: {lettura.intervento_id}")
-    print(f"[CREATE LETTURA COPIE] contatore_bn: {lettura.contatore_bn}, contatore_colore: {lettura.contatore_colore}")
+    logger.debug("[CREATE LETTURA COPIE] Creazione lettura copie per asset %s (intervento_id: %s, contatore_bn: %s, contatore_colore: %s)", lettura.asset_id, lettura.intervento_id, lettura.contatore_bn, lettura.contatore_colore)
     
     db_lettura = models.LetturaCopie(
         **lettura_dict,
         tecnico_id=current_user.id
     )
     db.add(db_lettura)
+    db.flush()
+    
+    # Calcolo copie e addebiti del periodo (riga di fatturazione, stessa transazione della lettura).
+    # Le note restano quelle del tecnico: il dettaglio del calcolo è nelle colonne della riga.
+    fatturazione_copie.aggiorna_righe(db, lettura_ids=[db_lettura.id])
     db.commit()
     db.refresh(db_lettura)
     
-    # Verifica che l'intervento_id sia stato salvato correttamente
-    print(f"[CREATE LETTURA COPIE] Lettura copie creata con ID: {db_lettura.id}")
-    print(f"[CREATE LETTURA COPIE] intervento_id salvato: {db_lettura.intervento_id}")
-    
-    # Se la lettura copie è associata a un intervento, verifica se è un prelievo copie
-    # e invia l'email dopo un breve delay per permettere la creazione di tutte le letture copie
-    if db_lettura.intervento_id:
-        print(f"[CREATE LETTURA COPIE] Verifica intervento {db_lettura.intervento_id} per invio email")
-        intervento = db.query(models.Intervento).filter(models.Intervento.id == db_lettura.intervento_id).first()
-        if intervento:
-            print(f"[CREATE LETTURA COPIE] Intervento trovato: id={intervento.id}, is_prelievo_copie={intervento.is_prelievo_copie}")
-        else:
-            print(f"[CREATE LETTURA COPIE] ATTENZIONE: Intervento {db_lettura.intervento_id} non trovato!")
-        
-        if intervento and intervento.is_prelievo_copie:
-            print(f"[CREATE LETTURA COPIE] Intervento {intervento.id} è un prelievo copie - Verifica programmazione email")
-            
-            # Usa un meccanismo di debouncing: programma l'email solo se non è già stata programmata
-            # per questo intervento negli ultimi 5 secondi
-            global _interventi_email_programmate
-            
-            # Rimuovi gli interventi più vecchi di 10 secondi dal set
-            import time as time_module
-            current_time = time_module.time()
-            _interventi_email_programmate = {
-                (interv_id, timestamp) for interv_id, timestamp in _interventi_email_programmate
-                if current_time - timestamp < 10
+    logger.debug("[CREATE LETTURA COPIE] Lettura copie creata con ID: %s", db_lettura.id)
+    return db_lettura
+
+@app.post("/interventi/{intervento_id}/letture-copie:batch", response_model=List[schemas.LetturaCopieResponse], tags=["Letture Copie"])
+def create_letture_copie_batch(
+    intervento_id: int,
+    batch: schemas.LetturaCopieBatchCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """
+    Salva tutte le letture copie di un RIT in un'unica transazione:
+    - asset e ultime letture caricati con una query ciascuno e validati tutti prima di salvare
+      (una lettura non valida annulla l'intera richiesta);
+    - inserimento multiplo delle letture e calcolo delle righe di fatturazione;
+    - se il RIT è un prelievo copie, un solo invio di PDF/email dopo il commit.
+    """
+    intervento = db.query(models.Intervento).filter(models.Intervento.id == intervento_id).first()
+    if not intervento:
+        raise HTTPException(status_code=404, detail="Intervento non trovato")
+    if not batch.letture:
+        return []
+    
+    asset_ids = [lettura.asset_id for lettura in batch.letture]
+    if len(set(asset_ids)) != len(asset_ids):
+        raise HTTPException(status_code=400, detail="Ogni macchina può comparire una sola volta nelle letture del RIT")
+    
+    assets = {
+        asset.id: asset
+        for asset in db.query(models.AssetCliente).filter(models.AssetCliente.id.in_(asset_ids)).all()
+    }
+    mancanti = [asset_id for asset_id in asset_ids if asset_id not in assets]
+    if mancanti:
+        raise HTTPException(status_code=404, detail=f"Asset non trovati: {', '.join(str(a) for a in mancanti)}")
+    non_printing = [a for a in assets.values() if a.tipo_asset != "Printing"]
+    if non_printing:
+        raise HTTPException(status_code=400, detail="Le letture copie sono disponibili solo per asset Printing")
+    
+    # Ultima lettura di ogni asset con una sola query
+    lettura_model = models.LetturaCopie
+    progressivo = func.row_number().over(
+        partition_by=lettura_model.asset_id,
+        order_by=(desc(lettura_model.data_lettura), desc(lettura_model.id))
+    ).label("progressivo")
+    ultime_subq = db.query(
+        lettura_model.asset_id,
+        lettura_model.data_lettura,
+        lettura_model.contatore_bn,
+        lettura_model.contatore_colore,
+        progressivo
+    ).filter(lettura_model.asset_id.in_(asset_ids)).subquery()
+    ultime_letture = {
+        riga.asset_id: riga
+        for riga in db.query(ultime_subq).filter(ultime_subq.c.progressivo == 1).all()
+    }
+    
+    # Stessa data per tutte le letture del RIT (data corrente, non quella del frontend)
+    data_lettura_corrente = datetime.now()
+    errori = []
+    for lettura in batch.letture:
+        asset = assets[lettura.asset_id]
+        errore = _errore_lettura_copie(asset, lettura.contatore_bn, lettura.contatore_colore, ultime_letture.get(lettura.asset_id), data_lettura_corrente)
+        if errore:
+            errori.append(f"{asset.marca or ''} {asset.modello or ''} ({asset.matricola or asset.id}): {errore}".strip())
+    if errori:
+        raise HTTPException(status_code=400, detail="\n".join(errori))
+    
+    nuove_ids = db.execute(
+        insert(lettura_model).returning(lettura_model.id),
+        [
+            {
+                "asset_id": lettura.asset_id,
+                "intervento_id": intervento_id,
+                "data_lettura": data_lettura_corrente,
+                "contatore_bn": lettura.contatore_bn,
+                "contatore_colore": lettura.contatore_colore,
+                "tecnico_id": current_user.id,
+                "note": lettura.note,
+                "created_at": data_lettura_corrente,
             }
-            
-            # Verifica se l'email è già stata programmata per questo intervento
-            email_gia_programmata = any(
-                interv_id == db_lettura.intervento_id and (current_time - timestamp) < 5
-                for interv_id, timestamp in _interventi_email_programmate
-            )
-            
-            if email_gia_programmata:
-                print(f"[CREATE LETTURA COPIE] Email già programmata per intervento {db_lettura.intervento_id} - Skip")
-            else:
-                # Aggiungi l'intervento al set
-                _interventi_email_programmate.add((db_lettura.intervento_id, current_time))
-                print(f"[CREATE LETTURA COPIE] Intervento {intervento.id} è un prelievo copie - Programmazione invio email")
-                
-                # Programma l'invio email dopo 3 secondi per permettere la creazione di tutte le letture copie
-                def send_email_after_letture_copie(intervento_id: int):
-                    """Funzione che viene eseguita dopo un delay per inviare l'email"""
-                    print(f"[CREATE LETTURA COPIE EMAIL] Avvio funzione invio email per intervento {intervento_id}")
-                    # Crea una nuova sessione DB per questa operazione asincrona
-                    from .database import SessionLocal
-                    db_email = SessionLocal()
-                    try:
-                        # Attendi 3 secondi per assicurarsi che tutte le letture copie siano state create
-                        import time
-                        print(f"[CREATE LETTURA COPIE EMAIL] Attendo 3 secondi...")
-                        time.sleep(3)
-                        
-                        # Verifica se ci sono altre letture copie create negli ultimi 2 secondi
-                        # Se sì, aspetta ancora un po' per evitare di inviare email multiple
-                        from datetime import timedelta
-                        letture_recenti = db_email.query(models.LetturaCopie).filter(
-                            models.LetturaCopie.intervento_id == intervento_id,
-                            models.LetturaCopie.created_at >= (datetime.now() - timedelta(seconds=2))
-                        ).count()
-                        
-                        if letture_recenti > 0:
-                            # Ci sono letture copie create molto recentemente, aspetta ancora 2 secondi
-                            print(f"[CREATE LETTURA COPIE EMAIL] Trovate {letture_recenti} letture copie recenti, attendo altri 2 secondi...")
-                            time.sleep(2)
-                        
-                        # Rimuovi l'intervento dal set dopo che l'email è stata inviata
-                        global _interventi_email_programmate
-                        _interventi_email_programmate = {
-                            (interv_id, timestamp) for interv_id, timestamp in _interventi_email_programmate
-                            if interv_id != intervento_id
-                        }
-                        
-                        # Ricarica l'intervento
-                        db_intervento_email = db_email.query(models.Intervento).filter(models.Intervento.id == intervento_id).first()
-                        if not db_intervento_email or not db_intervento_email.is_prelievo_copie:
-                            print(f"[CREATE LETTURA COPIE EMAIL] Intervento {intervento_id} non trovato o non è un prelievo copie")
-                            return
-                        
-                        # Verifica se ci sono letture copie associate
-                        letture_copie_count = db_email.query(models.LetturaCopie).filter(
-                            models.LetturaCopie.intervento_id == intervento_id
-                        ).count()
-                        
-                        if letture_copie_count == 0:
-                            print(f"[CREATE LETTURA COPIE EMAIL] Nessuna lettura copie trovata per intervento {intervento_id}")
-                            return
-                        
-                        print(f"[CREATE LETTURA COPIE EMAIL] Trovate {letture_copie_count} letture copie per intervento {intervento_id} - Generazione PDF per email")
-                        
-                        # Forza il caricamento delle relazioni
-                        _ = db_intervento_email.dettagli  # Carica dettagli
-                        _ = db_intervento_email.ricambi_utilizzati  # Carica ricambi
-                        
-                        # Carica tutte le letture copie con informazioni asset
-                        db_intervento_email.letture_copie = db_email.query(models.LetturaCopie).filter(
-                            models.LetturaCopie.intervento_id == intervento_id
-                        ).all()
-                        
-                        print(f"[CREATE LETTURA COPIE EMAIL] Letture copie caricate: {len(db_intervento_email.letture_copie)}")
-                        
-                        # Carica informazioni asset per ogni lettura copie
-                        for lettura_item in db_intervento_email.letture_copie:
-                            if lettura_item.asset_id:
-                                asset = db_email.query(models.AssetCliente).filter(models.AssetCliente.id == lettura_item.asset_id).first()
-                                if asset:
-                                    lettura_item.asset_marca = asset.marca or ''
-                                    lettura_item.asset_modello = asset.modello or ''
-                                    lettura_item.asset_marca_modello = f"{asset.marca or ''} {asset.modello or ''}".strip() or 'N/A'
-                                    print(f"[CREATE LETTURA COPIE EMAIL] Asset caricato per lettura {lettura_item.id}: {lettura_item.asset_marca_modello}")
-                        
-                        # Ricarica le impostazioni azienda
-                        settings_refreshed = get_settings_or_default(db_email)
-                        
-                        # Genera il PDF usando l'intervento ricaricato
-                        pdf_bytes = pdf_service.genera_pdf_intervento(db_intervento_email, settings_refreshed)
-                        
-                        # Data intervento
-                        data_intervento_email = db_intervento_email.data_creazione
-                        
-                        # Dati azienda per footer email
-                        azienda_indirizzo = settings_refreshed.indirizzo_completo or ""
-                        azienda_telefono = settings_refreshed.telefono or ""
-                        azienda_email_contatto = settings_refreshed.email or ""
-                        
-                        # Carica cliente
-                        cliente = db_email.query(models.Cliente).filter(models.Cliente.id == db_intervento_email.cliente_id).first()
-                        
-                        # Email al cliente (se ha email amministrazione)
-                        if cliente and cliente.email_amministrazione:
-                            send_email_background(
-                                cliente.email_amministrazione,
-                                pdf_bytes,
-                                db_intervento_email.numero_relazione,
-                                settings_refreshed.nome_azienda,
-                                data_intervento_email,
-                                azienda_indirizzo,
-                                azienda_telefono,
-                                azienda_email_contatto,
-                                db_email
-                            )
-                            print(f"[CREATE LETTURA COPIE EMAIL] Email inviata a cliente: {cliente.email_amministrazione}")
-                        
-                        # Email alla sede di intervento (se presente e ha email)
-                        if db_intervento_email.sede_id:
-                            sede = db_email.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento_email.sede_id).first()
-                            if sede and sede.email:
-                                send_email_background(
-                                    sede.email,
-                                    pdf_bytes,
-                                    db_intervento_email.numero_relazione,
-                                    settings_refreshed.nome_azienda,
-                                    data_intervento_email,
-                                    azienda_indirizzo,
-                                    azienda_telefono,
-                                    azienda_email_contatto,
-                                    db_email
-                                )
-                                print(f"[CREATE LETTURA COPIE EMAIL] Email inviata a sede: {sede.email}")
-                        
-                        # Email all'azienda (se configurata)
-                        email_azienda = settings_refreshed.email_notifiche_scadenze or settings_refreshed.email
-                        if email_azienda:
-                            send_email_background(
-                                email_azienda,
-                                pdf_bytes,
-                                db_intervento_email.numero_relazione,
-                                settings_refreshed.nome_azienda,
-                                data_intervento_email,
-                                azienda_indirizzo,
-                                azienda_telefono,
-                                azienda_email_contatto,
-                                db_email
-                            )
-                            print(f"[CREATE LETTURA COPIE EMAIL] Email inviata ad azienda: {email_azienda}")
-                        
-                        print(f"[CREATE LETTURA COPIE EMAIL] PDF generato e email inviate per RIT {db_intervento_email.numero_relazione}")
-                    except Exception as e:
-                        print(f"[CREATE LETTURA COPIE EMAIL] Warning: Errore generazione email durante creazione lettura copie: {e}")
-                        import traceback
-                        traceback.print_exc()
-                    finally:
-                        db_email.close()
-                
-                # Programma l'invio email dopo 3 secondi
-                background_tasks.add_task(send_email_after_letture_copie, db_lettura.intervento_id)
+            for lettura in batch.letture
+        ]
+    ).scalars().all()
+    fatturazione_copie.aggiorna_righe(db, lettura_ids=nuove_ids)
+    db.commit()
+    logger.info("[LETTURE COPIE BATCH] %s letture copie salvate per intervento %s", len(nuove_ids), intervento_id)
     
-    return db_lettura
+    if intervento.is_prelievo_copie:
+        background_tasks.add_task(metrics.in_coda(metrics.EMAIL_IN_CODA, _invia_email_prelievo_copie), intervento_id)
+    
+    return db.query(lettura_model).filter(lettura_model.id.in_(nuove_ids)).order_by(lettura_model.id).all()
 
 # --- API AUDIT LOG ---
 @app.get("/api/audit-logs/", response_model=List[schemas.AuditLogResponse], tags=["Audit Log"])
 def get_audit_logs(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     entity_type: Optional[str] = None,
@@ -3120,7 +2866,7 @@ def get_audit_logs(
     action: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     current_user: models.Utente = Depends(auth.require_admin)
 ):
     """
@@ -3143,15 +2889,40 @@ def get_audit_logs(
     if end_date:
         query = query.filter(models.AuditLog.timestamp <= end_date)
     
+    # Log solo inseriti: conteggio e id massimo bastano per l'ETag
+    invariata = cache_http.non_modificata(request, response, cache_http.etag(cache_http.firma(db, query), request.url.query))
+    if invariata:
+        return invariata
+    
     # Ordina per timestamp decrescente (più recenti prima)
     logs = query.order_by(desc(models.AuditLog.timestamp)).offset(skip).limit(limit).all()
     return logs
 
+@app.get("/api/audit-logs/export", tags=["Audit Log"])
+def export_audit_logs(
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """
+    Export CSV/XLSX dei log di audit (stessi filtri della lista).
+    Solo Admin e SuperAdmin possono accedere.
+    """
+    return _risposta_export(formato, "audit_log", "Audit log", lambda db: export_service.righe_audit_logs(
+        db, entity_type=entity_type, entity_id=entity_id, user_id=user_id,
+        action=action, start_date=start_date, end_date=end_date
+    ))
+
 @app.get("/api/audit-logs/stats", tags=["Audit Log"])
 def get_audit_logs_stats(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     current_user: models.Utente = Depends(auth.require_admin)
 ):
     """
@@ -3180,7 +2951,6 @@ def get_audit_logs_stats(
         action_stats[action] = count
     
     # Top 5 utenti più attivi
-    from sqlalchemy import func
     top_users = db.query(
         models.AuditLog.user_id,
         models.AuditLog.user_nome,
@@ -3195,3 +2965,127 @@ def get_audit_logs_stats(
         "action_stats": action_stats,
         "top_users": top_users_list
     }
+
+# --- API SCHEDULER ---
+@app.get("/api/scheduler/storico", response_model=List[schemas.StoricoJobResponse], tags=["Scheduler"])
+def get_storico_job(
+    job_id: Optional[str] = None,
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 50,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """
+    Storico delle esecuzioni dei job dello scheduler (durata, esito, notifiche inviate).
+    Solo Admin e SuperAdmin possono accedere.
+    """
+    query = db.query(models.StoricoJob)
+    if job_id:
+        query = query.filter(models.StoricoJob.job_id == job_id)
+    if status:
+        query = query.filter(models.StoricoJob.status == status.lower())
+    return query.order_by(desc(models.StoricoJob.started_at)).offset(skip).limit(limit).all()
+
+# --- PROFILING ---
+@app.get("/api/profiling/", response_model=List[schemas.ProfiloRichiestaResponse], tags=["Monitoraggio"])
+def get_profili(current_user: models.Utente = Depends(auth.require_admin)):
+    """
+    Ultime richieste profilate di questo processo (header X-Profile o campionamento).
+    Solo Admin e SuperAdmin possono accedere.
+    """
+    return profiling.elenco_profili()
+
+@app.get("/api/profiling/{profilo_id}", response_model=schemas.ProfiloRichiestaDettaglioResponse, tags=["Monitoraggio"])
+def get_profilo(profilo_id: str, current_user: models.Utente = Depends(auth.require_admin)):
+    """
+    Profilo di una richiesta: query SQL con durata e funzioni ordinate per tempo cumulativo.
+    Solo Admin e SuperAdmin possono accedere.
+    """
+    profilo = profiling.get_profilo(profilo_id)
+    if profilo is None:
+        raise HTTPException(status_code=404, detail="Profilo non trovato (scaduto o registrato da un altro worker)")
+    return profilo
+
+@app.delete("/api/profiling/", tags=["Monitoraggio"])
+def delete_profili(current_user: models.Utente = Depends(auth.require_admin)):
+    """Elimina i profili salvati in questo processo. Solo Admin e SuperAdmin possono accedere."""
+    profiling.svuota_profili()
+    return {"message": "Profili eliminati"}
+
+# --- METRICHE ---
+@app.get("/metrics", tags=["Monitoraggio"], include_in_schema=False)
+def get_metrics(request: Request):
+    """
+    Metriche in formato di esposizione testuale Prometheus (vedi app/metrics.py).
+    Protetto con METRICS_TOKEN (Authorization: Bearer); senza token configurato l'endpoint
+    non esiste (404) a meno che METRICS_PUBLIC=true lo esponga esplicitamente senza autenticazione.
+    """
+    if not metrics.METRICS_ENABLED or (not metrics.METRICS_TOKEN and not metrics.METRICS_PUBLIC):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if metrics.METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token metriche non valido")
+    return Response(content=metrics.esporta(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- API IMPORT MASSIVO ---
+
+@app.post("/api/import/{entita}", tags=["Import"])
+def importa_file(
+    entita: str,
+    file: UploadFile = File(...),
+    dry_run: bool = False,
+    batch_size: int = Query(import_service.IMPORT_BATCH_SIZE, ge=1, le=5000),
+    encoding: str = "utf-8-sig",
+    foglio: Optional[str] = None,
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """
+    Import massivo da CSV/XLSX di clienti, sedi, assets o magazzino (entita).
+    Risposta in streaming NDJSON: un evento di avanzamento per blocco con gli errori di riga,
+    poi il riepilogo. Con dry_run=true valida senza salvare.
+    Solo Admin e SuperAdmin possono accedere.
+    """
+    if entita not in import_service.IMPORTATORI:
+        raise HTTPException(status_code=400, detail=f"Tipo di import non valido. Valori ammessi: {', '.join(import_service.IMPORTATORI)}")
+    estensione = Path(file.filename or "").suffix.lower()
+    if estensione not in import_service.ESTENSIONI_SUPPORTATE:
+        raise HTTPException(status_code=400, detail="Formato file non supportato. Usa CSV o XLSX")
+
+    # Copia su disco a blocchi: l'upload viene chiuso al termine della richiesta, prima dello streaming
+    with tempfile.NamedTemporaryFile(delete=False, suffix=estensione) as tmp:
+        shutil.copyfileobj(file.file, tmp, 1024 * 1024)
+        percorso = tmp.name
+
+    try:
+        lettore = import_service.LettoreFile(percorso, encoding=encoding, foglio=foglio)
+        mancanti = import_service.verifica_colonne(entita, lettore.colonne)
+    except Exception as e:
+        # Intestazione illeggibile, codifica errata, XLSX danneggiato o foglio inesistente
+        os.remove(percorso)
+        raise HTTPException(status_code=400, detail=f"File non valido: {e}")
+    if mancanti:
+        lettore.close()
+        os.remove(percorso)
+        raise HTTPException(status_code=400, detail=f"Colonne obbligatorie mancanti: {', '.join(mancanti)}")
+
+    utente_id = current_user.id
+
+    def eventi():
+        # Sessione dedicata: quella delle dipendenze viene chiusa prima dello streaming della risposta
+        db = database.SessionLocal()
+        try:
+            for evento in import_service.importa(
+                db, entita, lettore, batch_size=batch_size, dry_run=dry_run, utente_id=utente_id
+            ):
+                yield json.dumps(evento, ensure_ascii=False, default=str) + "\n"
+        except UnicodeDecodeError as e:
+            yield json.dumps({"evento": "errore", "errore": f"Codifica del file non valida ({e}). Riprova con encoding=cp1252"}) + "\n"
+        except Exception as e:
+            db.rollback()
+            yield json.dumps({"evento": "errore", "errore": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            lettore.close()
+            db.close()
+            os.remove(percorso)
+
+    return StreamingResponse(eventi(), media_type="application/x-ndjson")
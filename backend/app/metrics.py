@@ -0,0 +1,351 @@
+"""
+Metriche dell'applicazione in formato di esposizione testuale Prometheus (GET /metrics).
+
+- MetricheMiddleware (ASGI): richieste per route/metodo/stato, istogramma delle latenze,
+  richieste in corso. La route è il percorso dichiarato (/interventi/{intervento_id}),
+  non l'URL, così il numero di serie resta limitato.
+- Eventi SQLAlchemy su tutti gli engine: numero di query e tempo DB per richiesta
+  (istogramma db_statements_per_request: le richieste N+1 finiscono nei bucket alti).
+- Tempo di generazione dei PDF, esiti e durata dei job dello scheduler, email in coda e inviate.
+
+Registro in memoria e per processo: con più worker uvicorn ogni processo espone le proprie
+metriche (Prometheus le somma per istanza). Nessuna dipendenza esterna.
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# GET /metrics richiede "Authorization: Bearer <token>"; senza token risponde 404,
+# a meno che METRICS_PUBLIC=true (es. porta raggiungibile solo da Prometheus)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() in ("1", "true", "yes")
+
+BUCKET_LATENZA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKET_QUERY = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BUCKET_PDF = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+
+def _escape(valore) -> str:
+    return str(valore).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatta_etichette(nomi: Tuple[str, ...], valori: Tuple[str, ...]) -> str:
+    if not nomi:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escape(valore)}"' for nome, valore in zip(nomi, valori)) + "}"
+
+
+def _formatta_numero(valore: float) -> str:
+    if valore == float("inf"):
+        return "+Inf"
+    return repr(float(valore)) if not float(valore).is_integer() else str(int(valore))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, descrizione: str, etichette: Iterable[str] = ()):
+        self.nome = nome
+        self.descrizione = descrizione
+        self.etichette = tuple(etichette)
+        self._lock = threading.Lock()
+        _REGISTRO.append(self)
+
+    def _chiave(self, valori: Tuple[str, ...]) -> Tuple[str, ...]:
+        if len(valori) != len(self.etichette):
+            raise ValueError(f"{self.nome}: attese le etichette {self.etichette}")
+        return tuple(str(v) for v in valori)
+
+    def esporta(self) -> List[str]:
+        righe = [f"# HELP {self.nome} {self.descrizione}", f"# TYPE {self.nome} {self.tipo}"]
+        righe.extend(self._campioni())
+        return righe
+
+    def _campioni(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Contatore(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valori: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *etichette, valore: float = 1.0):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = self._valori.get(chiave, 0.0) + valore
+
+    def _campioni(self) -> List[str]:
+        with self._lock:
+            valori = list(self._valori.items())
+        return [f"{self.nome}{_formatta_etichette(self.etichette, k)} {_formatta_numero(v)}" for k, v in valori]
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valori: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, valore: float, *etichette):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = valore
+
+    def inc(self, *etichette, valore: float = 1.0):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = self._valori.get(chiave, 0.0) + valore
+
+    def dec(self, *etichette, valore: float = 1.0):
+        self.inc(*etichette, valore=-valore)
+
+    def _campioni(self) -> List[str]:
+        with self._lock:
+            valori = list(self._valori.items())
+        return [f"{self.nome}{_formatta_etichette(self.etichette, k)} {_formatta_numero(v)}" for k, v in valori]
+
+
+class Istogramma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, descrizione: str, etichette: Iterable[str] = (), bucket: Iterable[float] = BUCKET_LATENZA):
+        super().__init__(nome, descrizione, etichette)
+        self.bucket = tuple(sorted(bucket))
+        # chiave -> [conteggi per bucket (non cumulativi), somma, conteggio]
+        self._serie: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, valore: float, *etichette):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            serie = self._serie.get(chiave)
+            if serie is None:
+                serie = self._serie[chiave] = [[0] * len(self.bucket), 0.0, 0]
+            for i, limite in enumerate(self.bucket):
+                if valore <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valore
+            serie[2] += 1
+
+    def time(self, *etichette):
+        """Context manager che osserva la durata del blocco in secondi"""
+        return _Cronometro(self, etichette)
+
+    def _campioni(self) -> List[str]:
+        with self._lock:
+            serie = [(k, list(v[0]), v[1], v[2]) for k, v in self._serie.items()]
+        righe = []
+        nomi_bucket = self.etichette + ("le",)
+        for chiave, conteggi, somma, totale in serie:
+            cumulativo = 0
+            for limite, conteggio in zip(self.bucket, conteggi):
+                cumulativo += conteggio
+                righe.append(f"{self.nome}_bucket{_formatta_etichette(nomi_bucket, chiave + (_formatta_numero(limite),))} {cumulativo}")
+            righe.append(f"{self.nome}_bucket{_formatta_etichette(nomi_bucket, chiave + ('+Inf',))} {totale}")
+            righe.append(f"{self.nome}_sum{_formatta_etichette(self.etichette, chiave)} {_formatta_numero(somma)}")
+            righe.append(f"{self.nome}_count{_formatta_etichette(self.etichette, chiave)} {totale}")
+        return righe
+
+
+class _Cronometro:
+    def __init__(self, istogramma: Istogramma, etichette: Tuple[str, ...]):
+        self.istogramma = istogramma
+        self.etichette = etichette
+
+    def __enter__(self):
+        self.inizio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.istogramma.observe(time.perf_counter() - self.inizio, *self.etichette)
+        return False
+
+
+_REGISTRO: List[_Metrica] = []
+
+# --- Metriche HTTP ---
+HTTP_RICHIESTE = Contatore("http_requests_total", "Richieste HTTP completate", ("method", "route", "status"))
+HTTP_DURATA = Istogramma("http_request_duration_seconds", "Durata delle richieste HTTP (fino all'ultimo byte inviato)", ("method", "route"))
+HTTP_IN_CORSO = Gauge("http_requests_in_flight", "Richieste HTTP in corso")
+
+# --- Metriche database ---
+DB_QUERY = Contatore("db_statements_total", "Query SQL eseguite", ("route",))
+DB_TEMPO = Contatore("db_time_seconds_total", "Tempo trascorso nelle query SQL", ("route",))
+DB_QUERY_PER_RICHIESTA = Istogramma("db_statements_per_request", "Query SQL per richiesta HTTP", ("route",), bucket=BUCKET_QUERY)
+
+# --- Metriche applicative ---
+PDF_DURATA = Istogramma("pdf_render_seconds", "Tempo di generazione dei PDF dei RIT", bucket=BUCKET_PDF)
+PDF_ULTIMA_DURATA = Gauge("pdf_render_last_seconds", "Durata dell'ultima generazione PDF")
+JOB_ESECUZIONI = Contatore("scheduler_job_runs_total", "Esecuzioni dei job schedulati", ("job", "status"))
+JOB_ULTIMA_DURATA = Gauge("scheduler_job_last_duration_seconds", "Durata dell'ultima esecuzione del job", ("job",))
+JOB_ULTIMO_SUCCESSO = Gauge("scheduler_job_last_success_timestamp_seconds", "Ultima esecuzione riuscita del job (epoch)", ("job",))
+EMAIL_IN_CODA = Gauge("email_queue_pending", "Email programmate in background e non ancora inviate")
+EMAIL_INVIATE = Contatore("emails_sent_total", "Email inviate per esito", ("esito",))
+GEOCODING_RICHIESTE = Contatore("geocoding_requests_total", "Ricerche indirizzi per origine della risposta", ("origine",))
+
+
+# --- Query per richiesta (eventi SQLAlchemy) ---
+class _StatisticheDb:
+    __slots__ = ("query", "tempo")
+
+    def __init__(self):
+        self.query = 0
+        self.tempo = 0.0
+
+
+_statistiche_richiesta: contextvars.ContextVar[Optional[_StatisticheDb]] = contextvars.ContextVar("statistiche_db", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _prima_della_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metriche_inizio_query", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _dopo_la_query(conn, cursor, statement, parameters, context, executemany):
+    inizi = conn.info.get("metriche_inizio_query")
+    if not inizi:
+        return
+    durata = time.perf_counter() - inizi.pop()
+    statistiche = _statistiche_richiesta.get()
+    if statistiche is not None:
+        # Il contatore della route viene aggiornato a fine richiesta (un lock per richiesta, non per query)
+        statistiche.query += 1
+        statistiche.tempo += durata
+    else:
+        # Query fuori da una richiesta HTTP (scheduler, thread di background)
+        DB_QUERY.inc("-")
+        DB_TEMPO.inc("-", valore=durata)
+
+
+# --- Middleware HTTP ---
+_route_per_endpoint: Dict[Callable, str] = {}
+
+
+def nome_route(scope) -> str:
+    """Percorso dichiarato della route (dall'endpoint risolto dal router)"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "non_trovata"
+    nome = _route_per_endpoint.get(endpoint)
+    if nome is None:
+        route = scope.get("route")
+        nome = getattr(route, "path", None)
+        if nome is None:
+            for candidata in getattr(scope.get("app"), "routes", []):
+                # Route normali (endpoint) e directory montate come /uploads (app)
+                if getattr(candidata, "endpoint", None) is endpoint or getattr(candidata, "app", None) is endpoint:
+                    nome = candidata.path
+                    break
+        nome = nome or getattr(endpoint, "__name__", "sconosciuta")
+        _route_per_endpoint[endpoint] = nome
+    return nome
+
+
+class MetricheMiddleware:
+    """Middleware ASGI (senza BaseHTTPMiddleware: nessun costo aggiuntivo sulle risposte in streaming)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stato = {"codice": 500, "registrata": False}
+        statistiche = _StatisticheDb()
+        token = _statistiche_richiesta.set(statistiche)
+
+        def registra():
+            # Una sola volta per richiesta: all'ultimo blocco della risposta o, se la risposta
+            # non è stata inviata (eccezione), alla fine della richiesta
+            if stato["registrata"]:
+                return
+            stato["registrata"] = True
+            durata = time.perf_counter() - inizio
+            HTTP_IN_CORSO.dec()
+            route = nome_route(scope)
+            metodo = scope.get("method", "")
+            HTTP_RICHIESTE.inc(metodo, route, stato["codice"])
+            HTTP_DURATA.observe(durata, metodo, route)
+            DB_QUERY_PER_RICHIESTA.observe(statistiche.query, route)
+            if statistiche.query:
+                DB_QUERY.inc(route, valore=statistiche.query)
+                DB_TEMPO.inc(route, valore=statistiche.tempo)
+
+        async def send_con_stato(messaggio):
+            if messaggio["type"] == "http.response.start":
+                stato["codice"] = messaggio["status"]
+            await send(messaggio)
+            # I BackgroundTasks girano dopo l'ultimo blocco, dentro self.app: non fanno parte
+            # della durata della richiesta (le loro query non vengono conteggiate)
+            if messaggio["type"] == "http.response.body" and not messaggio.get("more_body", False):
+                registra()
+
+        HTTP_IN_CORSO.inc()
+        inizio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_con_stato)
+        finally:
+            registra()
+            _statistiche_richiesta.reset(token)
+
+
+# --- Helper per il codice applicativo ---
+def cronometra(istogramma: Istogramma, ultima: Optional[Gauge] = None):
+    """Decoratore: osserva la durata della funzione (e la salva in un gauge "ultima durata")"""
+    def decoratore(funzione):
+        @functools.wraps(funzione)
+        def wrapper(*args, **kwargs):
+            inizio = time.perf_counter()
+            try:
+                return funzione(*args, **kwargs)
+            finally:
+                durata = time.perf_counter() - inizio
+                istogramma.observe(durata)
+                if ultima is not None:
+                    ultima.set(durata)
+        return wrapper
+    return decoratore
+
+
+def in_coda(gauge: Gauge, funzione: Callable) -> Callable:
+    """
+    Per i background task: incrementa il gauge subito (task programmato) e lo
+    decrementa quando il task termina.
+    """
+    gauge.inc()
+
+    @functools.wraps(funzione)
+    def wrapper(*args, **kwargs):
+        try:
+            return funzione(*args, **kwargs)
+        finally:
+            gauge.dec()
+    return wrapper
+
+
+def registra_job(job_id: str, esito: str, durata: float):
+    JOB_ESECUZIONI.inc(job_id, esito)
+    JOB_ULTIMA_DURATA.set(durata, job_id)
+    if esito == "success":
+        JOB_ULTIMO_SUCCESSO.set(time.time(), job_id)
+
+
+def esporta() -> str:
+    """Tutte le metriche nel formato di esposizione testuale (text/plain; version=0.0.4)"""
+    righe = []
+    for metrica in _REGISTRO:
+        righe.extend(metrica.esporta())
+    return "\n".join(righe) + "\n"
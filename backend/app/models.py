@@ -74,6 +74,12 @@ class Cliente(Base):
     chiamate_utilizzate_contratto = Column(Integer, default=0)  # Contatore chiamate utilizzate
     costo_chiamata_fuori_limite = Column(Float, nullable=True)  # Costo chiamata quando si supera il limite
     
+    # Coordinate dell'indirizzo (geocodificate in background, vedi app/services/coordinate.py)
+    latitudine = Column(Float, nullable=True)
+    longitudine = Column(Float, nullable=True)
+    geocodifica_il = Column(DateTime, nullable=True)  # Ultimo tentativo di geocodifica (NULL = da geocodificare)
+    aggiornato_il = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # Ultima modifica (ETag delle risposte, app/cache_http.py)
+    
     # Relazioni
     assets_noleggio = relationship("AssetCliente", back_populates="cliente", cascade="all, delete-orphan")
     sedi = relationship("SedeCliente", back_populates="cliente", cascade="all, delete-orphan")
@@ -89,6 +95,10 @@ class SedeCliente(Base):
     cap = Column(String, nullable=True)
     telefono = Column(String, nullable=True)
     email = Column(String, nullable=True)
+    latitudine = Column(Float, nullable=True)
+    longitudine = Column(Float, nullable=True)
+    geocodifica_il = Column(DateTime, nullable=True)  # Ultimo tentativo di geocodifica (NULL = da geocodificare)
+    aggiornato_il = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # Ultima modifica (ETag delle risposte, app/cache_http.py)
     
     cliente = relationship("Cliente", back_populates="sedi")
 
@@ -126,6 +136,7 @@ class AssetCliente(Base):
     seriale = Column(String, nullable=True)  # Numero seriale (solo per IT)
     descrizione = Column(Text, nullable=True)  # Descrizione prodotto (solo per IT)
     is_nuovo = Column(Boolean, nullable=True)  # True = nuovo, False = ricondizionato (solo per IT)
+    aggiornato_il = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # Ultima modifica (ETag delle risposte, app/cache_http.py)
     
     cliente = relationship("Cliente", back_populates="assets_noleggio")
     sede = relationship("SedeCliente", backref="assets_noleggio")
@@ -140,6 +151,22 @@ class ProdottoMagazzino(Base):
     giacenza = Column(Integer, default=0)
     categoria = Column(String, nullable=True)
 
+class MovimentoMagazzino(Base):
+    """
+    Registro dei movimenti di magazzino (solo inserimenti, mai modificati o cancellati).
+    La somma di quantita per prodotto coincide con la giacenza: permette di ricostruirla e verificarla.
+    """
+    __tablename__ = "movimenti_magazzino"
+    id = Column(Integer, primary_key=True, index=True)
+    prodotto_id = Column(Integer, ForeignKey("magazzino.id"), nullable=False, index=True)
+    intervento_id = Column(Integer, ForeignKey("interventi.id"), nullable=True, index=True)
+    tipo = Column(String, nullable=False)  # 'saldo_iniziale', 'carico_iniziale', 'scarico_rit', 'rettifica'
+    quantita = Column(Integer, nullable=False)  # Variazione con segno: negativa per gli scarichi
+    giacenza_risultante = Column(Integer, nullable=True)  # Giacenza dopo il movimento
+    utente_id = Column(Integer, ForeignKey("utenti.id"), nullable=True)
+    note = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
 # --- MODELLO INTERVENTO ---
 class Intervento(Base):
     __tablename__ = "interventi"
@@ -192,6 +219,8 @@ class Intervento(Base):
     nome_cliente = Column(String, nullable=True)  # Nome del cliente che firma
     cognome_cliente = Column(String, nullable=True)  # Cognome del cliente che firma
     
+    aggiornato_il = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # Ultima modifica, anche di dettagli e ricambi (ETag, app/cache_http.py)
+    
     # Relazioni
     cliente_rel = relationship("Cliente", back_populates="interventi")
     dettagli = relationship("DettaglioIntervento", back_populates="intervento", cascade="all, delete-orphan")
@@ -235,6 +264,43 @@ class LetturaCopie(Base):
     asset = relationship("AssetCliente", backref="letture_copie")
     intervento = relationship("Intervento", backref="letture_copie")
     tecnico = relationship("Utente")
+    # Calcolo copie e addebiti del periodo (una riga per lettura, vedi services/fatturazione_copie.py)
+    riga_fatturazione = relationship("RigaFatturazioneCopie", uselist=False, lazy="joined", viewonly=True)
+
+class RigaFatturazioneCopie(Base):
+    """
+    Riga di fatturazione copie per una lettura: copie del periodo (differenza con la lettura
+    precedente o con i contatori iniziali), copie incluse, eccedenti e importi.
+    Calcolata dal motore services/fatturazione_copie.py, letta da PDF ed export.
+    """
+    __tablename__ = "righe_fatturazione_copie"
+    id = Column(Integer, primary_key=True, index=True)
+    lettura_id = Column(Integer, ForeignKey("letture_copie.id", ondelete="CASCADE"), nullable=False, unique=True, index=True)
+    asset_id = Column(Integer, ForeignKey("assets_cliente.id"), nullable=False, index=True)
+    cliente_id = Column(Integer, ForeignKey("clienti.id"), nullable=True, index=True)
+    intervento_id = Column(Integer, nullable=True, index=True)
+    data_lettura = Column(DateTime, nullable=False, index=True)
+    data_lettura_precedente = Column(DateTime, nullable=True)  # Null = prima lettura (confronto con i contatori iniziali)
+    cadenza = Column(String, nullable=True)
+    mesi_periodo = Column(Integer, nullable=False, default=3)
+    # B/N
+    contatore_bn_precedente = Column(Integer, nullable=True)
+    contatore_bn = Column(Integer, nullable=True)
+    copie_bn = Column(Integer, nullable=False, default=0)
+    copie_incluse_bn = Column(Integer, nullable=False, default=0)  # Copie incluse nel periodo (mensili x mesi cadenza)
+    copie_addebitate_bn = Column(Integer, nullable=False, default=0)  # Eccedenti, o tutte se le copie non sono incluse
+    costo_copia_bn = Column(Float, nullable=True)
+    importo_bn = Column(Float, nullable=False, default=0.0)
+    # Colore
+    contatore_colore_precedente = Column(Integer, nullable=True)
+    contatore_colore = Column(Integer, nullable=True)
+    copie_colore = Column(Integer, nullable=False, default=0)
+    copie_incluse_colore = Column(Integer, nullable=False, default=0)
+    copie_addebitate_colore = Column(Integer, nullable=False, default=0)
+    costo_copia_colore = Column(Float, nullable=True)
+    importo_colore = Column(Float, nullable=False, default=0.0)
+    importo_totale = Column(Float, nullable=False, default=0.0)
+    calcolata_il = Column(DateTime, default=datetime.now, nullable=False)
 
 class ImpostazioniAzienda(Base):
     __tablename__ = "impostazioni_azienda"
@@ -279,4 +345,25 @@ class AuditLog(Base):
     ip_address = Column(String, nullable=True)  # IP dell'utente
     timestamp = Column(DateTime, default=datetime.now, nullable=False, index=True)
     
-    user = relationship("Utente", backref="audit_logs")
\ No newline at end of file
+    user = relationship("Utente", backref="audit_logs")
+
+class StoricoJob(Base):
+    """Storico delle esecuzioni dei job dello scheduler (notifiche scadenze)"""
+    __tablename__ = "storico_job"
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, nullable=False, index=True)  # 'check_scadenze_contratti', 'check_scadenze_letture_copie'
+    started_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_ms = Column(Float, nullable=True)
+    status = Column(String, nullable=False)  # 'success', 'error'
+    affected_rows = Column(Integer, nullable=True)  # Totale notifiche/asset elaborati
+    details = Column(JSONB, nullable=True)  # Conteggi per tipo: {"noleggi": 3, "contratti_assistenza": 1}
+    error = Column(Text, nullable=True)
+
+class GeocodingCache(Base):
+    """Cache persistente delle ricerche indirizzi (proxy Nominatim), condivisa tra i worker"""
+    __tablename__ = "geocoding_cache"
+    id = Column(Integer, primary_key=True, index=True)
+    query = Column(String, nullable=False, unique=True, index=True)  # Query normalizzata (minuscolo, spazi compattati)
+    risultati = Column(JSONB, nullable=False)  # Risposta di Nominatim (lista, anche vuota)
+    aggiornato_il = Column(DateTime, default=datetime.now, nullable=False, index=True)
@@ -0,0 +1,320 @@
+"""
+Profiling delle singole richieste e log delle query lente.
+
+Profiling (opt-in, nessun costo sulle richieste non profilate):
+- un admin invia l'header "X-Profile: 1" (il ruolo viene letto dal token JWT), oppure
+- una frazione delle richieste viene campionata (PROFILING_SAMPLE_RATE=0.01 = 1%).
+Per la richiesta vengono salvati il profilo del codice (cProfile, oppure pyinstrument con
+PROFILING_ENGINE=pyinstrument) e l'elenco delle query SQL con la durata. Gli ultimi
+PROFILING_MAX_PROFILES profili restano in memoria (per processo) e si consultano con
+GET /api/profiling/ e GET /api/profiling/{id}; la risposta profilata riporta l'header X-Profile-Id.
+
+Gli endpoint sincroni girano nel threadpool: il profiler viene attivato nel thread che esegue
+l'endpoint (RouteProfilabile) e nelle funzioni decorate con @profila (es. invio email in background).
+Le dipendenze (autenticazione) compaiono solo nell'elenco delle query e nella durata totale.
+
+Query lente: le query che superano SLOW_QUERY_MS vengono loggate (WARNING) con l'EXPLAIN
+(solo Postgres, al massimo una volta ogni EXPLAIN_INTERVALLO_SECONDI per statement).
+"""
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Optional
+from fastapi.routing import APIRoute
+from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from . import auth, metrics, models
+from .services import lazy_imports
+
+logger = logging.getLogger(__name__)
+
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "50"))
+PROFILING_ENGINE = os.getenv("PROFILING_ENGINE", "cprofile").lower()
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))  # 0 = disattivato
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+
+HEADER_PROFILING = b"x-profile"
+MAX_QUERY_PER_PROFILO = 500
+MAX_LUNGHEZZA_SQL = 2000
+RIGHE_PROFILO = 40  # funzioni riportate nel profilo cProfile (ordinate per tempo cumulativo)
+EXPLAIN_INTERVALLO_SECONDI = 600
+EXPLAIN_MAX_STATEMENT = 256  # statement ricordati per l'intervallo tra due EXPLAIN (i meno recenti escono)
+PERCORSI_ESCLUSI = ("/api/profiling", "/metrics")
+
+_RUOLI_ADMIN = (models.RuoloUtente.ADMIN.value, models.RuoloUtente.SUPERADMIN.value)
+
+_profili: deque = deque(maxlen=PROFILING_MAX_PROFILES)
+_profili_lock = threading.Lock()
+_profilo_corrente: contextvars.ContextVar[Optional["Profilo"]] = contextvars.ContextVar("profilo_corrente", default=None)
+
+
+class Profilo:
+    """Dati raccolti per una richiesta profilata"""
+
+    def __init__(self, metodo: str, percorso: str, motivo: str, utente: Optional[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.creato_il = datetime.now()
+        self.metodo = metodo
+        self.percorso = percorso
+        self.motivo = motivo
+        self.utente = utente
+        self.route = None
+        self.status = None
+        self.durata_ms = 0.0
+        self.query = []
+        self.query_omesse = 0
+        self.testo_profilo = []
+        self._cprofile = cProfile.Profile() if PROFILING_ENGINE != "pyinstrument" else None
+        # Un solo thread alla volta nel profiler (endpoint e background task sono sequenziali)
+        self._lock = threading.Lock()
+
+    def registra_query(self, statement: str, durata: float):
+        if len(self.query) >= MAX_QUERY_PER_PROFILO:
+            self.query_omesse += 1
+            return
+        self.query.append({"sql": statement[:MAX_LUNGHEZZA_SQL], "durata_ms": round(durata * 1000, 3)})
+
+    def esegui(self, funzione: Callable, *args, **kwargs):
+        """Esegue la funzione nel thread corrente con il profiler attivo"""
+        if sys.getprofile() is not None or not self._lock.acquire(blocking=False):
+            # Profiler già attivo (chiamata annidata) o in uso da un altro thread
+            return funzione(*args, **kwargs)
+        try:
+            pyinstrument = lazy_imports.get_pyinstrument() if self._cprofile is None else None
+            if pyinstrument is not None:
+                profiler = pyinstrument.Profiler(async_mode="disabled")
+                profiler.start()
+                try:
+                    return funzione(*args, **kwargs)
+                finally:
+                    profiler.stop()
+                    self.testo_profilo.append(profiler.output_text(unicode=True, color=False))
+            if self._cprofile is None:
+                self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+            try:
+                return funzione(*args, **kwargs)
+            finally:
+                self._cprofile.disable()
+        finally:
+            self._lock.release()
+
+    def testo(self) -> str:
+        if self._cprofile is None or not self._cprofile.getstats():
+            return "\n".join(self.testo_profilo)
+        import pstats  # Solo per leggere un profilo: non serve all'avvio
+
+        uscita = io.StringIO()
+        pstats.Stats(self._cprofile, stream=uscita).sort_stats("cumulative").print_stats(RIGHE_PROFILO)
+        return "\n".join(self.testo_profilo + [uscita.getvalue()])
+
+    def riepilogo(self) -> dict:
+        return {
+            "id": self.id,
+            "creato_il": self.creato_il,
+            "metodo": self.metodo,
+            "percorso": self.percorso,
+            "route": self.route,
+            "status": self.status,
+            "motivo": self.motivo,
+            "utente": self.utente,
+            "durata_ms": round(self.durata_ms, 1),
+            "numero_query": len(self.query) + self.query_omesse,
+            "tempo_sql_ms": round(sum(q["durata_ms"] for q in self.query), 1),
+        }
+
+    def dettaglio(self) -> dict:
+        return {**self.riepilogo(), "query": self.query, "query_omesse": self.query_omesse, "profilo": self.testo()}
+
+
+def profila(funzione: Callable) -> Callable:
+    """Decoratore: se la richiesta corrente è profilata, profila anche questa funzione (es. background task)"""
+    @functools.wraps(funzione)
+    def wrapper(*args, **kwargs):
+        profilo = _profilo_corrente.get()
+        if profilo is None:
+            return funzione(*args, **kwargs)
+        return profilo.esegui(funzione, *args, **kwargs)
+    return wrapper
+
+
+class RouteProfilabile(APIRoute):
+    """
+    Route che attiva il profiler nel thread dell'endpoint se la richiesta è profilata.
+    Usata come app.router.route_class (estensione documentata di FastAPI).
+    """
+
+    def get_route_handler(self):
+        # Solo gli endpoint sincroni (tutti quelli dell'app): negli async il cProfile del thread
+        # dell'event loop includerebbe anche le altre richieste; per questi restano durata e query
+        if not inspect.iscoroutinefunction(self.dependant.call):
+            self.dependant.call = profila(self.dependant.call)
+        return super().get_route_handler()
+
+
+def _utente_admin(headers) -> Optional[str]:
+    """Email dell'utente se il token Bearer è valido e il ruolo è admin/superadmin"""
+    autorizzazione = headers.get(b"authorization", b"").decode("latin-1")
+    if not autorizzazione.lower().startswith("bearer "):
+        return None
+    try:
+        payload = jwt.decode(autorizzazione[7:], auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub") if payload.get("ruolo") in _RUOLI_ADMIN else None
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI: decide se profilare la richiesta e salva il profilo al termine"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(PERCORSI_ESCLUSI):
+            await self.app(scope, receive, send)
+            return
+
+        motivo, utente = None, None
+        headers = dict(scope.get("headers") or [])
+        if headers.get(HEADER_PROFILING) in (b"1", b"true"):
+            utente = _utente_admin(headers)
+            if utente:
+                motivo = "header"
+        if motivo is None and PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE:
+            motivo = "campionamento"
+        if motivo is None:
+            await self.app(scope, receive, send)
+            return
+
+        profilo = Profilo(scope.get("method", ""), scope["path"], motivo, utente)
+        token = _profilo_corrente.set(profilo)
+
+        async def send_con_id(messaggio):
+            if messaggio["type"] == "http.response.start":
+                profilo.status = messaggio["status"]
+                messaggio["headers"] = list(messaggio.get("headers", [])) + [(b"x-profile-id", profilo.id.encode())]
+            await send(messaggio)
+
+        inizio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_con_id)
+        finally:
+            # Include i background task (eseguiti dopo l'invio della risposta)
+            profilo.durata_ms = (time.perf_counter() - inizio) * 1000
+            _profilo_corrente.reset(token)
+            profilo.route = metrics.nome_route(scope)
+            with _profili_lock:
+                _profili.append(profilo)
+            logger.info("Profilo %s: %s %s %.0f ms, %s query", profilo.id, profilo.metodo, profilo.percorso, profilo.durata_ms, len(profilo.query))
+
+
+def elenco_profili() -> list:
+    """Riepilogo dei profili salvati, dal più recente"""
+    with _profili_lock:
+        profili = list(_profili)
+    return [p.riepilogo() for p in reversed(profili)]
+
+
+def get_profilo(profilo_id: str) -> Optional[dict]:
+    with _profili_lock:
+        profilo = next((p for p in _profili if p.id == profilo_id), None)
+    return profilo.dettaglio() if profilo is not None else None
+
+
+def svuota_profili():
+    with _profili_lock:
+        _profili.clear()
+
+
+# --- Query SQL: elenco per il profilo e log delle query lente ---
+_STATEMENT_EXPLAIN = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+# Statement -> ultimo EXPLAIN. Limitato: le IN (...) espanse producono un testo diverso per ogni
+# lunghezza della lista. Letto e scritto dai thread del threadpool, quindi protetto da un lock.
+_ultimi_explain: "OrderedDict[str, float]" = OrderedDict()
+_ultimi_explain_lock = threading.Lock()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _prima_della_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiling_inizio_query", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _dopo_la_query(conn, cursor, statement, parameters, context, executemany):
+    inizi = conn.info.get("profiling_inizio_query")
+    if not inizi:
+        return
+    durata = time.perf_counter() - inizi.pop()
+    profilo = _profilo_corrente.get()
+    if profilo is not None:
+        profilo.registra_query(statement, durata)
+    if SLOW_QUERY_MS and durata * 1000 >= SLOW_QUERY_MS:
+        _log_query_lenta(conn, statement, parameters, durata, executemany)
+
+
+def _log_query_lenta(conn, statement, parameters, durata, executemany):
+    piano = None
+    if SLOW_QUERY_EXPLAIN and not executemany and conn.dialect.name == "postgresql" \
+            and statement.split(None, 1)[0].upper() in _STATEMENT_EXPLAIN:
+        if _explain_dovuto(statement):
+            piano = _explain(conn, statement, parameters)
+    if piano:
+        logger.warning("Query lenta (%.0f ms): %s\nParametri: %r\nEXPLAIN:\n%s", durata * 1000, statement, parameters, piano)
+    else:
+        logger.warning("Query lenta (%.0f ms): %s\nParametri: %r", durata * 1000, statement, parameters)
+
+
+def _explain_dovuto(statement: str) -> bool:
+    """True (e registra l'istante) se lo statement non ha avuto un EXPLAIN negli ultimi EXPLAIN_INTERVALLO_SECONDI"""
+    adesso = time.monotonic()
+    with _ultimi_explain_lock:
+        ultimo = _ultimi_explain.get(statement)
+        if ultimo is not None and adesso - ultimo < EXPLAIN_INTERVALLO_SECONDI:
+            return False
+        _ultimi_explain[statement] = adesso
+        _ultimi_explain.move_to_end(statement)
+        while len(_ultimi_explain) > EXPLAIN_MAX_STATEMENT:
+            _ultimi_explain.popitem(last=False)
+        return True
+
+
+def _explain(conn, statement, parameters) -> Optional[str]:
+    """
+    EXPLAIN (senza ANALYZE: la query non viene rieseguita) su un cursore DBAPI della stessa
+    connessione, dentro un savepoint: un errore non invalida la transazione della richiesta.
+    """
+    try:
+        cursore = conn.connection.dbapi_connection.cursor()
+    except Exception as e:
+        logger.debug("EXPLAIN non riuscito: %s", e)
+        return None
+    try:
+        cursore.execute("SAVEPOINT explain_query_lenta")
+        try:
+            cursore.execute("EXPLAIN " + statement, parameters)
+            piano = "\n".join(riga[0] for riga in cursore.fetchall())
+            cursore.execute("RELEASE SAVEPOINT explain_query_lenta")
+            return piano
+        except Exception as e:
+            cursore.execute("ROLLBACK TO SAVEPOINT explain_query_lenta")
+            logger.debug("EXPLAIN non riuscito: %s", e)
+            return None
+    except Exception as e:
+        logger.debug("EXPLAIN non riuscito: %s", e)
+        return None
+    finally:
+        cursore.close()
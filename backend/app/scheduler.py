@@ -0,0 +1,269 @@
+"""
+Scheduler per le notifiche scadenze (contratti e letture copie).
+
+Con più worker uvicorn ogni processo importa l'app: per evitare che gli stessi
+job delle 9:00 partano N volte, lo scheduler viene avviato solo dal processo
+che ottiene un advisory lock Postgres (leader). Il lock è di sessione e resta
+valido finché la connessione dedicata rimane aperta: se il leader termina,
+Postgres lo rilascia e un altro processo lo acquisisce al tentativo successivo.
+
+I job sono salvati nel database (SQLAlchemyJobStore, tabella apscheduler_jobs):
+se nessun worker è attivo all'orario previsto, l'esecuzione persa viene recuperata
+al riavvio entro SCHEDULER_MISFIRE_GRACE_SECONDS (più esecuzioni perse = una sola).
+Ogni esecuzione viene registrata in storico_job con durata e righe interessate.
+"""
+import logging
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.util import ref_to_obj
+from . import database, models, metrics
+
+logger = logging.getLogger(__name__)
+
+# Chiave dell'advisory lock usato per eleggere il leader dello scheduler
+SCHEDULER_LOCK_KEY = int(os.getenv("SCHEDULER_LOCK_KEY", "540054"))
+# Permette di disabilitare lo scheduler su istanze dedicate solo alle API
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Entro quanti secondi un'esecuzione persa viene ancora recuperata (default 12 ore)
+SCHEDULER_MISFIRE_GRACE_SECONDS = int(os.getenv("SCHEDULER_MISFIRE_GRACE_SECONDS", str(12 * 3600)))
+# Ogni quanti secondi i processi non leader riprovano a diventare leader (e il leader verifica il lock)
+SCHEDULER_LEADER_CHECK_SECONDS = int(os.getenv("SCHEDULER_LEADER_CHECK_SECONDS", "60"))
+
+# Definizione dei job: id -> (funzione per riferimento testuale, trigger, nome)
+# Riferimento testuale: questo modulo non importa app.main e i job restano serializzabili nel job store
+JOBS = {
+    'check_scadenze_contratti': (
+        "app.main:check_scadenze_contratti",
+        CronTrigger(day_of_week='mon', hour=9, minute=0),  # Ogni lunedì alle 9:00
+        'Controllo scadenze contratti (noleggio e assistenza) - Settimanale',
+    ),
+    'check_scadenze_letture_copie': (
+        "app.main:check_scadenze_letture_copie",
+        CronTrigger(hour=9, minute=0),  # Ogni giorno alle 9:00
+        'Controllo scadenze letture copie',
+    ),
+}
+
+# Job store con un engine proprio (url=): SQLAlchemyJobStore.shutdown() chiama engine.dispose(),
+# che con database.engine chiuderebbe il pool delle richieste a ogni perdita del lock e allo spegnimento
+scheduler = BackgroundScheduler(
+    jobstores={'default': SQLAlchemyJobStore(
+        url=database.SQLALCHEMY_DATABASE_URL,
+        engine_options={'pool_size': 2, 'pool_pre_ping': True},
+        tablename='apscheduler_jobs',
+    )},
+    job_defaults={
+        'coalesce': True,  # Più esecuzioni perse vengono recuperate con una sola esecuzione
+        'max_instances': 1,
+        'misfire_grace_time': SCHEDULER_MISFIRE_GRACE_SECONDS,
+    }
+)
+
+# Engine senza pool: la connessione del lock non deve occupare uno slot del pool delle richieste
+_lock_engine = None
+_leader_conn = None
+_leader_lock = threading.Lock()
+_monitor_stop = threading.Event()
+_monitor_thread = None
+
+
+def run_tracked_job(job_id: str, func_ref: str):
+    """
+    Esegue un job registrandone l'esito in storico_job.
+    La funzione può restituire un dict di conteggi (es. {"noleggi": 3}): la somma
+    dei valori numerici viene salvata come righe interessate.
+    """
+    started_at = datetime.now()
+    started = time.perf_counter()
+    status, details, error = "success", None, None
+    try:
+        result = ref_to_obj(func_ref)()
+        details = result if isinstance(result, dict) else None
+    except Exception as e:
+        status, error = "error", f"{e}\n{traceback.format_exc()}"
+        logger.error("Job %s terminato con errore: %s", job_id, e)
+    duration_ms = (time.perf_counter() - started) * 1000
+    metrics.registra_job(job_id, status, duration_ms / 1000)
+
+    affected_rows = None
+    if details:
+        affected_rows = sum(v for v in details.values() if isinstance(v, (int, float)) and not isinstance(v, bool))
+
+    try:
+        with database.SessionLocal() as db:
+            db.add(models.StoricoJob(
+                job_id=job_id,
+                started_at=started_at,
+                finished_at=datetime.now(),
+                duration_ms=duration_ms,
+                status=status,
+                affected_rows=affected_rows,
+                details=details,
+                error=error
+            ))
+            db.commit()
+    except Exception as e:
+        logger.warning("Impossibile registrare lo storico del job %s: %s", job_id, e)
+
+
+def _sync_jobs():
+    """
+    Allinea i job del job store con JOBS senza perdere il prossimo orario già salvato:
+    un job esistente con lo stesso trigger NON viene sostituito, così un'esecuzione
+    persa mentre nessun worker era attivo viene recuperata (misfire).
+    """
+    for job_id, (func_ref, trigger, name) in JOBS.items():
+        existing = scheduler.get_job(job_id)
+        if existing is None:
+            scheduler.add_job(
+                "app.scheduler:run_tracked_job",
+                trigger=trigger,
+                args=[job_id, func_ref],
+                id=job_id,
+                name=name
+            )
+        elif str(existing.trigger) != str(trigger) or list(existing.args) != [job_id, func_ref]:
+            scheduler.add_job(
+                "app.scheduler:run_tracked_job",
+                trigger=trigger,
+                args=[job_id, func_ref],
+                id=job_id,
+                name=name,
+                replace_existing=True
+            )
+
+
+def try_acquire_leadership() -> bool:
+    """Tenta (senza attendere) di ottenere l'advisory lock del leader"""
+    global _lock_engine, _leader_conn
+    if _leader_conn is not None:
+        return True
+    if _lock_engine is None:
+        _lock_engine = create_engine(database.SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+
+    conn = _lock_engine.connect()
+    try:
+        acquired = bool(conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": SCHEDULER_LOCK_KEY}
+        ).scalar())
+        # Il lock è di sessione: chiudiamo la transazione per non restare "idle in transaction"
+        conn.commit()
+    except Exception:
+        conn.close()
+        raise
+
+    if acquired:
+        _leader_conn = conn
+    else:
+        conn.close()
+    return acquired
+
+
+def _leadership_alive() -> bool:
+    """Verifica che la connessione che detiene il lock sia ancora aperta"""
+    if _leader_conn is None:
+        return False
+    try:
+        _leader_conn.execute(text("SELECT 1"))
+        _leader_conn.commit()
+        return True
+    except Exception:
+        return False
+
+
+def release_leadership():
+    """Rilascia l'advisory lock e chiude la connessione dedicata"""
+    global _leader_conn
+    if _leader_conn is None:
+        return
+    try:
+        _leader_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEDULER_LOCK_KEY})
+        _leader_conn.commit()
+    except Exception as e:
+        logger.warning("Errore rilascio lock scheduler: %s", e)
+    finally:
+        try:
+            _leader_conn.close()
+        except Exception:
+            pass
+        _leader_conn = None
+
+
+def _become_leader_if_possible() -> bool:
+    """Un tentativo di elezione: se il lock è ottenuto avvia lo scheduler"""
+    with _leader_lock:
+        if scheduler.running:
+            if _leadership_alive():
+                return True
+            # Connessione del lock persa (es. riavvio DB): un altro processo può essere diventato leader
+            logger.warning("Lock scheduler perso (pid %s): scheduler in pausa", os.getpid())
+            scheduler.shutdown(wait=False)
+            release_leadership()
+
+        try:
+            if not try_acquire_leadership():
+                return False
+        except Exception as e:
+            logger.warning("Impossibile verificare il leader dello scheduler: %s", e)
+            return False
+
+        try:
+            # Avvio in pausa: i job vengono allineati prima che possano partire
+            scheduler.start(paused=True)
+            _sync_jobs()
+            scheduler.resume()
+        except Exception as e:
+            logger.error("Errore avvio scheduler: %s", e)
+            if scheduler.running:
+                scheduler.shutdown(wait=False)
+            release_leadership()
+            return False
+
+        logger.info(
+            "Scheduler notifiche scadenze avviato (leader pid %s): contratti (noleggio e assistenza) "
+            "ogni lunedì alle 9:00, letture copie ogni giorno alle 9:00", os.getpid()
+        )
+        return True
+
+
+def _leadership_monitor():
+    """Thread di controllo: i follower riprovano l'elezione, il leader verifica il proprio lock"""
+    while not _monitor_stop.wait(SCHEDULER_LEADER_CHECK_SECONDS):
+        _become_leader_if_possible()
+
+
+def start_scheduler() -> bool:
+    """Avvia lo scheduler se questo processo è il leader. Restituisce True se avviato."""
+    global _monitor_thread
+    if not SCHEDULER_ENABLED:
+        logger.info("Scheduler notifiche scadenze disabilitato (SCHEDULER_ENABLED=false)")
+        return False
+
+    is_leader = _become_leader_if_possible()
+    if not is_leader:
+        logger.info("Scheduler notifiche scadenze in attesa: un altro processo è leader (pid %s)", os.getpid())
+
+    if _monitor_thread is None:
+        _monitor_stop.clear()
+        _monitor_thread = threading.Thread(target=_leadership_monitor, name="scheduler-leader-monitor", daemon=True)
+        _monitor_thread.start()
+    return is_leader
+
+
+def shutdown_scheduler():
+    """Ferma lo scheduler (se in esecuzione) e rilascia la leadership"""
+    global _monitor_thread
+    _monitor_stop.set()
+    _monitor_thread = None
+    with _leader_lock:
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        release_leadership()
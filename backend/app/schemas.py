@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 from .models import MacroCategoria, RuoloUtente
 
 # --- SCHEMAS UTENTE ---
@@ -89,6 +89,8 @@ class SedeClienteCreate(SedeClienteBase):
 class SedeClienteResponse(SedeClienteBase):
     id: int
     cliente_id: int
+    latitudine: Optional[float] = None
+    longitudine: Optional[float] = None
     class Config:
         from_attributes = True
 
@@ -133,11 +135,70 @@ class ClienteCreate(ClienteBase):
 
 class ClienteResponse(ClienteBase):
     id: int
+    latitudine: Optional[float] = None
+    longitudine: Optional[float] = None
     sedi: List[SedeClienteResponse] = []
     assets_noleggio: List[AssetClienteResponse] = []
     class Config:
         from_attributes = True
 
+class ClienteListItem(ClienteBase):
+    """Cliente per liste e autocomplete: solo dati anagrafici, senza sedi e assets"""
+    id: int
+    class Config:
+        from_attributes = True
+
+class ClienteLookup(BaseModel):
+    """Risultato minimo per l'autocomplete (/clienti/lookup)"""
+    id: int
+    ragione_sociale: str
+    p_iva: Optional[str] = None
+    citta: Optional[str] = None
+    class Config:
+        from_attributes = True
+
+class PuntoVicino(BaseModel):
+    """Cliente o sede vicino a una posizione (/clienti/vicini)"""
+    cliente_id: int
+    ragione_sociale: Optional[str] = None
+    sede_id: Optional[int] = None
+    nome_sede: Optional[str] = None
+    indirizzo: Optional[str] = None
+    latitudine: float
+    longitudine: float
+    distanza_km: float
+
+# --- SCHEMAS PERCORSI ---
+class Posizione(BaseModel):
+    latitudine: float
+    longitudine: float
+
+class ChiamataPercorso(BaseModel):
+    id: int  # ID intervento
+    numero_relazione: Optional[str] = None
+    cliente_id: Optional[int] = None
+    sede_id: Optional[int] = None
+    cliente_ragione_sociale: Optional[str] = None
+    sede_nome: Optional[str] = None
+    indirizzo: Optional[str] = None
+    latitudine: Optional[float] = None
+    longitudine: Optional[float] = None
+
+class VisitaPercorso(ChiamataPercorso):
+    ordine: int
+    distanza_precedente_km: float  # In linea d'aria dalla tappa precedente (o dalla partenza)
+    distanza_progressiva_km: float
+
+class PercorsoTecnicoResponse(BaseModel):
+    tecnico_id: int
+    data: date
+    partenza: Optional[Posizione] = None
+    ritorno: bool = False
+    visite: List[VisitaPercorso] = []
+    senza_coordinate: List[ChiamataPercorso] = []  # Indirizzi non ancora geocodificati o non trovati
+    distanza_totale_km: float
+    distanza_ordine_creazione_km: float  # Stesse tappe nell'ordine di creazione delle chiamate
+
 # --- SCHEMAS INTERVENTO ---
 class DettaglioAssetBase(BaseModel):
     categoria_it: Optional[str] = None
@@ -236,6 +297,19 @@ class ProdottoResponse(ProdottoBase):
     class Config:
         from_attributes = True
 
+class MovimentoMagazzinoResponse(BaseModel):
+    id: int
+    prodotto_id: int
+    intervento_id: Optional[int] = None
+    tipo: str
+    quantita: int
+    giacenza_risultante: Optional[int] = None
+    utente_id: Optional[int] = None
+    note: Optional[str] = None
+    created_at: datetime
+    class Config:
+        from_attributes = True
+
 # --- SCHEMAS IMPOSTAZIONI ---
 class ImpostazioniAziendaBase(BaseModel):
     nome_azienda: str
@@ -283,12 +357,63 @@ class LetturaCopieBase(BaseModel):
 class LetturaCopieCreate(LetturaCopieBase):
     pass
 
+class LetturaCopieBatchItem(BaseModel):
+    asset_id: int
+    contatore_bn: int
+    contatore_colore: Optional[int] = 0
+    note: Optional[str] = None
+
+class LetturaCopieBatchCreate(BaseModel):
+    """Letture copie di un RIT (una per macchina), salvate in un'unica transazione"""
+    letture: List[LetturaCopieBatchItem]
+
 class LetturaCopieResponse(LetturaCopieBase):
     id: int
     created_at: datetime
     class Config:
         from_attributes = True
 
+class RigaFatturazioneCopieResponse(BaseModel):
+    id: int
+    lettura_id: int
+    asset_id: int
+    cliente_id: Optional[int] = None
+    intervento_id: Optional[int] = None
+    data_lettura: datetime
+    data_lettura_precedente: Optional[datetime] = None
+    cadenza: Optional[str] = None
+    mesi_periodo: int
+    contatore_bn_precedente: Optional[int] = None
+    contatore_bn: Optional[int] = None
+    copie_bn: int
+    copie_incluse_bn: int
+    copie_addebitate_bn: int
+    costo_copia_bn: Optional[float] = None
+    importo_bn: float
+    contatore_colore_precedente: Optional[int] = None
+    contatore_colore: Optional[int] = None
+    copie_colore: int
+    copie_incluse_colore: int
+    copie_addebitate_colore: int
+    costo_copia_colore: Optional[float] = None
+    importo_colore: float
+    importo_totale: float
+    calcolata_il: datetime
+    class Config:
+        from_attributes = True
+
+class VolumiCopieMensiliResponse(BaseModel):
+    cliente_id: Optional[int] = None
+    cliente_ragione_sociale: Optional[str] = None
+    anno: int
+    mese: int
+    letture: int
+    copie_bn: int
+    copie_colore: int
+    copie_addebitate_bn: int
+    copie_addebitate_colore: int
+    importo_totale: float
+
 # --- SCHEMAS AUDIT LOG ---
 class AuditLogResponse(BaseModel):
     id: int
@@ -305,3 +430,41 @@ class AuditLogResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+# --- SCHEMAS SCHEDULER ---
+class StoricoJobResponse(BaseModel):
+    id: int
+    job_id: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+    status: str  # success, error
+    affected_rows: Optional[int] = None
+    details: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+# --- SCHEMAS PROFILING ---
+class ProfiloRichiestaResponse(BaseModel):
+    id: str
+    creato_il: datetime
+    metodo: str
+    percorso: str
+    route: Optional[str] = None
+    status: Optional[int] = None
+    motivo: str  # header, campionamento
+    utente: Optional[str] = None
+    durata_ms: float
+    numero_query: int
+    tempo_sql_ms: float
+
+class QueryProfilo(BaseModel):
+    sql: str
+    durata_ms: float
+
+class ProfiloRichiestaDettaglioResponse(ProfiloRichiestaResponse):
+    query: List[QueryProfilo]
+    query_omesse: int = 0
+    profilo: str
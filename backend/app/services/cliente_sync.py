@@ -0,0 +1,506 @@
+"""
+Sincronizzazione delle collezioni figlie di un cliente (asset a noleggio e sedi).
+
+Il payload di aggiornamento del cliente contiene l'elenco completo di asset e sedi:
+calcola_diff_assets / calcola_diff_sedi lo confrontano con lo stato del DB e producono
+inserimenti, aggiornamenti (solo i campi cambiati) ed eliminazioni. I vincoli
+("asset con letture copie", "sede usata da interventi o asset") sono verificati con
+una query EXISTS sull'insieme degli id candidati, sempre limitata al cliente.
+
+applica_piano esegue le modifiche con operazioni bulk. Lo stesso diff alimenta
+la preview (/clienti/{id}/preview-changes) e l'aggiornamento (PUT /clienti/{id}):
+la preview salva il piano in una cache breve (chiave = hash di cliente e payload)
+e il salvataggio che segue lo riusa invece di ricalcolarlo.
+La cache è locale al processo (invalida_piani non raggiunge gli altri worker): il piano
+contiene quindi lo stato di sedi e asset su cui è stato calcolato (id e aggiornato_il) e il
+salvataggio lo riusa solo se piano_attuale conferma che quelle righe non sono cambiate.
+"""
+import logging
+import copy
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import exists, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from .. import models
+from .coordinate import azzera_se_cambiato
+
+logger = logging.getLogger(__name__)
+
+# Nome della sede creata automaticamente quando sede_legale_operativa è attivo
+SEDE_LEGALE_NOME = "Sede Legale/Centrale"
+
+# Campi che, se 0 o None nel payload, non sovrascrivono il valore salvato
+CONTATORI_INIZIALI = ("contatore_iniziale_bn", "contatore_iniziale_colore")
+
+# Durata (secondi) del piano calcolato dalla preview e riutilizzabile dal salvataggio
+PREVIEW_CACHE_TTL = float(os.getenv("CLIENTE_PREVIEW_CACHE_TTL", "120"))
+PREVIEW_CACHE_MAX_ENTRIES = 256
+
+
+@dataclass
+class DiffAssets:
+    """Modifiche previste sugli asset a noleggio di un cliente"""
+    esistenti: Dict[int, models.AssetCliente] = field(default_factory=dict)
+    da_aggiornare: List[Tuple[models.AssetCliente, Dict[str, Any]]] = field(default_factory=list)  # (asset, campi cambiati)
+    invariati: List[models.AssetCliente] = field(default_factory=list)
+    da_creare: List[Dict[str, Any]] = field(default_factory=list)
+    da_eliminare: List[models.AssetCliente] = field(default_factory=list)
+    protetti: List[models.AssetCliente] = field(default_factory=list)  # Non più nel payload ma con letture copie
+    con_letture_ids: Set[int] = field(default_factory=set)
+
+    def sedi_referenziate(self) -> Set[int]:
+        """Sedi a cui resteranno collegati gli asset dopo l'aggiornamento"""
+        sedi = {valori.get("sede_id", asset.sede_id) for asset, valori in self.da_aggiornare}
+        sedi |= {asset.sede_id for asset in self.invariati}
+        sedi |= {valori.get("sede_id") for valori in self.da_creare}
+        sedi |= {asset.sede_id for asset in self.protetti}
+        return {s for s in sedi if s}
+
+    def piano(self) -> Dict[str, Any]:
+        """Versione serializzabile del diff (solo id e valori), indipendente dalla sessione"""
+        return {
+            "aggiorna": [{"id": asset.id, **cambiati} for asset, cambiati in self.da_aggiornare],
+            "crea": [dict(valori) for valori in self.da_creare],
+            "elimina": [asset.id for asset in self.da_eliminare],
+            "protetti": [asset.id for asset in self.protetti]
+        }
+
+
+@dataclass
+class DiffSedi:
+    """Modifiche previste sulle sedi di un cliente"""
+    esistenti: Dict[int, models.SedeCliente] = field(default_factory=dict)
+    da_aggiornare: List[Tuple[models.SedeCliente, Dict[str, Any]]] = field(default_factory=list)
+    da_creare: List[Dict[str, Any]] = field(default_factory=list)
+    da_eliminare: List[models.SedeCliente] = field(default_factory=list)
+    in_uso: List[models.SedeCliente] = field(default_factory=list)  # Non più richieste ma usate da interventi/asset
+
+    def piano(self) -> Dict[str, Any]:
+        """Versione serializzabile del diff (solo id e valori), indipendente dalla sessione"""
+        return {
+            # Un indirizzo modificato azzera le coordinate (nuova geocodifica in background)
+            "aggiorna": [{"id": sede.id, **azzera_se_cambiato(models.SedeCliente, cambiati)} for sede, cambiati in self.da_aggiornare],
+            "crea": [dict(valori) for valori in self.da_creare],
+            "elimina": [sede.id for sede in self.da_eliminare]
+        }
+
+
+def nome_asset(asset: Any) -> str:
+    """Descrizione breve di un asset (modello o dict): marca modello matricola/seriale"""
+    get = asset.get if isinstance(asset, dict) else lambda key: getattr(asset, key, None)
+    return f"{get('marca') or ''} {get('modello') or ''} {get('matricola') or get('seriale') or ''}".strip()
+
+
+def _to_dict(item: Any) -> Dict[str, Any]:
+    return item.model_dump() if hasattr(item, "model_dump") else dict(item)
+
+
+def normalizza_asset(asset: Any) -> Dict[str, Any]:
+    """Converte un asset del payload in dict pronto per il modello AssetCliente"""
+    asset_dict = _to_dict(asset)
+    # Rimuovi eventuali campi non presenti nel modello
+    asset_dict.pop("tipo_configurazione_bn", None)
+    asset_dict.pop("tipo_configurazione_colore", None)
+    # sede_id 0 significa "nessuna sede"
+    if asset_dict.get("sede_id") in (0, "0"):
+        asset_dict["sede_id"] = None
+    elif asset_dict.get("sede_id") is not None:
+        asset_dict["sede_id"] = int(asset_dict["sede_id"])
+    return asset_dict
+
+
+def _stesso_asset(asset_dict: Dict[str, Any], esistente: models.AssetCliente) -> bool:
+    """Stesso tipo, marca e modello e stessa matricola (Printing) o seriale (IT), senza distinzione di maiuscole"""
+    tipo_asset = asset_dict.get("tipo_asset")
+    if esistente.tipo_asset != tipo_asset:
+        return False
+    for campo in ("marca", "modello"):
+        if (asset_dict.get(campo) or "").strip().lower() != (getattr(esistente, campo) or "").strip().lower():
+            return False
+
+    campo_id = {"Printing": "matricola", "IT": "seriale"}.get(tipo_asset)
+    if campo_id is None:
+        return False
+    nuovo = (asset_dict.get(campo_id) or "").strip().lower()
+    attuale = (getattr(esistente, campo_id) or "").strip().lower()
+    # Match se coincidono, oppure se entrambi sono vuoti (marca/modello già corrispondono)
+    return nuovo == attuale
+
+
+def _campi_cambiati(db_obj: Any, valori: Dict[str, Any], preserva_contatori: bool = False) -> Dict[str, Any]:
+    """Campi del payload diversi dal valore salvato (id escluso)"""
+    cambiati = {}
+    for key, value in valori.items():
+        if key == "id" or not hasattr(db_obj, key):
+            continue
+        # Contatori iniziali non specificati (0/None): preserva il valore esistente
+        if preserva_contatori and key in CONTATORI_INIZIALI and not value:
+            continue
+        if getattr(db_obj, key) != value:
+            cambiati[key] = value
+    return cambiati
+
+
+def asset_ids_con_letture(db: Session, cliente_id: int, asset_ids: Optional[Iterable[int]] = None) -> Set[int]:
+    """Id degli asset del cliente che hanno almeno una lettura copie (non eliminabili)"""
+    query = db.query(models.AssetCliente.id).filter(
+        models.AssetCliente.cliente_id == cliente_id,
+        exists().where(models.LetturaCopie.asset_id == models.AssetCliente.id)
+    )
+    if asset_ids is not None:
+        asset_ids = list(asset_ids)
+        if not asset_ids:
+            return set()
+        query = query.filter(models.AssetCliente.id.in_(asset_ids))
+    return {row[0] for row in query.all()}
+
+
+def _asset_della_sede(escludi_asset_ids: Optional[Iterable[int]] = None):
+    """Condizione "asset collegato alla sede", ignorando gli asset che stanno per essere eliminati"""
+    condizione = models.AssetCliente.sede_id == models.SedeCliente.id
+    escludi = list(escludi_asset_ids or [])
+    if escludi:
+        condizione = condizione & models.AssetCliente.id.notin_(escludi)
+    return condizione
+
+
+def sedi_ids_in_uso(
+    db: Session,
+    cliente_id: int,
+    sede_ids: Iterable[int],
+    escludi_asset_ids: Optional[Iterable[int]] = None
+) -> Set[int]:
+    """
+    Id delle sedi del cliente (tra quelle indicate) referenziate da interventi o asset.
+    Un'unica query con EXISTS invece di leggere tutti i sede_id della tabella interventi.
+    """
+    sede_ids = list(sede_ids)
+    if not sede_ids:
+        return set()
+    rows = db.query(models.SedeCliente.id).filter(
+        models.SedeCliente.cliente_id == cliente_id,
+        models.SedeCliente.id.in_(sede_ids),
+        or_(
+            exists().where(models.Intervento.sede_id == models.SedeCliente.id),
+            exists().where(_asset_della_sede(escludi_asset_ids))
+        )
+    ).all()
+    return {row[0] for row in rows}
+
+
+def conteggio_letture_assets(db: Session, cliente_id: int) -> Dict[int, int]:
+    """Numero di letture copie per ogni asset del cliente che ne ha (una query raggruppata)"""
+    rows = db.query(
+        models.LetturaCopie.asset_id, func.count(models.LetturaCopie.id)
+    ).join(
+        models.AssetCliente, models.AssetCliente.id == models.LetturaCopie.asset_id
+    ).filter(
+        models.AssetCliente.cliente_id == cliente_id
+    ).group_by(models.LetturaCopie.asset_id).all()
+    return dict(rows)
+
+
+def conteggio_utilizzo_sedi(
+    db: Session,
+    cliente_id: int,
+    escludi_asset_ids: Optional[Iterable[int]] = None
+) -> Dict[int, Dict[str, int]]:
+    """
+    Numero di interventi e di asset collegati a ogni sede del cliente (una query).
+    Restituisce solo le sedi in uso: {sede_id: {"interventi": n, "assets": m}}
+    """
+    interventi = select(func.count(models.Intervento.id)).where(
+        models.Intervento.sede_id == models.SedeCliente.id
+    ).correlate(models.SedeCliente).scalar_subquery()
+    assets = select(func.count(models.AssetCliente.id)).where(
+        _asset_della_sede(escludi_asset_ids)
+    ).correlate(models.SedeCliente).scalar_subquery()
+    rows = db.query(models.SedeCliente.id, interventi, assets).filter(
+        models.SedeCliente.cliente_id == cliente_id
+    ).all()
+    return {sede_id: {"interventi": n_int, "assets": n_ass} for sede_id, n_int, n_ass in rows if n_int or n_ass}
+
+
+def calcola_diff_assets(
+    db: Session,
+    cliente_id: int,
+    assets_payload: Optional[Iterable[Any]],
+    con_letture_ids: Optional[Set[int]] = None
+) -> DiffAssets:
+    """
+    Confronta gli asset del payload con quelli del cliente.
+    Un asset esistente è riconosciuto per id oppure per tipo/marca/modello/matricola(seriale),
+    così un salvataggio non duplica gli asset e ne preserva contatori iniziali e letture copie.
+    con_letture_ids: asset con letture già noti (es. da conteggio_letture_assets), evita la query EXISTS.
+    """
+    diff = DiffAssets()
+    diff.esistenti = {
+        a.id: a for a in db.query(models.AssetCliente).filter(models.AssetCliente.cliente_id == cliente_id).all()
+    }
+    if con_letture_ids is not None:
+        diff.con_letture_ids = set(con_letture_ids)
+    else:
+        diff.con_letture_ids = asset_ids_con_letture(db, cliente_id) if diff.esistenti else set()
+
+    processati: Set[int] = set()
+    for asset in assets_payload or []:
+        asset_dict = normalizza_asset(asset)
+        asset_id = asset_dict.get("id")
+
+        db_asset = None
+        if asset_id and asset_id in diff.esistenti and asset_id not in processati:
+            db_asset = diff.esistenti[asset_id]
+        else:
+            for existing_id, existing_asset in diff.esistenti.items():
+                if existing_id not in processati and _stesso_asset(asset_dict, existing_asset):
+                    db_asset = existing_asset
+                    break
+
+        if db_asset is not None:
+            processati.add(db_asset.id)
+            cambiati = _campi_cambiati(db_asset, asset_dict, preserva_contatori=True)
+            if cambiati:
+                diff.da_aggiornare.append((db_asset, cambiati))
+            else:
+                diff.invariati.append(db_asset)
+        else:
+            asset_dict.pop("id", None)
+            diff.da_creare.append(asset_dict)
+
+    # Asset non più presenti: eliminati solo se senza letture copie (dati storici)
+    for asset_id, asset in diff.esistenti.items():
+        if asset_id in processati:
+            continue
+        if asset_id in diff.con_letture_ids:
+            diff.protetti.append(asset)
+        else:
+            diff.da_eliminare.append(asset)
+    return diff
+
+
+def _valori_sede_legale(dati_cliente: Dict[str, Any]) -> Dict[str, Any]:
+    """Valori della sede legale/centrale ricavati dai dati anagrafici del cliente"""
+    return {
+        "indirizzo_completo": f"{dati_cliente.get('indirizzo')}, {dati_cliente.get('citta') or ''} {dati_cliente.get('cap') or ''}".strip(),
+        "citta": dati_cliente.get("citta"),
+        "cap": dati_cliente.get("cap"),
+        "email": dati_cliente.get("email_amministrazione")
+    }
+
+
+def calcola_diff_sedi(
+    db: Session,
+    cliente_id: int,
+    cliente: Any,
+    dati_cliente: Dict[str, Any],
+    sedi_referenziate: Optional[Set[int]] = None,
+    sedi_in_uso_ids: Optional[Set[int]] = None,
+    escludi_asset_ids: Optional[Iterable[int]] = None
+) -> DiffSedi:
+    """
+    Confronta le sedi del payload con quelle del cliente.
+
+    Args:
+        cliente: Payload ClienteCreate (usa has_multisede, sede_legale_operativa, sedi)
+        dati_cliente: Anagrafica del cliente dopo l'aggiornamento (per la sede legale/centrale)
+        sedi_referenziate: Sedi che resteranno collegate ad asset del cliente (vedi DiffAssets.sedi_referenziate)
+        sedi_in_uso_ids: Sedi in uso già note (es. da conteggio_utilizzo_sedi), evita la query EXISTS
+        escludi_asset_ids: Asset che verranno eliminati (non contano come utilizzo della sede)
+    """
+    diff = DiffSedi()
+    diff.esistenti = {
+        s.id: s for s in db.query(models.SedeCliente).filter(models.SedeCliente.cliente_id == cliente_id).all()
+    }
+    per_nome_indirizzo = {(s.nome_sede, s.indirizzo_completo): s for s in diff.esistenti.values()}
+    sede_legale = next((s for s in diff.esistenti.values() if s.nome_sede == SEDE_LEGALE_NOME), None)
+
+    mantenute: Set[int] = set()
+    candidate: List[models.SedeCliente] = []
+
+    # Sede legale gestita automaticamente
+    if cliente.sede_legale_operativa:
+        valori = _valori_sede_legale(dati_cliente)
+        if sede_legale is None:
+            diff.da_creare.append({"nome_sede": SEDE_LEGALE_NOME, "telefono": None, **valori})
+        else:
+            mantenute.add(sede_legale.id)
+            cambiati = _campi_cambiati(sede_legale, valori)
+            if cambiati:
+                diff.da_aggiornare.append((sede_legale, cambiati))
+    elif sede_legale is not None:
+        candidate.append(sede_legale)
+
+    if cliente.has_multisede and cliente.sedi is not None:
+        for sede_data in cliente.sedi:
+            sede_dict = _to_dict(sede_data)
+            # Salta la sede legale se è gestita automaticamente
+            if cliente.sede_legale_operativa and sede_dict.get("nome_sede") == SEDE_LEGALE_NOME:
+                continue
+
+            sede_id = sede_dict.get("id")
+            db_sede = diff.esistenti.get(sede_id) if sede_id else None
+            if db_sede is None and sede_dict.get("nome_sede") and sede_dict.get("indirizzo_completo"):
+                # Nessun ID valido: riusa la sede con stesso nome e indirizzo invece di duplicarla
+                db_sede = per_nome_indirizzo.get((sede_dict["nome_sede"], sede_dict["indirizzo_completo"]))
+
+            if db_sede is not None:
+                if db_sede.id in mantenute:
+                    continue
+                mantenute.add(db_sede.id)
+                cambiati = _campi_cambiati(db_sede, sede_dict)
+                if cambiati:
+                    diff.da_aggiornare.append((db_sede, cambiati))
+            else:
+                sede_dict.pop("id", None)
+                diff.da_creare.append(sede_dict)
+
+        candidate += [s for s in diff.esistenti.values() if s.id not in mantenute and s is not sede_legale]
+    elif not cliente.has_multisede:
+        # Multisede disabilitato: restano solo la sede legale automatica e le sedi in uso
+        candidate += [s for s in diff.esistenti.values() if s.id not in mantenute and s is not sede_legale]
+
+    # Sedi da eliminare: solo se non usate da interventi o asset
+    if sedi_in_uso_ids is not None:
+        in_uso = set(sedi_in_uso_ids)
+    else:
+        in_uso = sedi_ids_in_uso(db, cliente_id, [s.id for s in candidate], escludi_asset_ids)
+    if sedi_referenziate:
+        in_uso |= sedi_referenziate
+    for sede in candidate:
+        if sede.id in in_uso:
+            diff.in_uso.append(sede)
+        else:
+            diff.da_eliminare.append(sede)
+    return diff
+
+
+def _applica_collezione(db: Session, model, cliente_id: int, piano: Dict[str, Any], vincoli_eliminazione):
+    """UPDATE per chiave primaria, INSERT multiplo e DELETE ... IN limitati al cliente"""
+    if piano["aggiorna"]:
+        db.execute(update(model), [dict(valori) for valori in piano["aggiorna"]])
+    if piano["crea"]:
+        db.execute(insert(model), [{**valori, "cliente_id": cliente_id} for valori in piano["crea"]])
+    if piano["elimina"]:
+        # I vincoli sono ricontrollati nella DELETE: un piano in cache non elimina righe diventate in uso
+        db.query(model).filter(
+            model.cliente_id == cliente_id,
+            model.id.in_(piano["elimina"]),
+            *vincoli_eliminazione
+        ).delete(synchronize_session=False)
+
+
+def applica_piano(db: Session, cliente_id: int, piano: Dict[str, Any]):
+    """
+    Applica il piano (vedi calcola_piano) con operazioni bulk: prima gli asset, poi le sedi,
+    così le sedi eliminate non sono più referenziate da asset rimossi.
+    """
+    _applica_collezione(db, models.AssetCliente, cliente_id, piano["assets"], [
+        ~exists().where(models.LetturaCopie.asset_id == models.AssetCliente.id)
+    ])
+    for asset_id in piano["assets"]["protetti"]:
+        logger.info("Asset %s ha letture copie associate - NON eliminato", asset_id)
+
+    _applica_collezione(db, models.SedeCliente, cliente_id, piano["sedi"], [
+        ~exists().where(models.Intervento.sede_id == models.SedeCliente.id),
+        ~exists().where(models.AssetCliente.sede_id == models.SedeCliente.id)
+    ])
+
+
+def calcola_piano(
+    db: Session,
+    cliente_id: int,
+    cliente: Any,
+    dati_cliente: Dict[str, Any],
+    con_conteggi: bool = False
+) -> Tuple[DiffAssets, DiffSedi, Dict[str, Any]]:
+    """
+    Calcola il diff di asset e sedi e il piano serializzabile.
+    con_conteggi=True usa le query raggruppate (conteggio_letture_assets, conteggio_utilizzo_sedi),
+    utili alla preview che mostra i numeri; altrimenti bastano le query EXISTS.
+    Restituisce (diff_assets, diff_sedi, piano); con con_conteggi il piano contiene anche i conteggi.
+    """
+    letture = conteggio_letture_assets(db, cliente_id) if con_conteggi else None
+    diff_assets = calcola_diff_assets(
+        db, cliente_id, cliente.assets_noleggio,
+        con_letture_ids=set(letture) if letture is not None else None
+    )
+    asset_eliminati = [asset.id for asset in diff_assets.da_eliminare]
+    utilizzo_sedi = conteggio_utilizzo_sedi(db, cliente_id, asset_eliminati) if con_conteggi else None
+    diff_sedi = calcola_diff_sedi(
+        db, cliente_id, cliente, dati_cliente,
+        sedi_referenziate=diff_assets.sedi_referenziate(),
+        sedi_in_uso_ids=set(utilizzo_sedi) if utilizzo_sedi is not None else None,
+        escludi_asset_ids=asset_eliminati
+    )
+    piano = {
+        "assets": diff_assets.piano(),
+        "sedi": diff_sedi.piano(),
+        "stato": _stato(models.AssetCliente, [(a.id, a.aggiornato_il) for a in diff_assets.esistenti.values()])
+        + _stato(models.SedeCliente, [(s.id, s.aggiornato_il) for s in diff_sedi.esistenti.values()]),
+    }
+    if con_conteggi:
+        piano["conteggi"] = {"letture_assets": letture, "utilizzo_sedi": utilizzo_sedi}
+    return diff_assets, diff_sedi, piano
+
+
+def _stato(model, righe: Iterable[Tuple[int, Any]]) -> List[str]:
+    """Id e aggiornato_il delle righe (ordinati): cambia se una riga viene aggiunta, modificata o eliminata"""
+    return sorted(f"{model.__tablename__}:{id_}:{aggiornato_il.isoformat() if aggiornato_il else ''}" for id_, aggiornato_il in righe)
+
+
+def piano_attuale(db: Session, cliente_id: int, piano: Dict[str, Any]) -> bool:
+    """
+    True se sedi e asset del cliente sono ancora quelli su cui è stato calcolato il piano.
+    Un piano in cache può essere superato da un salvataggio gestito da un altro worker:
+    applicarlo duplicherebbe sedi/asset o sovrascriverebbe valori più recenti.
+    """
+    righe = []
+    for model in (models.AssetCliente, models.SedeCliente):
+        righe += _stato(model, db.query(model.id, model.aggiornato_il).filter(model.cliente_id == cliente_id))
+    return righe == piano.get("stato")
+
+
+# --- Cache dei piani calcolati dalla preview ---
+_preview_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_preview_cache_lock = threading.Lock()
+
+
+def chiave_piano(cliente_id: int, cliente: Any) -> str:
+    """Chiave "<cliente_id>:<hash del payload>": la stessa richiesta di preview e di salvataggio produce la stessa chiave"""
+    payload = cliente.model_dump_json() if hasattr(cliente, "model_dump_json") else repr(cliente)
+    return f"{cliente_id}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def salva_piano(chiave: str, piano: Dict[str, Any]):
+    """Memorizza il piano della preview per PREVIEW_CACHE_TTL secondi"""
+    if PREVIEW_CACHE_TTL <= 0:
+        return
+    now = time.monotonic()
+    with _preview_cache_lock:
+        # Rimuove le voci scadute; se la cache è piena elimina le più vecchie
+        for key in [k for k, (scadenza, _) in _preview_cache.items() if scadenza <= now]:
+            del _preview_cache[key]
+        while len(_preview_cache) >= PREVIEW_CACHE_MAX_ENTRIES:
+            del _preview_cache[min(_preview_cache, key=lambda k: _preview_cache[k][0])]
+        _preview_cache[chiave] = (now + PREVIEW_CACHE_TTL, copy.deepcopy(piano))
+
+
+def leggi_piano(chiave: str, consuma: bool = False) -> Optional[Dict[str, Any]]:
+    """Piano in cache ancora valido (copia) oppure None; consuma=True lo rimuove dalla cache"""
+    with _preview_cache_lock:
+        voce = _preview_cache.pop(chiave, None) if consuma else _preview_cache.get(chiave)
+    if voce is None or voce[0] <= time.monotonic():
+        return None
+    return copy.deepcopy(voce[1])
+
+
+def invalida_piani(cliente_id: int):
+    """Scarta i piani in cache del cliente: da chiamare dopo ogni sua modifica (i piani sarebbero superati)"""
+    prefisso = f"{cliente_id}:"
+    with _preview_cache_lock:
+        for key in [k for k in _preview_cache if k.startswith(prefisso)]:
+            del _preview_cache[key]
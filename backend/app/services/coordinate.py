@@ -0,0 +1,108 @@
+"""
+Coordinate (latitudine/longitudine) di clienti e sedi per la pianificazione dei percorsi.
+
+Le coordinate vengono calcolate in background dal proxy geocoding (cache in memoria e
+tabella geocoding_cache, chiamate a Nominatim distanziate) e salvate sulle righe:
+- dopo la creazione o la modifica di un cliente (BackgroundTasks dell'endpoint);
+- per i dati esistenti o importati con POST /api/geocoding/coordinate-mancanti o
+  con lo script geocodifica_indirizzi.py.
+geocodifica_il NULL indica una riga da geocodificare; dopo un tentativo viene valorizzato
+anche se l'indirizzo non è stato trovato (latitudine NULL), così non viene ritentato a ogni
+salvataggio. Quando cambia l'indirizzo le coordinate vengono azzerate (azzera_se_cambiato).
+Se Nominatim non risponde l'elaborazione si interrompe e le righe restano da geocodificare.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import update
+from starlette.concurrency import run_in_threadpool
+from .. import database, models
+from . import geocoding
+
+logger = logging.getLogger(__name__)
+
+# false: nessuna geocodifica automatica al salvataggio dei clienti (es. installazioni senza accesso a Nominatim)
+GEOCODIFICA_AUTOMATICA = os.getenv("GEOCODIFICA_AUTOMATICA", "true").lower() in ("1", "true", "yes")
+
+CAMPI_INDIRIZZO = {
+    models.Cliente: ("indirizzo", "citta", "cap"),
+    models.SedeCliente: ("indirizzo_completo", "citta", "cap"),
+}
+COORDINATE_AZZERATE = {"latitudine": None, "longitudine": None, "geocodifica_il": None}
+
+
+def azzera_se_cambiato(model, cambiati: Dict[str, Any]) -> Dict[str, Any]:
+    """Aggiunge l'azzeramento delle coordinate ai campi modificati se cambia l'indirizzo"""
+    if any(campo in cambiati for campo in CAMPI_INDIRIZZO[model]):
+        return {**cambiati, **COORDINATE_AZZERATE}
+    return cambiati
+
+
+def indirizzo_da_geocodificare(indirizzo: Optional[str], citta: Optional[str], cap: Optional[str]) -> str:
+    """Indirizzo completo per Nominatim; città e CAP aggiunti se non già contenuti"""
+    parti = [indirizzo.strip()] if indirizzo and indirizzo.strip() else []
+    testo = " ".join(parti).lower()
+    localita = " ".join(p for p in (cap, citta) if p and p.strip().lower() not in testo).strip()
+    if localita:
+        parti.append(localita)
+    return ", ".join(parti)
+
+
+def _da_geocodificare(cliente_id: Optional[int], limite: int) -> List[Tuple[Any, int, Tuple]]:
+    """(modello, id, (indirizzo, città, CAP)) delle righe senza tentativo di geocodifica"""
+    righe = []
+    with database.SessionLocal() as db:
+        for model, (campo_indirizzo, _, _) in CAMPI_INDIRIZZO.items():
+            colonna_cliente = model.id if model is models.Cliente else model.cliente_id
+            query = db.query(model.id, getattr(model, campo_indirizzo), model.citta, model.cap).filter(
+                model.geocodifica_il.is_(None)
+            )
+            if cliente_id is not None:
+                query = query.filter(colonna_cliente == cliente_id)
+            for riga_id, indirizzo, citta, cap in query.order_by(model.id).limit(max(0, limite - len(righe))):
+                righe.append((model, riga_id, (indirizzo, citta, cap)))
+    return righe
+
+
+def _salva(model, riga_id: int, valori_indirizzo: Tuple, posizione: Optional[Tuple[float, float]]):
+    latitudine, longitudine = posizione if posizione else (None, None)
+    # Solo se l'indirizzo è ancora quello geocodificato: se nel frattempo è cambiato la riga resta da rifare
+    stesso_indirizzo = [
+        getattr(model, campo).is_not_distinct_from(valore)
+        for campo, valore in zip(CAMPI_INDIRIZZO[model], valori_indirizzo)
+    ]
+    with database.SessionLocal() as db:
+        db.execute(
+            update(model)
+            .where(model.id == riga_id, model.geocodifica_il.is_(None), *stesso_indirizzo)
+            .values(latitudine=latitudine, longitudine=longitudine, geocodifica_il=datetime.now())
+        )
+        db.commit()
+
+
+async def geocodifica(cliente_id: Optional[int] = None, limite: int = 500) -> Dict[str, int]:
+    """Geocodifica le righe in attesa (di un cliente o di tutti). Conteggi trovate/non_trovate/in_attesa"""
+    righe = await run_in_threadpool(_da_geocodificare, cliente_id, limite)
+    conteggi = {"trovate": 0, "non_trovate": 0, "in_attesa": 0}
+    for indice, (model, riga_id, valori_indirizzo) in enumerate(righe):
+        indirizzo = indirizzo_da_geocodificare(*valori_indirizzo)
+        posizione = None
+        if indirizzo:
+            try:
+                posizione = await geocoding.coordinate(indirizzo)
+            except RuntimeError as e:
+                conteggi["in_attesa"] = len(righe) - indice
+                logger.warning("Geocodifica interrotta, %s indirizzi restano da geocodificare: %s", conteggi["in_attesa"], e)
+                break
+        await run_in_threadpool(_salva, model, riga_id, valori_indirizzo, posizione)
+        conteggi["trovate" if posizione else "non_trovate"] += 1
+    if righe:
+        logger.info("Geocodifica %s: %s", f"cliente {cliente_id}" if cliente_id else "indirizzi", conteggi)
+    return conteggi
+
+
+async def geocodifica_cliente(cliente_id: int):
+    """Task in background dopo il salvataggio di un cliente (sede legale e sedi)"""
+    if GEOCODIFICA_AUTOMATICA:
+        await geocodifica(cliente_id=cliente_id)
@@ -1,13 +1,16 @@
 """
 Servizio per l'invio di email
 """
+import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional
+from typing import Iterable, Optional, Tuple
 import os
 from sqlalchemy.orm import Session
-from .. import models
+from .. import models, metrics
+
+logger = logging.getLogger(__name__)
 
 def get_smtp_config(db: Session) -> dict:
     """Ottiene la configurazione SMTP dalle impostazioni azienda"""
@@ -24,6 +27,44 @@ def get_smtp_config(db: Session) -> dict:
         'from_email': settings.smtp_username or settings.email or os.getenv("SMTP_FROM", "")
     }
 
+def _resolve_smtp_config(db: Optional[Session] = None, smtp_config: Optional[dict] = None) -> dict:
+    """Configurazione SMTP effettiva: impostazioni azienda (se db) con fallback sulle variabili d'ambiente"""
+    if smtp_config is None:
+        smtp_config = get_smtp_config(db) if db else {}
+    smtp_user = smtp_config.get('username', os.getenv("SMTP_USER", ""))
+    return {
+        'host': smtp_config.get('host', os.getenv("SMTP_HOST", "smtp.gmail.com")),
+        'port': smtp_config.get('port', int(os.getenv("SMTP_PORT", "587"))),
+        'username': smtp_user,
+        'password': smtp_config.get('password', os.getenv("SMTP_PASSWORD", "")),
+        'from_email': smtp_config.get('from_email', os.getenv("SMTP_FROM", smtp_user)),
+        'use_tls': smtp_config.get('use_tls', True)
+    }
+
+def _build_message(smtp_from: str, to_email: str, subject: str, body_html: str, body_text: Optional[str] = None) -> MIMEMultipart:
+    """Crea il messaggio MIME (testo opzionale + HTML)"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = smtp_from
+    msg['To'] = to_email
+    
+    if body_text:
+        msg.attach(MIMEText(body_text, 'plain'))
+    msg.attach(MIMEText(body_html, 'html'))
+    return msg
+
+def _open_smtp(config: dict) -> smtplib.SMTP:
+    """Apre e autentica una connessione SMTP"""
+    server = smtplib.SMTP(config['host'], config['port'])
+    if config['use_tls']:
+        server.starttls()
+    server.login(config['username'], config['password'])
+    return server
+
+def _print_mock(to_email: str, subject: str, body_html: str, body_text: Optional[str] = None):
+    metrics.EMAIL_INVIATE.inc("mock")
+    logger.info("[EMAIL MOCK] TO: %s SUBJECT: %s BODY: %s...", to_email, subject, body_text or body_html[:200])
+
 def send_email(
     to_email: str,
     subject: str,
@@ -44,61 +85,95 @@ def send_email(
     Returns:
         True se inviata con successo, False altrimenti
     """
-    # Ottieni configurazione SMTP
-    if db:
-        smtp_config = get_smtp_config(db)
-        smtp_host = smtp_config.get('host', os.getenv("SMTP_HOST", "smtp.gmail.com"))
-        smtp_port = smtp_config.get('port', int(os.getenv("SMTP_PORT", "587")))
-        smtp_user = smtp_config.get('username', os.getenv("SMTP_USER", ""))
-        smtp_password = smtp_config.get('password', os.getenv("SMTP_PASSWORD", ""))
-        smtp_from = smtp_config.get('from_email', smtp_user)
-        use_tls = smtp_config.get('use_tls', True)
-    else:
-        smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        smtp_user = os.getenv("SMTP_USER", "")
-        smtp_password = os.getenv("SMTP_PASSWORD", "")
-        smtp_from = os.getenv("SMTP_FROM", smtp_user)
-        use_tls = True
+    config = _resolve_smtp_config(db)
     
     # Se non configurato, usa mock
-    if not smtp_user or not smtp_password:
-        print(f"--- [EMAIL MOCK] ---")
-        print(f"TO: {to_email}")
-        print(f"SUBJECT: {subject}")
-        print(f"BODY: {body_text or body_html[:200]}...")
-        print("--------------------")
+    if not config['username'] or not config['password']:
+        _print_mock(to_email, subject, body_html, body_text)
         return True
     
     try:
-        # Crea messaggio
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = smtp_from
-        msg['To'] = to_email
-        
-        # Aggiungi corpo
-        if body_text:
-            part1 = MIMEText(body_text, 'plain')
-            msg.attach(part1)
-        
-        part2 = MIMEText(body_html, 'html')
-        msg.attach(part2)
+        msg = _build_message(config['from_email'], to_email, subject, body_html, body_text)
         
         # Invia email
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            if use_tls:
-                server.starttls()
-            server.login(smtp_user, smtp_password)
+        with _open_smtp(config) as server:
             server.send_message(msg)
         
-        print(f"Email inviata con successo a {to_email}")
+        metrics.EMAIL_INVIATE.inc("ok")
+        logger.info("Email inviata con successo a %s", to_email)
         return True
         
     except Exception as e:
-        print(f"Errore invio email a {to_email}: {str(e)}")
+        metrics.EMAIL_INVIATE.inc("errore")
+        logger.error("Errore invio email a %s: %s", to_email, e)
         return False
 
+def send_emails_batch(
+    messages: Iterable[Tuple[str, str, str]],
+    db: Optional[Session] = None,
+    smtp_config: Optional[dict] = None
+) -> int:
+    """
+    Invia più email riutilizzando una sola connessione SMTP (login una volta sola).
+    Pensata per i job schedulati che generano molte notifiche.
+    
+    Args:
+        messages: Sequenza di tuple (destinatario, oggetto, corpo HTML)
+        db: Sessione database per la configurazione SMTP (letta una sola volta)
+        smtp_config: Configurazione già letta con get_smtp_config (alternativa a db)
+    
+    Returns:
+        Numero di email inviate con successo
+    """
+    config = _resolve_smtp_config(db, smtp_config)
+    messages = [m for m in messages if m[0]]
+    if not messages:
+        return 0
+    
+    # Se non configurato, usa mock
+    if not config['username'] or not config['password']:
+        for to_email, subject, body_html in messages:
+            _print_mock(to_email, subject, body_html)
+        return len(messages)
+    
+    inviate = 0
+    server = None
+    try:
+        for to_email, subject, body_html in messages:
+            msg = _build_message(config['from_email'], to_email, subject, body_html)
+            # Un solo tentativo di riconnessione se il server chiude la sessione (timeout/limite messaggi)
+            for tentativo in range(2):
+                if server is None:
+                    # Connessione o login falliti: inutile proseguire con le altre email
+                    server = _open_smtp(config)
+                try:
+                    server.send_message(msg)
+                    inviate += 1
+                    break
+                except smtplib.SMTPServerDisconnected:
+                    server = None
+                    if tentativo == 1:
+                        logger.warning("Errore invio email a %s: connessione SMTP chiusa dal server", to_email)
+                except smtplib.SMTPException as e:
+                    # Errore del singolo messaggio (destinatario rifiutato, 550 sui dati, mittente rifiutato...):
+                    # la sessione resta valida, si passa al messaggio successivo
+                    logger.error("Errore invio email a %s: %s", to_email, e)
+                    break
+    except Exception as e:
+        logger.error("Errore invio email batch (%s/%s inviate): %s", inviate, len(messages), e)
+    finally:
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+    
+    metrics.EMAIL_INVIATE.inc("ok", valore=inviate)
+    if inviate < len(messages):
+        metrics.EMAIL_INVIATE.inc("errore", valore=len(messages) - inviate)
+    logger.info("Email batch inviate: %s/%s", inviate, len(messages))
+    return inviate
+
 def generate_scadenza_contratto_email(
     cliente_nome: str,
     tipo_contratto: str,  # "noleggio" o "assistenza"
@@ -0,0 +1,294 @@
+"""
+Export in streaming (CSV o XLSX) di RIT, letture copie e log di audit per la fatturazione di fine mese.
+
+Le query selezionano solo le colonne esportate e vengono lette con yield_per: con Postgres
+SQLAlchemy usa un cursore lato server e le righe arrivano a blocchi di EXPORT_YIELD_PER,
+senza mai caricare l'intero risultato in memoria.
+- CSV: ogni blocco di righe viene scritto e inviato subito al client (separatore ';',
+  BOM UTF-8 e decimali con la virgola per l'apertura diretta con Excel in italiano).
+- XLSX: openpyxl in modalità write_only scrive le righe su un file temporaneo (memoria
+  costante), che viene poi inviato a blocchi ed eliminato. Il formato ZIP non permette
+  di inviare il file prima che sia completo.
+
+Ogni funzione righe_* restituisce (intestazione, query) con gli stessi filtri degli endpoint
+di lista corrispondenti.
+"""
+import csv
+import enum
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime, time as dt_time
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import Query, Session, aliased
+from .. import database, models
+from . import lazy_imports, ricerca
+
+# Righe lette dal cursore lato server (e scritte nel CSV) per ogni blocco
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "2000"))
+FORMATI = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+_CHUNK_FILE = 256 * 1024
+
+
+def righe_interventi(
+    db: Session,
+    q: str = "",
+    data_da: Optional[datetime] = None,
+    data_a: Optional[datetime] = None,
+    cliente_id: Optional[int] = None,
+    macro_categoria: Optional[str] = None
+) -> Tuple[List[str], Query]:
+    """RIT con importi applicati e totale ricambi (filtri come GET /interventi/ più periodo e cliente)"""
+    intervento = models.Intervento
+    ricambio = models.MovimentoRicambio
+    tecnico = aliased(models.Utente)
+    totale_ricambi = (
+        select(func.coalesce(func.sum(
+            ricambio.quantita * func.coalesce(ricambio.prezzo_applicato, ricambio.prezzo_unitario, 0)
+        ), 0))
+        .where(ricambio.intervento_id == intervento.id)
+        .scalar_subquery()
+    )
+    query = db.query(
+        intervento.numero_relazione,
+        intervento.data_creazione,
+        intervento.cliente_ragione_sociale,
+        intervento.cliente_piva,
+        intervento.sede_nome,
+        intervento.macro_categoria,
+        tecnico.nome_completo,
+        intervento.is_contratto,
+        intervento.is_garanzia,
+        intervento.is_chiamata,
+        intervento.is_sopralluogo,
+        intervento.is_prelievo_copie,
+        intervento.ora_inizio,
+        intervento.ora_fine,
+        intervento.costo_chiamata_applicato,
+        intervento.tariffa_oraria_applicata,
+        intervento.costi_extra,
+        intervento.descrizione_extra,
+        totale_ricambi,
+        intervento.chiamate_utilizzate_contratto,
+        intervento.chiamate_rimanenti_contratto,
+    ).outerjoin(tecnico, tecnico.id == intervento.tecnico_id)
+
+    if q and q.strip():
+        query = query.filter(ricerca.condizione_ricerca_interventi(q))
+    if data_da:
+        query = query.filter(intervento.data_creazione >= data_da)
+    if data_a:
+        query = query.filter(intervento.data_creazione <= data_a)
+    if cliente_id:
+        query = query.filter(intervento.cliente_id == cliente_id)
+    if macro_categoria:
+        query = query.filter(intervento.macro_categoria == models.MacroCategoria(macro_categoria))
+
+    intestazione = [
+        "Numero RIT", "Data", "Cliente", "P.IVA", "Sede", "Categoria", "Tecnico",
+        "Contratto", "Garanzia", "Chiamata", "Sopralluogo", "Prelievo copie",
+        "Ora inizio", "Ora fine", "Costo chiamata", "Tariffa oraria", "Costi extra",
+        "Descrizione extra", "Totale ricambi", "Chiamate utilizzate", "Chiamate rimanenti",
+    ]
+    return intestazione, query.order_by(intervento.data_creazione, intervento.id)
+
+
+def righe_letture_copie(
+    db: Session,
+    asset_id: Optional[int] = None,
+    cliente_id: Optional[int] = None,
+    data_da: Optional[datetime] = None,
+    data_a: Optional[datetime] = None
+) -> Tuple[List[str], Query]:
+    """Letture copie con cliente, sede, macchina, RIT di riferimento e calcolo di fatturazione"""
+    lettura = models.LetturaCopie
+    fatturazione = models.RigaFatturazioneCopie
+    asset = models.AssetCliente
+    cliente = models.Cliente
+    sede = models.SedeCliente
+    intervento = models.Intervento
+    tecnico = aliased(models.Utente)
+    query = (
+        db.query(
+            lettura.data_lettura,
+            cliente.ragione_sociale,
+            cliente.p_iva,
+            sede.nome_sede,
+            asset.marca,
+            asset.modello,
+            asset.matricola,
+            asset.is_colore,
+            lettura.contatore_bn,
+            lettura.contatore_colore,
+            fatturazione.copie_bn,
+            fatturazione.copie_incluse_bn,
+            fatturazione.copie_addebitate_bn,
+            fatturazione.importo_bn,
+            fatturazione.copie_colore,
+            fatturazione.copie_incluse_colore,
+            fatturazione.copie_addebitate_colore,
+            fatturazione.importo_colore,
+            fatturazione.importo_totale,
+            intervento.numero_relazione,
+            tecnico.nome_completo,
+            lettura.note,
+        )
+        .join(asset, asset.id == lettura.asset_id)
+        .join(cliente, cliente.id == asset.cliente_id)
+        .outerjoin(sede, sede.id == asset.sede_id)
+        .outerjoin(fatturazione, fatturazione.lettura_id == lettura.id)
+        .outerjoin(intervento, intervento.id == lettura.intervento_id)
+        .outerjoin(tecnico, tecnico.id == lettura.tecnico_id)
+    )
+    if asset_id:
+        query = query.filter(lettura.asset_id == asset_id)
+    if cliente_id:
+        query = query.filter(asset.cliente_id == cliente_id)
+    if data_da:
+        query = query.filter(lettura.data_lettura >= data_da)
+    if data_a:
+        query = query.filter(lettura.data_lettura <= data_a)
+
+    intestazione = [
+        "Data lettura", "Cliente", "P.IVA", "Sede", "Marca", "Modello", "Matricola", "Colore",
+        "Contatore B/N", "Contatore colore",
+        "Copie B/N", "Incluse B/N", "Addebitate B/N", "Importo B/N",
+        "Copie colore", "Incluse colore", "Addebitate colore", "Importo colore", "Importo totale",
+        "Numero RIT", "Tecnico", "Note",
+    ]
+    return intestazione, query.order_by(cliente.ragione_sociale, asset.id, lettura.data_lettura)
+
+
+def righe_audit_logs(
+    db: Session,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> Tuple[List[str], Query]:
+    """Log di audit (filtri come GET /api/audit-logs/)"""
+    log = models.AuditLog
+    query = db.query(
+        log.timestamp, log.user_email, log.user_nome, log.action, log.entity_type,
+        log.entity_id, log.entity_name, log.changes, log.ip_address,
+    )
+    if entity_type:
+        query = query.filter(log.entity_type == entity_type)
+    if entity_id:
+        query = query.filter(log.entity_id == entity_id)
+    if user_id:
+        query = query.filter(log.user_id == user_id)
+    if action:
+        query = query.filter(log.action == action.upper())
+    if start_date:
+        query = query.filter(log.timestamp >= start_date)
+    if end_date:
+        query = query.filter(log.timestamp <= end_date)
+
+    intestazione = ["Data", "Email utente", "Utente", "Azione", "Entità", "ID entità", "Nome entità", "Modifiche", "IP"]
+    return intestazione, query.order_by(desc(log.timestamp))
+
+
+def _valore_csv(valore: Any) -> Any:
+    """Valori leggibili da Excel in italiano"""
+    if valore is None:
+        return ""
+    if isinstance(valore, bool):
+        return "Sì" if valore else "No"
+    if isinstance(valore, enum.Enum):
+        return valore.value
+    if isinstance(valore, datetime):
+        return valore.strftime("%d/%m/%Y %H:%M")
+    if isinstance(valore, date):
+        return valore.strftime("%d/%m/%Y")
+    if isinstance(valore, dt_time):
+        return valore.strftime("%H:%M")
+    if isinstance(valore, float):
+        return f"{valore:.2f}".replace(".", ",")
+    if isinstance(valore, (dict, list)):
+        return json.dumps(valore, ensure_ascii=False, default=str)
+    return valore
+
+
+def _valore_xlsx(valore: Any) -> Any:
+    """Tipi nativi per Excel (date e numeri restano ordinabili)"""
+    if isinstance(valore, enum.Enum):
+        return valore.value
+    if isinstance(valore, (dict, list)):
+        return json.dumps(valore, ensure_ascii=False, default=str)
+    return valore
+
+
+def _righe_a_blocchi(query: Query) -> Iterator[Any]:
+    """Righe dal cursore lato server, EXPORT_YIELD_PER alla volta"""
+    return query.execution_options(yield_per=EXPORT_YIELD_PER)
+
+
+def _stream_csv(intestazione: List[str], query: Query) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")  # BOM: Excel riconosce l'UTF-8 (accenti corretti)
+    writer.writerow(intestazione)
+    righe_nel_buffer = 0
+    for riga in _righe_a_blocchi(query):
+        writer.writerow([_valore_csv(v) for v in riga])
+        righe_nel_buffer += 1
+        if righe_nel_buffer >= EXPORT_YIELD_PER:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            righe_nel_buffer = 0
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _stream_xlsx(intestazione: List[str], query: Query, titolo: str) -> Iterator[bytes]:
+    openpyxl = lazy_imports.get_openpyxl()
+    if openpyxl is None:
+        raise RuntimeError("Export XLSX non disponibile: openpyxl non installato")
+    workbook = openpyxl.Workbook(write_only=True)
+    foglio = workbook.create_sheet(title=titolo[:31])
+    foglio.append(intestazione)
+    for riga in _righe_a_blocchi(query):
+        foglio.append([_valore_xlsx(v) for v in riga])
+
+    fd, percorso = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(percorso)
+        with open(percorso, "rb") as f:
+            while True:
+                blocco = f.read(_CHUNK_FILE)
+                if not blocco:
+                    break
+                yield blocco
+    finally:
+        os.remove(percorso)
+
+
+def genera_export(
+    formato: str,
+    costruisci: Callable[[Session], Tuple[List[str], Query]],
+    titolo: str = "Export"
+) -> Iterator[bytes]:
+    """
+    Generatore dei byte del file. La sessione (di sola lettura) viene aperta qui e resta
+    aperta per tutta la durata dello streaming: quella delle dipendenze FastAPI viene
+    chiusa prima dell'invio della risposta.
+    """
+    with database.read_session() as db:
+        intestazione, query = costruisci(db)
+        if formato == "xlsx":
+            yield from _stream_xlsx(intestazione, query, titolo)
+        else:
+            yield from _stream_csv(intestazione, query)
+
+
+def nome_file(prefisso: str, formato: str) -> str:
+    return f"{prefisso}_{datetime.now().strftime('%Y%m%d_%H%M')}.{formato}"
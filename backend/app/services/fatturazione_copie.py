@@ -0,0 +1,296 @@
+"""
+Motore di calcolo della fatturazione copie per le stampanti a noleggio.
+
+Per ogni lettura calcola, in un'unica query SQL su tutte le letture interessate:
+  - copie del periodo B/N e colore: differenza con la lettura precedente dello stesso asset
+    (funzione finestra LAG) o, per la prima lettura, con i contatori iniziali dell'asset;
+  - copie incluse nel periodo: copie incluse mensili x mesi della cadenza letture;
+  - copie addebitate e importo:
+      * copie incluse configurate: eccedenza oltre le incluse x costo copia fuori limite;
+      * copie non incluse (copie_incluse nullo e costo "non incluse" impostato): tutte le copie
+        del periodo x costo copia non incluse.
+I risultati vengono salvati in righe_fatturazione_copie (una riga per lettura) con
+INSERT ... SELECT, senza trasferire le letture in Python. PDF, export e statistiche leggono
+queste colonne: le note della lettura contengono solo il testo inserito dal tecnico.
+
+Le funzioni non fanno commit: il ricalcolo fa parte della transazione del chiamante.
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, case, delete, func, insert, select
+from sqlalchemy.orm import Session
+from .. import models
+
+# Mesi coperti da ciascuna cadenza di lettura (le copie incluse sono mensili)
+MESI_CADENZA = {"mensile": 1, "bimestrale": 2, "trimestrale": 3, "semestrale": 6}
+CADENZA_DEFAULT = "trimestrale"
+
+# Colonne di righe_fatturazione_copie calcolate dalla query (calcolata_il a parte)
+_COLONNE = [
+    "lettura_id", "asset_id", "cliente_id", "intervento_id", "data_lettura", "data_lettura_precedente",
+    "cadenza", "mesi_periodo",
+    "contatore_bn_precedente", "contatore_bn", "copie_bn", "copie_incluse_bn", "copie_addebitate_bn",
+    "costo_copia_bn", "importo_bn",
+    "contatore_colore_precedente", "contatore_colore", "copie_colore", "copie_incluse_colore",
+    "copie_addebitate_colore", "costo_copia_colore", "importo_colore",
+    "importo_totale",
+]
+
+
+def _positivo(valore):
+    """max(valore, 0) portabile (GREATEST non esiste in SQLite)"""
+    return case((valore > 0, valore), else_=0)
+
+
+def query_righe(
+    lettura_ids: Optional[Iterable[int]] = None,
+    asset_ids: Optional[Iterable[int]] = None,
+    cliente_id: Optional[int] = None,
+    data_da: Optional[datetime] = None,
+    data_a: Optional[datetime] = None
+):
+    """
+    SELECT con le colonne di righe_fatturazione_copie per le letture che rispettano i filtri.
+    La finestra LAG scorre lo storico completo degli asset interessati, così anche la prima
+    lettura del periodo viene confrontata con quella precedente.
+    """
+    lettura = models.LetturaCopie
+    asset = models.AssetCliente
+
+    finestra = {"partition_by": lettura.asset_id, "order_by": (lettura.data_lettura, lettura.id)}
+    storico = select(
+        lettura.id.label("lettura_id"),
+        lettura.asset_id,
+        lettura.intervento_id,
+        lettura.data_lettura,
+        lettura.contatore_bn,
+        lettura.contatore_colore,
+        func.lag(lettura.data_lettura).over(**finestra).label("data_precedente"),
+        func.lag(lettura.contatore_bn).over(**finestra).label("bn_precedente"),
+        func.lag(lettura.contatore_colore).over(**finestra).label("colore_precedente"),
+        func.row_number().over(**finestra).label("progressivo"),
+    )
+    # Limita le partizioni agli asset interessati (la finestra non deve scorrere tutte le letture)
+    if lettura_ids is not None:
+        storico = storico.where(lettura.asset_id.in_(
+            select(lettura.asset_id).where(lettura.id.in_(list(lettura_ids))).scalar_subquery()
+        ))
+    if asset_ids is not None:
+        storico = storico.where(lettura.asset_id.in_(list(asset_ids)))
+    if cliente_id:
+        storico = storico.where(lettura.asset_id.in_(
+            select(asset.id).where(asset.cliente_id == cliente_id).scalar_subquery()
+        ))
+    if data_a:
+        storico = storico.where(lettura.data_lettura <= data_a)
+    storico = storico.subquery("storico")
+
+    prima = storico.c.progressivo == 1
+    bn_precedente = case((prima, func.coalesce(asset.contatore_iniziale_bn, 0)), else_=storico.c.bn_precedente)
+    colore_precedente = case((prima, asset.contatore_iniziale_colore), else_=storico.c.colore_precedente)
+    cadenza = func.coalesce(asset.cadenza_letture_copie, CADENZA_DEFAULT)
+    mesi = case(MESI_CADENZA, value=cadenza, else_=MESI_CADENZA[CADENZA_DEFAULT])
+
+    # Primo livello: copie del periodo, incluse e tariffa applicabile
+    non_incluse_bn = and_(asset.copie_incluse_bn.is_(None), asset.costo_copia_bn_non_incluse.isnot(None))
+    non_incluse_colore = and_(asset.copie_incluse_colore.is_(None), asset.costo_copia_colore_non_incluse.isnot(None))
+    copie_colore = case(
+        (and_(storico.c.contatore_colore.isnot(None), colore_precedente.isnot(None)),
+         _positivo(storico.c.contatore_colore - colore_precedente)),
+        else_=0
+    )
+    calcolo = (
+        select(
+            storico.c.lettura_id,
+            storico.c.asset_id,
+            asset.cliente_id,
+            storico.c.intervento_id,
+            storico.c.data_lettura,
+            storico.c.data_precedente.label("data_lettura_precedente"),
+            cadenza.label("cadenza"),
+            mesi.label("mesi_periodo"),
+            bn_precedente.label("contatore_bn_precedente"),
+            storico.c.contatore_bn,
+            _positivo(storico.c.contatore_bn - bn_precedente).label("copie_bn"),
+            func.coalesce(asset.copie_incluse_bn * mesi, 0).label("copie_incluse_bn"),
+            non_incluse_bn.label("non_incluse_bn"),
+            case((non_incluse_bn, asset.costo_copia_bn_non_incluse), else_=asset.costo_copia_bn_fuori_limite).label("costo_copia_bn"),
+            colore_precedente.label("contatore_colore_precedente"),
+            storico.c.contatore_colore,
+            copie_colore.label("copie_colore"),
+            func.coalesce(asset.copie_incluse_colore * mesi, 0).label("copie_incluse_colore"),
+            non_incluse_colore.label("non_incluse_colore"),
+            case((non_incluse_colore, asset.costo_copia_colore_non_incluse), else_=asset.costo_copia_colore_fuori_limite).label("costo_copia_colore"),
+        )
+        .join(asset, asset.id == storico.c.asset_id)
+    )
+    if lettura_ids is not None:
+        calcolo = calcolo.where(storico.c.lettura_id.in_(list(lettura_ids)))
+    if data_da:
+        calcolo = calcolo.where(storico.c.data_lettura >= data_da)
+    calcolo = calcolo.subquery("calcolo")
+
+    # Secondo livello: copie addebitate e importi
+    addebitate_bn = case(
+        (calcolo.c.non_incluse_bn, calcolo.c.copie_bn),
+        else_=_positivo(calcolo.c.copie_bn - calcolo.c.copie_incluse_bn)
+    )
+    addebitate_colore = case(
+        (calcolo.c.non_incluse_colore, calcolo.c.copie_colore),
+        else_=_positivo(calcolo.c.copie_colore - calcolo.c.copie_incluse_colore)
+    )
+    importo_bn = func.coalesce(addebitate_bn * calcolo.c.costo_copia_bn, 0.0)
+    importo_colore = func.coalesce(addebitate_colore * calcolo.c.costo_copia_colore, 0.0)
+    colonne = {
+        "lettura_id": calcolo.c.lettura_id,
+        "asset_id": calcolo.c.asset_id,
+        "cliente_id": calcolo.c.cliente_id,
+        "intervento_id": calcolo.c.intervento_id,
+        "data_lettura": calcolo.c.data_lettura,
+        "data_lettura_precedente": calcolo.c.data_lettura_precedente,
+        "cadenza": calcolo.c.cadenza,
+        "mesi_periodo": calcolo.c.mesi_periodo,
+        "contatore_bn_precedente": calcolo.c.contatore_bn_precedente,
+        "contatore_bn": calcolo.c.contatore_bn,
+        "copie_bn": calcolo.c.copie_bn,
+        "copie_incluse_bn": calcolo.c.copie_incluse_bn,
+        "copie_addebitate_bn": addebitate_bn,
+        "costo_copia_bn": calcolo.c.costo_copia_bn,
+        "importo_bn": importo_bn,
+        "contatore_colore_precedente": calcolo.c.contatore_colore_precedente,
+        "contatore_colore": calcolo.c.contatore_colore,
+        "copie_colore": calcolo.c.copie_colore,
+        "copie_incluse_colore": calcolo.c.copie_incluse_colore,
+        "copie_addebitate_colore": addebitate_colore,
+        "costo_copia_colore": calcolo.c.costo_copia_colore,
+        "importo_colore": importo_colore,
+        "importo_totale": importo_bn + importo_colore,
+    }
+    return select(*(colonne[nome].label(nome) for nome in _COLONNE))
+
+
+def calcola_righe(db: Session, **filtri) -> List[Dict[str, Any]]:
+    """Calcolo senza salvataggio (anteprima); filtri come query_righe"""
+    return [dict(riga._mapping) for riga in db.execute(query_righe(**filtri).order_by("data_lettura"))]
+
+
+def aggiorna_righe(db: Session, **filtri) -> int:
+    """
+    Ricalcola e salva le righe di fatturazione delle letture che rispettano i filtri
+    (filtri come query_righe). Le righe esistenti vengono sostituite. Restituisce il numero di righe.
+    """
+    righe = query_righe(**filtri).subquery("righe")
+    riga = models.RigaFatturazioneCopie
+    db.execute(
+        delete(riga)
+        .where(riga.lettura_id.in_(select(righe.c.lettura_id)))
+        .execution_options(synchronize_session=False)
+    )
+    risultato = db.execute(
+        insert(riga).from_select(
+            _COLONNE + ["calcolata_il"],
+            select(*(righe.c[nome] for nome in _COLONNE), func.current_timestamp())
+        )
+    )
+    return risultato.rowcount
+
+
+
+# Formato del dettaglio calcolo che create_lettura_copie aggiungeva alle note (fino all'introduzione
+# di righe_fatturazione_copie): serve solo al recupero delle letture storiche
+_INIZIO_CALCOLO = re.compile(r"(?:^|\n\n)Calcolo copie per cadenza '([^']*)':\n")
+_DATA = r"(\d{2}/\d{2}/\d{4})"
+_COPPIA = r"B/N[:=] ?(-?\d+), Colore[:=] ?(-?\d+)"
+_RIGHE_CALCOLO = {
+    "precedente": re.compile(rf"Ultima lettura: {_DATA} \({_COPPIA}\)"),
+    "iniziali": re.compile(rf"Contatori iniziali: {_COPPIA}"),
+    "incluse": re.compile(rf"Copie incluse nel periodo \([^)]*\): {_COPPIA}"),
+    "stampate": re.compile(rf"Copie stampate nel periodo: {_COPPIA}"),
+    "addebitate": re.compile(rf"Copie (?:fuori limite|addebitate): {_COPPIA}"),
+    "costo": re.compile(r"Costo totale: B/N=€(-?[\d.]+), Colore=€(-?[\d.]+)"),
+}
+
+
+def separa_note_calcolo(note: Optional[str]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Separa una nota storica nel testo inserito dal tecnico e nel dettaglio calcolo.
+    Restituisce (note_utente, valori) con i valori nei nomi delle colonne di
+    righe_fatturazione_copie, oppure (note, None) se la nota non contiene un calcolo.
+    """
+    if not note:
+        return note, None
+    inizio = _INIZIO_CALCOLO.search(note)
+    if not inizio:
+        return note, None
+    testo = note[inizio.end():]
+    trovati = {nome: regex.search(testo) for nome, regex in _RIGHE_CALCOLO.items()}
+    if not trovati["stampate"]:
+        return note, None
+
+    valori: Dict[str, Any] = {"cadenza": inizio.group(1)}
+    if trovati["precedente"]:
+        valori["data_lettura_precedente"] = datetime.strptime(trovati["precedente"].group(1), "%d/%m/%Y")
+        valori["contatore_bn_precedente"] = int(trovati["precedente"].group(2))
+        valori["contatore_colore_precedente"] = int(trovati["precedente"].group(3))
+    elif trovati["iniziali"]:
+        valori["contatore_bn_precedente"] = int(trovati["iniziali"].group(1))
+        valori["contatore_colore_precedente"] = int(trovati["iniziali"].group(2))
+    valori["copie_bn"], valori["copie_colore"] = (int(v) for v in trovati["stampate"].groups())
+    if trovati["incluse"]:
+        valori["copie_incluse_bn"], valori["copie_incluse_colore"] = (int(v) for v in trovati["incluse"].groups())
+    if trovati["addebitate"]:
+        valori["copie_addebitate_bn"], valori["copie_addebitate_colore"] = (int(v) for v in trovati["addebitate"].groups())
+    importo_bn, importo_colore = (float(v) for v in trovati["costo"].groups()) if trovati["costo"] else (0.0, 0.0)
+    valori["importo_bn"] = importo_bn
+    valori["importo_colore"] = importo_colore
+    valori["importo_totale"] = round(importo_bn + importo_colore, 2)
+
+    note_utente = note[:inizio.start()].strip() or None
+    return note_utente, valori
+
+
+def volumi_mensili(
+    db: Session,
+    anno: Optional[int] = None,
+    cliente_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Copie e importi per cliente e mese (mese della lettura) dalle righe di fatturazione"""
+    riga = models.RigaFatturazioneCopie
+    anno_lettura = func.extract("year", riga.data_lettura)
+    mese_lettura = func.extract("month", riga.data_lettura)
+    query = (
+        db.query(
+            riga.cliente_id,
+            models.Cliente.ragione_sociale,
+            anno_lettura.label("anno"),
+            mese_lettura.label("mese"),
+            func.count(riga.id).label("letture"),
+            func.sum(riga.copie_bn).label("copie_bn"),
+            func.sum(riga.copie_colore).label("copie_colore"),
+            func.sum(riga.copie_addebitate_bn).label("copie_addebitate_bn"),
+            func.sum(riga.copie_addebitate_colore).label("copie_addebitate_colore"),
+            func.sum(riga.importo_totale).label("importo_totale"),
+        )
+        .outerjoin(models.Cliente, models.Cliente.id == riga.cliente_id)
+        .group_by(riga.cliente_id, models.Cliente.ragione_sociale, anno_lettura, mese_lettura)
+    )
+    if anno:
+        query = query.filter(anno_lettura == anno)
+    if cliente_id:
+        query = query.filter(riga.cliente_id == cliente_id)
+    return [
+        {
+            "cliente_id": r.cliente_id,
+            "cliente_ragione_sociale": r.ragione_sociale,
+            "anno": int(r.anno),
+            "mese": int(r.mese),
+            "letture": r.letture,
+            "copie_bn": r.copie_bn or 0,
+            "copie_colore": r.copie_colore or 0,
+            "copie_addebitate_bn": r.copie_addebitate_bn or 0,
+            "copie_addebitate_colore": r.copie_addebitate_colore or 0,
+            "importo_totale": round(r.importo_totale or 0.0, 2),
+        }
+        for r in query.order_by(anno_lettura, mese_lettura, models.Cliente.ragione_sociale).all()
+    ]
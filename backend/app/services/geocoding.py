@@ -0,0 +1,286 @@
+"""
+Proxy asincrono verso Nominatim per l'autocomplete indirizzi (/api/geocoding/search).
+
+Ogni ricerca passa da tre livelli:
+1. LRU in memoria (per worker) sulla query normalizzata;
+2. tabella geocoding_cache (condivisa tra i worker, migrate_geocoding_cache.py) con TTL;
+3. Nominatim, con un client httpx asincrono condiviso (connessioni riusate) e una
+   distanza minima tra le chiamate (la policy di Nominatim ammette 1 richiesta al secondo).
+Le ricerche identiche in corso nello stesso momento vengono unite: una sola chiamata a
+Nominatim, il risultato viene restituito a tutte. Se Nominatim non risponde si usa la riga
+scaduta della cache, se esiste.
+
+GEOCODING_URL permette di puntare a un Nominatim locale o a un server di test (test_geocoding.py).
+Il frontend (AddressAutocomplete) attende GEOCODING_DEBOUNCE_MS dopo l'ultimo tasto, non cerca
+sotto GEOCODING_MIN_CHARS caratteri e annulla la richiesta precedente ancora in corso.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+from .. import database, metrics, models
+from . import lazy_imports
+
+logger = logging.getLogger(__name__)
+
+GEOCODING_URL = os.getenv("GEOCODING_URL", "https://nominatim.openstreetmap.org/search")
+GEOCODING_USER_AGENT = os.getenv("GEOCODING_USER_AGENT", "Sistema54-App/1.0")
+GEOCODING_TIMEOUT = float(os.getenv("GEOCODING_TIMEOUT", "5"))
+GEOCODING_CACHE_TTL_HOURS = float(os.getenv("GEOCODING_CACHE_TTL_HOURS", "720"))
+GEOCODING_LRU_SIZE = int(os.getenv("GEOCODING_LRU_SIZE", "1024"))
+GEOCODING_MIN_CHARS = int(os.getenv("GEOCODING_MIN_CHARS", "3"))
+# Distanza minima tra due chiamate a Nominatim dallo stesso worker (0 con un Nominatim locale)
+GEOCODING_MIN_INTERVAL_SECONDS = float(os.getenv("GEOCODING_MIN_INTERVAL_SECONDS", "1.0"))
+GEOCODING_LIMIT = 5
+
+
+class RisultatoRicerca(NamedTuple):
+    risultati: List[Dict[str, Any]]
+    origine: str  # lru, db, upstream, db-scaduta, vuota
+
+
+def normalizza(q: str) -> str:
+    """Chiave di cache: minuscolo, spazi compattati, virgole uniformate ("Via Roma ,1" -> "via roma, 1")"""
+    testo = unicodedata.normalize("NFKC", q or "").casefold()
+    parti = (" ".join(parte.split()) for parte in testo.split(","))
+    return ", ".join(parte for parte in parti if parte).strip(" .;")
+
+
+class _CacheLRU:
+    """LRU con scadenza (thread-safe: letta anche dai test fuori dall'event loop)"""
+
+    def __init__(self, dimensione: int, ttl_secondi: float):
+        self.dimensione = dimensione
+        self.ttl_secondi = ttl_secondi
+        self._voci: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chiave: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is None:
+                return None
+            if time.monotonic() - voce[0] > self.ttl_secondi:
+                del self._voci[chiave]
+                return None
+            self._voci.move_to_end(chiave)
+            return voce[1]
+
+    def set(self, chiave: str, risultati: List[Dict[str, Any]], eta_secondi: float = 0.0):
+        if self.dimensione <= 0:
+            return
+        with self._lock:
+            self._voci[chiave] = (time.monotonic() - eta_secondi, risultati)
+            self._voci.move_to_end(chiave)
+            while len(self._voci) > self.dimensione:
+                self._voci.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._voci.clear()
+
+
+_lru = _CacheLRU(GEOCODING_LRU_SIZE, GEOCODING_CACHE_TTL_HOURS * 3600)
+
+# Stato legato all'event loop (uno per worker; i TestClient ne creano uno per contesto)
+_client = None
+_client_loop = None
+_in_corso: Dict[str, "asyncio.Task"] = {}
+_turno_lock: Optional[asyncio.Lock] = None
+_turno_loop = None
+_ultima_chiamata = 0.0
+_avviso_db_mostrato = False
+
+
+# --- Cache persistente (geocoding_cache) ---
+
+def _leggi_db(chiave: str) -> Optional[Tuple[List[Dict[str, Any]], datetime]]:
+    global _avviso_db_mostrato
+    try:
+        with database.SessionLocal() as db:
+            riga = db.query(models.GeocodingCache.risultati, models.GeocodingCache.aggiornato_il).filter(
+                models.GeocodingCache.query == chiave
+            ).first()
+            return (riga.risultati, riga.aggiornato_il) if riga else None
+    except SQLAlchemyError as e:
+        if not _avviso_db_mostrato:
+            _avviso_db_mostrato = True
+            logger.warning("Cache geocoding su database non disponibile, solo LRU in memoria (python migrate_geocoding_cache.py): %s", e)
+        return None
+
+
+def _salva_db(chiave: str, risultati: List[Dict[str, Any]]):
+    try:
+        with database.SessionLocal() as db:
+            adesso = datetime.now()
+            if db.get_bind().dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as pg_insert
+                istruzione = pg_insert(models.GeocodingCache).values(query=chiave, risultati=risultati, aggiornato_il=adesso)
+                db.execute(istruzione.on_conflict_do_update(
+                    index_elements=[models.GeocodingCache.query],
+                    set_={"risultati": istruzione.excluded.risultati, "aggiornato_il": istruzione.excluded.aggiornato_il},
+                ))
+            else:
+                riga = db.query(models.GeocodingCache).filter(models.GeocodingCache.query == chiave).first()
+                if riga is None:
+                    db.add(models.GeocodingCache(query=chiave, risultati=risultati, aggiornato_il=adesso))
+                else:
+                    riga.risultati, riga.aggiornato_il = risultati, adesso
+            db.commit()
+    except SQLAlchemyError as e:
+        logger.debug("Salvataggio cache geocoding non riuscito per %r: %s", chiave, e)
+
+
+# --- Nominatim ---
+
+def _get_client():
+    """Client httpx condiviso dal worker (pool di connessioni keep-alive verso Nominatim)"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        httpx = lazy_imports.get_httpx()
+        if httpx is None:
+            raise RuntimeError("Servizio di ricerca indirizzi non disponibile (httpx non installato)")
+        _client = httpx.AsyncClient(
+            timeout=GEOCODING_TIMEOUT,
+            headers={"User-Agent": GEOCODING_USER_AGENT},  # richiesto dalla policy di Nominatim
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def _attendi_turno():
+    """Rispetta GEOCODING_MIN_INTERVAL_SECONDS tra due chiamate a Nominatim di questo worker"""
+    global _turno_lock, _turno_loop, _ultima_chiamata
+    if GEOCODING_MIN_INTERVAL_SECONDS <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    if _turno_lock is None or _turno_loop is not loop:
+        _turno_lock, _turno_loop = asyncio.Lock(), loop
+    async with _turno_lock:
+        attesa = _ultima_chiamata + GEOCODING_MIN_INTERVAL_SECONDS - time.monotonic()
+        if attesa > 0:
+            await asyncio.sleep(attesa)
+        _ultima_chiamata = time.monotonic()
+
+
+async def _interroga_nominatim(chiave: str) -> List[Dict[str, Any]]:
+    client = _get_client()
+    await _attendi_turno()
+    params = {
+        "q": f"{chiave}, Italia",
+        "format": "json",
+        "addressdetails": "1",
+        "limit": str(GEOCODING_LIMIT),
+        "countrycodes": "it",
+        "accept-language": "it",
+    }
+    try:
+        risposta = await client.get(GEOCODING_URL, params=params)
+        risposta.raise_for_status()
+        risultati = risposta.json()
+    except Exception as e:
+        stato = getattr(getattr(e, "response", None), "status_code", None)
+        raise RuntimeError(f"Errore nella ricerca indirizzi: {f'Nominatim ha risposto {stato}' if stato else e}") from e
+    if not isinstance(risultati, list):
+        raise RuntimeError("Errore nella ricerca indirizzi: risposta di Nominatim non valida")
+    return risultati
+
+
+async def _risolvi(chiave: str) -> RisultatoRicerca:
+    """Cache su database, poi Nominatim (una sola esecuzione per chiave grazie a _in_corso)"""
+    ttl = timedelta(hours=GEOCODING_CACHE_TTL_HOURS)
+    salvata = await run_in_threadpool(_leggi_db, chiave)
+    if salvata is not None:
+        risultati, aggiornato_il = salvata
+        eta = datetime.now() - aggiornato_il
+        if eta <= ttl:
+            _lru.set(chiave, risultati, eta.total_seconds())
+            return RisultatoRicerca(risultati, "db")
+
+    try:
+        risultati = await _interroga_nominatim(chiave)
+    except RuntimeError as e:
+        if salvata is None:
+            raise
+        logger.warning("Nominatim non disponibile, uso la cache scaduta per %r: %s", chiave, e)
+        return RisultatoRicerca(salvata[0], "db-scaduta")
+
+    _lru.set(chiave, risultati)
+    await run_in_threadpool(_salva_db, chiave, risultati)
+    return RisultatoRicerca(risultati, "upstream")
+
+
+def _ricerca_terminata(chiave: str):
+    def callback(task):
+        if _in_corso.get(chiave) is task:
+            del _in_corso[chiave]
+        # Errore già gestito da chi attende; evita "Task exception was never retrieved" se nessuno attende più
+        if not task.cancelled():
+            task.exception()
+    return callback
+
+
+async def cerca(q: str) -> RisultatoRicerca:
+    """Cerca indirizzi italiani. RuntimeError se Nominatim non risponde e non c'è nulla in cache"""
+    chiave = normalizza(q)
+    if len(chiave) < GEOCODING_MIN_CHARS:
+        return RisultatoRicerca([], "vuota")
+
+    risultati = _lru.get(chiave)
+    if risultati is not None:
+        metrics.GEOCODING_RICHIESTE.inc("lru")
+        return RisultatoRicerca(risultati, "lru")
+
+    task = _in_corso.get(chiave)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_risolvi(chiave))
+        _in_corso[chiave] = task
+        task.add_done_callback(_ricerca_terminata(chiave))
+        condivisa = False
+    else:
+        condivisa = True
+
+    try:
+        # shield: se il client che ha avviato la ricerca si disconnette, le altre attese proseguono
+        risultato = await asyncio.shield(task)
+    except RuntimeError:
+        metrics.GEOCODING_RICHIESTE.inc("errore")
+        raise
+    metrics.GEOCODING_RICHIESTE.inc("condivisa" if condivisa else risultato.origine)
+    return risultato
+
+
+async def coordinate(indirizzo: str) -> Optional[Tuple[float, float]]:
+    """(latitudine, longitudine) del primo risultato, None se l'indirizzo non viene trovato"""
+    risultato = await cerca(indirizzo)
+    for luogo in risultato.risultati:
+        try:
+            return float(luogo["lat"]), float(luogo["lon"])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+async def chiudi():
+    """Chiude il client httpx (arresto dell'applicazione)"""
+    global _client, _client_loop
+    if _client is not None:
+        client, _client, _client_loop = _client, None, None
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.debug("Chiusura client geocoding: %s", e)
+
+
+def svuota_cache_memoria():
+    """Svuota l'LRU del worker (test)"""
+    _lru.clear()
@@ -0,0 +1,588 @@
+"""
+Import massivo da file CSV/XLSX di clienti, sedi, assets a noleggio e articoli di magazzino.
+
+Il file viene letto una riga alla volta (csv.reader / openpyxl in modalità read_only) e
+mai caricato interamente in memoria. Le righe vengono elaborate a blocchi (IMPORT_BATCH_SIZE):
+  1. validazione con gli schemi Pydantic esistenti (ClienteBase, SedeClienteCreate, ...);
+  2. deduplica con insiemi di chiavi: P.IVA / codice fiscale (clienti), nome sede per
+     cliente (sedi), matricola o seriale (assets), codice articolo (magazzino), confrontando
+     sia i dati già presenti nel database (una query IN per blocco) sia le righe già importate;
+  3. inserimento con un'unica INSERT multipla (executemany) e commit del blocco.
+Se l'inserimento del blocco fallisce (es. vincolo violato) le righe vengono reinserite
+una per una in un savepoint per individuare e scartare solo quelle errate.
+
+importa() è un generatore: dopo ogni blocco restituisce un evento di avanzamento con gli
+errori di riga del blocco, alla fine il riepilogo (usato dall'endpoint NDJSON e da import_dati.py).
+"""
+import csv
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Type, get_args
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import and_, case, func, insert, update
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session
+from .. import models, schemas
+from . import lazy_imports, magazzino_service
+
+# Righe validate e inserite per ogni blocco (e per ogni commit)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+ESTENSIONI_SUPPORTATE = (".csv", ".txt", ".xlsx", ".xlsm")
+# Lunghezze di una P.IVA numerica che Excel ha privato degli zeri iniziali (es. 01234567890 -> 1234567890)
+CIFRE_PIVA_SENZA_ZERI = (9, 10)
+
+# Intestazioni alternative comuni nei file esportati da gestionali e fogli Excel
+ALIAS_COLONNE = {
+    "partita_iva": "p_iva",
+    "piva": "p_iva",
+    "cf": "codice_fiscale",
+    "pec": "email_pec",
+    "sdi": "codice_sdi",
+    "codice": "codice_articolo",
+    "prezzo": "prezzo_vendita",
+    "costo": "costo_acquisto",
+    "quantita": "giacenza",
+    "sede": "sede_nome",
+    "indirizzo_sede": "indirizzo_completo",
+    "numero_serie": "seriale",
+    "serial_number": "seriale",
+    "tipo": "tipo_asset",
+    "cliente_partita_iva": "cliente_p_iva",
+    "piva_cliente": "cliente_p_iva",
+    "p_iva_cliente": "cliente_p_iva",
+}
+
+_VALORI_VERO = {"1", "true", "si", "sì", "s", "x", "yes", "y", "vero"}
+_VALORI_FALSO = {"0", "false", "no", "n", "falso"}
+_RE_DATA_ITALIANA = re.compile(r"^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$")
+
+
+class _DialettoExcelItaliano(csv.excel):
+    delimiter = ";"
+
+
+def normalizza_intestazione(colonna: Any) -> str:
+    """'Partita IVA' -> 'p_iva', 'Codice Articolo' -> 'codice_articolo'"""
+    nome = re.sub(r"[^a-z0-9]+", "_", str(colonna or "").strip().lower()).strip("_")
+    return ALIAS_COLONNE.get(nome, nome)
+
+
+class LettoreFile:
+    """
+    Lettura incrementale di un file CSV o XLSX: colonne normalizzate e iterazione
+    su (numero_riga, dati) saltando le righe vuote. Da usare come context manager.
+    """
+
+    def __init__(self, percorso: str, nome_file: Optional[str] = None, encoding: str = "utf-8-sig", foglio: Optional[str] = None):
+        self.estensione = os.path.splitext(nome_file or percorso)[1].lower()
+        if self.estensione not in ESTENSIONI_SUPPORTATE:
+            raise ValueError(f"Formato file non supportato ({self.estensione or 'senza estensione'}). Usa CSV o XLSX")
+        self.righe_totali: Optional[int] = None
+        self._file = None
+        self._workbook = None
+
+        if self.estensione in (".xlsx", ".xlsm"):
+            openpyxl = lazy_imports.get_openpyxl()
+            if openpyxl is None:
+                raise ValueError("Import XLSX non disponibile: openpyxl non installato. Salva il file come CSV")
+            # read_only: le righe vengono lette dal file compresso man mano, senza caricare il foglio
+            self._workbook = openpyxl.load_workbook(percorso, read_only=True, data_only=True)
+            ws = self._workbook[foglio] if foglio else self._workbook.active
+            self._righe = ws.iter_rows(values_only=True)
+            if ws.max_row:
+                self.righe_totali = max(0, ws.max_row - 1)
+        else:
+            self._file = open(percorso, newline="", encoding=encoding)
+            campione = self._file.read(64 * 1024)
+            self._file.seek(0)
+            try:
+                dialetto = csv.Sniffer().sniff(campione, delimiters=";,\t|")
+            except csv.Error:
+                # Excel in italiano esporta con il punto e virgola
+                dialetto = _DialettoExcelItaliano if campione.count(";") >= campione.count(",") else csv.excel
+            self._righe = csv.reader(self._file, dialetto)
+
+        intestazione = next(self._righe, None)
+        if not intestazione:
+            self.close()
+            raise ValueError("Il file è vuoto o senza riga di intestazione")
+        self.colonne = [normalizza_intestazione(c) for c in intestazione]
+
+    def __iter__(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        for numero, valori in enumerate(self._righe, start=2):
+            dati = {}
+            for colonna, valore in zip(self.colonne, valori):
+                if not colonna:
+                    continue
+                if isinstance(valore, str):
+                    valore = valore.strip() or None
+                if valore is not None:
+                    dati[colonna] = valore
+            if dati:
+                yield numero, dati
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _tipo_campo(annotation) -> Any:
+    """Tipo base di un campo Optional[...] dello schema"""
+    argomenti = [a for a in get_args(annotation) if a is not type(None)]
+    return argomenti[0] if argomenti else annotation
+
+
+def _converti(tipo, valore):
+    """Conversioni tolleranti per i valori dei fogli di calcolo italiani"""
+    if tipo is bool and isinstance(valore, str):
+        minuscolo = valore.lower()
+        if minuscolo in _VALORI_VERO:
+            return True
+        if minuscolo in _VALORI_FALSO:
+            return False
+    elif tipo in (float, int) and isinstance(valore, str):
+        # "1.234,50" -> "1234.50"
+        numero = valore.replace("€", "").replace(" ", "")
+        if "," in numero:
+            numero = numero.replace(".", "").replace(",", ".")
+        return numero
+    elif tipo is datetime:
+        if isinstance(valore, date) and not isinstance(valore, datetime):
+            return datetime(valore.year, valore.month, valore.day)
+        if isinstance(valore, str):
+            data = _RE_DATA_ITALIANA.match(valore)
+            if data:
+                giorno, mese, anno = data.groups()
+                return f"{anno}-{int(mese):02d}-{int(giorno):02d}"
+    elif tipo is str and not isinstance(valore, str):
+        # Excel restituisce numeri per codici e P.IVA: 12345.0 -> "12345"
+        if isinstance(valore, float) and valore.is_integer():
+            valore = int(valore)
+        return str(valore)
+    return valore
+
+
+def valida_riga(schema: Type[BaseModel], dati: Dict[str, Any]) -> Tuple[Optional[BaseModel], List[str]]:
+    """Valida una riga con lo schema Pydantic; restituisce (oggetto, errori)"""
+    valori = {}
+    for nome, campo in schema.model_fields.items():
+        if nome in dati:
+            valori[nome] = _converti(_tipo_campo(campo.annotation), dati[nome])
+    # P.IVA scritte male (es. "12345") segnalate come errore invece di essere completate con zeri
+    errori_piva = []
+    for campo in ("p_iva", "cliente_p_iva"):
+        if campo in schema.model_fields or campo == "cliente_p_iva":
+            errore = errore_piva(dati.get(campo))
+            if errore:
+                errori_piva.append(f"{campo}: {errore}")
+    try:
+        oggetto = schema.model_validate(valori)
+    except ValidationError as e:
+        return None, errori_piva + [
+            f"{'.'.join(str(p) for p in errore['loc']) or 'riga'}: {errore['msg']}"
+            for errore in e.errors()
+        ]
+    return (None, errori_piva) if errori_piva else (oggetto, [])
+
+
+def normalizza_piva(valore: Optional[str]) -> Optional[str]:
+    """
+    P.IVA senza spazi né prefisso IT. Se Excel ha salvato la P.IVA come numero (9-10 cifre)
+    gli zeri iniziali persi vengono ripristinati; le altre lunghezze restano invariate
+    (errore di riga, vedi errore_piva).
+    """
+    if not valore:
+        return None
+    if isinstance(valore, float) and valore.is_integer():
+        valore = int(valore)  # Cella numerica di Excel
+    piva = str(valore).replace(" ", "").upper()
+    if piva.startswith("IT") and piva[2:].isdigit():
+        piva = piva[2:]
+    if piva.isdigit() and len(piva) in CIFRE_PIVA_SENZA_ZERI:
+        piva = piva.zfill(11)
+    return piva
+
+
+def errore_piva(valore: Optional[str]) -> Optional[str]:
+    """Messaggio di errore per una P.IVA italiana (solo cifre) che non ha 11 cifre, altrimenti None"""
+    piva = normalizza_piva(valore)
+    if piva and piva.isdigit() and len(piva) != 11:
+        return f"P.IVA {valore} non valida ({len(piva)} cifre, attese 11)"
+    return None
+
+
+def piva_normalizzata_sql(colonna):
+    """Stessa normalizzazione di normalizza_piva in SQL, per confrontare le P.IVA salvate senza normalizzarle"""
+    senza_spazi = func.upper(func.replace(colonna, " ", ""))
+    return case(
+        (and_(senza_spazi.like("IT%"), func.length(senza_spazi) == 13), func.substr(senza_spazi, 3)),
+        else_=senza_spazi,
+    )
+
+
+def _colonne_modello(model, dati: Dict[str, Any]) -> Dict[str, Any]:
+    """Solo i campi che corrispondono a colonne della tabella"""
+    colonne = model.__table__.columns.keys()
+    return {k: v for k, v in dati.items() if k in colonne}
+
+
+class RigaImport:
+    """Riga validata pronta per l'inserimento"""
+    __slots__ = ("numero", "valori", "chiavi")
+
+    def __init__(self, numero: int, valori: Dict[str, Any], chiavi: Tuple):
+        self.numero = numero
+        self.valori = valori
+        self.chiavi = chiavi
+
+
+class Importatore(ABC):
+    """Logica di un tipo di import: schema, colonne obbligatorie, deduplica e inserimento"""
+    schema: Type[BaseModel]
+    model = None
+    colonne_collegamento: Tuple[Tuple[str, ...], ...] = ()  # Almeno una colonna per gruppo
+
+    def __init__(self, utente_id: Optional[int] = None):
+        self.utente_id = utente_id
+        # Chiavi già importate da questo file (in aggiunta a quelle presenti nel database)
+        self.viste: Set = set()
+
+    def colonne_mancanti(self, colonne: List[str]) -> List[str]:
+        mancanti = [
+            nome for nome, campo in self.schema.model_fields.items()
+            if campo.is_required() and nome not in colonne
+        ]
+        mancanti += [" o ".join(gruppo) for gruppo in self.colonne_collegamento if not any(c in colonne for c in gruppo)]
+        return mancanti
+
+    @abstractmethod
+    def prepara(self, db: Session, righe: List[Tuple[int, BaseModel, Dict[str, Any]]]) -> Tuple[List[RigaImport], List[dict], List[dict]]:
+        """Restituisce (righe da inserire, errori, duplicati) per un blocco di righe valide"""
+
+    def inserisci(self, db: Session, righe: List[RigaImport]):
+        db.execute(insert(self.model), [r.valori for r in righe])
+
+    def _filtra_duplicati(self, righe: List[RigaImport], esistenti: Set, descrizione) -> Tuple[List[RigaImport], List[dict]]:
+        """Scarta le righe con una chiave già presente nel database, già importata o ripetuta nel blocco"""
+        da_inserire, duplicati = [], []
+        nel_blocco = set()
+        for riga in righe:
+            doppia = next((k for k in riga.chiavi if k in esistenti or k in self.viste or k in nel_blocco), None)
+            if doppia is not None:
+                duplicati.append({"riga": riga.numero, "errore": f"Duplicato: {descrizione(doppia)} già presente"})
+                continue
+            nel_blocco.update(riga.chiavi)
+            da_inserire.append(riga)
+        return da_inserire, duplicati
+
+
+class ImportClienti(Importatore):
+    schema = schemas.ClienteBase
+    model = models.Cliente
+
+    def prepara(self, db, righe):
+        candidate = []
+        for numero, oggetto, _ in righe:
+            valori = oggetto.model_dump()
+            valori["p_iva"] = normalizza_piva(valori.get("p_iva"))
+            if valori.get("codice_fiscale"):
+                valori["codice_fiscale"] = valori["codice_fiscale"].replace(" ", "").upper()
+            chiavi = tuple(
+                (tipo, valori[campo]) for tipo, campo in (("piva", "p_iva"), ("cf", "codice_fiscale")) if valori.get(campo)
+            )
+            candidate.append(RigaImport(numero, _colonne_modello(models.Cliente, valori), chiavi))
+
+        piva = [v for r in candidate for t, v in r.chiavi if t == "piva"]
+        cf = [v for r in candidate for t, v in r.chiavi if t == "cf"]
+        esistenti = set()
+        if piva:
+            # P.IVA salvate con prefisso IT o spazi: confronto sul valore normalizzato
+            piva_salvata = piva_normalizzata_sql(models.Cliente.p_iva)
+            esistenti.update(("piva", v) for (v,) in db.query(piva_salvata).filter(piva_salvata.in_(piva)))
+        if cf:
+            esistenti.update(("cf", v) for (v,) in db.query(models.Cliente.codice_fiscale).filter(models.Cliente.codice_fiscale.in_(cf)))
+        da_inserire, duplicati = self._filtra_duplicati(
+            candidate, esistenti, lambda k: f"{'P.IVA' if k[0] == 'piva' else 'codice fiscale'} {k[1]}"
+        )
+        return da_inserire, [], duplicati
+
+
+class _ImportPerCliente(Importatore):
+    """Righe collegate a un cliente esistente tramite cliente_id o cliente_p_iva"""
+    colonne_collegamento = (("cliente_id", "cliente_p_iva"),)
+    flag_cliente: Optional[str] = None  # Flag del cliente da attivare (has_multisede, has_noleggio)
+
+    def _risolvi_clienti(self, db, righe) -> Tuple[List[Tuple[int, BaseModel, Dict[str, Any], int]], List[dict]]:
+        piva = {normalizza_piva(d.get("cliente_p_iva")) for _, _, d in righe if d.get("cliente_p_iva")}
+        id_richiesti = set()
+        for _, _, dati in righe:
+            try:
+                if dati.get("cliente_id") is not None:
+                    id_richiesti.add(int(dati["cliente_id"]))
+            except (TypeError, ValueError):
+                pass
+        per_piva = {}
+        if piva:
+            piva_salvata = piva_normalizzata_sql(models.Cliente.p_iva)
+            per_piva = dict(db.query(piva_salvata, models.Cliente.id).filter(piva_salvata.in_(piva)).all())
+        id_validi = set()
+        if id_richiesti:
+            id_validi = {i for (i,) in db.query(models.Cliente.id).filter(models.Cliente.id.in_(id_richiesti))}
+
+        risolte, errori = [], []
+        for numero, oggetto, dati in righe:
+            cliente_id = None
+            if dati.get("cliente_id") is not None:
+                try:
+                    cliente_id = int(dati["cliente_id"])
+                except (TypeError, ValueError):
+                    cliente_id = None
+                if cliente_id not in id_validi:
+                    errori.append({"riga": numero, "errore": f"Cliente con ID {dati['cliente_id']} non trovato"})
+                    continue
+            else:
+                cliente_id = per_piva.get(normalizza_piva(dati.get("cliente_p_iva")))
+                if cliente_id is None:
+                    errori.append({"riga": numero, "errore": f"Cliente con P.IVA {dati.get('cliente_p_iva')} non trovato"})
+                    continue
+            risolte.append((numero, oggetto, dati, cliente_id))
+        return risolte, errori
+
+    def inserisci(self, db, righe):
+        super().inserisci(db, righe)
+        if self.flag_cliente:
+            colonna = getattr(models.Cliente, self.flag_cliente)
+            cliente_ids = {r.valori["cliente_id"] for r in righe}
+            db.execute(
+                update(models.Cliente)
+                .where(models.Cliente.id.in_(cliente_ids), colonna.isnot(True))
+                .values({self.flag_cliente: True})
+                .execution_options(synchronize_session=False)
+            )
+
+
+class ImportSedi(_ImportPerCliente):
+    schema = schemas.SedeClienteCreate
+    model = models.SedeCliente
+    flag_cliente = "has_multisede"
+
+    def prepara(self, db, righe):
+        risolte, errori = self._risolvi_clienti(db, righe)
+        candidate = []
+        for numero, oggetto, _, cliente_id in risolte:
+            valori = {**oggetto.model_dump(), "cliente_id": cliente_id}
+            chiave = ("sede", cliente_id, valori["nome_sede"].strip().lower())
+            candidate.append(RigaImport(numero, _colonne_modello(models.SedeCliente, valori), (chiave,)))
+
+        cliente_ids = {r.valori["cliente_id"] for r in candidate}
+        esistenti = set()
+        if cliente_ids:
+            esistenti = {
+                ("sede", cid, (nome or "").strip().lower())
+                for cid, nome in db.query(models.SedeCliente.cliente_id, models.SedeCliente.nome_sede)
+                .filter(models.SedeCliente.cliente_id.in_(cliente_ids))
+            }
+        da_inserire, duplicati = self._filtra_duplicati(candidate, esistenti, lambda k: f"sede '{k[2]}' del cliente {k[1]}")
+        return da_inserire, errori, duplicati
+
+
+class ImportAssets(_ImportPerCliente):
+    schema = schemas.AssetClienteCreate
+    model = models.AssetCliente
+    flag_cliente = "has_noleggio"
+
+    def prepara(self, db, righe):
+        risolte, errori = self._risolvi_clienti(db, righe)
+
+        # Sede di ubicazione per nome (colonna sede_nome), tra le sedi dei clienti del blocco
+        cliente_ids = {cliente_id for _, _, _, cliente_id in risolte}
+        sedi = {}
+        if cliente_ids and any(d.get("sede_nome") for _, _, d, _ in risolte):
+            sedi = {
+                (cid, (nome or "").strip().lower()): sid
+                for sid, cid, nome in db.query(models.SedeCliente.id, models.SedeCliente.cliente_id, models.SedeCliente.nome_sede)
+                .filter(models.SedeCliente.cliente_id.in_(cliente_ids))
+            }
+
+        candidate = []
+        for numero, oggetto, dati, cliente_id in risolte:
+            valori = {**oggetto.model_dump(), "cliente_id": cliente_id}
+            tipo = (valori.get("tipo_asset") or "").strip().lower()
+            valori["tipo_asset"] = "IT" if tipo == "it" else "Printing" if tipo == "printing" else valori["tipo_asset"]
+            if dati.get("sede_nome"):
+                sede_id = sedi.get((cliente_id, str(dati["sede_nome"]).strip().lower()))
+                if sede_id is None:
+                    errori.append({"riga": numero, "errore": f"Sede '{dati['sede_nome']}' non trovata per il cliente {cliente_id}"})
+                    continue
+                valori["sede_id"] = sede_id
+            chiavi = tuple(
+                (campo, str(valori[campo]).strip().upper()) for campo in ("matricola", "seriale") if valori.get(campo)
+            )
+            candidate.append(RigaImport(numero, _colonne_modello(models.AssetCliente, valori), chiavi))
+
+        esistenti = set()
+        for campo in ("matricola", "seriale"):
+            codici = [v for r in candidate for c, v in r.chiavi if c == campo]
+            if codici:
+                colonna = getattr(models.AssetCliente, campo)
+                esistenti.update(
+                    (campo, (v or "").strip().upper())
+                    for (v,) in db.query(colonna).filter(func.upper(colonna).in_(codici))
+                )
+        da_inserire, duplicati = self._filtra_duplicati(candidate, esistenti, lambda k: f"{k[0]} {k[1]}")
+        return da_inserire, errori, duplicati
+
+
+class ImportMagazzino(Importatore):
+    schema = schemas.ProdottoCreate
+    model = models.ProdottoMagazzino
+
+    def prepara(self, db, righe):
+        candidate = [
+            RigaImport(numero, oggetto.model_dump(), (("codice", oggetto.codice_articolo.strip()),))
+            for numero, oggetto, _ in righe
+        ]
+        for riga in candidate:
+            riga.valori["codice_articolo"] = riga.valori["codice_articolo"].strip()
+        codici = [r.valori["codice_articolo"] for r in candidate]
+        esistenti = set()
+        if codici:
+            esistenti = {
+                ("codice", v) for (v,) in db.query(models.ProdottoMagazzino.codice_articolo)
+                .filter(models.ProdottoMagazzino.codice_articolo.in_(codici))
+            }
+        da_inserire, duplicati = self._filtra_duplicati(candidate, esistenti, lambda k: f"codice articolo {k[1]}")
+        return da_inserire, [], duplicati
+
+    def inserisci(self, db, righe):
+        # Giacenza iniziale registrata nei movimenti di magazzino, come per la creazione manuale
+        inseriti = db.execute(
+            insert(models.ProdottoMagazzino).returning(models.ProdottoMagazzino.id, models.ProdottoMagazzino.giacenza),
+            [r.valori for r in righe]
+        ).all()
+        magazzino_service.registra_carichi_iniziali(db, inseriti, utente_id=self.utente_id, note="Import da file")
+
+
+IMPORTATORI: Dict[str, Type[Importatore]] = {
+    "clienti": ImportClienti,
+    "sedi": ImportSedi,
+    "assets": ImportAssets,
+    "magazzino": ImportMagazzino,
+}
+
+
+def verifica_colonne(entita: str, colonne: List[str]) -> List[str]:
+    """Colonne obbligatorie mancanti nell'intestazione del file per il tipo di import"""
+    if entita not in IMPORTATORI:
+        raise ValueError(f"Tipo di import non valido: {entita}. Valori ammessi: {', '.join(IMPORTATORI)}")
+    return IMPORTATORI[entita]().colonne_mancanti(colonne)
+
+
+def _inserisci_blocco(db: Session, importatore: Importatore, righe: List[RigaImport]) -> Tuple[int, List[dict]]:
+    """Inserimento multiplo del blocco; se fallisce, riga per riga in savepoint per isolare gli errori"""
+    if not righe:
+        return 0, []
+    try:
+        importatore.inserisci(db, righe)
+        db.commit()
+        for riga in righe:
+            importatore.viste.update(riga.chiavi)
+        return len(righe), []
+    except (IntegrityError, DBAPIError):
+        db.rollback()
+
+    inserite, errori = 0, []
+    for riga in righe:
+        try:
+            with db.begin_nested():
+                importatore.inserisci(db, [riga])
+            importatore.viste.update(riga.chiavi)
+            inserite += 1
+        except (IntegrityError, DBAPIError) as e:
+            errori.append({"riga": riga.numero, "errore": f"Errore database: {str(getattr(e, 'orig', e)).splitlines()[0]}"})
+    db.commit()
+    return inserite, errori
+
+
+def importa(
+    db: Session,
+    entita: str,
+    lettore: LettoreFile,
+    batch_size: Optional[int] = None,
+    dry_run: bool = False,
+    utente_id: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Importa le righe del file a blocchi. Genera un evento {"evento": "avanzamento", ...} per
+    ogni blocco (con gli errori di riga del blocco) e infine {"evento": "completato", ...}.
+    dry_run: valida e deduplica senza scrivere nel database.
+    """
+    mancanti = verifica_colonne(entita, lettore.colonne)
+    if mancanti:
+        raise ValueError(f"Colonne obbligatorie mancanti: {', '.join(mancanti)}")
+
+    importatore = IMPORTATORI[entita](utente_id=utente_id)
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    inizio = time.perf_counter()
+    totali = {"righe": 0, "importate": 0, "duplicate": 0, "errori": 0}
+
+    def elabora(blocco: List[Tuple[int, Dict[str, Any]]]) -> Dict[str, Any]:
+        valide, problemi = [], []
+        for numero, dati in blocco:
+            oggetto, errori = valida_riga(importatore.schema, dati)
+            if errori:
+                problemi.append({"riga": numero, "errore": "; ".join(errori)})
+            else:
+                valide.append((numero, oggetto, dati))
+
+        da_inserire, errori, duplicati = importatore.prepara(db, valide) if valide else ([], [], [])
+        problemi += errori
+        if dry_run:
+            for riga in da_inserire:
+                importatore.viste.update(riga.chiavi)
+            inserite = len(da_inserire)
+            db.rollback()
+        else:
+            inserite, errori_db = _inserisci_blocco(db, importatore, da_inserire)
+            problemi += errori_db
+
+        totali["righe"] += len(blocco)
+        totali["importate"] += inserite
+        totali["duplicate"] += len(duplicati)
+        totali["errori"] += len(problemi)
+        return {
+            "evento": "avanzamento",
+            **totali,
+            "righe_totali": lettore.righe_totali,
+            "problemi": sorted(problemi + duplicati, key=lambda p: p["riga"]),
+        }
+
+    blocco = []
+    for numero, dati in lettore:
+        blocco.append((numero, dati))
+        if len(blocco) >= batch_size:
+            yield elabora(blocco)
+            blocco = []
+    if blocco:
+        yield elabora(blocco)
+
+    yield {
+        "evento": "completato",
+        "entita": entita,
+        "dry_run": dry_run,
+        **totali,
+        "durata_s": round(time.perf_counter() - inizio, 2),
+    }
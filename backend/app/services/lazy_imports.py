@@ -0,0 +1,141 @@
+"""
+Caricamento on-demand delle dipendenze pesanti (WeasyPrint, PyPDF2, FPDF, qrcode/PIL, requests, openpyxl, httpx, brotli).
+
+Importarle all'avvio costa centinaia di ms e decine di MB per ogni worker,
+mentre la maggior parte delle richieste non genera PDF né QR code.
+Ogni modulo viene importato al primo utilizzo e memorizzato; se non è
+installato la funzione restituisce None (una sola volta viene stampato l'avviso).
+
+warm_up() permette di precaricarle in background dopo l'avvio (PRELOAD_OPTIONAL_DEPS),
+così la prima richiesta che genera un PDF non paga il costo dell'import.
+"""
+import logging
+import importlib
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+_modules: Dict[str, Optional[Any]] = {}
+_lock = threading.Lock()
+
+# Moduli che NON devono essere importati all'avvio dell'app (lista usata da check_startup_profile.py)
+HEAVY_MODULES = ("weasyprint", "PyPDF2", "fpdf", "qrcode", "PIL", "requests", "openpyxl", "pyinstrument", "httpx", "brotli")
+
+
+def _load(module_name: str, warning: str) -> Optional[Any]:
+    """Importa un modulo una sola volta (thread-safe); None se non disponibile"""
+    if module_name in _modules:
+        return _modules[module_name]
+    with _lock:
+        if module_name not in _modules:
+            try:
+                _modules[module_name] = importlib.import_module(module_name)
+            except Exception as e:
+                # WeasyPrint può fallire anche con OSError se mancano le librerie di sistema (cairo/pango)
+                _modules[module_name] = None
+                logger.warning("%s (%s)", warning, e)
+    return _modules[module_name]
+
+
+def get_weasyprint():
+    """Modulo weasyprint (HTML, CSS) o None"""
+    return _load("weasyprint", "WeasyPrint non disponibile. Fallback su FPDF.")
+
+
+def get_pypdf2():
+    """Modulo PyPDF2 (PdfWriter, PdfReader) o None"""
+    return _load("PyPDF2", "PyPDF2 non installato. Merge PDF non disponibile.")
+
+
+def get_fpdf():
+    """Classe FPDF (pacchetto fpdf2, importato come 'fpdf') o None"""
+    module = _load("fpdf", "FPDF non installato. Solo WeasyPrint disponibile.")
+    return getattr(module, "FPDF", None) if module is not None else None
+
+
+def get_qrcode():
+    """Modulo qrcode (usa PIL per generare l'immagine) o None"""
+    return _load("qrcode", "qrcode non installato. Generazione QR code non disponibile.")
+
+
+def get_pil_image():
+    """Modulo PIL.Image (Pillow: varianti del logo aziendale) o None"""
+    return _load("PIL.Image", "Pillow non installato. Il logo viene salvato senza ridimensionamento.")
+
+
+def get_requests():
+    """Modulo requests o None"""
+    return _load("requests", "requests non installato. Chiamate HTTP esterne non disponibili.")
+
+
+def get_openpyxl():
+    """Modulo openpyxl (lettura file XLSX per l'import) o None"""
+    return _load("openpyxl", "openpyxl non installato. Import da file XLSX non disponibile.")
+
+
+def get_httpx():
+    """Modulo httpx (client HTTP asincrono del proxy geocoding) o None"""
+    return _load("httpx", "httpx non installato. Ricerca indirizzi non disponibile.")
+
+
+def get_brotli():
+    """Modulo brotli (compressione delle risposte) o None"""
+    return _load("brotli", "brotli non installato. Risposte compresse solo con gzip.")
+
+
+def get_pyinstrument():
+    """Modulo pyinstrument (profiler a campionamento, PROFILING_ENGINE=pyinstrument) o None"""
+    return _load("pyinstrument", "pyinstrument non installato. Profiling con cProfile.")
+
+
+_LOADERS = {
+    "weasyprint": get_weasyprint,
+    "pypdf2": get_pypdf2,
+    "fpdf": get_fpdf,
+    "qrcode": get_qrcode,
+    "pil": get_pil_image,
+    "requests": get_requests,
+    "openpyxl": get_openpyxl,
+    "httpx": get_httpx,
+    "brotli": get_brotli,
+}
+
+
+def warm_up(names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Precarica le dipendenze indicate (default: tutte) e restituisce i tempi di import in secondi.
+    Nomi validi: weasyprint, pypdf2, fpdf, qrcode, pil, requests, openpyxl, httpx, brotli.
+    """
+    timings = {}
+    for name in (names if names is not None else _LOADERS.keys()):
+        loader = _LOADERS.get(name.strip().lower())
+        if loader is None:
+            logger.warning("Dipendenza sconosciuta per il warm-up: %s", name)
+            continue
+        started = time.perf_counter()
+        loader()
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def start_background_warm_up() -> Optional[threading.Thread]:
+    """
+    Avvia il warm-up in un thread daemon se PRELOAD_OPTIONAL_DEPS è impostata
+    (es. "weasyprint,pypdf2" oppure "all"). Non blocca l'avvio dell'app.
+    """
+    setting = os.getenv("PRELOAD_OPTIONAL_DEPS", "").strip()
+    if not setting:
+        return None
+    names = None if setting.lower() == "all" else [n for n in setting.split(",") if n.strip()]
+
+    def _run():
+        timings = warm_up(names)
+        summary = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items())
+        logger.info("Warm-up dipendenze opzionali completato: %s", summary)
+
+    thread = threading.Thread(target=_run, name="optional-deps-warm-up", daemon=True)
+    thread.start()
+    return thread
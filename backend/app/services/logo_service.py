@@ -0,0 +1,146 @@
+"""
+Logo aziendale: varianti normalizzate generate al caricamento (POST /api/upload/logo).
+
+Dal file caricato (PNG, JPG, GIF, WEBP) vengono create, con Pillow:
+- logo_<hash>_ui.png e logo_<hash>_ui.webp: al massimo DIMENSIONE_UI px per lato, per
+  intestazione, login e favicon del frontend;
+- logo_<hash>_pdf.png: al massimo DIMENSIONE_PDF px (circa 300 dpi per lo spazio di
+  180x60 px del logo nei PDF dei RIT), incorporata da WeasyPrint al posto dell'originale.
+<hash> deriva dal contenuto del file: un nuovo logo ha sempre un nome nuovo, quindi
+/uploads/logos viene servito con Cache-Control immutable e il browser lo scarica una volta.
+impostazioni_azienda.logo_url punta alla variante _ui.png; le altre si ricavano dal nome.
+Gli SVG (o tutti i file se Pillow non è installato) vengono salvati così come sono,
+sempre con nome derivato dal contenuto.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from starlette.staticfiles import StaticFiles
+from . import lazy_imports
+
+logger = logging.getLogger(__name__)
+
+# Directory degli upload (relativa alla directory di lavoro: /app nel container)
+UPLOAD_DIR = Path("uploads")
+LOGO_DIR = UPLOAD_DIR / "logos"
+LOGO_URL_PREFIX = "/uploads/logos/"
+
+ESTENSIONI_AMMESSE = {".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp"}
+DIMENSIONE_MASSIMA_FILE = 5 * 1024 * 1024  # Stesso limite del frontend
+DIMENSIONE_UI = (256, 256)
+DIMENSIONE_PDF = (600, 200)
+CACHE_CONTROL_IMMUTABILE = "public, max-age=31536000, immutable"
+
+
+class StaticFilesImmutabili(StaticFiles):
+    """StaticFiles per file con nome derivato dal contenuto: cache del browser senza scadenza"""
+
+    def file_response(self, *args, **kwargs):
+        risposta = super().file_response(*args, **kwargs)
+        risposta.headers["Cache-Control"] = CACHE_CONTROL_IMMUTABILE
+        return risposta
+
+
+def _hash_contenuto(contenuto: bytes) -> str:
+    return hashlib.sha256(contenuto).hexdigest()[:16]
+
+
+def _scrivi(percorso: Path, contenuto: bytes):
+    """Scrittura atomica: chi legge il file (StaticFiles, WeasyPrint) non lo vede mai a metà"""
+    fd, temporaneo = tempfile.mkstemp(dir=percorso.parent, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(contenuto)
+        os.replace(temporaneo, percorso)
+    except BaseException:
+        Path(temporaneo).unlink(missing_ok=True)
+        raise
+
+
+def _variante(Image, immagine, dimensione: Tuple[int, int], formato: str) -> bytes:
+    copia = immagine.copy()
+    copia.thumbnail(dimensione, resample=Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    if formato == "WEBP":
+        copia.save(buffer, format="WEBP", quality=90, method=6)
+    else:
+        copia.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def genera_varianti(contenuto: bytes, estensione: str) -> Dict[str, bytes]:
+    """
+    Nome file -> contenuto delle varianti del logo. ValueError se il file non è un'immagine valida.
+    """
+    estensione = estensione.lower()
+    if estensione not in ESTENSIONI_AMMESSE:
+        raise ValueError("Formato file non supportato. Usa PNG, JPG, GIF, SVG o WEBP")
+    if len(contenuto) > DIMENSIONE_MASSIMA_FILE:
+        raise ValueError("File troppo grande. Massimo 5MB")
+    base = f"logo_{_hash_contenuto(contenuto)}"
+
+    Image = lazy_imports.get_pil_image() if estensione != ".svg" else None
+    if Image is None:
+        if estensione == ".svg" and b"<svg" not in contenuto[:4096].lower():
+            raise ValueError("Il file SVG non è valido")
+        return {f"{base}{'.jpg' if estensione == '.jpeg' else estensione}": contenuto}
+
+    try:
+        immagine = Image.open(io.BytesIO(contenuto))
+        immagine.load()  # GIF animate: primo fotogramma
+    except Exception as e:
+        raise ValueError(f"Immagine non valida ({e})") from e
+    # Trasparenza preservata; JPG e palette convertiti in RGB/RGBA
+    immagine = immagine.convert("RGBA" if "A" in immagine.getbands() or "transparency" in immagine.info else "RGB")
+    return {
+        f"{base}_ui.png": _variante(Image, immagine, DIMENSIONE_UI, "PNG"),
+        f"{base}_ui.webp": _variante(Image, immagine, DIMENSIONE_UI, "WEBP"),
+        f"{base}_pdf.png": _variante(Image, immagine, DIMENSIONE_PDF, "PNG"),
+    }
+
+
+def salva_logo(contenuto: bytes, estensione: str) -> str:
+    """Salva le varianti in LOGO_DIR e restituisce il logo_url da memorizzare nelle impostazioni"""
+    varianti = genera_varianti(contenuto, estensione)
+    LOGO_DIR.mkdir(parents=True, exist_ok=True)
+    for nome, dati in varianti.items():
+        percorso = LOGO_DIR / nome
+        if not percorso.exists():  # Stesso contenuto: file già presente e identico
+            _scrivi(percorso, dati)
+    principale = next((nome for nome in varianti if nome.endswith("_ui.png")), next(iter(varianti)))
+    dimensioni = {nome: len(dati) for nome, dati in varianti.items()}
+    logger.info("Logo caricato (%s byte): varianti %s", len(contenuto), dimensioni)
+    return f"{LOGO_URL_PREFIX}{principale}"
+
+
+def _file_del_logo(logo_url: Optional[str]) -> list:
+    """File in LOGO_DIR che appartengono al logo (tutte le varianti o il file singolo)"""
+    if not logo_url or not logo_url.startswith(LOGO_URL_PREFIX):
+        return []
+    nome = Path(logo_url).name
+    if nome.endswith("_ui.png"):
+        return list(LOGO_DIR.glob(f"{nome[:-len('_ui.png')]}_*"))
+    return [LOGO_DIR / nome]
+
+
+def elimina_logo(logo_url: Optional[str], tranne: Optional[str] = None):
+    """Elimina i file di un logo sostituito (non quelli del logo in uso, se coincidono)"""
+    da_tenere = set(_file_del_logo(tranne))
+    for percorso in _file_del_logo(logo_url):
+        if percorso not in da_tenere:
+            percorso.unlink(missing_ok=True)
+
+
+def percorso_logo_pdf(logo_url: Optional[str]) -> Optional[Path]:
+    """File da incorporare nei PDF: variante _pdf.png se esiste, altrimenti il file del logo"""
+    if not logo_url or not logo_url.startswith(LOGO_URL_PREFIX):
+        return None
+    nome = Path(logo_url).name
+    candidati = [LOGO_DIR / nome]
+    if nome.endswith("_ui.png"):
+        candidati.insert(0, LOGO_DIR / f"{nome[:-len('_ui.png')]}_pdf.png")
+    return next((p for p in candidati if p.is_file()), None)
@@ -0,0 +1,176 @@
+"""
+Movimenti di magazzino: scarico atomico dei ricambi e registro dei movimenti.
+
+La giacenza non viene mai letta e riscritta da Python (read-modify-write): con più
+RIT chiusi in contemporanea sullo stesso articolo un aggiornamento andrebbe perso.
+Tutti i ricambi di un RIT vengono scaricati con un'unica
+    UPDATE magazzino SET giacenza = giacenza - v.qta FROM (VALUES ...) v ... RETURNING
+che Postgres applica riga per riga sulla versione più recente (lock di riga, nessun
+lock esplicito lato applicazione). Ogni variazione viene scritta in movimenti_magazzino
+(solo inserimenti, vedi migrate_movimenti_magazzino.py) nella stessa transazione.
+
+Le funzioni non fanno commit: il movimento fa parte della transazione del chiamante.
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Integer, column, func, insert, update, values
+from sqlalchemy.orm import Session
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+TIPO_SALDO_INIZIALE = "saldo_iniziale"
+TIPO_CARICO_INIZIALE = "carico_iniziale"
+TIPO_SCARICO_RIT = "scarico_rit"
+TIPO_RETTIFICA = "rettifica"
+
+
+def _registra_movimenti(db: Session, movimenti: List[dict]):
+    """Inserimento multiplo nel registro movimenti"""
+    if movimenti:
+        db.execute(insert(models.MovimentoMagazzino), movimenti)
+
+
+def scarica_ricambi(
+    db: Session,
+    ricambi: Iterable[Tuple[Optional[int], Optional[int]]],
+    intervento_id: Optional[int] = None,
+    utente_id: Optional[int] = None
+) -> Dict[int, int]:
+    """
+    Scarica dal magazzino i ricambi (prodotto_id, quantita) di un RIT con una sola UPDATE.
+    Le righe dello stesso articolo vengono sommate; quelle senza prodotto o con quantità 0 ignorate.
+    Restituisce {prodotto_id: giacenza_risultante} per gli articoli aggiornati
+    (un prodotto_id inesistente viene ignorato, come in precedenza).
+    """
+    quantita_per_prodotto = defaultdict(int)
+    for prodotto_id, quantita in ricambi:
+        if prodotto_id and quantita:
+            quantita_per_prodotto[prodotto_id] += quantita
+    if not quantita_per_prodotto:
+        return {}
+
+    # Ordinati per id: le righe vengono bloccate sempre nello stesso ordine (meno rischio di deadlock)
+    scarichi = values(column("id", Integer), column("qta", Integer), name="scarichi").data(
+        sorted(quantita_per_prodotto.items())
+    )
+    magazzino = models.ProdottoMagazzino
+    risultato = db.execute(
+        update(magazzino)
+        .where(magazzino.id == scarichi.c.id)
+        .values(giacenza=func.coalesce(magazzino.giacenza, 0) - scarichi.c.qta)
+        .returning(magazzino.id, magazzino.giacenza)
+        .execution_options(synchronize_session=False)
+    ).all()
+    giacenze = {prodotto_id: giacenza for prodotto_id, giacenza in risultato}
+
+    _registra_movimenti(db, [
+        {
+            "prodotto_id": prodotto_id,
+            "intervento_id": intervento_id,
+            "tipo": TIPO_SCARICO_RIT,
+            "quantita": -quantita_per_prodotto[prodotto_id],
+            "giacenza_risultante": giacenza,
+            "utente_id": utente_id,
+        }
+        for prodotto_id, giacenza in sorted(giacenze.items())
+    ])
+    for prodotto_id, giacenza in giacenze.items():
+        if giacenza is not None and giacenza < 0:
+            logger.warning("Giacenza negativa per il prodotto %s (%s) dopo lo scarico RIT %s", prodotto_id, giacenza, intervento_id)
+    return giacenze
+
+
+def registra_carichi_iniziali(
+    db: Session,
+    giacenze: Iterable[Tuple[int, Optional[int]]],
+    utente_id: Optional[int] = None,
+    note: Optional[str] = None
+):
+    """Movimenti di apertura (prodotto_id, giacenza) per articoli appena creati, con un solo inserimento"""
+    _registra_movimenti(db, [
+        {
+            "prodotto_id": prodotto_id,
+            "tipo": TIPO_CARICO_INIZIALE,
+            "quantita": giacenza,
+            "giacenza_risultante": giacenza,
+            "utente_id": utente_id,
+            "note": note,
+        }
+        for prodotto_id, giacenza in giacenze
+        if giacenza
+    ])
+
+
+def registra_carico_iniziale(db: Session, prodotto: models.ProdottoMagazzino, utente_id: Optional[int] = None):
+    """Movimento di apertura per un articolo appena creato con giacenza iniziale"""
+    registra_carichi_iniziali(db, [(prodotto.id, prodotto.giacenza)], utente_id=utente_id)
+
+
+def rettifica_giacenza(
+    db: Session,
+    prodotto_id: int,
+    nuova_giacenza: int,
+    utente_id: Optional[int] = None,
+    note: Optional[str] = None
+) -> Optional[int]:
+    """
+    Imposta la giacenza (inventario / correzione manuale) registrando la differenza.
+    La giacenza attuale viene letta con FOR UPDATE: uno scarico concorrente non può
+    inserirsi tra lettura e scrittura e la differenza registrata resta esatta.
+    Restituisce la variazione applicata (None se il prodotto non esiste).
+    """
+    magazzino = models.ProdottoMagazzino
+    giacenza_attuale = db.query(magazzino.giacenza).filter(magazzino.id == prodotto_id).with_for_update().first()
+    if giacenza_attuale is None:
+        return None
+    variazione = nuova_giacenza - (giacenza_attuale[0] or 0)
+    if variazione == 0:
+        return 0
+
+    db.execute(
+        update(magazzino)
+        .where(magazzino.id == prodotto_id)
+        .values(giacenza=nuova_giacenza)
+        .execution_options(synchronize_session=False)
+    )
+    _registra_movimenti(db, [{
+        "prodotto_id": prodotto_id,
+        "tipo": TIPO_RETTIFICA,
+        "quantita": variazione,
+        "giacenza_risultante": nuova_giacenza,
+        "utente_id": utente_id,
+        "note": note,
+    }])
+    return variazione
+
+
+def verifica_giacenze(db: Session, prodotto_ids: Optional[Iterable[int]] = None) -> List[dict]:
+    """
+    Confronta la giacenza di ogni articolo con la somma dei suoi movimenti.
+    Restituisce solo gli articoli che non coincidono (lista vuota = registro coerente).
+    """
+    magazzino = models.ProdottoMagazzino
+    saldi = (
+        db.query(
+            models.MovimentoMagazzino.prodotto_id.label("prodotto_id"),
+            func.sum(models.MovimentoMagazzino.quantita).label("saldo")
+        )
+        .group_by(models.MovimentoMagazzino.prodotto_id)
+        .subquery()
+    )
+    query = db.query(
+        magazzino.id,
+        magazzino.codice_articolo,
+        func.coalesce(magazzino.giacenza, 0),
+        func.coalesce(saldi.c.saldo, 0)
+    ).outerjoin(saldi, saldi.c.prodotto_id == magazzino.id).filter(
+        func.coalesce(magazzino.giacenza, 0) != func.coalesce(saldi.c.saldo, 0)
+    )
+    if prodotto_ids is not None:
+        query = query.filter(magazzino.id.in_(list(prodotto_ids)))
+    return [
+        {"prodotto_id": pid, "codice_articolo": codice, "giacenza": giacenza, "saldo_movimenti": saldo}
+        for pid, codice, giacenza, saldo in query.order_by(magazzino.id).all()
+    ]
@@ -1,54 +1,54 @@
+import logging
 import io
 from datetime import datetime, timedelta
 from pathlib import Path
 from jinja2 import Template, Environment, FileSystemLoader
-try:
-    from PyPDF2 import PdfWriter, PdfReader
-    HAS_PYPDF2 = True
-except ImportError:
-    HAS_PYPDF2 = False
-    print("ATTENZIONE: PyPDF2 non installato. Merge PDF non disponibile.")
+# WeasyPrint, PyPDF2 e FPDF vengono caricati al primo PDF generato (vedi lazy_imports)
+from .lazy_imports import get_weasyprint, get_pypdf2, get_fpdf
+from . import logo_service
+from .. import metrics
 
-# TENTATIVO DI IMPORTAZIONE WEASYPRINT (Priorità Alta)
-try:
-    from weasyprint import HTML, CSS
-    HAS_WEASYPRINT = True
-except ImportError:
-    HAS_WEASYPRINT = False
-    print("ATTENZIONE: WeasyPrint non installato. Fallback su FPDF.")
-
-# FALLBACK FPDF (Per compatibilità con il tuo errore attuale)
-try:
-    from fpdf import FPDF
-except ImportError:
-    try:
-        from fpdf2 import FPDF
-    except ImportError:
-        FPDF = None
-        print("ATTENZIONE: FPDF non installato. Solo WeasyPrint disponibile.")
+logger = logging.getLogger(__name__)
 
 # --- CLASSE DI COMPATIBILITÀ (FIX PER IL TUO ERRORE) ---
-class PDF(FPDF):
+_pdf_class = None
+
+def get_pdf_class():
     """
-    Questa classe esiste SOLO per evitare il crash 'PDF.__init__ takes 1 argument'.
-    Accetta qualsiasi argomento in input e lo passa a FPDF.
+    Restituisce la classe PDF (sottoclasse di FPDF), creata al primo utilizzo
+    per non importare fpdf all'avvio. None se FPDF non è installato.
     """
-    def __init__(self, *args, **kwargs):
-        # Intercettiamo i parametri di orientamento/formato
-        super().__init__(*args, **kwargs)
-        self.azienda = {}
+    global _pdf_class
+    if _pdf_class is not None:
+        return _pdf_class
+    FPDF = get_fpdf()
+    if FPDF is None:
+        return None
+
+    class PDF(FPDF):
+        """
+        Questa classe esiste SOLO per evitare il crash 'PDF.__init__ takes 1 argument'.
+        Accetta qualsiasi argomento in input e lo passa a FPDF.
+        """
+        def __init__(self, *args, **kwargs):
+            # Intercettiamo i parametri di orientamento/formato
+            super().__init__(*args, **kwargs)
+            self.azienda = {}
+
+        def header(self):
+            # Header semplice di emergenza
+            self.set_font('Arial', 'B', 12)
+            nome = self.azienda.get('nome_azienda', 'Report Tecnico')
+            self.cell(0, 10, str(nome), 0, 1, 'C')
+            self.ln(5)
 
-    def header(self):
-        # Header semplice di emergenza
-        self.set_font('Arial', 'B', 12)
-        nome = self.azienda.get('nome_azienda', 'Report Tecnico')
-        self.cell(0, 10, str(nome), 0, 1, 'C')
-        self.ln(5)
+        def footer(self):
+            self.set_y(-15)
+            self.set_font('Arial', 'I', 8)
+            self.cell(0, 10, f'Pagina {self.page_no()}', 0, 0, 'C')
 
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Pagina {self.page_no()}', 0, 0, 'C')
+    _pdf_class = PDF
+    return _pdf_class
 
 # --- CSS STYLE ---
 CSS_STYLE = """
@@ -143,6 +143,7 @@ def get_prelievo_copie_template():
     env = get_template_environment()
     return env.get_template("prelievo_copie_template.html")
 
+@metrics.cronometra(metrics.PDF_DURATA, metrics.PDF_ULTIMA_DURATA)
 def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
     """
     Genera il PDF. Tenta di usare WeasyPrint (HTML).
@@ -226,58 +227,42 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
     totale = imponibile + iva
 
     # 3. PROVIAMO WEASYPRINT (La via Maestra)
-    if HAS_WEASYPRINT:
+    weasyprint = get_weasyprint()
+    if weasyprint is not None:
+        HTML, CSS = weasyprint.HTML, weasyprint.CSS
         try:
-            print(f"Generazione PDF con WeasyPrint per RIT: {intervento.numero_relazione}")
+            logger.info("Generazione PDF con WeasyPrint per RIT: %s", intervento.numero_relazione)
             # Debug: verifica che i dati azienda siano presenti
-            print(f"[PDF DEBUG] Dati azienda per RIT {intervento.numero_relazione}:")
-            print(f"  - nome_azienda: {safe_azienda.get('nome_azienda', 'NON PRESENTE')}")
-            print(f"  - indirizzo_completo: {safe_azienda.get('indirizzo_completo', 'NON PRESENTE')}")
-            print(f"  - p_iva: {safe_azienda.get('p_iva', 'NON PRESENTE')}")
-            print(f"  - telefono: {safe_azienda.get('telefono', 'NON PRESENTE')}")
-            print(f"  - email: {safe_azienda.get('email', 'NON PRESENTE')}")
-            print(f"  - logo_url: {safe_azienda.get('logo_url', 'NON PRESENTE')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Dati azienda per RIT %s: %s", intervento.numero_relazione,
+                    {chiave: safe_azienda.get(chiave, 'NON PRESENTE') for chiave in ('nome_azienda', 'indirizzo_completo', 'p_iva', 'telefono', 'email', 'logo_url')}
+                )
             
-            # Normalizza logo_url per WeasyPrint (deve essere un path assoluto o URL)
+            # Logo per WeasyPrint: file locale (variante a risoluzione di stampa, vedi logo_service)
             if safe_azienda.get('logo_url') and safe_azienda['logo_url'].startswith('/uploads/'):
-                # Nel container Docker, i file sono in /app/uploads/
-                logo_filename = safe_azienda['logo_url'].replace('/uploads/', '')
-                # Prova diversi path possibili
-                possible_paths = [
-                    Path('/app') / safe_azienda['logo_url'].lstrip('/'),  # Path assoluto nel container: /app/uploads/logos/logo.png
-                    Path('/app/uploads') / logo_filename,  # Path diretto: /app/uploads/logos/logo.png
-                ]
-                
-                logo_path = None
-                for path in possible_paths:
-                    if path.exists():
-                        logo_path = path
-                        break
-                
+                logo_path = logo_service.percorso_logo_pdf(safe_azienda['logo_url'])
                 if logo_path:
-                    # Usa file:// per WeasyPrint
-                    abs_path = str(logo_path.absolute()).replace('\\', '/')
-                    safe_azienda['logo_url'] = f"file://{abs_path}"
-                    print(f"✅ Logo trovato: {safe_azienda['logo_url']}")
+                    safe_azienda['logo_url'] = logo_path.resolve().as_uri()
+                    logger.debug("Logo trovato: %s", safe_azienda['logo_url'])
                 else:
-                    print(f"⚠️ ATTENZIONE: Logo non trovato. Path cercati: {[str(p) for p in possible_paths]}")
+                    logger.warning("Logo non trovato: %s", safe_azienda['logo_url'])
                     safe_azienda['logo_url'] = None
             elif safe_azienda.get('logo_url'):
-                print(f"ℹ️ Logo URL presente ma non in formato /uploads/: {safe_azienda.get('logo_url')}")
+                logger.debug("Logo URL presente ma non in formato /uploads/: %s", safe_azienda.get('logo_url'))
             else:
-                print(f"ℹ️ Nessun logo URL configurato")
+                logger.debug("Nessun logo URL configurato")
             
             # Carica letture copie se è un prelievo copie
             # Le informazioni dell'asset dovrebbero essere già incluse nelle letture copie
             # quando vengono caricate prima di chiamare questa funzione
             letture_copie_dettagli = []
             if intervento.is_prelievo_copie:
-                print(f"[PDF GENERATION] Prelievo copie rilevato per RIT {intervento.numero_relazione}")
-                print(f"[PDF GENERATION] hasattr(intervento, 'letture_copie'): {hasattr(intervento, 'letture_copie')}")
+                logger.debug("Prelievo copie rilevato per RIT %s", intervento.numero_relazione)
                 if hasattr(intervento, 'letture_copie') and intervento.letture_copie:
-                    print(f"[PDF GENERATION] Trovate {len(intervento.letture_copie)} letture copie")
+                    logger.debug("Trovate %s letture copie", len(intervento.letture_copie))
                     for lettura in intervento.letture_copie:
-                        # Parse delle note per estrarre i dettagli del calcolo
+                        # Note del tecnico (il dettaglio del calcolo è in lettura.riga_fatturazione)
                         note = lettura.note or ""
                         
                         # Estrai informazioni asset se disponibili (aggiunte durante il caricamento)
@@ -285,7 +270,7 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                         asset_modello = getattr(lettura, 'asset_modello', '') or ''
                         asset_marca_modello = getattr(lettura, 'asset_marca_modello', '') or ''
                         
-                        print(f"[PDF GENERATION] Lettura {lettura.id}: asset_id={lettura.asset_id}, asset_marca_modello={asset_marca_modello}")
+                        logger.debug("Lettura %s: asset_id=%s, asset_marca_modello=%s", lettura.id, lettura.asset_id, asset_marca_modello)
                         
                         # Se non disponibili, prova a costruirle da marca e modello
                         if not asset_marca_modello and (asset_marca or asset_modello):
@@ -297,14 +282,16 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                             'contatore_bn': lettura.contatore_bn,
                             'contatore_colore': lettura.contatore_colore,
                             'note': note,
+                            # Calcolo strutturato (righe_fatturazione_copie); None per letture non ancora calcolate
+                            'fatturazione': getattr(lettura, 'riga_fatturazione', None),
                             'asset_marca': asset_marca,
                             'asset_modello': asset_modello,
                             'asset_marca_modello': asset_marca_modello or 'N/A'
                         })
                 else:
-                    print(f"[PDF GENERATION] ATTENZIONE: Nessuna lettura copie trovata per prelievo copie!")
+                    logger.warning("Nessuna lettura copie trovata per il prelievo copie %s", intervento.numero_relazione)
             
-            print(f"[PDF GENERATION] Totale letture_copie_dettagli preparate: {len(letture_copie_dettagli)}")
+            logger.debug("Totale letture_copie_dettagli preparate: %s", len(letture_copie_dettagli))
             
             # Verifica se è solo prelievo copie (nessun dettaglio o ricambi significativi)
             has_manutenzione = False
@@ -321,7 +308,7 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
             
             # Se è solo prelievo copie, genera PDF semplificato
             if intervento.is_prelievo_copie and not has_manutenzione:
-                print(f"Generazione PDF semplificato per prelievo copie: {intervento.numero_relazione}")
+                logger.info("Generazione PDF semplificato per prelievo copie: %s", intervento.numero_relazione)
                 template_prelievo = get_prelievo_copie_template()
                 html_prelievo = template_prelievo.render(
                     rit=intervento,
@@ -337,7 +324,7 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
             
             # Se c'è anche manutenzione, genera entrambi i PDF e uniscili
             elif intervento.is_prelievo_copie and has_manutenzione:
-                print(f"Generazione PDF combinato (prelievo copie + manutenzione): {intervento.numero_relazione}")
+                logger.info("Generazione PDF combinato (prelievo copie + manutenzione): %s", intervento.numero_relazione)
                 
                 # 1. Genera PDF prelievo copie (senza firme)
                 template_prelievo = get_prelievo_copie_template()
@@ -375,25 +362,26 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                 pdf_rit_file.seek(0)
                 
                 # 3. Unisci i PDF (prelievo copie + RIT completo)
-                if HAS_PYPDF2:
+                pypdf2 = get_pypdf2()
+                if pypdf2 is not None:
                     try:
-                        merger = PdfWriter()
+                        merger = pypdf2.PdfWriter()
                         # Aggiungi PDF prelievo copie
-                        merger.append(PdfReader(pdf_prelievo_file))
+                        merger.append(pypdf2.PdfReader(pdf_prelievo_file))
                         # Aggiungi PDF RIT completo (con firme)
-                        merger.append(PdfReader(pdf_rit_file))
+                        merger.append(pypdf2.PdfReader(pdf_rit_file))
                         # Scrivi PDF unito
                         pdf_merged = io.BytesIO()
                         merger.write(pdf_merged)
                         pdf_merged.seek(0)
                         return pdf_merged.read()
                     except Exception as e:
-                        print(f"Errore merge PDF: {e}. Restituisco solo PDF RIT completo.")
+                        logger.warning("Errore merge PDF: %s. Restituisco solo PDF RIT completo.", e)
                         pdf_rit_file.seek(0)
                         return pdf_rit_file.read()
                 else:
                     # Se PyPDF2 non è disponibile, restituisci solo il PDF RIT completo
-                    print("PyPDF2 non disponibile. Restituisco solo PDF RIT completo.")
+                    logger.warning("PyPDF2 non disponibile. Restituisco solo PDF RIT completo.")
                     pdf_rit_file.seek(0)
                     return pdf_rit_file.read()
             
@@ -421,12 +409,11 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                 pdf_file.seek(0)
                 return pdf_file.read()
         except Exception as e:
-            print(f"Errore WeasyPrint: {e}. Passo al fallback FPDF.")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Errore WeasyPrint: %s. Passo al fallback FPDF.", e)
     
     # 4. FALLBACK FPDF (Se WeasyPrint fallisce o mancano librerie di sistema)
-    if FPDF is None:
+    PDF = get_pdf_class()
+    if PDF is None:
         raise Exception("Nessun motore PDF disponibile. Installare WeasyPrint o fpdf2.")
     
     # Questo codice viene eseguito SOLO se WeasyPrint non va.
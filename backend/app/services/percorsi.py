@@ -0,0 +1,221 @@
+"""
+Ordine di visita delle chiamate di un tecnico (problema del commesso viaggiatore, euristica).
+
+Lavora solo sulle coordinate salvate di clienti e sedi (nessun servizio esterno):
+1. distanze in linea d'aria (formula dell'emisenoverso) tra tutte le coppie di punti;
+2. percorso iniziale "vicino più vicino";
+3. miglioramento 2-opt: inverte tratti del percorso finché la lunghezza diminuisce.
+Senza punto di partenza si prova il vicino più vicino da più visite (al massimo MAX_INIZI)
+e si tiene il percorso migliore.
+Con poche decine di visite al giorno il calcolo richiede pochi millisecondi.
+
+percorso_tecnico legge le chiamate del giorno (coordinate della sede dell'intervento o, in
+mancanza, del cliente); punti_vicini cerca clienti e sedi vicini a una posizione con l'indice
+GiST su point(longitudine, latitudine) (migrate_coordinate_clienti.py).
+"""
+import math
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .. import models
+
+Coordinate = Tuple[float, float]  # (latitudine, longitudine)
+
+RAGGIO_TERRA_KM = 6371.0088
+# Oltre questo numero di visite il 2-opt si limita a un solo giro di miglioramenti
+MAX_VISITE_2OPT_COMPLETO = 200
+# Visite da cui provare il percorso iniziale quando non c'è un punto di partenza
+MAX_INIZI = 20
+
+
+def distanza_km(a: Coordinate, b: Coordinate) -> float:
+    """Distanza in linea d'aria (km) tra due coordinate"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAGGIO_TERRA_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def matrice_distanze(punti: Sequence[Coordinate]) -> List[List[float]]:
+    n = len(punti)
+    d = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            d[i][j] = d[j][i] = distanza_km(punti[i], punti[j])
+    return d
+
+
+def lunghezza(ordine: Sequence[int], d: List[List[float]], chiuso: bool = False) -> float:
+    totale = sum((d[a][b] for a, b in zip(ordine, ordine[1:])), 0.0)
+    if chiuso and len(ordine) > 1:
+        totale += d[ordine[-1]][ordine[0]]
+    return totale
+
+
+def vicino_piu_vicino(d: List[List[float]], inizio: int) -> List[int]:
+    """Percorso che visita ogni volta il punto non ancora visitato più vicino"""
+    da_visitare = set(range(len(d))) - {inizio}
+    ordine = [inizio]
+    while da_visitare:
+        ultimo = d[ordine[-1]]
+        prossimo = min(da_visitare, key=lambda j: ultimo[j])
+        da_visitare.remove(prossimo)
+        ordine.append(prossimo)
+    return ordine
+
+
+def due_opt(ordine: List[int], d: List[List[float]], inizio_fisso: bool, chiuso: bool = False) -> List[int]:
+    """
+    Inverte il tratto ordine[i..j] quando accorcia il percorso, fino a non trovare miglioramenti.
+    Con inizio_fisso il primo punto (partenza) non si sposta; con chiuso si torna al primo punto.
+    """
+    ordine = list(ordine)
+    n = len(ordine)
+    if n < 3:
+        return ordine
+    primo = 1 if inizio_fisso or chiuso else 0
+    migliorato = True
+    giri = 0
+    while migliorato and (giri == 0 or n <= MAX_VISITE_2OPT_COMPLETO):
+        migliorato = False
+        giri += 1
+        for i in range(primo, n - 1):
+            prima = ordine[i - 1] if i > 0 else None
+            for j in range(i + 1, n):
+                dopo = ordine[j + 1] if j + 1 < n else (ordine[0] if chiuso else None)
+                # Archi (prima, i) e (j, dopo) sostituiti da (prima, j) e (i, dopo)
+                attuale = (d[prima][ordine[i]] if prima is not None else 0.0) + (d[ordine[j]][dopo] if dopo is not None else 0.0)
+                nuovo = (d[prima][ordine[j]] if prima is not None else 0.0) + (d[ordine[i]][dopo] if dopo is not None else 0.0)
+                if nuovo < attuale - 1e-9:
+                    ordine[i:j + 1] = reversed(ordine[i:j + 1])
+                    migliorato = True
+    return ordine
+
+
+def ottimizza(
+    punti: Sequence[Coordinate],
+    partenza: Optional[Coordinate] = None,
+    ritorno: bool = False
+) -> Tuple[List[int], float]:
+    """
+    Ordine di visita dei punti (indici in punti) e lunghezza totale in km.
+    Con partenza il percorso parte da lì (e con ritorno vi torna a fine giornata); la
+    lunghezza comprende i tratti da e verso la partenza.
+    """
+    if not punti:
+        return [], 0.0
+    if partenza is not None:
+        d = matrice_distanze([partenza, *punti])
+        ordine = due_opt(vicino_piu_vicino(d, 0), d, inizio_fisso=True, chiuso=ritorno)
+        return [i - 1 for i in ordine[1:]], lunghezza(ordine, d, chiuso=ritorno)
+
+    d = matrice_distanze(punti)
+    migliore, migliore_lunghezza = None, math.inf
+    passo = max(1, len(punti) // MAX_INIZI)
+    for inizio in range(0, len(punti), passo):
+        ordine = due_opt(vicino_piu_vicino(d, inizio), d, inizio_fisso=False)
+        totale = lunghezza(ordine, d)
+        if totale < migliore_lunghezza - 1e-9:
+            migliore, migliore_lunghezza = ordine, totale
+    return migliore, migliore_lunghezza
+
+
+# --- Chiamate del tecnico e punti vicini ---
+
+def percorso_tecnico(
+    db: Session,
+    tecnico_id: int,
+    giorno: date,
+    partenza: Optional[Coordinate] = None,
+    ritorno: bool = False,
+    solo_aperte: bool = True
+) -> Dict[str, Any]:
+    """
+    Chiamate del tecnico nel giorno (is_chiamata; con solo_aperte quelle non ancora firmate dal
+    cliente) in ordine di visita, con distanza dalla tappa precedente e progressiva.
+    Le chiamate senza coordinate vengono restituite a parte, nell'ordine di creazione.
+    """
+    intervento, sede, cliente = models.Intervento, models.SedeCliente, models.Cliente
+    inizio = datetime.combine(giorno, time.min)
+    query = (
+        db.query(
+            intervento.id, intervento.numero_relazione, intervento.cliente_id, intervento.sede_id,
+            intervento.cliente_ragione_sociale, intervento.sede_nome,
+            func.coalesce(intervento.sede_indirizzo, intervento.cliente_indirizzo).label("indirizzo"),
+            func.coalesce(sede.latitudine, cliente.latitudine).label("latitudine"),
+            func.coalesce(sede.longitudine, cliente.longitudine).label("longitudine"),
+        )
+        .outerjoin(sede, sede.id == intervento.sede_id)
+        .outerjoin(cliente, cliente.id == intervento.cliente_id)
+        .filter(
+            intervento.tecnico_id == tecnico_id,
+            intervento.is_chiamata.is_(True),
+            intervento.data_creazione >= inizio,
+            intervento.data_creazione < inizio + timedelta(days=1),
+        )
+        .order_by(intervento.data_creazione, intervento.id)
+    )
+    if solo_aperte:
+        query = query.filter(intervento.firma_cliente.is_(None))
+
+    chiamate = [dict(riga._mapping) for riga in query]
+    con_coordinate = [c for c in chiamate if c["latitudine"] is not None and c["longitudine"] is not None]
+    senza_coordinate = [c for c in chiamate if c["latitudine"] is None or c["longitudine"] is None]
+    punti = [(c["latitudine"], c["longitudine"]) for c in con_coordinate]
+
+    ordine, totale = ottimizza(punti, partenza, ritorno)
+    visite, precedente, progressiva = [], partenza, 0.0
+    for posizione, indice in enumerate(ordine, start=1):
+        tratto = distanza_km(precedente, punti[indice]) if precedente is not None else 0.0
+        progressiva += tratto
+        visite.append({
+            **con_coordinate[indice],
+            "ordine": posizione,
+            "distanza_precedente_km": round(tratto, 2),
+            "distanza_progressiva_km": round(progressiva, 2),
+        })
+        precedente = punti[indice]
+
+    # Stesse tappe nell'ordine di creazione delle chiamate, per confronto
+    originale = [partenza, *punti, partenza if ritorno else None] if partenza is not None else punti
+    originale = [p for p in originale if p is not None]
+    return {
+        "tecnico_id": tecnico_id,
+        "data": giorno,
+        "partenza": {"latitudine": partenza[0], "longitudine": partenza[1]} if partenza else None,
+        "ritorno": ritorno and partenza is not None,
+        "visite": visite,
+        "senza_coordinate": senza_coordinate,
+        "distanza_totale_km": round(totale, 2),
+        "distanza_ordine_creazione_km": round(sum((distanza_km(a, b) for a, b in zip(originale, originale[1:])), 0.0), 2),
+    }
+
+
+def punti_vicini(db: Session, posizione: Coordinate, limite: int = 20, raggio_km: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Clienti (indirizzo principale) e sedi più vicini alla posizione, con distanza in linea d'aria"""
+    cliente, sede = models.Cliente, models.SedeCliente
+    query_clienti = db.query(
+        cliente.id.label("cliente_id"), cliente.ragione_sociale, cliente.indirizzo,
+        cliente.latitudine, cliente.longitudine,
+    )
+    query_sedi = db.query(
+        sede.cliente_id, cliente.ragione_sociale, sede.indirizzo_completo.label("indirizzo"),
+        sede.id.label("sede_id"), sede.nome_sede, sede.latitudine, sede.longitudine,
+    ).join(cliente, cliente.id == sede.cliente_id)
+
+    candidati = []
+    for model, query in ((cliente, query_clienti), (sede, query_sedi)):
+        query = query.filter(model.latitudine.isnot(None), model.longitudine.isnot(None))
+        if db.get_bind().dialect.name == "postgresql":
+            # Ordinamento k-nearest-neighbour servito dall'indice GiST; la distanza in gradi è
+            # approssimata: si leggono più candidati e si riordinano con la distanza reale
+            query = query.order_by(
+                func.point(model.longitudine, model.latitudine).op("<->")(func.point(posizione[1], posizione[0]))
+            ).limit(limite * 3)
+        candidati += [dict(riga._mapping) for riga in query]
+
+    for punto in candidati:
+        punto["distanza_km"] = round(distanza_km(posizione, (punto["latitudine"], punto["longitudine"])), 2)
+    if raggio_km is not None:
+        candidati = [p for p in candidati if p["distanza_km"] <= raggio_km]
+    return sorted(candidati, key=lambda p: p["distanza_km"])[:limite]
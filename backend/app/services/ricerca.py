@@ -0,0 +1,204 @@
+"""
+Ricerca testuale su clienti (autocomplete) e articoli di magazzino basata su pg_trgm.
+
+Un ILIKE '%testo%' non può usare un indice btree: con l'estensione pg_trgm e gli
+indici GIN creati da migrate_ricerca_trigram.py Postgres risolve sia l'ILIKE sia
+l'operatore di similarità (%) tramite indice e i risultati vengono ordinati per
+pertinenza (prima chi inizia con il testo cercato, poi per similarità).
+
+P.IVA, codice fiscale e codice articolo hanno un percorso veloce per prefisso
+(indici btree text_pattern_ops). Se pg_trgm non è installata la ricerca funziona
+comunque con il solo ILIKE, ordinata alfabeticamente.
+Indici: migrate_ricerca_trigram.py (clienti), migrate_ricerca_magazzino.py (magazzino).
+"""
+import logging
+import os
+import re
+import threading
+from typing import Any, List, Optional, Sequence
+from sqlalchemy import case, desc, exists, func, or_, text
+from sqlalchemy.orm import Session
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+# Numero di risultati predefinito e massimo per le ricerche dell'autocomplete
+RICERCA_LIMIT_DEFAULT = int(os.getenv("RICERCA_LIMIT_DEFAULT", "50"))
+RICERCA_LIMIT_MAX = int(os.getenv("RICERCA_LIMIT_MAX", "200"))
+
+# P.IVA italiana (con o senza prefisso IT) e codice fiscale (persona fisica o numerico)
+_RE_PIVA = re.compile(r"^(?:IT)?(\d{3,11})$", re.IGNORECASE)
+_RE_CODICE_FISCALE = re.compile(r"^[A-Z0-9]{3,16}$", re.IGNORECASE)
+
+_trgm_lock = threading.Lock()
+_trgm_per_engine = {}
+
+
+def pg_trgm_disponibile(db: Session) -> bool:
+    """Verifica (una volta per engine) se l'estensione pg_trgm è installata nel database"""
+    bind = db.get_bind()
+    chiave = str(bind.url)
+    if chiave in _trgm_per_engine:
+        return _trgm_per_engine[chiave]
+    with _trgm_lock:
+        if chiave not in _trgm_per_engine:
+            disponibile = False
+            if bind.dialect.name == "postgresql":
+                try:
+                    disponibile = db.execute(
+                        text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                    ).scalar() is not None
+                except Exception as e:
+                    logger.warning("Impossibile verificare l'estensione pg_trgm (%s)", e)
+            if not disponibile:
+                logger.warning("Estensione pg_trgm non disponibile - ricerca senza indici trigram (python migrate_ricerca_trigram.py)")
+            _trgm_per_engine[chiave] = disponibile
+    return _trgm_per_engine[chiave]
+
+
+def escape_like(valore: str) -> str:
+    """Escape dei caratteri speciali di LIKE (%, _ e \\) nel testo cercato"""
+    return valore.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def normalizza_limit(limit: Optional[int]) -> int:
+    """Limite richiesto riportato nell'intervallo 1..RICERCA_LIMIT_MAX"""
+    if not limit or limit < 1:
+        return RICERCA_LIMIT_DEFAULT
+    return min(limit, RICERCA_LIMIT_MAX)
+
+
+def _cerca_clienti_per_codice(db: Session, testo: str, limit: int, colonne: Optional[Sequence[Any]] = None) -> List[Any]:
+    """Percorso veloce: P.IVA o codice fiscale che iniziano con il testo (indici per prefisso)"""
+    compatto = testo.replace(" ", "")
+    condizioni = []
+    match_piva = _RE_PIVA.match(compatto)
+    if match_piva:
+        condizioni.append(models.Cliente.p_iva.like(f"{match_piva.group(1)}%"))
+    if _RE_CODICE_FISCALE.match(compatto) and any(c.isdigit() for c in compatto):
+        condizioni.append(func.upper(models.Cliente.codice_fiscale).like(f"{compatto.upper()}%"))
+    if not condizioni:
+        return []
+
+    codice = match_piva.group(1) if match_piva else compatto.upper()
+    return db.query(*(colonne or [models.Cliente])).filter(or_(*condizioni)).order_by(
+        # Corrispondenza esatta per prima
+        case(
+            (or_(models.Cliente.p_iva == codice, func.upper(models.Cliente.codice_fiscale) == codice), 0),
+            else_=1
+        ),
+        models.Cliente.ragione_sociale.asc()
+    ).limit(limit).all()
+
+
+def cerca_clienti(
+    db: Session,
+    q: str = "",
+    limit: Optional[int] = None,
+    colonne: Optional[Sequence[Any]] = None
+) -> List[Any]:
+    """
+    Clienti per l'autocomplete: ragione sociale, P.IVA o codice fiscale contenenti il testo,
+    ordinati per pertinenza. Senza testo restituisce i primi clienti in ordine alfabetico.
+    colonne: se indicate restituisce solo quelle colonne (righe, non oggetti Cliente).
+    """
+    limit = normalizza_limit(limit)
+    testo = (q or "").strip()
+    query = db.query(*(colonne or [models.Cliente]))
+    if not testo:
+        return query.order_by(models.Cliente.ragione_sociale.asc()).limit(limit).all()
+
+    # P.IVA / codice fiscale: se il testo è un codice e trova risultati non serve la ricerca full-text
+    per_codice = _cerca_clienti_per_codice(db, testo, limit, colonne)
+    if per_codice:
+        return per_codice
+
+    search = f"%{escape_like(testo)}%"
+    condizioni = [
+        models.Cliente.ragione_sociale.ilike(search, escape="\\"),
+        models.Cliente.p_iva.ilike(search, escape="\\"),
+        models.Cliente.codice_fiscale.ilike(search, escape="\\")
+    ]
+    ordinamento = [
+        # Prima le ragioni sociali che iniziano con il testo cercato
+        case((models.Cliente.ragione_sociale.ilike(f"{escape_like(testo)}%", escape="\\"), 0), else_=1)
+    ]
+    if pg_trgm_disponibile(db):
+        # Similarità trigram: trova anche parole in ordine diverso o con piccoli errori di battitura
+        condizioni.append(models.Cliente.ragione_sociale.op("%")(testo))
+        ordinamento.append(desc(func.similarity(models.Cliente.ragione_sociale, testo)))
+    ordinamento.append(models.Cliente.ragione_sociale.asc())
+
+    return query.filter(or_(*condizioni)).order_by(*ordinamento).limit(limit).all()
+
+
+def cerca_prodotti(
+    db: Session,
+    q: str = "",
+    categoria: Optional[str] = None,
+    skip: int = 0,
+    limit: Optional[int] = None
+) -> List[models.ProdottoMagazzino]:
+    """
+    Articoli di magazzino per codice (esatto, per prefisso o contenuto) e descrizione (trigram).
+    Ordinamento: codice esatto, codice per prefisso, descrizione per prefisso, altri;
+    a parità di pertinenza prima gli articoli disponibili (giacenza > 0), poi per similarità.
+    """
+    limit = normalizza_limit(limit)
+    testo = (q or "").strip()
+    query = db.query(models.ProdottoMagazzino)
+    if categoria:
+        query = query.filter(models.ProdottoMagazzino.categoria == categoria)
+    if not testo:
+        return query.order_by(models.ProdottoMagazzino.descrizione.asc()).offset(skip).limit(limit).all()
+
+    codice = func.upper(models.ProdottoMagazzino.codice_articolo)
+    testo_like = escape_like(testo.upper())
+    search = f"%{escape_like(testo)}%"
+    condizioni = [
+        codice.like(f"{testo_like}%", escape="\\"),
+        models.ProdottoMagazzino.codice_articolo.ilike(search, escape="\\"),
+        models.ProdottoMagazzino.descrizione.ilike(search, escape="\\")
+    ]
+    ordinamento = [
+        case(
+            (codice == testo.upper(), 0),
+            (codice.like(f"{testo_like}%", escape="\\"), 1),
+            (models.ProdottoMagazzino.descrizione.ilike(f"{escape_like(testo)}%", escape="\\"), 2),
+            else_=3
+        ),
+        # Disponibili prima degli esauriti
+        case((models.ProdottoMagazzino.giacenza > 0, 0), else_=1)
+    ]
+    if pg_trgm_disponibile(db):
+        condizioni.append(models.ProdottoMagazzino.descrizione.op("%")(testo))
+        ordinamento.append(desc(func.similarity(models.ProdottoMagazzino.descrizione, testo)))
+    ordinamento.append(models.ProdottoMagazzino.descrizione.asc())
+
+    return query.filter(or_(*condizioni)).order_by(*ordinamento).offset(skip).limit(limit).all()
+
+
+def condizione_ricerca_interventi(q: str):
+    """
+    Condizione per la ricerca RIT: numero relazione, cliente, seriale / part number /
+    marca-modello nei dettagli asset, descrizione dei ricambi (EXISTS, una sola query).
+    """
+    search = f"%{escape_like(q.strip())}%"
+    dettaglio = models.DettaglioIntervento
+    ricambio = models.MovimentoRicambio
+    return or_(
+        models.Intervento.numero_relazione.ilike(search, escape="\\"),
+        models.Intervento.cliente_ragione_sociale.ilike(search, escape="\\"),
+        exists().where(
+            dettaglio.intervento_id == models.Intervento.id,
+            or_(
+                dettaglio.serial_number.ilike(search, escape="\\"),
+                dettaglio.part_number.ilike(search, escape="\\"),
+                dettaglio.marca_modello.ilike(search, escape="\\")
+            )
+        ),
+        exists().where(
+            ricambio.intervento_id == models.Intervento.id,
+            ricambio.descrizione.ilike(search, escape="\\")
+        )
+    )
@@ -3,11 +3,11 @@ Servizio per gestire l'autenticazione a due fattori (2FA) con TOTP
 Compatibile con Authy, Google Authenticator, Microsoft Authenticator, ecc.
 """
 import pyotp
-import qrcode
 import io
 import base64
 import secrets
 from typing import Tuple, List
+from .lazy_imports import get_qrcode
 
 def generate_secret() -> str:
     """Genera un secret TOTP casuale"""
@@ -31,7 +31,10 @@ def generate_qr_code(secret: str, email: str, app_name: str = "SISTEMA54") -> st
         issuer_name=app_name
     )
     
-    # Genera QR code
+    # Genera QR code (qrcode/PIL caricati solo al primo utilizzo)
+    qrcode = get_qrcode()
+    if qrcode is None:
+        raise RuntimeError("Libreria qrcode non installata: impossibile generare il QR code")
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(totp_uri)
     qr.make(fit=True)
@@ -0,0 +1,214 @@
+"""
+Micro-benchmark dei percorsi critici dell'API su dati sintetici (benchmarks/dati_sintetici.py).
+
+Genera uno schema separato (default "benchmark_api") nel database indicato da DATABASE_URL e misura:
+- genera_numero_rit
+- read_interventi (GET /interventi/): lista, ricerca per numero RIT, per cliente e per seriale
+- genera_pdf_intervento (WeasyPrint o fallback FPDF, riportato nei risultati)
+- check_scadenze_contratti e check_scadenze_letture_copie (email in modalità mock)
+- update_cliente (PUT /clienti/{id} con sedi e asset)
+Gli endpoint passano dall'app completa (middleware, autenticazione con token, serializzazione)
+tramite TestClient, senza server HTTP. Tutte le connessioni dell'app usano lo schema di benchmark
+(PGOPTIONS), i dati di produzione non vengono toccati.
+
+I risultati (p50/p95/max per benchmark, commit git, scala dei dati) vengono salvati in JSON
+e si confrontano tra commit con benchmarks/confronta.py:
+
+    python benchmarks/benchmark_api.py --keep --output base.json
+    git checkout <altro commit>
+    python benchmarks/benchmark_api.py --riusa --output nuovo.json
+    python benchmarks/confronta.py base.json nuovo.json
+
+Uso:
+    python benchmarks/benchmark_api.py [--clienti 1000] [--interventi 100000] [--anni 3]
+        [--ripetizioni 20] [--riusa] [--keep] [--output risultati.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Prima di importare app.database (letta all'import): i benchmark usano solo il primario
+os.environ.pop("DATABASE_REPLICA_URL", None)
+
+from sqlalchemy import text
+from benchmarks import dati_sintetici
+from benchmarks.dati_sintetici import PASSWORD_BENCHMARK, Scala, opzioni_schema
+
+
+def statistiche(tempi):
+    tempi = sorted(tempi)
+    return {
+        "ripetizioni": len(tempi),
+        "p50_ms": round(statistics.median(tempi), 2),
+        "p95_ms": round(tempi[max(0, int(len(tempi) * 0.95) - 1)], 2),
+        "max_ms": round(tempi[-1], 2),
+        "media_ms": round(statistics.fmean(tempi), 2),
+    }
+
+
+def misura(funzione, ripetizioni: int, warm_up: int = 1):
+    """Latenza (ms) della funzione; le prime esecuzioni (cache, import lazy) non vengono contate"""
+    for _ in range(warm_up):
+        funzione()
+    tempi = []
+    for _ in range(ripetizioni):
+        start = time.perf_counter()
+        funzione()
+        tempi.append((time.perf_counter() - start) * 1000)
+    return statistiche(tempi)
+
+
+def commit_git() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        modifiche = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if modifiche else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "sconosciuto"
+
+
+def esegui_benchmark(ripetizioni: int) -> dict:
+    # Import dopo la configurazione dell'ambiente (PGOPTIONS, SMTP, log) fatta in main()
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+    from app import main as app_main, models
+    from app.database import SessionLocal
+    from app.services import pdf_service, lazy_imports
+
+    risultati = {}
+    client = TestClient(app_main.app)
+    risposta = client.post("/api/auth/login", data={"username": "admin@bench.local", "password": PASSWORD_BENCHMARK})
+    risposta.raise_for_status()
+    headers = {"Authorization": f"Bearer {risposta.json()['access_token']}"}
+
+    def get(url, **params):
+        r = client.get(url, params=params, headers=headers)
+        r.raise_for_status()
+        return r
+
+    with SessionLocal() as db:
+        # Campioni dai dati generati (id assegnati dal generatore: deterministici a parità di scala)
+        intervento = db.get(models.Intervento, max(1, (db.query(func.max(models.Intervento.id)).scalar() or 0) // 2))
+        seriale = db.query(models.DettaglioIntervento.serial_number).filter(
+            models.DettaglioIntervento.serial_number.isnot(None)
+        ).order_by(models.DettaglioIntervento.id).limit(1).scalar()
+        cliente_id = intervento.cliente_id
+        frammento_cliente = intervento.cliente_ragione_sociale.split()[0]
+
+        risultati["genera_numero_rit"] = misura(lambda: app_main.genera_numero_rit(db), ripetizioni)
+
+    risultati["read_interventi[lista]"] = misura(lambda: get("/interventi/", limit=50), ripetizioni)
+    risultati["read_interventi[numero_rit]"] = misura(lambda: get("/interventi/", q=intervento.numero_relazione), ripetizioni)
+    risultati["read_interventi[cliente]"] = misura(lambda: get("/interventi/", q=frammento_cliente, limit=50), ripetizioni)
+    if seriale:
+        risultati["read_interventi[seriale]"] = misura(lambda: get("/interventi/", q=seriale), ripetizioni)
+
+    # PDF: stessa preparazione dell'endpoint /interventi/{id}/pdf, sessione nuova per ogni esecuzione
+    motore_pdf = "weasyprint" if lazy_imports.get_weasyprint() is not None else "fpdf"
+
+    def pdf():
+        with SessionLocal() as db:
+            rit = db.get(models.Intervento, intervento.id)
+            pdf_service.genera_pdf_intervento(rit, app_main.get_settings_or_default(db))
+
+    try:
+        risultati["genera_pdf_intervento"] = {**misura(pdf, ripetizioni), "motore": motore_pdf}
+    except Exception as e:
+        print(f"⚠️  genera_pdf_intervento non misurato: {e}")
+
+    # Job schedulati: più lenti, meno ripetizioni
+    ripetizioni_job = max(3, ripetizioni // 5)
+    risultati["check_scadenze_contratti"] = misura(app_main.check_scadenze_contratti, ripetizioni_job)
+    risultati["check_scadenze_letture_copie"] = misura(app_main.check_scadenze_letture_copie, ripetizioni_job)
+
+    # update_cliente: payload come lo invia il frontend (cliente completo con sedi e asset)
+    cliente = get(f"/clienti/{cliente_id}").json()
+    citta = [cliente["citta"], f"{cliente['citta']} (benchmark)"]
+    contatore = [0]
+
+    def aggiorna_cliente():
+        contatore[0] += 1
+        cliente["citta"] = citta[contatore[0] % 2]
+        client.put(f"/clienti/{cliente_id}", json=cliente, headers=headers).raise_for_status()
+
+    risultati["update_cliente"] = {**misura(aggiorna_cliente, ripetizioni), "sedi": len(cliente["sedi"]), "assets": len(cliente["assets_noleggio"])}
+    return risultati
+
+
+def stampa(risultati: dict):
+    print(f"\n{'benchmark':<36}{'rip.':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for nome, r in risultati.items():
+        print(f"{nome:<36}{r['ripetizioni']:>6}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['max_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark API su dati sintetici")
+    parser.add_argument("--schema", default="benchmark_api")
+    parser.add_argument("--clienti", type=int, default=Scala.clienti)
+    parser.add_argument("--interventi", type=int, default=Scala.interventi)
+    parser.add_argument("--anni", type=int, default=Scala.anni_letture)
+    parser.add_argument("--ripetizioni", type=int, default=20)
+    parser.add_argument("--riusa", action="store_true", help="Usa lo schema già generato (implica --keep)")
+    parser.add_argument("--keep", action="store_true", help="Non eliminare lo schema di benchmark")
+    parser.add_argument("--output", help="Salva i risultati in JSON")
+    args = parser.parse_args()
+
+    # Ambiente dell'app (letto alla connessione o all'import di app.main): schema di benchmark,
+    # niente SMTP reale, log essenziali
+    os.environ["PGOPTIONS"] = opzioni_schema(args.schema)
+    os.environ["SMTP_USER"] = ""
+    os.environ["SMTP_PASSWORD"] = ""
+    os.environ["PROFILING_SAMPLE_RATE"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    scala = Scala(clienti=args.clienti, interventi=args.interventi, anni_letture=args.anni)
+    conteggi, generazione_s = None, None
+    if not args.riusa:
+        print(f"Generazione dati sintetici nello schema {args.schema} ({asdict(scala)})...")
+        start = time.perf_counter()
+        engine = dati_sintetici.prepara_schema(args.schema)
+        conteggi = dati_sintetici.genera(engine, scala)
+        engine.dispose()
+        generazione_s = round(time.perf_counter() - start, 1)
+        print(f"Dati generati in {generazione_s}s: {conteggi}")
+
+    from app.database import engine as app_engine
+    try:
+        with app_engine.connect() as conn:
+            versione_pg = conn.execute(text("SHOW server_version")).scalar()
+        risultati = esegui_benchmark(args.ripetizioni)
+    finally:
+        if not args.keep and not args.riusa:
+            with app_engine.connect() as conn:
+                conn.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+                conn.commit()
+        app_engine.dispose()
+    stampa(risultati)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": commit_git(),
+                "data": datetime.now().isoformat(timespec="seconds"),
+                "postgres": versione_pg,
+                "python": platform.python_version(),
+                "schema": args.schema,
+                "scala": None if args.riusa else asdict(scala),
+                "generazione_s": generazione_s,
+                "righe": conteggi,
+                "benchmark": risultati,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\nRisultati salvati in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
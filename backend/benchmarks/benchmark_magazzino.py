@@ -0,0 +1,162 @@
+"""
+Benchmark della ricerca magazzino (GET /magazzino/?q=...) su un catalogo sintetico.
+
+Crea uno schema separato (default "benchmark_magazzino") nel database indicato da
+DATABASE_URL, lo popola con N articoli (default 100.000) e misura la latenza di
+ricerca.cerca_prodotti per diversi tipi di query, prima e dopo la creazione degli
+indici di migrate_ricerca_magazzino.py. Lo schema viene eliminato alla fine
+(--keep per conservarlo). I dati di produzione non vengono toccati.
+
+Uso:
+    python benchmarks/benchmark_magazzino.py [--articoli 100000] [--ripetizioni 30] [--output risultati.json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+from app import models
+from app.database import engine
+from app.services import ricerca
+from migrate_ricerca_magazzino import crea_indici
+
+MARCHE = ["Kyocera", "Ricoh", "Canon", "Konica Minolta", "Sharp", "Xerox", "Brother", "HP", "Lexmark", "Olivetti"]
+PARTI = ["Toner", "Drum", "Fusore", "Rullo di trasferimento", "Cinghia di trasferimento", "Kit manutenzione",
+         "Vaschetta recupero toner", "Developer", "Rullo pescaggio", "Scheda madre", "Alimentatore", "Lampada scanner"]
+COLORI = ["Nero", "Ciano", "Magenta", "Giallo", ""]
+CATEGORIE = ["Consumabili", "Ricambi", "Elettronica", "Accessori", "Kit"]
+
+
+def genera_articoli(n: int, seed: int = 54):
+    """Genera n articoli plausibili (codice univoco, descrizione, categoria, giacenza)"""
+    rnd = random.Random(seed)
+    for i in range(n):
+        marca = rnd.choice(MARCHE)
+        parte = rnd.choice(PARTI)
+        modello = f"{rnd.choice('ABCDEFMPT')}{rnd.randint(100, 9999)}"
+        colore = rnd.choice(COLORI) if parte in ("Toner", "Drum", "Developer") else ""
+        yield {
+            "codice_articolo": f"{marca[:2].upper()}-{parte[:2].upper()}{i:06d}",
+            "descrizione": f"{parte} {marca} {modello} {colore}".strip(),
+            "prezzo_vendita": round(rnd.uniform(5, 400), 2),
+            "costo_acquisto": round(rnd.uniform(2, 250), 2),
+            "giacenza": rnd.choice([0, 0, 1, 2, 5, 10, 25]),
+            "categoria": rnd.choice(CATEGORIE),
+        }
+
+
+def query_di_test(n_articoli: int):
+    """Tipi di ricerca tipici dal form RIT: (nome, q, categoria)"""
+    rnd = random.Random(7)
+    indice = rnd.randrange(n_articoli)
+    articolo = next(a for i, a in enumerate(genera_articoli(indice + 1)) if i == indice)
+    # Codice modello (es. "M4125") contenuto nella descrizione
+    modello = next(p for p in articolo["descrizione"].split() if p[0].isupper() and p[1:].isdigit())
+    return [
+        ("codice_esatto", articolo["codice_articolo"], None),
+        ("codice_prefisso", articolo["codice_articolo"][:6], None),
+        ("descrizione_parola", "fusore", None),
+        ("descrizione_modello", modello, None),
+        ("descrizione_errore_battitura", "tonr kyocra", None),
+        ("categoria_e_testo", "drum", "Consumabili"),
+        ("lista_completa", "", None),
+    ]
+
+
+def misura(db: Session, queries, ripetizioni: int):
+    """Latenza (ms) per tipo di query: p50, p95, max e numero risultati"""
+    risultati = {}
+    for nome, q, categoria in queries:
+        ricerca.cerca_prodotti(db, q, categoria=categoria, limit=20)  # warm-up (cache del piano e dei buffer)
+        tempi = []
+        trovati = 0
+        for _ in range(ripetizioni):
+            start = time.perf_counter()
+            trovati = len(ricerca.cerca_prodotti(db, q, categoria=categoria, limit=20))
+            tempi.append((time.perf_counter() - start) * 1000)
+        tempi.sort()
+        risultati[nome] = {
+            "q": q,
+            "categoria": categoria,
+            "risultati": trovati,
+            "p50_ms": round(statistics.median(tempi), 2),
+            "p95_ms": round(tempi[max(0, int(len(tempi) * 0.95) - 1)], 2),
+            "max_ms": round(tempi[-1], 2),
+        }
+    return risultati
+
+
+def stampa(titolo: str, risultati):
+    print(f"\n{titolo}")
+    print(f"{'query':<30}{'risultati':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for nome, r in risultati.items():
+        print(f"{nome:<30}{r['risultati']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['max_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ricerca magazzino")
+    parser.add_argument("--articoli", type=int, default=100_000)
+    parser.add_argument("--ripetizioni", type=int, default=30)
+    parser.add_argument("--schema", default="benchmark_magazzino")
+    parser.add_argument("--output", help="Salva i risultati in JSON")
+    parser.add_argument("--keep", action="store_true", help="Non eliminare lo schema di benchmark")
+    args = parser.parse_args()
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # L'estensione va creata nello schema pubblico, prima di spostare il search_path
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+        conn.execute(text(f'CREATE SCHEMA "{args.schema}"'))
+        conn.execute(text(f'SET search_path TO "{args.schema}", public'))
+        try:
+            models.ProdottoMagazzino.__table__.create(conn)
+
+            print(f"Inserimento di {args.articoli} articoli nello schema {args.schema}...")
+            start = time.perf_counter()
+            batch = []
+            for articolo in genera_articoli(args.articoli):
+                batch.append(articolo)
+                if len(batch) == 5000:
+                    conn.execute(insert(models.ProdottoMagazzino), batch)
+                    batch = []
+            if batch:
+                conn.execute(insert(models.ProdottoMagazzino), batch)
+            conn.execute(text("ANALYZE magazzino"))
+            print(f"Dati generati in {time.perf_counter() - start:.1f}s")
+
+            db = Session(bind=conn)
+            queries = query_di_test(args.articoli)
+            senza_indici = misura(db, queries, args.ripetizioni)
+            stampa("Senza indici di ricerca", senza_indici)
+
+            start = time.perf_counter()
+            crea_indici(conn)
+            print(f"\nIndici creati in {time.perf_counter() - start:.1f}s")
+            con_indici = misura(db, queries, args.ripetizioni)
+            stampa("Con indici (migrate_ricerca_magazzino.py)", con_indici)
+            db.close()
+
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "articoli": args.articoli,
+                        "ripetizioni": args.ripetizioni,
+                        "senza_indici": senza_indici,
+                        "con_indici": con_indici,
+                    }, f, indent=2, ensure_ascii=False)
+                print(f"\nRisultati salvati in {args.output}")
+        finally:
+            conn.execute(text("SET search_path TO public"))
+            if not args.keep:
+                conn.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+
+
+if __name__ == "__main__":
+    main()
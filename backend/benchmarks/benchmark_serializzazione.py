@@ -0,0 +1,149 @@
+"""
+Benchmark della serializzazione di una pagina di RIT (GET /interventi/, default 100 RIT).
+
+Non usa il database: i RIT (con dettagli, ricambi e firme base64 come quelle reali) vengono
+creati in memoria, così si misura solo il costo della risposta. Percorsi confrontati:
+- costruzione_modelli: parte comune, eseguita dall'endpoint (orari convertiti e model_validate);
+- prima[...]: percorso standard di FastAPI per un endpoint con response_model che restituisce
+  istanze già validate (serialize_response: riconversione in dizionari, seconda validazione,
+  serializzazione) e rendering con JSONResponse (json.dumps) o ORJSONResponse;
+- dopo[risposta_validata]: app/serializzazione.py, istanze scritte direttamente in JSON
+  da pydantic-core senza seconda validazione;
+- pagina_*: costruzione dei modelli più serializzazione, prima e dopo.
+Prima di misurare verifica che tutti i percorsi producano lo stesso JSON.
+I risultati hanno lo stesso formato di benchmark_api.py (confrontabili con confronta.py).
+
+Uso:
+    python benchmarks/benchmark_serializzazione.py [--rit 100] [--ripetizioni 50] [--output risultati.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+from datetime import datetime, time, timedelta
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app import models, schemas, serializzazione
+from app.main import convert_intervento_time_fields
+from benchmarks.benchmark_api import commit_git, misura, stampa
+from benchmarks.dati_sintetici import DIFETTI, LAVORI, PC, STAMPANTI
+
+SEED = 54
+
+
+def genera_rit(n: int, dettagli: int, ricambi: int) -> List[models.Intervento]:
+    """RIT in memoria (non salvati) con dettagli e ricambi; 8 su 10 firmati"""
+    rnd = random.Random(SEED)
+    firma = "data:image/png;base64," + "iVBORw0KGgoAAAANSUhEUgAA" * 600  # ~15 KB come una firma reale
+    inizio = datetime(2025, 1, 1, 8, 0)
+    rit = []
+    for i in range(n):
+        firmato = rnd.random() < 0.8
+        marca, modello, _ = rnd.choice(STAMPANTI)
+        intervento = models.Intervento(
+            id=n - i, numero_relazione=f"RIT-2025-{n - i:05d}", anno_riferimento=2025,
+            data_creazione=inizio + timedelta(hours=i * 3), cliente_id=rnd.randint(1, 1000),
+            cliente_ragione_sociale=f"Cliente {rnd.randint(1, 1000)} S.r.l.", cliente_indirizzo="Via Roma 1, Salerno",
+            cliente_piva=f"{rnd.randint(10**10, 10**11 - 1)}", macro_categoria=models.MacroCategoria.PRINTING if i % 2 else models.MacroCategoria.IT,
+            is_chiamata=rnd.random() < 0.5, flag_diritto_chiamata=True, costi_extra=0.0,
+            difetto_segnalato=rnd.choice(DIFETTI), ora_inizio=time(9, 0), ora_fine=time(10, 30),
+            firma_tecnico=firma if firmato else None, firma_cliente=firma if firmato else None,
+            nome_cliente="Mario" if firmato else None, cognome_cliente="Rossi" if firmato else None,
+        )
+        intervento.dettagli = [
+            models.DettaglioIntervento(
+                id=i * dettagli + j, intervento_id=intervento.id, categoria_it=models.CategoriaIT.GENERICO,
+                marca_modello=f"{marca} {modello}" if i % 2 else " ".join(rnd.choice(PC)),
+                serial_number=f"SN{rnd.randint(10**7, 10**8 - 1)}", part_number=f"PN-{rnd.randint(1000, 9999)}",
+                descrizione_lavoro=rnd.choice(LAVORI), dati_tecnici={"contatore_bn": rnd.randint(0, 10**6)},
+            )
+            for j in range(dettagli)
+        ]
+        intervento.ricambi_utilizzati = [
+            models.MovimentoRicambio(
+                id=i * ricambi + j, intervento_id=intervento.id, prodotto_id=rnd.randint(1, 5000),
+                descrizione=f"Toner {marca}", quantita=1, prezzo_unitario=49.9, prezzo_applicato=49.9,
+            )
+            for j in range(ricambi)
+        ]
+        rit.append(intervento)
+    return rit
+
+
+def costruisci_modelli(interventi) -> List[schemas.InterventoResponse]:
+    """Stessa costruzione di read_interventi (app/main.py)"""
+    result = []
+    for i in interventi:
+        intervento_dict = convert_intervento_time_fields(i)
+        intervento_dict['dettagli'] = [schemas.DettaglioAssetResponse.model_validate(d) for d in i.dettagli]
+        intervento_dict['ricambi_utilizzati'] = [schemas.RicambioResponse.model_validate(r) for r in i.ricambi_utilizzati]
+        result.append(schemas.InterventoResponse.model_validate(intervento_dict))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serializzazione di una pagina di RIT")
+    parser.add_argument("--rit", type=int, default=100)
+    parser.add_argument("--dettagli", type=int, default=3)
+    parser.add_argument("--ricambi", type=int, default=2)
+    parser.add_argument("--ripetizioni", type=int, default=50)
+    parser.add_argument("--output", help="Salva i risultati in JSON")
+    args = parser.parse_args()
+
+    tipo = List[schemas.InterventoResponse]
+    campo = create_response_field(name="Response_Read_Interventi_Interventi__Get", type_=tipo)
+    loop = asyncio.new_event_loop()
+    interventi = genera_rit(args.rit, args.dettagli, args.ricambi)
+    modelli = costruisci_modelli(interventi)
+
+    def fastapi(classe, pagina):
+        # is_coroutine=True: validazione nel thread corrente (misura solo la CPU, non il threadpool)
+        contenuto = loop.run_until_complete(serialize_response(field=campo, response_content=pagina, is_coroutine=True))
+        return classe(contenuto).body
+
+    percorsi = {
+        "prima[fastapi+json]": lambda pagina: fastapi(JSONResponse, pagina),
+        "prima[fastapi+orjson]": lambda pagina: fastapi(ORJSONResponse, pagina),
+        "dopo[risposta_validata]": lambda pagina: serializzazione.risposta_validata(tipo, pagina).body,
+    }
+    riferimento = json.loads(percorsi["prima[fastapi+json]"](modelli))
+    for nome, percorso in percorsi.items():
+        if json.loads(percorso(modelli)) != riferimento:
+            print(f"❌ {nome} produce un JSON diverso dal percorso standard")
+            sys.exit(1)
+    dimensione_kb = round(len(percorsi["dopo[risposta_validata]"](modelli)) / 1024, 1)
+    print(f"Pagina di {args.rit} RIT: {dimensione_kb} KB di JSON, stesso contenuto per tutti i percorsi")
+
+    risultati = {"costruzione_modelli": misura(lambda: costruisci_modelli(interventi), args.ripetizioni)}
+    for nome, percorso in percorsi.items():
+        risultati[nome] = misura(lambda: percorso(modelli), args.ripetizioni)
+    risultati["pagina_prima"] = misura(lambda: percorsi["prima[fastapi+json]"](costruisci_modelli(interventi)), args.ripetizioni)
+    risultati["pagina_dopo"] = misura(lambda: percorsi["dopo[risposta_validata]"](costruisci_modelli(interventi)), args.ripetizioni)
+    loop.close()
+    stampa(risultati)
+    print(f"\nSerializzazione: {risultati['prima[fastapi+json]']['p50_ms'] / max(risultati['dopo[risposta_validata]']['p50_ms'], 0.001):.1f}x più veloce (p50)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": commit_git(),
+                "data": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "righe": {"rit": args.rit, "dettagli_per_rit": args.dettagli, "ricambi_per_rit": args.ricambi},
+                "json_kb": dimensione_kb,
+                "benchmark": risultati,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\nRisultati salvati in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Confronto di due risultati di benchmarks/benchmark_api.py (es. prima e dopo una modifica).
+
+Per ogni benchmark presente in entrambi i file mostra p50 e p95 e la variazione percentuale.
+È una regressione se il p95 peggiora oltre la soglia (default 20%) e di almeno --minimo-ms
+(sotto qualche millisecondo la variazione è rumore). Exit code 1 se ci sono regressioni,
+così il confronto si può usare in uno script prima del merge.
+
+Uso:
+    python benchmarks/confronta.py base.json nuovo.json [--soglia 20] [--minimo-ms 2]
+"""
+import argparse
+import json
+import sys
+
+
+def carica(percorso: str) -> dict:
+    with open(percorso, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def variazione(prima: float, dopo: float) -> float:
+    return (dopo - prima) / prima * 100 if prima else 0.0
+
+
+def confronta(base: dict, nuovo: dict, soglia: float, minimo_ms: float) -> list:
+    """Righe (nome, p50 base, p50 nuovo, p95 base, p95 nuovo, variazione p95 %, regressione)"""
+    righe = []
+    for nome, prima in base["benchmark"].items():
+        dopo = nuovo["benchmark"].get(nome)
+        if dopo is None:
+            continue
+        delta = variazione(prima["p95_ms"], dopo["p95_ms"])
+        regressione = delta > soglia and dopo["p95_ms"] - prima["p95_ms"] >= minimo_ms
+        righe.append((nome, prima["p50_ms"], dopo["p50_ms"], prima["p95_ms"], dopo["p95_ms"], delta, regressione))
+    return righe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta due risultati di benchmark_api.py")
+    parser.add_argument("base")
+    parser.add_argument("nuovo")
+    parser.add_argument("--soglia", type=float, default=20.0, help="Peggioramento massimo del p95 in percentuale")
+    parser.add_argument("--minimo-ms", type=float, default=2.0, help="Peggioramento minimo assoluto del p95 per segnalare")
+    args = parser.parse_args()
+
+    base, nuovo = carica(args.base), carica(args.nuovo)
+    print(f"Base:  {base.get('commit')} ({base.get('data')}, Postgres {base.get('postgres')})")
+    print(f"Nuovo: {nuovo.get('commit')} ({nuovo.get('data')}, Postgres {nuovo.get('postgres')})")
+    if base.get("righe") and nuovo.get("righe") and base["righe"] != nuovo["righe"]:
+        print("⚠️  I dati sintetici hanno scale diverse: il confronto non è significativo")
+
+    righe = confronta(base, nuovo, args.soglia, args.minimo_ms)
+    print(f"\n{'benchmark':<36}{'p50 base':>10}{'p50 nuovo':>11}{'p95 base':>10}{'p95 nuovo':>11}{'Δ p95':>9}")
+    for nome, p50_base, p50_nuovo, p95_base, p95_nuovo, delta, regressione in righe:
+        segno = "  ❌" if regressione else ""
+        print(f"{nome:<36}{p50_base:>10}{p50_nuovo:>11}{p95_base:>10}{p95_nuovo:>11}{delta:>8.1f}%{segno}")
+
+    mancanti = sorted(set(base["benchmark"]) ^ set(nuovo["benchmark"]))
+    if mancanti:
+        print(f"\nBenchmark presenti in un solo file: {', '.join(mancanti)}")
+
+    regressioni = [r[0] for r in righe if r[6]]
+    if regressioni:
+        print(f"\n❌ Regressioni oltre il {args.soglia:.0f}%: {', '.join(regressioni)}")
+        sys.exit(1)
+    print("\n✅ Nessuna regressione")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Generatore di dati sintetici per i benchmark e i test di carico dell'API.
+
+Popola uno schema separato (default "benchmark_api") nel database indicato da DATABASE_URL con:
+utenti (1 admin + tecnici), clienti con sedi, asset Printing a noleggio e IT, anni di letture
+copie (con le righe di fatturazione), RIT con dettagli e ricambi, magazzino e audit log.
+I dati sono deterministici (seed fisso): la stessa scala produce lo stesso database, così i
+risultati di commit diversi sono confrontabili. I dati di produzione non vengono toccati.
+
+Le connessioni dell'app usano lo schema tramite PGOPTIONS (vedi opzioni_schema), ad esempio
+per avviare il backend sui dati sintetici per il test di carico (benchmarks/locustfile.py):
+
+    python benchmarks/dati_sintetici.py --schema benchmark_api --interventi 100000
+    PGOPTIONS="-csearch_path=benchmark_api,public" uvicorn app.main:app --workers 4
+
+Utenti creati: admin@bench.local e tecnico1..N@bench.local, password PASSWORD_BENCHMARK.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+from app import models, auth
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.services import fatturazione_copie
+from benchmarks.benchmark_magazzino import genera_articoli
+
+PASSWORD_BENCHMARK = "benchmark"
+BATCH = 5000
+SEED = 54
+
+CITTA = [("Salerno", "84121"), ("Napoli", "80100"), ("Avellino", "83100"), ("Caserta", "81100"),
+         ("Roma", "00100"), ("Battipaglia", "84091"), ("Eboli", "84025"), ("Nocera Inferiore", "84014")]
+FORME = ["S.r.l.", "S.p.A.", "S.n.c.", "S.a.s.", "Studio Associato", "Comune di", "Istituto Comprensivo"]
+NOMI = ["Alfa", "Delta", "Sole", "Vesuvio", "Tirreno", "Picentino", "Cilento", "Irno", "Amalfi", "Sele",
+        "Minerva", "Aurora", "Galileo", "Partenope", "Orione", "Athena"]
+STAMPANTI = [("Kyocera", "TASKalfa 2554ci", True), ("Kyocera", "ECOSYS M3145dn", False), ("Ricoh", "IM C3000", True),
+             ("Canon", "imageRUNNER 2630i", False), ("Konica Minolta", "bizhub C258", True), ("Sharp", "MX-3071", True)]
+PC = [("HP", "ProDesk 400 G7"), ("Lenovo", "ThinkCentre M70q"), ("Dell", "OptiPlex 3090"), ("HP", "ProBook 450 G8")]
+LAVORI = ["Sostituzione toner e pulizia gruppo fusore", "Configurazione scansione su cartella di rete",
+          "Sostituzione drum e reset contatori", "Installazione driver e test di stampa",
+          "Formattazione e reinstallazione sistema operativo", "Sostituzione alimentatore",
+          "Aggiornamento firmware e verifica funzionamento", "Rimozione inceppamento vassoio 2"]
+DIFETTI = ["Stampa con righe", "Inceppamento carta", "Non scansiona su email", "PC non si avvia", "Errore C6000", ""]
+CADENZE = ["mensile", "bimestrale", "trimestrale", "trimestrale", "semestrale"]
+
+
+@dataclass
+class Scala:
+    clienti: int = 1000
+    interventi: int = 100_000
+    anni_letture: int = 3
+    tecnici: int = 20
+    articoli: int = 5000
+
+
+def opzioni_schema(schema: str) -> str:
+    """Valore per PGOPTIONS: tutte le connessioni libpq del processo usano lo schema"""
+    return f"-csearch_path={schema},public"
+
+
+def prepara_schema(schema: str):
+    """Schema pulito con tutte le tabelle dei modelli e gli indici delle migrazioni di ricerca"""
+    if schema == "public":
+        raise ValueError("Usare uno schema dedicato: lo schema public contiene i dati reali")
+    # search_path esplicito: con PGOPTIONS impostato l'estensione finirebbe nello schema da eliminare
+    admin_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"options": "-csearch_path=public"})
+    with admin_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    admin_engine.dispose()
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"options": opzioni_schema(schema)})
+    models.Base.metadata.create_all(engine)
+    return engine
+
+
+def _inserisci(conn, modello, righe):
+    """Inserimento a blocchi di BATCH righe (executemany)"""
+    blocco = []
+    for riga in righe:
+        blocco.append(riga)
+        if len(blocco) == BATCH:
+            conn.execute(insert(modello), blocco)
+            blocco = []
+    if blocco:
+        conn.execute(insert(modello), blocco)
+
+
+def _allinea_sequenze(conn):
+    """Gli id sono assegnati dal generatore: le sequenze ripartono dal massimo"""
+    for tabella in models.Base.metadata.sorted_tables:
+        if "id" in tabella.c:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{tabella.name}', 'id'), COALESCE((SELECT MAX(id) FROM {tabella.name}), 0) + 1, false)"
+            ))
+
+
+def genera(engine, scala: Scala, seed: int = SEED) -> dict:
+    """Popola lo schema dell'engine; restituisce il numero di righe per tabella"""
+    rnd = random.Random(seed)
+    adesso = datetime.now().replace(microsecond=0)
+    inizio = adesso - timedelta(days=365 * scala.anni_letture)
+    conteggi = {}
+
+    with engine.begin() as conn:
+        # --- Utenti ---
+        password_hash = auth.get_password_hash(PASSWORD_BENCHMARK)
+        utenti = [{"id": 1, "email": "admin@bench.local", "password_hash": password_hash,
+                   "nome_completo": "Admin Benchmark", "ruolo": models.RuoloUtente.ADMIN, "is_active": True, "permessi": {}}]
+        utenti += [{"id": i + 1, "email": f"tecnico{i}@bench.local", "password_hash": password_hash,
+                    "nome_completo": f"Tecnico {i}", "ruolo": models.RuoloUtente.TECNICO, "is_active": True, "permessi": {}}
+                   for i in range(1, scala.tecnici + 1)]
+        _inserisci(conn, models.Utente, utenti)
+        tecnici = [u["id"] for u in utenti[1:]] or [1]
+        conteggi["utenti"] = len(utenti)
+
+        conn.execute(insert(models.ImpostazioniAzienda), [{
+            "id": 1, "nome_azienda": "SISTEMA54 Benchmark", "indirizzo_completo": "Via Roma 1, Salerno",
+            "p_iva": "01234567890", "telefono": "089000000", "email": "info@bench.local",
+            "email_notifiche_scadenze": "scadenze@bench.local", "email_avvisi_promemoria": "promemoria@bench.local",
+            "tariffe_categorie": {}, "configurazioni_avanzate": {}, "template_pdf_config": {}, "oauth_config": {},
+        }])
+
+        # --- Clienti e sedi ---
+        clienti, sedi = [], []
+        for cliente_id in range(1, scala.clienti + 1):
+            citta, cap = rnd.choice(CITTA)
+            multisede = rnd.random() < 0.3
+            contratto = rnd.random() < 0.4
+            clienti.append({
+                "id": cliente_id,
+                "ragione_sociale": f"{rnd.choice(NOMI)} {rnd.choice(NOMI)} {rnd.choice(FORME)} {cliente_id}",
+                "indirizzo": f"Via {rnd.choice(NOMI)} {rnd.randint(1, 200)}", "citta": citta, "cap": cap,
+                "p_iva": f"{rnd.randrange(10 ** 10):011d}", "email_amministrazione": f"amministrazione{cliente_id}@cliente.local",
+                "has_multisede": multisede, "has_noleggio": True, "has_contratto_assistenza": contratto,
+                "data_inizio_contratto_assistenza": adesso - timedelta(days=rnd.randint(30, 700)) if contratto else None,
+                "data_fine_contratto_assistenza": adesso + timedelta(days=rnd.randint(-60, 400)) if contratto else None,
+                "limite_chiamate_contratto": rnd.choice([None, 10, 20]) if contratto else None,
+                "chiamate_utilizzate_contratto": 0,
+            })
+            for n in range(rnd.randint(2, 4) if multisede else 0):
+                citta_sede, cap_sede = rnd.choice(CITTA)
+                sedi.append({"id": len(sedi) + 1, "cliente_id": cliente_id, "nome_sede": f"Sede {citta_sede} {n + 1}",
+                             "indirizzo_completo": f"Via {rnd.choice(NOMI)} {rnd.randint(1, 200)}, {citta_sede}",
+                             "citta": citta_sede, "cap": cap_sede, "email": f"sede{len(sedi) + 1}@cliente.local"})
+        _inserisci(conn, models.Cliente, clienti)
+        _inserisci(conn, models.SedeCliente, sedi)
+        conteggi["clienti"], conteggi["sedi_cliente"] = len(clienti), len(sedi)
+        sedi_per_cliente = {}
+        for sede in sedi:
+            sedi_per_cliente.setdefault(sede["cliente_id"], []).append(sede["id"])
+
+        # --- Asset (stampanti a noleggio e PC) ---
+        assets = []
+        for cliente in clienti:
+            for _ in range(rnd.randint(0, 4)):
+                marca, modello, colore = rnd.choice(STAMPANTI)
+                assets.append({
+                    "id": len(assets) + 1, "cliente_id": cliente["id"], "tipo_asset": "Printing",
+                    "sede_id": rnd.choice(sedi_per_cliente.get(cliente["id"], [None])),
+                    "marca": marca, "modello": modello, "matricola": f"{marca[:2].upper()}{rnd.randrange(10 ** 8):08d}",
+                    "data_installazione": inizio - timedelta(days=rnd.randint(0, 60)),
+                    "data_scadenza_noleggio": adesso + timedelta(days=rnd.randint(-90, 900)),
+                    "is_colore": colore, "tipo_formato": rnd.choice(["A4", "A3"]), "cadenza_letture_copie": rnd.choice(CADENZE),
+                    "contatore_iniziale_bn": rnd.randint(0, 5000), "contatore_iniziale_colore": rnd.randint(0, 2000) if colore else 0,
+                    "copie_incluse_bn": rnd.choice([None, 1000, 3000, 5000]), "copie_incluse_colore": rnd.choice([None, 500, 1000]) if colore else None,
+                    "costo_copia_bn_fuori_limite": 0.008, "costo_copia_colore_fuori_limite": 0.06 if colore else None,
+                    "costo_copia_bn_non_incluse": 0.01, "costo_copia_colore_non_incluse": 0.08 if colore else None,
+                })
+            for _ in range(rnd.randint(0, 2)):
+                marca, modello = rnd.choice(PC)
+                assets.append({
+                    "id": len(assets) + 1, "cliente_id": cliente["id"], "tipo_asset": "IT",
+                    "marca": marca, "modello": modello, "seriale": f"SN{rnd.randrange(10 ** 9):09d}",
+                    "codice_prodotto": f"{marca[:2].upper()}-{rnd.randint(1000, 9999)}", "descrizione": f"{marca} {modello}",
+                    "is_nuovo": rnd.random() < 0.7, "data_scadenza_noleggio": adesso + timedelta(days=rnd.randint(-30, 700)),
+                })
+        # executemany richiede le stesse colonne in ogni riga: stampanti e PC separati
+        stampanti = [a for a in assets if a["tipo_asset"] == "Printing"]
+        _inserisci(conn, models.AssetCliente, stampanti)
+        _inserisci(conn, models.AssetCliente, [a for a in assets if a["tipo_asset"] == "IT"])
+        conteggi["assets_cliente"] = len(assets)
+        asset_per_cliente = {}
+        for asset in assets:
+            asset_per_cliente.setdefault(asset["cliente_id"], []).append(asset)
+
+        # --- Magazzino ---
+        articoli = [{"id": i + 1, **articolo} for i, articolo in enumerate(genera_articoli(scala.articoli, seed))]
+        _inserisci(conn, models.ProdottoMagazzino, articoli)
+        conteggi["magazzino"] = len(articoli)
+
+        # --- RIT con dettagli, ricambi e audit log (in ordine cronologico, numerazione per anno) ---
+        durata = (adesso - inizio).total_seconds()
+        date_rit = sorted(inizio + timedelta(seconds=rnd.random() * durata) for _ in range(scala.interventi))
+        progressivi = {}
+        dettagli, ricambi, audit = [], [], []
+
+        def righe_interventi():
+            for intervento_id, data in enumerate(date_rit, start=1):
+                cliente = clienti[rnd.randrange(len(clienti))]
+                progressivi[data.year] = progressivi.get(data.year, 0) + 1
+                asset_cliente = asset_per_cliente.get(cliente["id"]) or [None]
+                asset = rnd.choice(asset_cliente)
+                printing = asset is not None and asset["tipo_asset"] == "Printing"
+                tecnico_id = rnd.choice(tecnici)
+                numero = f"RIT-{data.year}-{progressivi[data.year]:03d}"
+                ora_inizio = rnd.randint(8, 16)
+                for _ in range(rnd.randint(1, 2)):
+                    dettagli.append({
+                        "intervento_id": intervento_id,
+                        "marca_modello": f"{asset['marca']} {asset['modello']}" if asset else "Postazione di lavoro",
+                        "serial_number": (asset.get("matricola") or asset.get("seriale")) if asset else None,
+                        "part_number": asset.get("codice_prodotto") if asset else None,
+                        "descrizione_lavoro": rnd.choice(LAVORI), "dati_tecnici": {},
+                    })
+                for _ in range(rnd.choice([0, 0, 1, 1, 2, 3])):
+                    articolo = articoli[rnd.randrange(len(articoli))]
+                    quantita = rnd.randint(1, 3)
+                    ricambi.append({
+                        "intervento_id": intervento_id, "prodotto_id": articolo["id"], "descrizione": articolo["descrizione"],
+                        "quantita": quantita, "prezzo_unitario": articolo["prezzo_vendita"],
+                        "prezzo_applicato": round(articolo["prezzo_vendita"] * quantita, 2),
+                    })
+                audit.append({
+                    "user_id": tecnico_id, "user_email": f"tecnico{tecnico_id - 1}@bench.local", "user_nome": f"Tecnico {tecnico_id - 1}",
+                    "action": "CREATE", "entity_type": "intervento", "entity_id": intervento_id, "entity_name": numero,
+                    "changes": None, "ip_address": "10.0.0.1", "timestamp": data,
+                })
+                if rnd.random() < 0.2:
+                    audit.append({
+                        "user_id": 1, "user_email": "admin@bench.local", "user_nome": "Admin Benchmark",
+                        "action": "UPDATE", "entity_type": "cliente", "entity_id": cliente["id"], "entity_name": cliente["ragione_sociale"],
+                        "changes": {"citta": {"old": cliente["citta"], "new": cliente["citta"]}}, "ip_address": "10.0.0.1",
+                        "timestamp": data + timedelta(minutes=5),
+                    })
+                yield {
+                    "id": intervento_id, "numero_relazione": numero, "anno_riferimento": data.year, "data_creazione": data,
+                    "tecnico_id": tecnico_id, "cliente_id": cliente["id"], "sede_id": asset.get("sede_id") if asset else None,
+                    "cliente_ragione_sociale": cliente["ragione_sociale"], "cliente_indirizzo": cliente["indirizzo"],
+                    "cliente_piva": cliente["p_iva"],
+                    "macro_categoria": models.MacroCategoria.PRINTING if printing else models.MacroCategoria.IT,
+                    "is_contratto": cliente["has_contratto_assistenza"], "is_chiamata": rnd.random() < 0.6,
+                    "flag_diritto_chiamata": True, "costo_chiamata_applicato": 30.0, "tariffa_oraria_applicata": 50.0,
+                    "difetto_segnalato": rnd.choice(DIFETTI) or None,
+                    "ora_inizio": datetime.min.replace(hour=ora_inizio).time(),
+                    "ora_fine": datetime.min.replace(hour=ora_inizio + 1, minute=rnd.choice([0, 15, 30, 45])).time(),
+                    "nome_cliente": "Mario", "cognome_cliente": "Rossi",
+                }
+
+        _inserisci(conn, models.Intervento, righe_interventi())
+        _inserisci(conn, models.DettaglioIntervento, dettagli)
+        _inserisci(conn, models.MovimentoRicambio, ricambi)
+        conteggi["interventi"], conteggi["dettagli_interventi"], conteggi["ricambi"] = len(date_rit), len(dettagli), len(ricambi)
+
+        # --- Letture copie: una per periodo di cadenza per ogni stampante ---
+        def righe_letture():
+            for asset in stampanti:
+                mesi = fatturazione_copie.MESI_CADENZA.get(asset["cadenza_letture_copie"], 3)
+                bn, colore = asset["contatore_iniziale_bn"], asset["contatore_iniziale_colore"]
+                data = inizio + timedelta(days=rnd.randint(1, 20))
+                while data < adesso:
+                    # 5% di periodi senza copie (macchina ferma)
+                    bn += max(0, int(rnd.gauss(1500, 600) * mesi)) if rnd.random() > 0.05 else 0
+                    if asset["is_colore"]:
+                        colore += max(0, int(rnd.gauss(400, 200) * mesi))
+                    yield {"asset_id": asset["id"], "data_lettura": data, "contatore_bn": bn,
+                           "contatore_colore": colore if asset["is_colore"] else 0,
+                           "tecnico_id": rnd.choice(tecnici), "created_at": data}
+                    data += timedelta(days=30 * mesi + rnd.randint(-3, 3))
+
+        _inserisci(conn, models.LetturaCopie, righe_letture())
+        conteggi["letture_copie"] = conn.execute(text("SELECT COUNT(*) FROM letture_copie")).scalar()
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_letture_copie_asset_data ON letture_copie(asset_id, data_lettura, id)"))
+        with Session(bind=conn) as db:
+            conteggi["righe_fatturazione_copie"] = fatturazione_copie.aggiorna_righe(db)
+            db.flush()
+
+        _inserisci(conn, models.AuditLog, audit)
+        conteggi["audit_logs"] = len(audit)
+
+        _allinea_sequenze(conn)
+
+    # Indici di ricerca delle migrazioni (CONCURRENTLY richiede AUTOCOMMIT)
+    from migrate_ricerca_magazzino import crea_indici
+    from migrate_ricerca_trigram import INDICI as INDICI_CLIENTI
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        crea_indici(conn)
+        for sql in INDICI_CLIENTI:
+            conn.execute(text(sql))
+        conn.execute(text("ANALYZE"))
+    return conteggi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera i dati sintetici per benchmark e test di carico")
+    parser.add_argument("--schema", default="benchmark_api")
+    parser.add_argument("--clienti", type=int, default=Scala.clienti)
+    parser.add_argument("--interventi", type=int, default=Scala.interventi)
+    parser.add_argument("--anni", type=int, default=Scala.anni_letture, help="Anni di storico (RIT e letture copie)")
+    parser.add_argument("--tecnici", type=int, default=Scala.tecnici)
+    parser.add_argument("--articoli", type=int, default=Scala.articoli)
+    args = parser.parse_args()
+
+    scala = Scala(clienti=args.clienti, interventi=args.interventi, anni_letture=args.anni,
+                  tecnici=args.tecnici, articoli=args.articoli)
+    start = time.perf_counter()
+    engine = prepara_schema(args.schema)
+    conteggi = genera(engine, scala)
+    engine.dispose()
+    print(f"Schema {args.schema} generato in {time.perf_counter() - start:.1f}s ({asdict(scala)})")
+    for tabella, righe in conteggi.items():
+        print(f"  {tabella:<28}{righe:>10}")
+    print(f'\nBackend sui dati sintetici: PGOPTIONS="{opzioni_schema(args.schema)}" uvicorn app.main:app')
+    print(f"Utenti: admin@bench.local, tecnico1..{scala.tecnici}@bench.local (password: {PASSWORD_BENCHMARK})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Profilo di carico HTTP (Locust) che simula i tecnici durante la giornata lavorativa:
+apertura e ricerca dei RIT, ricerca clienti, consultazione magazzino e letture copie,
+download PDF e, più raramente, creazione di un nuovo RIT.
+
+Richiede i dati sintetici e il backend avviato sullo stesso schema:
+
+    python benchmarks/dati_sintetici.py --schema benchmark_api
+    PGOPTIONS="-csearch_path=benchmark_api,public" uvicorn app.main:app --workers 4
+    pip install locust
+    locust -f benchmarks/locustfile.py --host http://localhost:8000 \\
+        --users 50 --spawn-rate 5 --run-time 5m --headless --json > carico.json
+
+Variabili d'ambiente (devono corrispondere alla scala dei dati generati):
+    BENCH_TECNICI=20  BENCH_CLIENTI=1000  BENCH_INTERVENTI=100000  BENCH_ASSETS=3000
+"""
+import os
+import random
+from locust import HttpUser, between, task
+
+TECNICI = int(os.getenv("BENCH_TECNICI", "20"))
+CLIENTI = int(os.getenv("BENCH_CLIENTI", "1000"))
+INTERVENTI = int(os.getenv("BENCH_INTERVENTI", "100000"))
+ASSETS = int(os.getenv("BENCH_ASSETS", "3000"))
+PASSWORD = os.getenv("BENCH_PASSWORD", "benchmark")
+
+# Termini presenti nei dati sintetici (nomi clienti, descrizioni magazzino)
+RICERCHE_CLIENTI = ["Vesuvio", "Alfa", "Cilento", "Amalfi S.r.l.", "Comune di", "Partenope"]
+RICERCHE_MAGAZZINO = ["toner", "drum kyocera", "fusore", "kit manutenzione", "rullo"]
+
+
+class Tecnico(HttpUser):
+    wait_time = between(2, 8)
+
+    def on_start(self):
+        email = f"tecnico{random.randint(1, TECNICI)}@bench.local"
+        risposta = self.client.post("/api/auth/login", data={"username": email, "password": PASSWORD}, name="/api/auth/login")
+        risposta.raise_for_status()
+        self.client.headers["Authorization"] = f"Bearer {risposta.json()['access_token']}"
+
+    @task(6)
+    def lista_rit(self):
+        self.client.get("/interventi/?limit=50", name="/interventi/")
+
+    @task(3)
+    def cerca_rit(self):
+        q = random.choice(RICERCHE_CLIENTI)
+        self.client.get(f"/interventi/?q={q}&limit=50", name="/interventi/?q=[cliente]")
+
+    @task(5)
+    def apri_rit(self):
+        self.client.get(f"/interventi/{random.randint(1, INTERVENTI)}", name="/interventi/{id}")
+
+    @task(6)
+    def lookup_clienti(self):
+        q = random.choice(RICERCHE_CLIENTI)[:random.randint(2, 6)]
+        self.client.get(f"/clienti/lookup?q={q}", name="/clienti/lookup")
+
+    @task(4)
+    def apri_cliente(self):
+        self.client.get(f"/clienti/{random.randint(1, CLIENTI)}", name="/clienti/{id}")
+
+    @task(3)
+    def cerca_magazzino(self):
+        self.client.get(f"/magazzino/?q={random.choice(RICERCHE_MAGAZZINO)}", name="/magazzino/?q=")
+
+    @task(2)
+    def ultima_lettura(self):
+        # 404 se l'asset non è una stampante o non ha letture: risposta attesa
+        with self.client.get(f"/letture-copie/asset/{random.randint(1, ASSETS)}/ultima",
+                             name="/letture-copie/asset/{id}/ultima", catch_response=True) as risposta:
+            if risposta.status_code == 404:
+                risposta.success()
+
+    @task(1)
+    def scarica_pdf(self):
+        self.client.get(f"/interventi/{random.randint(1, INTERVENTI)}/pdf", name="/interventi/{id}/pdf")
+
+    @task(1)
+    def crea_rit(self):
+        cliente = self.client.get(f"/clienti/{random.randint(1, CLIENTI)}", name="/clienti/{id}").json()
+        self.client.post("/interventi/", name="/interventi/ [POST]", json={
+            "macro_categoria": "Informatica & IT",
+            "cliente_id": cliente["id"],
+            "cliente_ragione_sociale": cliente["ragione_sociale"],
+            "cliente_indirizzo": cliente["indirizzo"],
+            "cliente_piva": cliente.get("p_iva"),
+            "is_chiamata": True,
+            "difetto_segnalato": "PC non si avvia",
+            "ora_inizio": "09:00",
+            "ora_fine": "10:00",
+            "dettagli": [{"marca_modello": "HP ProDesk 400 G7", "serial_number": "SN000000001",
+                          "descrizione_lavoro": "Sostituzione alimentatore"}],
+            "ricambi": [],
+        })
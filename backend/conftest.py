@@ -0,0 +1,45 @@
+"""
+Fixture comuni ai test pytest del backend.
+
+schema_postgres: engine su uno schema Postgres dedicato al modulo di test (search_path sullo
+schema, tutte le tabelle dei modelli), eliminato alla fine. I test che lo usano vengono saltati
+se DATABASE_URL non è un database Postgres raggiungibile; gli altri test girano sempre.
+"""
+import os
+import sys
+
+import pytest
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def schema_postgres(request):
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.exc import OperationalError
+    from app import models
+    from app.database import SQLALCHEMY_DATABASE_URL
+
+    if make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() != "postgresql":
+        pytest.skip("Richiede Postgres (DATABASE_URL)")
+    schema = request.module.__name__.rsplit(".", 1)[-1]
+    admin_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"connect_timeout": 5})
+    try:
+        with admin_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+            conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    except OperationalError as e:
+        admin_engine.dispose()
+        pytest.skip(f"Database non raggiungibile: {e.orig}")
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"options": f"-csearch_path={schema},public"})
+    models.Base.metadata.create_all(engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        admin_engine.dispose()
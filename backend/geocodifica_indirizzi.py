@@ -0,0 +1,43 @@
+"""
+Geocodifica in blocco di clienti e sedi senza coordinate (dati esistenti o importati).
+
+Usa lo stesso proxy dell'app (cache geocoding_cache, chiamate a Nominatim distanziate di
+GEOCODING_MIN_INTERVAL_SECONDS): con Nominatim pubblico circa 3600 indirizzi l'ora, gli
+indirizzi già cercati dall'autocomplete non vengono richiesti di nuovo.
+Eseguire dopo migrate_coordinate_clienti.py. Lo script è rieseguibile: elabora solo le righe
+mai geocodificate o con l'indirizzo modificato.
+
+Uso:
+    python geocodifica_indirizzi.py [--limite 5000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import coordinate, geocoding
+
+
+async def esegui(limite: int):
+    try:
+        return await coordinate.geocodifica(limite=limite)
+    finally:
+        await geocoding.chiudi()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geocodifica clienti e sedi senza coordinate")
+    parser.add_argument("--limite", type=int, default=5000, help="Numero massimo di indirizzi elaborati")
+    args = parser.parse_args()
+
+    conteggi = asyncio.run(esegui(args.limite))
+    print(f"Trovati: {conteggi['trovate']}, non trovati: {conteggi['non_trovate']}")
+    if conteggi["in_attesa"]:
+        print(f"❌ Nominatim non disponibile: {conteggi['in_attesa']} indirizzi restano da geocodificare")
+        sys.exit(1)
+    print("✅ Geocodifica completata")
+
+
+if __name__ == "__main__":
+    main()
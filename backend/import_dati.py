@@ -0,0 +1,89 @@
+"""
+Import massivo da riga di comando di clienti, sedi, assets a noleggio o articoli di magazzino
+da file CSV/XLSX (stessa logica dell'endpoint POST /api/import/{entita}).
+
+Il file viene letto ed elaborato a blocchi senza caricarlo in memoria: l'avanzamento viene
+stampato dopo ogni blocco e gli errori di riga possono essere salvati in un CSV (--errori).
+
+Colonne (intestazione, non importa maiuscole/spazi):
+    clienti:   ragione_sociale, indirizzo, p_iva, codice_fiscale, citta, cap, ...
+    sedi:      cliente_p_iva (o cliente_id), nome_sede, indirizzo_completo, citta, cap, ...
+    assets:    cliente_p_iva (o cliente_id), tipo_asset, marca, modello, matricola, sede_nome, ...
+    magazzino: codice_articolo, descrizione, prezzo_vendita, giacenza, categoria, ...
+
+Uso:
+    python import_dati.py clienti clienti.csv [--dry-run] [--batch-size 500] [--errori errori.csv]
+    python import_dati.py assets contratto.xlsx --foglio "Macchine"
+"""
+import argparse
+import csv
+import sys
+import os
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.services import import_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import massivo da CSV/XLSX")
+    parser.add_argument("entita", choices=list(import_service.IMPORTATORI))
+    parser.add_argument("file")
+    parser.add_argument("--batch-size", type=int, default=import_service.IMPORT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Valida e deduplica senza salvare")
+    parser.add_argument("--encoding", default="utf-8-sig", help="Codifica dei CSV (es. cp1252 per i file Excel datati)")
+    parser.add_argument("--foglio", help="Foglio del file XLSX (default: il primo)")
+    parser.add_argument("--errori", help="Salva gli errori di riga in questo file CSV")
+    args = parser.parse_args()
+
+    try:
+        lettore = import_service.LettoreFile(args.file, encoding=args.encoding, foglio=args.foglio)
+    except Exception as e:
+        print(f"❌ File non valido: {e}")
+        sys.exit(1)
+
+    file_errori = open(args.errori, "w", newline="", encoding="utf-8-sig") if args.errori else None
+    scrittore = csv.writer(file_errori, delimiter=";") if file_errori else None
+    if scrittore:
+        scrittore.writerow(["riga", "errore"])
+
+    db = SessionLocal()
+    riepilogo = None
+    try:
+        with lettore:
+            for evento in import_service.importa(db, args.entita, lettore, batch_size=args.batch_size, dry_run=args.dry_run):
+                if evento["evento"] == "completato":
+                    riepilogo = evento
+                    break
+                totale = f"/{evento['righe_totali']}" if evento.get("righe_totali") else ""
+                print(
+                    f"\r  righe {evento['righe']}{totale} - importate {evento['importate']}, "
+                    f"duplicate {evento['duplicate']}, errori {evento['errori']}",
+                    end="", flush=True
+                )
+                for problema in evento["problemi"]:
+                    if scrittore:
+                        scrittore.writerow([problema["riga"], problema["errore"]])
+                    elif not problema["errore"].startswith("Duplicato"):
+                        print(f"\n  riga {problema['riga']}: {problema['errore']}", end="")
+        print()
+    except ValueError as e:
+        print(f"\n❌ {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+        if file_errori:
+            file_errori.close()
+
+    modalita = " (dry-run, nessun dato salvato)" if args.dry_run else ""
+    print(
+        f"✅ Import {args.entita} completato{modalita} in {riepilogo['durata_s']}s: "
+        f"{riepilogo['importate']} importate, {riepilogo['duplicate']} duplicate, "
+        f"{riepilogo['errori']} errori su {riepilogo['righe']} righe"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Script per creare esplicitamente lo schema del database (tabelle mancanti)
+e il superadmin di default.
+
+L'API non crea più le tabelle all'import: eseguire questo script dopo
+un'installazione nuova, oppure avviare il backend con AUTO_CREATE_SCHEMA=true.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine, SessionLocal
+from app import models
+
+def init_db():
+    print("🔄 Creazione tabelle mancanti...")
+    models.Base.metadata.create_all(bind=engine)
+    print("✅ Schema database aggiornato")
+
+    # Import ritardato: app.main non esegue più operazioni DB all'import
+    from app.main import init_superadmin
+    with SessionLocal() as db:
+        init_superadmin(db)
+
+if __name__ == "__main__":
+    init_db()
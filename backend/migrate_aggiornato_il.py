@@ -0,0 +1,33 @@
+"""
+Migration script per la colonna aggiornato_il (ultima modifica) usata dagli ETag delle
+risposte grandi (/interventi/, /clienti/{id}, vedi app/cache_http.py).
+
+- Colonna aggiornato_il su interventi, clienti, sedi_cliente e assets_cliente
+  (valorizzata con la data della migrazione per le righe esistenti).
+- Indici su cliente_id di sedi e assets: la firma di /clienti/{id} li legge a ogni richiesta.
+Lo script è rieseguibile.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from sqlalchemy import text
+
+def migrate():
+    with engine.connect() as conn:
+        for tabella in ("interventi", "clienti", "sedi_cliente", "assets_cliente"):
+            conn.execute(text(f"""
+                ALTER TABLE {tabella} ADD COLUMN IF NOT EXISTS aggiornato_il TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+            """))
+
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_sedi_cliente_cliente_id ON sedi_cliente(cliente_id);
+            CREATE INDEX IF NOT EXISTS ix_assets_cliente_cliente_id ON assets_cliente(cliente_id);
+        """))
+
+        conn.commit()
+        print("✅ Migration completata: colonna aggiornato_il su interventi, clienti, sedi e assets")
+
+if __name__ == "__main__":
+    migrate()
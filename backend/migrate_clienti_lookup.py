@@ -0,0 +1,25 @@
+"""
+Migration script per l'autocomplete /clienti/lookup:
+indice di copertura su ragione_sociale con id, p_iva e citta inclusi, così la lista
+ordinata per ragione sociale viene letta solo dall'indice (index-only scan, PostgreSQL 11+).
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from sqlalchemy import text
+
+def migrate():
+    # CREATE INDEX CONCURRENTLY non può essere eseguito dentro una transazione
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clienti_lookup
+            ON clienti (ragione_sociale) INCLUDE (id, p_iva, citta)
+        """))
+        # Aggiorna la visibility map: necessaria perché l'index-only scan eviti di leggere la tabella
+        conn.execute(text("VACUUM ANALYZE clienti"))
+        print("✅ Migration completata: indice di copertura ix_clienti_lookup creato")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,42 @@
+"""
+Migration script per le coordinate di clienti e sedi (pianificazione percorsi dei tecnici).
+
+- Colonne latitudine, longitudine e geocodifica_il su clienti e sedi_cliente
+  (riempite in background da app/services/coordinate.py; per i dati esistenti
+  eseguire poi python geocodifica_indirizzi.py).
+- Indici GiST su point(longitudine, latitudine) per le ricerche per vicinanza (/clienti/vicini).
+- Indice (tecnico_id, data_creazione) sugli interventi per le chiamate del giorno di un tecnico.
+Lo script è rieseguibile.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from sqlalchemy import text
+
+def migrate():
+    with engine.connect() as conn:
+        for tabella in ("clienti", "sedi_cliente"):
+            conn.execute(text(f"""
+                ALTER TABLE {tabella} ADD COLUMN IF NOT EXISTS latitudine DOUBLE PRECISION;
+                ALTER TABLE {tabella} ADD COLUMN IF NOT EXISTS longitudine DOUBLE PRECISION;
+                ALTER TABLE {tabella} ADD COLUMN IF NOT EXISTS geocodifica_il TIMESTAMP;
+            """))
+            conn.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS ix_{tabella}_posizione ON {tabella}
+                    USING gist (point(longitudine, latitudine))
+                    WHERE latitudine IS NOT NULL AND longitudine IS NOT NULL;
+                CREATE INDEX IF NOT EXISTS ix_{tabella}_da_geocodificare ON {tabella}(id)
+                    WHERE geocodifica_il IS NULL;
+            """))
+
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_interventi_tecnico_data ON interventi(tecnico_id, data_creazione);
+        """))
+
+        conn.commit()
+        print("✅ Migration completata: coordinate e indici spaziali su clienti e sedi_cliente")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,72 @@
+"""
+Migration script per creare le righe di fatturazione copie (righe_fatturazione_copie).
+
+- Una riga per lettura con copie del periodo, copie incluse, addebitate e importi
+  (calcolate da app/services/fatturazione_copie.py).
+- Indice (asset_id, data_lettura, id) su letture_copie per la funzione finestra LAG
+  del motore di calcolo (lettura precedente dello stesso asset).
+- Calcolo iniziale di tutte le letture esistenti con un'unica INSERT ... SELECT.
+  Lo script è rieseguibile: le righe esistenti vengono ricalcolate.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine, SessionLocal
+from app.services import fatturazione_copie
+from sqlalchemy import text
+
+def migrate():
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS righe_fatturazione_copie (
+                id SERIAL PRIMARY KEY,
+                lettura_id INTEGER NOT NULL UNIQUE REFERENCES letture_copie(id) ON DELETE CASCADE,
+                asset_id INTEGER NOT NULL REFERENCES assets_cliente(id),
+                cliente_id INTEGER REFERENCES clienti(id),
+                intervento_id INTEGER,
+                data_lettura TIMESTAMP NOT NULL,
+                data_lettura_precedente TIMESTAMP,
+                cadenza VARCHAR,
+                mesi_periodo INTEGER NOT NULL DEFAULT 3,
+                contatore_bn_precedente INTEGER,
+                contatore_bn INTEGER,
+                copie_bn INTEGER NOT NULL DEFAULT 0,
+                copie_incluse_bn INTEGER NOT NULL DEFAULT 0,
+                copie_addebitate_bn INTEGER NOT NULL DEFAULT 0,
+                costo_copia_bn DOUBLE PRECISION,
+                importo_bn DOUBLE PRECISION NOT NULL DEFAULT 0,
+                contatore_colore_precedente INTEGER,
+                contatore_colore INTEGER,
+                copie_colore INTEGER NOT NULL DEFAULT 0,
+                copie_incluse_colore INTEGER NOT NULL DEFAULT 0,
+                copie_addebitate_colore INTEGER NOT NULL DEFAULT 0,
+                costo_copia_colore DOUBLE PRECISION,
+                importo_colore DOUBLE PRECISION NOT NULL DEFAULT 0,
+                importo_totale DOUBLE PRECISION NOT NULL DEFAULT 0,
+                calcolata_il TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_righe_fatturazione_copie_id ON righe_fatturazione_copie(id);
+            CREATE INDEX IF NOT EXISTS ix_righe_fatturazione_copie_lettura_id ON righe_fatturazione_copie(lettura_id);
+            CREATE INDEX IF NOT EXISTS ix_righe_fatturazione_copie_asset_id ON righe_fatturazione_copie(asset_id);
+            CREATE INDEX IF NOT EXISTS ix_righe_fatturazione_copie_cliente_id ON righe_fatturazione_copie(cliente_id);
+            CREATE INDEX IF NOT EXISTS ix_righe_fatturazione_copie_intervento_id ON righe_fatturazione_copie(intervento_id);
+            CREATE INDEX IF NOT EXISTS ix_righe_fatturazione_copie_data_lettura ON righe_fatturazione_copie(data_lettura);
+            CREATE INDEX IF NOT EXISTS ix_letture_copie_asset_data ON letture_copie(asset_id, data_lettura, id);
+        """))
+        conn.commit()
+
+    # Calcolo iniziale di tutte le letture esistenti
+    db = SessionLocal()
+    try:
+        righe = fatturazione_copie.aggiorna_righe(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"✅ Migration completata: tabella righe_fatturazione_copie creata ({righe} letture calcolate)")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,34 @@
+"""
+Migration script per creare la tabella geocoding_cache (cache persistente del proxy
+di ricerca indirizzi /api/geocoding/search, vedi app/services/geocoding.py).
+Le righe più vecchie di GEOCODING_CACHE_TTL_HOURS vengono aggiornate alla ricerca successiva.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from sqlalchemy import text
+
+def migrate():
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS geocoding_cache (
+                id SERIAL PRIMARY KEY,
+                query VARCHAR NOT NULL UNIQUE,
+                risultati JSONB NOT NULL,
+                aggiornato_il TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_geocoding_cache_id ON geocoding_cache(id);
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_geocoding_cache_query ON geocoding_cache(query);
+            CREATE INDEX IF NOT EXISTS ix_geocoding_cache_aggiornato_il ON geocoding_cache(aggiornato_il);
+        """))
+
+        conn.commit()
+        print("✅ Migration completata: tabella geocoding_cache creata")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,42 @@
+"""
+Migration script per convertire il logo già caricato nelle varianti con nome derivato dal
+contenuto (logo_<hash>_ui.png, _ui.webp, _pdf.png, vedi app/services/logo_service.py).
+Aggiorna impostazioni_azienda.logo_url ed elimina il file originale.
+Da eseguire dalla directory del backend (/app nel container), dove si trova uploads/.
+"""
+import sys
+import os
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from app.services import logo_service
+from sqlalchemy import text
+
+def migrate():
+    with engine.connect() as conn:
+        riga = conn.execute(text("SELECT id, logo_url FROM impostazioni_azienda ORDER BY id LIMIT 1")).first()
+        if riga is None or not riga.logo_url:
+            print("✅ Migration completata: nessun logo da convertire")
+            return
+        if riga.logo_url.endswith("_ui.png"):
+            print(f"✅ Migration completata: logo già convertito ({riga.logo_url})")
+            return
+
+        percorso = logo_service.percorso_logo_pdf(riga.logo_url)
+        if percorso is None:
+            print(f"⚠️  File del logo non trovato in {logo_service.LOGO_DIR.resolve()}: {riga.logo_url}")
+            return
+
+        logo_url = logo_service.salva_logo(percorso.read_bytes(), Path(percorso).suffix)
+        conn.execute(
+            text("UPDATE impostazioni_azienda SET logo_url = :logo_url WHERE id = :id"),
+            {"logo_url": logo_url, "id": riga.id},
+        )
+        conn.commit()
+        if logo_url != riga.logo_url:
+            logo_service.elimina_logo(riga.logo_url, tranne=logo_url)
+        print(f"✅ Migration completata: logo convertito in {logo_url}")
+
+if __name__ == "__main__":
+    migrate()
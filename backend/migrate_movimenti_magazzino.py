@@ -0,0 +1,66 @@
+"""
+Migration script per creare il registro dei movimenti di magazzino (movimenti_magazzino).
+
+- La tabella accetta solo inserimenti: un trigger rifiuta UPDATE e DELETE.
+- Per gli articoli già presenti viene registrato un movimento 'saldo_iniziale' pari alla
+  giacenza attuale, così la somma dei movimenti coincide da subito con la giacenza.
+  Lo script è rieseguibile: il saldo iniziale viene inserito solo per gli articoli senza movimenti.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from sqlalchemy import text
+
+def migrate():
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS movimenti_magazzino (
+                id SERIAL PRIMARY KEY,
+                prodotto_id INTEGER NOT NULL REFERENCES magazzino(id),
+                intervento_id INTEGER REFERENCES interventi(id),
+                tipo VARCHAR NOT NULL,
+                quantita INTEGER NOT NULL,
+                giacenza_risultante INTEGER,
+                utente_id INTEGER REFERENCES utenti(id),
+                note TEXT,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_movimenti_magazzino_id ON movimenti_magazzino(id);
+            CREATE INDEX IF NOT EXISTS ix_movimenti_magazzino_prodotto_id ON movimenti_magazzino(prodotto_id);
+            CREATE INDEX IF NOT EXISTS ix_movimenti_magazzino_intervento_id ON movimenti_magazzino(intervento_id);
+        """))
+
+        # Registro append-only: i movimenti errati si correggono con una rettifica, non modificando lo storico
+        conn.execute(text("""
+            CREATE OR REPLACE FUNCTION movimenti_magazzino_append_only() RETURNS trigger AS $$
+            BEGIN
+                RAISE EXCEPTION 'movimenti_magazzino accetta solo inserimenti (registrare una rettifica)';
+            END;
+            $$ LANGUAGE plpgsql;
+        """))
+        conn.execute(text("DROP TRIGGER IF EXISTS trg_movimenti_magazzino_append_only ON movimenti_magazzino"))
+        conn.execute(text("""
+            CREATE TRIGGER trg_movimenti_magazzino_append_only
+            BEFORE UPDATE OR DELETE ON movimenti_magazzino
+            FOR EACH ROW EXECUTE FUNCTION movimenti_magazzino_append_only();
+        """))
+
+        # Saldo di apertura per gli articoli esistenti
+        result = conn.execute(text("""
+            INSERT INTO movimenti_magazzino (prodotto_id, tipo, quantita, giacenza_risultante, note)
+            SELECT m.id, 'saldo_iniziale', m.giacenza, m.giacenza, 'Giacenza all''attivazione del registro movimenti'
+            FROM magazzino m
+            WHERE COALESCE(m.giacenza, 0) <> 0
+              AND NOT EXISTS (SELECT 1 FROM movimenti_magazzino mm WHERE mm.prodotto_id = m.id)
+        """))
+
+        conn.commit()
+        print(f"✅ Migration completata: tabella movimenti_magazzino creata ({result.rowcount} saldi iniziali registrati)")
+
+if __name__ == "__main__":
+    migrate()
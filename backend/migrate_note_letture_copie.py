@@ -0,0 +1,76 @@
+"""
+Migration script per spostare il dettaglio calcolo delle letture copie storiche dalle note
+alle colonne di righe_fatturazione_copie.
+
+Fino all'introduzione delle righe di fatturazione il calcolo (copie incluse, stampate,
+fuori limite, costo) veniva accodato come testo alle note della lettura. Per ogni lettura
+con il dettaglio nelle note:
+- i valori letti dalle note (quelli effettivamente addebitati, con le tariffe dell'epoca)
+  sostituiscono quelli ricalcolati da migrate_fatturazione_copie.py;
+- le note tornano a contenere solo il testo inserito dal tecnico.
+
+Le letture vengono elaborate a blocchi di BATCH_SIZE (un commit per blocco).
+Lo script è rieseguibile: le note già ripulite non vengono più selezionate.
+Eseguire dopo migrate_fatturazione_copie.py.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app import models
+from app.services import fatturazione_copie
+from sqlalchemy import update
+
+BATCH_SIZE = 500
+
+def migrate():
+    db = SessionLocal()
+    lettura = models.LetturaCopie
+    riga = models.RigaFatturazioneCopie
+    ultimo_id = 0
+    aggiornate = 0
+    non_riconosciute = 0
+    try:
+        while True:
+            blocco = (
+                db.query(lettura.id, lettura.note)
+                .filter(lettura.id > ultimo_id, lettura.note.like("%Calcolo copie per cadenza%"))
+                .order_by(lettura.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not blocco:
+                break
+            ultimo_id = blocco[-1].id
+
+            # Letture senza riga di fatturazione (migrate_fatturazione_copie.py non eseguito o letture successive)
+            ids = [lettura_id for lettura_id, _ in blocco]
+            con_riga = {r for (r,) in db.query(riga.lettura_id).filter(riga.lettura_id.in_(ids))}
+            senza_riga = [lettura_id for lettura_id in ids if lettura_id not in con_riga]
+            if senza_riga:
+                fatturazione_copie.aggiorna_righe(db, lettura_ids=senza_riga)
+
+            for lettura_id, note in blocco:
+                note_utente, valori = fatturazione_copie.separa_note_calcolo(note)
+                if valori is None:
+                    non_riconosciute += 1
+                    continue
+                # Costo unitario applicato all'epoca (dove ricavabile)
+                if valori.get("copie_addebitate_bn") and valori["importo_bn"]:
+                    valori["costo_copia_bn"] = round(valori["importo_bn"] / valori["copie_addebitate_bn"], 6)
+                if valori.get("copie_addebitate_colore") and valori["importo_colore"]:
+                    valori["costo_copia_colore"] = round(valori["importo_colore"] / valori["copie_addebitate_colore"], 6)
+                db.execute(update(riga).where(riga.lettura_id == lettura_id).values(**valori))
+                db.execute(update(lettura).where(lettura.id == lettura_id).values(note=note_utente))
+                aggiornate += 1
+
+            db.commit()
+            print(f"  ... {aggiornate} letture aggiornate (fino a id {ultimo_id})")
+    finally:
+        db.close()
+
+    print(f"✅ Migration completata: dettaglio calcolo spostato dalle note per {aggiornate} letture ({non_riconosciute} note non riconosciute lasciate invariate)")
+
+if __name__ == "__main__":
+    migrate()
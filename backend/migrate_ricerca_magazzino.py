@@ -0,0 +1,39 @@
+"""
+Migration script per la ricerca articoli di magazzino:
+- abilita l'estensione pg_trgm
+- indice per prefisso sul codice articolo (maiuscolo, text_pattern_ops): codice esatto e "inizia con"
+- indici GIN trigram su codice articolo e descrizione (ILIKE '%testo%' e similarità)
+- indice su categoria + descrizione (filtro per categoria con ordinamento) e su descrizione (lista completa)
+
+Gli indici vengono creati con CONCURRENTLY per non bloccare le scritture sul magazzino.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from sqlalchemy import text
+
+INDICI = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_magazzino_codice_prefix ON magazzino (upper(codice_articolo) text_pattern_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_magazzino_codice_trgm ON magazzino USING gin (codice_articolo gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_magazzino_descrizione_trgm ON magazzino USING gin (descrizione gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_magazzino_categoria_descrizione ON magazzino (categoria, descrizione)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_magazzino_descrizione ON magazzino (descrizione)",
+]
+
+def crea_indici(conn):
+    """Crea estensione e indici (la connessione deve essere in AUTOCOMMIT)"""
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for sql in INDICI:
+        conn.execute(text(sql))
+    conn.execute(text("ANALYZE magazzino"))
+
+def migrate():
+    # CREATE INDEX CONCURRENTLY non può essere eseguito dentro una transazione
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        crea_indici(conn)
+        print("✅ Migration completata: indici di ricerca magazzino creati")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,34 @@
+"""
+Migration script per la ricerca clienti con pg_trgm:
+- abilita l'estensione pg_trgm
+- indici GIN trigram su ragione_sociale, p_iva e codice_fiscale (ILIKE '%testo%' e similarità)
+- indici per prefisso su p_iva e codice fiscale (ricerca per codice)
+
+Gli indici vengono creati con CONCURRENTLY per non bloccare le scritture sulla tabella clienti.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from sqlalchemy import text
+
+INDICI = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clienti_ragione_sociale_trgm ON clienti USING gin (ragione_sociale gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clienti_p_iva_trgm ON clienti USING gin (p_iva gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clienti_codice_fiscale_trgm ON clienti USING gin (codice_fiscale gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clienti_p_iva_prefix ON clienti (p_iva text_pattern_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clienti_codice_fiscale_prefix ON clienti (upper(codice_fiscale) text_pattern_ops)",
+]
+
+def migrate():
+    # CREATE INDEX CONCURRENTLY non può essere eseguito dentro una transazione
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for sql in INDICI:
+            conn.execute(text(sql))
+        conn.execute(text("ANALYZE clienti"))
+        print("✅ Migration completata: pg_trgm abilitata e indici di ricerca clienti creati")
+
+if __name__ == "__main__":
+    migrate()
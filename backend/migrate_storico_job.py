@@ -0,0 +1,38 @@
+"""
+Migration script per creare la tabella storico_job (storico esecuzioni dello scheduler).
+La tabella apscheduler_jobs del job store viene creata automaticamente da APScheduler all'avvio.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from sqlalchemy import text
+
+def migrate():
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS storico_job (
+                id SERIAL PRIMARY KEY,
+                job_id VARCHAR NOT NULL,
+                started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP,
+                duration_ms DOUBLE PRECISION,
+                status VARCHAR NOT NULL,
+                affected_rows INTEGER,
+                details JSONB,
+                error TEXT
+            );
+        """))
+
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_storico_job_id ON storico_job(id);
+            CREATE INDEX IF NOT EXISTS ix_storico_job_job_id ON storico_job(job_id);
+            CREATE INDEX IF NOT EXISTS ix_storico_job_started_at ON storico_job(started_at);
+        """))
+
+        conn.commit()
+        print("✅ Migration completata: tabella storico_job creata")
+
+if __name__ == "__main__":
+    migrate()
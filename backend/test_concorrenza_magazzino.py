@@ -0,0 +1,254 @@
+"""
+Script di test per verificare lo scarico concorrente del magazzino (nessun aggiornamento perso).
+
+Crea uno schema separato (default "test_concorrenza_magazzino") nel database indicato da
+DATABASE_URL, con alcuni articoli a giacenza nota, e simula più worker che chiudono RIT
+in contemporanea sugli stessi articoli:
+
+1. con il vecchio metodo (lettura della giacenza in Python e riscrittura) per mostrare
+   quanti scarichi vanno persi;
+2. con magazzino_service.scarica_ricambi: la giacenza finale deve essere esattamente
+   quella iniziale meno il totale scaricato e la somma dei movimenti deve coincidere.
+
+Lo schema viene eliminato alla fine (--keep per conservarlo). Exit code 1 se il test fallisce.
+Con pytest viene eseguito solo il punto 2 (saltato se il database Postgres non è raggiungibile).
+
+Uso:
+    python test_concorrenza_magazzino.py [--thread 16] [--rit 50] [--articoli 5]
+    pytest test_concorrenza_magazzino.py
+"""
+import argparse
+import random
+import sys
+import os
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app import models
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.services import magazzino_service
+
+GIACENZA_INIZIALE = 100_000
+
+
+def prepara_schema(schema: str):
+    """Schema pulito con tutte le tabelle dei modelli; engine con search_path sullo schema"""
+    admin_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"connect_timeout": 5})
+    try:
+        with admin_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+            conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    finally:
+        admin_engine.dispose()
+
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_size=32,
+        max_overflow=0,
+        connect_args={"options": f"-csearch_path={schema}"}
+    )
+    models.Base.metadata.create_all(engine)
+    return engine
+
+
+def elimina_schema(schema: str):
+    admin_engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with admin_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+    admin_engine.dispose()
+
+
+def reimposta_articoli(engine, n_articoli: int):
+    """Articoli con giacenza iniziale e relativo saldo iniziale nel registro movimenti"""
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE movimenti_magazzino, magazzino RESTART IDENTITY CASCADE"))
+        conn.execute(insert(models.ProdottoMagazzino), [
+            {"codice_articolo": f"TEST-{i:03d}", "descrizione": f"Articolo test {i}", "prezzo_vendita": 10.0,
+             "costo_acquisto": 5.0, "giacenza": GIACENZA_INIZIALE, "categoria": "Test"}
+            for i in range(n_articoli)
+        ])
+        conn.execute(text("""
+            INSERT INTO movimenti_magazzino (prodotto_id, tipo, quantita, giacenza_risultante, created_at)
+            SELECT id, 'saldo_iniziale', giacenza, giacenza, now() FROM magazzino
+        """))
+        return [row[0] for row in conn.execute(text("SELECT id FROM magazzino ORDER BY id"))]
+
+
+def genera_rit(prodotto_ids, n_rit: int, seed: int):
+    """Ricambi di n RIT: 1-4 righe ciascuno, anche più righe dello stesso articolo"""
+    rnd = random.Random(seed)
+    return [
+        [(rnd.choice(prodotto_ids), rnd.randint(1, 3)) for _ in range(rnd.randint(1, 4))]
+        for _ in range(n_rit)
+    ]
+
+
+def scarico_vecchio_metodo(db: Session, ricambi):
+    """Il codice precedente di create_intervento: una query per ricambio e giacenza -= quantita in Python"""
+    for prodotto_id, quantita in ricambi:
+        prodotto = db.query(models.ProdottoMagazzino).filter(models.ProdottoMagazzino.id == prodotto_id).first()
+        if prodotto:
+            # Pausa minima per rendere visibile la finestra tra lettura e scrittura
+            time.sleep(0.001)
+            prodotto.giacenza -= quantita
+    db.commit()
+
+
+def scarico_atomico(db: Session, ricambi):
+    magazzino_service.scarica_ricambi(db, ricambi)
+    db.commit()
+
+
+def esegui_concorrente(engine, lavori, funzione):
+    """Ogni thread chiude i propri RIT; i deadlock vengono ritentati come farebbe il client"""
+    barriera = threading.Barrier(len(lavori))
+    ritentativi = Counter()
+    errori = []
+
+    def worker(indice, rit_del_thread):
+        barriera.wait()
+        for ricambi in rit_del_thread:
+            while True:
+                db = Session(bind=engine)
+                try:
+                    funzione(db, ricambi)
+                    break
+                except OperationalError as e:
+                    db.rollback()
+                    if getattr(e.orig, "pgcode", None) == "40P01":  # deadlock_detected
+                        ritentativi[indice] += 1
+                        continue
+                    errori.append(e)
+                    break
+                finally:
+                    db.close()
+
+    threads = [threading.Thread(target=worker, args=(i, rit)) for i, rit in enumerate(lavori)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, sum(ritentativi.values()), errori
+
+
+def giacenze_attese(lavori):
+    scaricato = Counter()
+    for rit_del_thread in lavori:
+        for ricambi in rit_del_thread:
+            for prodotto_id, quantita in ricambi:
+                scaricato[prodotto_id] += quantita
+    return scaricato
+
+
+def verifica(engine, lavori, prodotto_ids, controlla_registro: bool):
+    """Confronta le giacenze finali con quelle attese; restituisce (scarichi persi, differenze registro)"""
+    scaricato = giacenze_attese(lavori)
+    with Session(bind=engine) as db:
+        giacenze = dict(db.query(models.ProdottoMagazzino.id, models.ProdottoMagazzino.giacenza).all())
+        persi = 0
+        for prodotto_id in prodotto_ids:
+            attesa = GIACENZA_INIZIALE - scaricato[prodotto_id]
+            persi += giacenze[prodotto_id] - attesa
+            print(f"  articolo {prodotto_id}: attesa {attesa}, effettiva {giacenze[prodotto_id]}")
+        differenze = magazzino_service.verifica_giacenze(db) if controlla_registro else []
+    return persi, differenze
+
+
+def scarico_vecchio_metodo_concorrente(engine, n_thread: int, n_rit: int, n_articoli: int) -> int:
+    """Dimostrazione con il vecchio metodo: restituisce gli scarichi persi (di solito > 0)"""
+    print("\n" + "=" * 60)
+    print("TEST: Vecchio metodo (lettura e riscrittura in Python)")
+    print("=" * 60)
+    prodotto_ids = reimposta_articoli(engine, n_articoli)
+    lavori = [genera_rit(prodotto_ids, n_rit, seed) for seed in range(n_thread)]
+    durata, _, _ = esegui_concorrente(engine, lavori, scarico_vecchio_metodo)
+    persi, _ = verifica(engine, lavori, prodotto_ids, controlla_registro=False)
+    print(f"Durata {durata:.2f}s - unità scaricate ma non sottratte (aggiornamenti persi): {persi}")
+    return persi
+
+
+def scarico_atomico_concorrente(engine, n_thread: int, n_rit: int, n_articoli: int) -> list:
+    """Scarico con magazzino_service.scarica_ricambi da più thread; restituisce i problemi trovati"""
+    print("\n" + "=" * 60)
+    print("TEST: magazzino_service.scarica_ricambi (UPDATE atomica)")
+    print("=" * 60)
+    prodotto_ids = reimposta_articoli(engine, n_articoli)
+    lavori = [genera_rit(prodotto_ids, n_rit, seed) for seed in range(n_thread)]
+    durata, deadlock, errori = esegui_concorrente(engine, lavori, scarico_atomico)
+    persi, differenze = verifica(engine, lavori, prodotto_ids, controlla_registro=True)
+    print(f"Durata {durata:.2f}s - deadlock ritentati: {deadlock}")
+
+    with engine.connect() as conn:
+        movimenti = conn.execute(text("SELECT count(*) FROM movimenti_magazzino WHERE tipo = 'scarico_rit'")).scalar()
+    rit_con_articoli = sum(len({pid for pid, _ in ricambi}) for lavoro in lavori for ricambi in lavoro)
+
+    problemi = []
+    if errori:
+        problemi.append(f"{len(errori)} RIT non scaricati per errore: {errori[0]}")
+    if persi != 0:
+        problemi.append(f"Aggiornamenti persi: {persi}")
+    if differenze:
+        problemi.append(f"Giacenze diverse dalla somma dei movimenti: {differenze}")
+    if movimenti != rit_con_articoli:
+        problemi.append(f"Movimenti registrati {movimenti}, attesi {rit_con_articoli}")
+    for problema in problemi:
+        print(f"❌ {problema}")
+    if not problemi:
+        print(f"✅ Nessun aggiornamento perso: {n_thread * n_rit} RIT, {movimenti} movimenti coerenti con le giacenze")
+    return problemi
+
+
+@pytest.fixture(scope="module")
+def engine_magazzino():
+    """Schema dedicato al test; il test viene saltato se il database Postgres non è raggiungibile"""
+    schema = "test_concorrenza_magazzino"
+    if make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() != "postgresql":
+        pytest.skip("Richiede Postgres (DATABASE_URL)")
+    try:
+        engine = prepara_schema(schema)
+    except OperationalError as e:
+        pytest.skip(f"Database non raggiungibile: {e.orig}")
+    yield engine
+    engine.dispose()
+    elimina_schema(schema)
+
+
+def test_scarico_concorrente_senza_aggiornamenti_persi(engine_magazzino):
+    """Più thread chiudono RIT sugli stessi articoli: giacenze e registro movimenti esatti"""
+    assert scarico_atomico_concorrente(engine_magazzino, n_thread=8, n_rit=25, n_articoli=3) == []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test concorrenza scarico magazzino")
+    parser.add_argument("--thread", type=int, default=16)
+    parser.add_argument("--rit", type=int, default=50, help="RIT chiusi da ogni thread")
+    parser.add_argument("--articoli", type=int, default=5, help="Pochi articoli = più contesa")
+    parser.add_argument("--schema", default="test_concorrenza_magazzino")
+    parser.add_argument("--keep", action="store_true", help="Non eliminare lo schema di test")
+    args = parser.parse_args()
+
+    engine = prepara_schema(args.schema)
+    try:
+        scarico_vecchio_metodo_concorrente(engine, args.thread, args.rit, args.articoli)
+        problemi = scarico_atomico_concorrente(engine, args.thread, args.rit, args.articoli)
+    finally:
+        engine.dispose()
+        if not args.keep:
+            elimina_schema(args.schema)
+
+    sys.exit(1 if problemi else 0)
+
+
+if __name__ == "__main__":
+    main()
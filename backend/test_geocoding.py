@@ -0,0 +1,183 @@
+"""
+Test del proxy di ricerca indirizzi (app/services/geocoding.py) senza chiamare Nominatim.
+
+Senza database:
+1. query che differiscono solo per maiuscole, spazi e virgole hanno la stessa chiave;
+2. LRU: eliminazione della voce meno usata e scadenza;
+3. le query troppo corte e quelle già nell'LRU non chiamano Nominatim.
+
+Con Postgres (tabella geocoding_cache in uno schema separato, vedi conftest.py; saltati se il
+database non è raggiungibile) e un finto Nominatim locale (http.server in un thread) che conta
+le richieste ricevute e risponde con un ritardo:
+4. N ricerche identiche contemporanee producono una sola chiamata a Nominatim; la successiva
+   arriva dall'LRU e, svuotato l'LRU, dalla tabella geocoding_cache;
+5. con Nominatim in errore si usa la riga scaduta della cache, altrimenti RuntimeError;
+6. le chiamate a Nominatim sono distanziate di almeno GEOCODING_MIN_INTERVAL_SECONDS.
+
+Uso:
+    pytest test_geocoding.py
+    python test_geocoding.py
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy.orm import sessionmaker
+from app import database, models
+from app.services import geocoding
+
+CONCORRENTI = 20
+INTERVALLO_MINIMO = 0.2
+RITARDO_RISPOSTA = 0.3
+
+
+class FintoNominatim(BaseHTTPRequestHandler):
+    """Risponde a /search come Nominatim (lista JSON) e conta le query ricevute"""
+    chiamate = Counter()
+    istanti = []
+    in_errore = False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = parse_qs(url.query).get("q", [""])[0]
+        FintoNominatim.chiamate[q] += 1
+        FintoNominatim.istanti.append(time.monotonic())
+        time.sleep(RITARDO_RISPOSTA)
+        if url.path != "/search" or FintoNominatim.in_errore:
+            self.send_response(500 if url.path == "/search" else 404)
+            self.end_headers()
+            return
+        corpo = json.dumps([{"place_id": 1, "display_name": q, "lat": "40.85", "lon": "14.26", "address": {"country_code": "it"}}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_normalizza_chiave_unica():
+    varianti = ["Via Roma 1, Napoli", "  via  ROMA 1 ,napoli", "VIA ROMA 1,NAPOLI."]
+    assert {geocoding.normalizza(v) for v in varianti} == {"via roma 1, napoli"}
+    assert geocoding.normalizza("Via Roma ,1") == "via roma, 1"
+    assert geocoding.normalizza(None) == ""
+
+
+def test_lru_eliminazione_e_scadenza():
+    lru = geocoding._CacheLRU(dimensione=2, ttl_secondi=60)
+    lru.set("a", [1])
+    lru.set("b", [2])
+    assert lru.get("a") == [1]  # "a" diventa la più recente
+    lru.set("c", [3])
+    assert lru.get("b") is None and lru.get("a") == [1] and lru.get("c") == [3]
+
+    lru.set("vecchia", [4], eta_secondi=61)  # Già oltre il TTL (es. riga letta dal database)
+    assert lru.get("vecchia") is None
+
+    disattivata = geocoding._CacheLRU(dimensione=0, ttl_secondi=60)
+    disattivata.set("a", [1])
+    assert disattivata.get("a") is None
+
+
+def test_query_corta_e_lru_senza_nominatim(monkeypatch):
+    # Porta chiusa: una chiamata a Nominatim fallirebbe con RuntimeError
+    monkeypatch.setattr(geocoding, "GEOCODING_URL", "http://127.0.0.1:9/search")
+    geocoding.svuota_cache_memoria()
+
+    async def scenario():
+        corta = await geocoding.cerca("na")
+        geocoding._lru.set("via roma 1, napoli", [{"display_name": "Via Roma 1, Napoli"}])
+        dall_lru = await geocoding.cerca("  VIA ROMA 1 ,napoli")
+        await geocoding.chiudi()
+        return corta, dall_lru
+
+    try:
+        corta, dall_lru = asyncio.run(scenario())
+    finally:
+        geocoding.svuota_cache_memoria()
+    assert corta == geocoding.RisultatoRicerca([], "vuota")
+    assert dall_lru.origine == "lru" and dall_lru.risultati[0]["display_name"] == "Via Roma 1, Napoli"
+
+
+@pytest.fixture
+def nominatim(schema_postgres, monkeypatch):
+    """Finto Nominatim locale e cache geocoding_cache sullo schema di test"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FintoNominatim)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    FintoNominatim.chiamate.clear()
+    FintoNominatim.istanti.clear()
+    FintoNominatim.in_errore = False
+    monkeypatch.setattr(geocoding, "GEOCODING_URL", f"http://127.0.0.1:{server.server_port}/search")
+    monkeypatch.setattr(geocoding, "GEOCODING_MIN_INTERVAL_SECONDS", INTERVALLO_MINIMO)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=schema_postgres))
+    geocoding.svuota_cache_memoria()
+    yield FintoNominatim
+    geocoding.svuota_cache_memoria()
+    server.shutdown()
+    server.server_close()
+
+
+def test_ricerche_contemporanee_unite_e_cache(nominatim):
+    varianti = ["Via Roma 1, Napoli", "  via  ROMA 1 ,napoli", "VIA ROMA 1,NAPOLI."]
+
+    async def scenario():
+        risultati = await asyncio.gather(*(geocoding.cerca(varianti[i % len(varianti)]) for i in range(CONCORRENTI)))
+        dall_lru = await geocoding.cerca("via roma 1, napoli")
+        geocoding.svuota_cache_memoria()
+        dal_db = await geocoding.cerca("Via Roma 1, Napoli")
+        await geocoding.chiudi()
+        return risultati, dall_lru, dal_db
+
+    risultati, dall_lru, dal_db = asyncio.run(scenario())
+    assert sum(nominatim.chiamate.values()) == 1
+    assert all(r.risultati == risultati[0].risultati for r in risultati)
+    assert dall_lru.origine == "lru"
+    assert dal_db.origine == "db" and dal_db.risultati == risultati[0].risultati
+    assert sum(nominatim.chiamate.values()) == 1
+
+
+def test_cache_scaduta_con_nominatim_in_errore(nominatim):
+    async def scenario():
+        await geocoding.cerca("via roma 1, napoli")
+        with database.SessionLocal() as db:
+            db.query(models.GeocodingCache).update({models.GeocodingCache.aggiornato_il: datetime.now() - timedelta(days=365)})
+            db.commit()
+        geocoding.svuota_cache_memoria()
+        nominatim.in_errore = True
+        scaduta = await geocoding.cerca("via roma 1, napoli")
+        with pytest.raises(RuntimeError):
+            await geocoding.cerca("via toledo 10, napoli")
+        await geocoding.chiudi()
+        return scaduta
+
+    scaduta = asyncio.run(scenario())
+    assert scaduta.origine == "db-scaduta" and scaduta.risultati
+
+
+def test_chiamate_distanziate(nominatim):
+    async def scenario():
+        for indirizzo in ("piazza dante, napoli", "corso umberto, salerno", "via duomo, amalfi"):
+            await geocoding.cerca(indirizzo)
+        await geocoding.chiudi()
+
+    asyncio.run(scenario())
+    distanze = [b - a for a, b in zip(nominatim.istanti, nominatim.istanti[1:])]
+    assert len(distanze) == 2 and min(distanze) >= INTERVALLO_MINIMO * 0.95, distanze
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-rs"]))
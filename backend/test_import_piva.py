@@ -0,0 +1,149 @@
+"""
+Test della P.IVA e delle conversioni nell'import massivo (app/services/import_service.py).
+
+Senza database:
+1. normalizza_piva / errore_piva: prefisso IT e spazi rimossi, zeri iniziali ripristinati solo
+   per le celle numeriche di Excel (9-10 cifre), altre lunghezze segnalate come errore;
+2. valida_riga con numeri ("1.234,50 €"), date ("31/12/2025") e booleani ("sì") all'italiana.
+
+Con Postgres (schema separato, vedi conftest.py; saltati se il database non è raggiungibile):
+3. un cliente già salvato con prefisso IT o con spazi nella P.IVA viene riconosciuto come
+   duplicato importando la stessa P.IVA senza prefisso;
+4. le sedi con cliente_p_iva vengono collegate ai clienti salvati con prefisso o spazi,
+   anche quando Excel ha tolto lo zero iniziale (10 cifre);
+5. una P.IVA di lunghezza errata (es. "12345") è un errore di riga e non viene completata con zeri.
+
+Uso:
+    pytest test_import_piva.py
+    python test_import_piva.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+import pytest
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy.orm import Session
+from app import models, schemas
+from app.services import import_service
+
+
+def _importa(db, entita: str, righe: list) -> list:
+    """Eventi dell'import di un CSV con le righe indicate (la prima è l'intestazione)"""
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8") as f:
+        f.write("\n".join(";".join(riga) for riga in righe))
+    try:
+        with import_service.LettoreFile(f.name) as lettore:
+            return list(import_service.importa(db, entita, lettore))
+    finally:
+        os.unlink(f.name)
+
+
+def test_normalizza_piva():
+    assert import_service.normalizza_piva("IT 012 345 678 90") == "01234567890"
+    assert import_service.normalizza_piva("it01234567890") == "01234567890"
+    # Cella numerica di Excel: zero iniziale perso
+    assert import_service.normalizza_piva(1234567890.0) == "01234567890"
+    assert import_service.normalizza_piva("123456789") == "00123456789"
+    # Lunghezze non spiegabili con gli zeri persi: invariate
+    assert import_service.normalizza_piva("12345") == "12345"
+    assert import_service.normalizza_piva("123456789012") == "123456789012"
+    assert import_service.normalizza_piva("") is None
+
+
+def test_errore_piva():
+    assert import_service.errore_piva("12345") == "P.IVA 12345 non valida (5 cifre, attese 11)"
+    assert import_service.errore_piva("123456789012") is not None
+    assert import_service.errore_piva("IT01234567890") is None
+    assert import_service.errore_piva("1234567890") is None
+    assert import_service.errore_piva(None) is None
+
+
+def test_valida_riga_formati_italiani():
+    prodotto, errori = import_service.valida_riga(schemas.ProdottoCreate, {
+        "codice_articolo": 4711.0, "descrizione": "Toner", "prezzo_vendita": "1.234,50 €",
+        "costo_acquisto": "12,5", "giacenza": "12",
+    })
+    assert errori == []
+    assert prodotto.codice_articolo == "4711"
+    assert prodotto.prezzo_vendita == 1234.5
+    assert prodotto.costo_acquisto == 12.5
+    assert prodotto.giacenza == 12
+
+    asset, errori = import_service.valida_riga(schemas.AssetClienteCreate, {
+        "tipo_asset": "Printing", "data_scadenza_noleggio": "31/12/2025",
+        "data_installazione": "1.2.2024", "is_colore": "sì", "is_nuovo": "no",
+    })
+    assert errori == []
+    assert asset.data_scadenza_noleggio.date() == date(2025, 12, 31)
+    assert asset.data_installazione.date() == date(2024, 2, 1)
+    assert asset.is_colore is True and asset.is_nuovo is False
+
+
+def test_valida_riga_piva_errata():
+    cliente, errori = import_service.valida_riga(schemas.ClienteBase, {
+        "ragione_sociale": "Rossi S.r.l.", "indirizzo": "Via Roma 1", "p_iva": "12345",
+    })
+    assert cliente is None
+    assert errori == ["p_iva: P.IVA 12345 non valida (5 cifre, attese 11)"]
+
+    sede, errori = import_service.valida_riga(schemas.SedeClienteCreate, {
+        "cliente_p_iva": "12345", "nome_sede": "Magazzino", "indirizzo_completo": "Via Roma 1",
+    })
+    assert sede is None and errori[0].startswith("cliente_p_iva: P.IVA 12345")
+
+    _, errori = import_service.valida_riga(schemas.ClienteBase, {
+        "ragione_sociale": "Rossi S.r.l.", "indirizzo": "Via Roma 1", "p_iva": "IT 012 345 678 90",
+    })
+    assert errori == []
+
+
+@pytest.fixture
+def db_clienti(schema_postgres):
+    """Sessione sullo schema di test con due clienti salvati con P.IVA non normalizzata"""
+    with Session(bind=schema_postgres) as db:
+        db.add_all([
+            models.Cliente(ragione_sociale="Prefisso IT S.r.l.", indirizzo="Via Salerno 1", p_iva="IT01234567890"),
+            models.Cliente(ragione_sociale="Con Spazi S.r.l.", indirizzo="Via Salerno 2", p_iva="098 765 432 10"),
+        ])
+        db.commit()
+        yield db
+
+
+def test_clienti_duplicati_con_piva_salvata_non_normalizzata(db_clienti):
+    eventi = _importa(db_clienti, "clienti", [
+        ["ragione_sociale", "indirizzo", "p_iva"],
+        ["Doppione Prefisso", "Via Roma 1", "01234567890"],
+        ["Doppione Spazi", "Via Roma 2", "09876543210"],
+        ["Nuovo Cliente", "Via Roma 3", "11111111111"],
+        ["P.IVA Sbagliata", "Via Roma 4", "12345"],
+    ])
+    totali = eventi[-1]
+    assert totali["duplicate"] == 2
+    assert totali["importate"] == 1
+    problemi = eventi[0]["problemi"]
+    assert any(p["riga"] == 5 and "12345" in p["errore"] for p in problemi), problemi
+    # La P.IVA errata non viene completata con zeri né inserita
+    assert db_clienti.query(models.Cliente).filter(models.Cliente.p_iva.like("%12345")).count() == 0
+
+
+def test_sedi_collegate_per_cliente_p_iva(db_clienti):
+    eventi = _importa(db_clienti, "sedi", [
+        ["cliente_p_iva", "nome_sede", "indirizzo_completo"],
+        ["1234567890", "Magazzino", "Via Roma 1, Salerno"],
+        ["IT09876543210", "Uffici", "Via Napoli 2, Salerno"],
+        ["12345", "Sede Errata", "Via Milano 3, Salerno"],
+    ])
+    totali = eventi[-1]
+    assert totali["importate"] == 2
+    assert totali["errori"] == 1
+    sedi = {s.nome_sede: s.cliente.ragione_sociale for s in db_clienti.query(models.SedeCliente)}
+    assert sedi == {"Magazzino": "Prefisso IT S.r.l.", "Uffici": "Con Spazi S.r.l."}
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-rs"]))
@@ -0,0 +1,21 @@
+"""
+Test del profilo di avvio: esegue check_startup_profile.py in un processo separato.
+
+Fallisce se l'import a freddo di app.main supera il riferimento di startup_profile.json
+(oltre la tolleranza) o se una dipendenza di lazy_imports.HEAVY_MODULES viene importata all'avvio.
+"""
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_profilo_di_avvio():
+    """Import a freddo entro il limite e nessuna dipendenza pesante caricata all'avvio"""
+    result = subprocess.run(
+        [sys.executable, os.path.join(BASE_DIR, "check_startup_profile.py")],
+        cwd=BASE_DIR, capture_output=True, text=True, timeout=300
+    )
+    print(result.stdout)
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-2000:]
@@ -3,6 +3,12 @@ import { MapPin, Loader2 } from 'lucide-react';
 import axios from 'axios';
 import { getApiUrl } from '../config/api';
 
+// Contratto con il proxy /api/geocoding/search (app/services/geocoding.py): una ricerca solo dopo
+// GEOCODING_DEBOUNCE_MS senza digitazione, mai sotto GEOCODING_MIN_CHARS caratteri,
+// e la richiesta precedente ancora in corso viene annullata
+const GEOCODING_DEBOUNCE_MS = 400;
+const GEOCODING_MIN_CHARS = 3;
+
 interface AddressSuggestion {
   display_name: string;
   address: {
@@ -43,17 +49,19 @@ export default function AddressAutocomplete({
   const inputRef = useRef<HTMLInputElement>(null);
   const suggestionsRef = useRef<HTMLDivElement>(null);
   const timeoutRef = useRef<NodeJS.Timeout | null>(null);
+  const abortRef = useRef<AbortController | null>(null);
 
   useEffect(() => {
     // Se l'utente ha già inserito un valore e non ci sono suggerimenti, permetti l'inserimento manuale
-    if (value.length < 3) {
+    if (value.trim().length < GEOCODING_MIN_CHARS) {
+      abortRef.current?.abort();
       setSuggestions([]);
       setShowSuggestions(false);
       return;
     }
     
     // Se l'utente ha digitato qualcosa ma non ci sono suggerimenti dopo un po', permetti l'inserimento manuale
-    if (value.length >= 3 && !isLoading && suggestions.length === 0 && showSuggestions) {
+    if (value.length >= GEOCODING_MIN_CHARS && !isLoading && suggestions.length === 0 && showSuggestions) {
       // L'utente può continuare a digitare manualmente
       return;
     }
@@ -65,7 +73,7 @@ export default function AddressAutocomplete({
 
     timeoutRef.current = setTimeout(() => {
       searchAddresses(value);
-    }, 300);
+    }, GEOCODING_DEBOUNCE_MS);
 
     return () => {
       if (timeoutRef.current) {
@@ -74,14 +82,23 @@ export default function AddressAutocomplete({
     };
   }, [value]);
 
+  // Annulla l'ultima ricerca se il componente viene smontato
+  useEffect(() => () => abortRef.current?.abort(), []);
+
   const searchAddresses = async (query: string) => {
-    if (query.length < 3) return;
+    if (query.trim().length < GEOCODING_MIN_CHARS) return;
+
+    // La risposta di una ricerca superata dalla digitazione non serve più
+    abortRef.current?.abort();
+    const controller = new AbortController();
+    abortRef.current = controller;
 
     setIsLoading(true);
     try {
       // Usa il proxy backend per evitare problemi CORS
       const response = await axios.get(`${getApiUrl()}/api/geocoding/search`, {
-        params: { q: query }
+        params: { q: query },
+        signal: controller.signal
       });
 
       if (response.data && Array.isArray(response.data)) {
@@ -95,12 +112,15 @@ export default function AddressAutocomplete({
         setShowSuggestions(false);
       }
     } catch (error) {
+      if (axios.isCancel(error)) return;
       // Silenzia l'errore per non disturbare l'utente - permette inserimento manuale
       console.error('Errore ricerca indirizzo:', error);
       setSuggestions([]);
       setShowSuggestions(false);
     } finally {
-      setIsLoading(false);
+      if (abortRef.current === controller) {
+        setIsLoading(false);
+      }
     }
   };
 
@@ -3,7 +3,7 @@ import { useNavigate, useLocation } from 'react-router-dom';
 import { useEffect, useRef } from 'react';
 import { useSettingsStore } from '../store/settingsStore';
 import { useAuthStore } from '../store/authStore';
-import { getApiUrl } from '../config/api';
+import LogoAzienda from './LogoAzienda';
 
 interface AppHeaderProps {
   title: string;
@@ -57,8 +57,8 @@ export default function AppHeader({ title, showBack = true, showHome = true, rig
           )}
           <div className="flex items-center gap-2 sm:gap-3">
             {logoUrl && (
-              <img 
-                src={`${getApiUrl()}${logoUrl}`} 
+              <LogoAzienda
+                logoUrl={logoUrl}
                 alt={nomeAzienda}
                 className="h-8 w-8 sm:h-10 sm:w-10 object-contain"
               />
@@ -0,0 +1,25 @@
+import { getApiUrl } from '../config/api';
+
+interface LogoAziendaProps {
+  logoUrl: string;
+  alt: string;
+  className?: string;
+}
+
+// I loghi caricati generano le varianti logo_<hash>_ui.png e logo_<hash>_ui.webp (backend: logo_service.py):
+// il browser sceglie la WebP, più leggera. I loghi caricati prima delle varianti hanno solo il file originale.
+function webpUrl(logoUrl: string): string | null {
+  return logoUrl.endsWith('_ui.png') ? logoUrl.replace(/_ui\.png$/, '_ui.webp') : null;
+}
+
+export default function LogoAzienda({ logoUrl, alt, className = '' }: LogoAziendaProps) {
+  const webp = webpUrl(logoUrl);
+  const img = <img src={`${getApiUrl()}${logoUrl}`} alt={alt} className={className} />;
+  if (!webp) return img;
+  return (
+    <picture>
+      <source srcSet={`${getApiUrl()}${webp}`} type="image/webp" />
+      {img}
+    </picture>
+  );
+}
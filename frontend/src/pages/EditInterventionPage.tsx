@@ -455,25 +455,24 @@ export default function EditInterventionPage() {
       // Salva letture copie se prelievo copie è attivo
       if (formDataTemp.is_prelievo_copie && macroCategoria === "Printing & Office") {
         const assetsPrinting = assetsNoleggioCliente.filter((a: any) => a.tipo_asset === "Printing");
-        for (const asset of assetsPrinting) {
-          const lettura = lettureCopie[asset.id];
-          if (lettura && lettura.contatore_bn) {
-            try {
-              await axios.post(`${getApiUrl()}/letture-copie/`, {
-                asset_id: asset.id,
-                intervento_id: parseInt(id || '0'),
-                data_lettura: new Date().toISOString(),
-                contatore_bn: lettura.contatore_bn,
-                contatore_colore: lettura.contatore_colore || 0
-              }, {
-                headers: {
-                  'Authorization': `Bearer ${token}`
-                }
-              });
-            } catch (err: any) {
-              console.error(`Errore salvataggio lettura per asset ${asset.id}:`, err);
-              alert(`Errore nel salvare la lettura copie per ${asset.marca} ${asset.modello}: ${err.response?.data?.detail || err.message}`);
-            }
+        // Tutte le letture del RIT in una sola richiesta (una transazione, un solo invio del PDF)
+        const letture = assetsPrinting
+          .filter((asset: any) => lettureCopie[asset.id] && lettureCopie[asset.id].contatore_bn)
+          .map((asset: any) => ({
+            asset_id: asset.id,
+            contatore_bn: lettureCopie[asset.id].contatore_bn,
+            contatore_colore: lettureCopie[asset.id].contatore_colore || 0
+          }));
+        if (letture.length > 0) {
+          try {
+            await axios.post(`${getApiUrl()}/interventi/${id}/letture-copie:batch`, { letture }, {
+              headers: {
+                'Authorization': `Bearer ${token}`
+              }
+            });
+          } catch (err: any) {
+            console.error('Errore salvataggio letture copie:', err);
+            alert(`Errore nel salvare le letture copie: ${err.response?.data?.detail || err.message}`);
           }
         }
       }
@@ -4,7 +4,7 @@ import { useAuthStore } from '../store/authStore';
 import { useSettingsStore } from '../store/settingsStore';
 import { LogIn, Lock, Mail, AlertCircle, Shield } from 'lucide-react';
 import { IOSCard, IOSInput } from '../components/ui/ios-elements';
-import { getApiUrl } from '../config/api';
+import LogoAzienda from '../components/LogoAzienda';
 
 export default function LoginPage() {
   const [email, setEmail] = useState('');
@@ -58,8 +58,8 @@ export default function LoginPage() {
         <div className="text-center mb-8">
           {logoUrl ? (
             <div className="flex flex-col items-center mb-4">
-              <img 
-                src={`${getApiUrl()}${logoUrl}`} 
+              <LogoAzienda
+                logoUrl={logoUrl}
                 alt={nomeAzienda}
                 className="h-20 w-20 sm:h-24 sm:w-24 object-contain mb-4"
               />
@@ -779,26 +779,27 @@ export default function NewInterventionPage() {
             console.error('Token non disponibile per salvare le letture copie');
             alert('Errore: sessione scaduta. Le letture copie non sono state salvate. Ricarica la pagina e riprova.');
           } else {
-            for (const asset of assetsPrinting) {
-              const lettura = lettureCopie[asset.id];
-              if (lettura && lettura.contatore_bn !== undefined && lettura.contatore_bn !== null) {
-                try {
-                  // Usa axios con gli header di default già configurati
-                  const response = await axios.post(`${getApiUrl()}/letture-copie/`, {
-                    asset_id: asset.id,
-                    intervento_id: nuovoId,
-                    data_lettura: new Date().toISOString(),
-                    contatore_bn: lettura.contatore_bn,
-                    contatore_colore: lettura.contatore_colore || 0
-                  });
-                  console.log(`Lettura copie salvata per asset ${asset.id}:`, response.data);
-                } catch (err: any) {
-                  console.error(`Errore salvataggio lettura per asset ${asset.id}:`, err);
-                  if (err.response?.status === 401) {
-                    alert(`Errore di autenticazione. Le letture copie per ${asset.marca} ${asset.modello} non sono state salvate. Ricarica la pagina e riprova.`);
-                  } else {
-                    alert(`Errore nel salvare la lettura copie per ${asset.marca} ${asset.modello}: ${err.response?.data?.detail || err.message}`);
-                  }
+            // Tutte le letture del RIT in una sola richiesta (una transazione, un solo invio del PDF)
+            const letture = assetsPrinting
+              .filter((asset: any) => {
+                const lettura = lettureCopie[asset.id];
+                return lettura && lettura.contatore_bn !== undefined && lettura.contatore_bn !== null;
+              })
+              .map((asset: any) => ({
+                asset_id: asset.id,
+                contatore_bn: lettureCopie[asset.id].contatore_bn,
+                contatore_colore: lettureCopie[asset.id].contatore_colore || 0
+              }));
+            if (letture.length > 0) {
+              try {
+                const response = await axios.post(`${getApiUrl()}/interventi/${nuovoId}/letture-copie:batch`, { letture });
+                console.log(`Letture copie salvate per RIT ${nuovoId}:`, response.data);
+              } catch (err: any) {
+                console.error('Errore salvataggio letture copie:', err);
+                if (err.response?.status === 401) {
+                  alert('Errore di autenticazione. Le letture copie non sono state salvate. Ricarica la pagina e riprova.');
+                } else {
+                  alert(`Errore nel salvare le letture copie: ${err.response?.data?.detail || err.message}`);
                 }
               }
             }